@@ -37,7 +37,21 @@ resource "aws_iam_role_policy" "lambda_api" {
           "dynamodb:Query",
           "dynamodb:DescribeTable"
         ],
-        Resource = aws_dynamodb_table.suricata_events.arn
+        Resource = [
+          aws_dynamodb_table.suricata_events.arn,
+          "${aws_dynamodb_table.suricata_events.arn}/index/*"
+        ]
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:Query"
+        ],
+        Resource = [
+          aws_dynamodb_table.attackers.arn,
+          "${aws_dynamodb_table.attackers.arn}/index/*"
+        ]
       },
       {
         Effect = "Allow",
@@ -65,12 +79,19 @@ resource "aws_lambda_function" "suricata_api" {
   runtime          = "python3.11"
   filename         = data.archive_file.suricata_api.output_path
   source_code_hash = data.archive_file.suricata_api.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
   timeout          = 45
   memory_size      = 128 # Reduced from 256 MB - sufficient for DynamoDB queries (~$1/month savings)
 
   environment {
     variables = {
-      TABLE_NAME = aws_dynamodb_table.suricata_events.name
+      TABLE_NAME            = aws_dynamodb_table.suricata_events.name
+      SRC_IP_INDEX_NAME     = "src_ip-timestamp-index"
+      ATTACKERS_TABLE_NAME  = aws_dynamodb_table.attackers.name
+      PROFILE_OUTPUT        = var.lambda_profile_output
+      PROFILE_SAMPLE_RATE   = var.lambda_profile_sample_rate
+      PROFILE_HEADER_SECRET = var.lambda_profile_header_secret
+      METRICS_NAMESPACE     = "${var.project_name}/Api"
     }
   }
 
@@ -90,10 +111,11 @@ resource "aws_apigatewayv2_api" "suricata" {
   protocol_type = "HTTP"
 
   cors_configuration {
-    allow_origins = ["*"]
-    allow_methods = ["GET", "POST", "OPTIONS"]
-    allow_headers = ["*"]
-    max_age       = 600
+    allow_origins  = ["*"]
+    allow_methods  = ["GET", "POST", "OPTIONS"]
+    allow_headers  = ["*"]
+    expose_headers = ["etag"] # lets the dashboard revalidate /events with If-None-Match
+    max_age        = 600
   }
 }
 
@@ -139,6 +161,12 @@ resource "aws_apigatewayv2_route" "suricata_metrics" {
   target    = "integrations/${aws_apigatewayv2_integration.suricata.id}"
 }
 
+resource "aws_apigatewayv2_route" "suricata_attackers" {
+  api_id    = aws_apigatewayv2_api.suricata.id
+  route_key = "GET /attackers"
+  target    = "integrations/${aws_apigatewayv2_integration.suricata.id}"
+}
+
 resource "aws_lambda_permission" "apigw_invoke" {
   statement_id  = "AllowAPIGatewayInvoke"
   action        = "lambda:InvokeFunction"
@@ -0,0 +1,169 @@
+# ===========================================================
+#                     PhantomWall Cloud Threat
+#                     Analyst API Route Metrics
+# ===========================================================
+# Description: p95 latency alarms and a dashboard for the
+#             per-route EMF metrics suricata_api and
+#             s3_log_query print on every request
+#             (lambda/layer/python/phantomwall/metrics.py)
+#
+# Naming Convention: phantomwall-{resource}-{environment}
+# Last Updated: 2026-10-18
+# ===========================================================
+
+locals {
+  api_metrics_namespace = "${var.project_name}/Api"
+
+  # Route => Lambda service and the p95 latency (ms) it should stay under
+  api_routes = {
+    "GET /events"       = { service = "suricata_api", p95_ms = 2000 }
+    "GET /metrics"      = { service = "suricata_api", p95_ms = 3000 }
+    "GET /attackers"    = { service = "suricata_api", p95_ms = 2000 }
+    "GET /logs"         = { service = "s3_log_query", p95_ms = 20000 } # inline Athena wait
+    "GET /logs summary" = { service = "s3_log_query", p95_ms = 5000 }
+  }
+}
+
+# ----------------------------------------------------------
+#            p95 Latency Alarms (one per route)
+# ----------------------------------------------------------
+
+resource "aws_cloudwatch_metric_alarm" "api_route_p95_latency" {
+  for_each = local.api_routes
+
+  alarm_name          = "${var.project_name}-api-p95-${replace(lower(each.key), "/[^a-z0-9]+/", "-")}-${var.environment}"
+  alarm_description   = "${each.key} p95 latency above ${each.value.p95_ms} ms for 15 minutes"
+  comparison_operator = "GreaterThanThreshold"
+  evaluation_periods  = 3
+  metric_name         = "LatencyMs"
+  namespace           = local.api_metrics_namespace
+  period              = 300
+  extended_statistic  = "p95"
+  threshold           = each.value.p95_ms
+  treat_missing_data  = "notBreaching"
+
+  dimensions = {
+    Service = each.value.service
+    Route   = each.key
+  }
+
+  tags = {
+    Project = var.project_name
+    Env     = var.environment
+    Service = "monitoring"
+  }
+}
+
+# ----------------------------------------------------------
+#            Dashboard — Analyst API Routes
+# ----------------------------------------------------------
+
+resource "aws_cloudwatch_dashboard" "api_routes" {
+  dashboard_name = "${var.project_name}-api-routes-${var.environment}"
+
+  dashboard_body = jsonencode({
+    widgets = [
+      {
+        type   = "metric"
+        x      = 0
+        y      = 0
+        width  = 12
+        height = 6
+        properties = {
+          title = "Route latency p95 (ms)"
+          metrics = [
+            for route, config in local.api_routes :
+            [local.api_metrics_namespace, "LatencyMs", "Service", config.service, "Route", route, { stat = "p95", label = route }]
+          ]
+          view   = "timeSeries"
+          region = var.aws_region
+          period = 300
+        }
+      },
+      {
+        type   = "metric"
+        x      = 12
+        y      = 0
+        width  = 12
+        height = 6
+        properties = {
+          title = "Route latency p99 (ms)"
+          metrics = [
+            for route, config in local.api_routes :
+            [local.api_metrics_namespace, "LatencyMs", "Service", config.service, "Route", route, { stat = "p99", label = route }]
+          ]
+          view   = "timeSeries"
+          region = var.aws_region
+          period = 300
+        }
+      },
+      {
+        type   = "metric"
+        x      = 0
+        y      = 6
+        width  = 12
+        height = 6
+        properties = {
+          title = "GET /logs — time in AWS calls p95 (ms)"
+          metrics = [
+            for name in ["AthenaMs", "GlueMs", "S3Ms", "DynamoDBMs"] :
+            [local.api_metrics_namespace, name, "Service", "s3_log_query", "Route", "GET /logs", { stat = "p95", label = name }]
+          ]
+          view   = "timeSeries"
+          region = var.aws_region
+          period = 300
+        }
+      },
+      {
+        type   = "metric"
+        x      = 12
+        y      = 6
+        width  = 12
+        height = 6
+        properties = {
+          title = "Response bytes p95"
+          metrics = [
+            for route, config in local.api_routes :
+            [local.api_metrics_namespace, "ResponseBytes", "Service", config.service, "Route", route, { stat = "p95", label = route }]
+          ]
+          view   = "timeSeries"
+          region = var.aws_region
+          period = 300
+        }
+      },
+      {
+        type   = "metric"
+        x      = 0
+        y      = 12
+        width  = 12
+        height = 6
+        properties = {
+          title = "GET /logs — cache hits vs misses"
+          metrics = [
+            [local.api_metrics_namespace, "CacheHits", "Service", "s3_log_query", "Route", "GET /logs", { stat = "Sum", color = "#2ca02c" }],
+            [local.api_metrics_namespace, "CacheMisses", "Service", "s3_log_query", "Route", "GET /logs", { stat = "Sum", color = "#d62728" }]
+          ]
+          view   = "timeSeries"
+          region = var.aws_region
+          period = 300
+        }
+      },
+      {
+        type   = "alarm"
+        x      = 12
+        y      = 12
+        width  = 12
+        height = 6
+        properties = {
+          title  = "🚨 Route latency alarms"
+          alarms = [for alarm in aws_cloudwatch_metric_alarm.api_route_p95_latency : alarm.arn]
+        }
+      }
+    ]
+  })
+}
+
+output "api_routes_dashboard_url" {
+  description = "CloudWatch Dashboard URL for the analyst API route metrics"
+  value       = "https://${var.aws_region}.console.aws.amazon.com/cloudwatch/home?region=${var.aws_region}#dashboards:name=${aws_cloudwatch_dashboard.api_routes.dashboard_name}"
+}
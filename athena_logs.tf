@@ -12,7 +12,7 @@ Architecture:
   React LogViewer → API Gateway /logs → Lambda → Athena → S3 (all logs)
 
 Cost: Athena charges $5 per TB scanned. Partitioned by year/month/day/hour
-      so queries are efficient and cheap.
+      and event type (etype) so queries are efficient and cheap.
 ================================================================================
 */
 
@@ -73,7 +73,7 @@ resource "aws_glue_catalog_table" "suricata_events" {
     ser_de_info {
       serialization_library = "org.openx.data.jsonserde.JsonSerDe"
       parameters = {
-        "paths" = "timestamp,event_type,src_ip,src_port,dest_ip,dest_port,proto,alert,flow,tcp"
+        "paths" = "timestamp,event_type,src_ip,src_port,dest_ip,dest_port,proto,alert,flow,tcp,sample_weight"
       }
     }
 
@@ -122,6 +122,12 @@ resource "aws_glue_catalog_table" "suricata_events" {
       name = "app_proto"
       type = "string"
     }
+    # Events a sampled or rolled-up record stands for (NULL = 1); see
+    # suricata_ingest's INGEST_SAMPLING_POLICY
+    columns {
+      name = "sample_weight"
+      type = "int"
+    }
   }
 
   # Partitioned by date/hour to match S3 key structure
@@ -141,6 +147,12 @@ resource "aws_glue_catalog_table" "suricata_events" {
     name = "hour"
     type = "string"
   }
+  # Event type split (etype=alert/). Not named event_type: Hive forbids a
+  # partition key sharing a data column's name. Pre-split hours are 'all'.
+  partition_keys {
+    name = "etype"
+    type = "string"
+  }
 }
 
 # ----------------------------------------------------------
@@ -165,6 +177,33 @@ resource "aws_athena_workgroup" "suricata" {
   }
 }
 
+# ----------------------------------------------------------
+#            Daily Athena scan budget
+# ----------------------------------------------------------
+# One item per UTC day with the bytes Athena scanned for /logs searches;
+# s3_log_query narrows or rejects searches once SCAN_BUDGET_DAILY_BYTES is used.
+resource "aws_dynamodb_table" "query_budget" {
+  name         = "${var.project_name}-dynamodb-query-budget-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "budget_date"
+
+  attribute {
+    name = "budget_date"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
+  tags = {
+    Project = var.project_name
+    Env     = var.environment
+    Service = "query-budget"
+  }
+}
+
 # ----------------------------------------------------------
 #            Lambda for S3 Log Queries
 # ----------------------------------------------------------
@@ -195,6 +234,7 @@ resource "aws_iam_role_policy" "lambda_log_query" {
         Action = [
           "athena:StartQueryExecution",
           "athena:GetQueryExecution",
+          "athena:BatchGetQueryExecution",
           "athena:GetQueryResults",
           "athena:StopQueryExecution"
         ],
@@ -207,6 +247,7 @@ resource "aws_iam_role_policy" "lambda_log_query" {
           "glue:GetPartitions",
           "glue:GetDatabase",
           "glue:BatchCreatePartition",
+          "glue:BatchDeletePartition",
           "glue:CreatePartition"
         ],
         Resource = [
@@ -231,6 +272,7 @@ resource "aws_iam_role_policy" "lambda_log_query" {
         Action = [
           "s3:GetObject",
           "s3:PutObject",
+          "s3:AbortMultipartUpload", # NDJSON exports upload in parts
           "s3:ListBucket",
           "s3:GetBucketLocation"
         ],
@@ -239,6 +281,16 @@ resource "aws_iam_role_policy" "lambda_log_query" {
           "${aws_s3_bucket.athena_results.arn}/*"
         ]
       },
+      {
+        Effect   = "Allow",
+        Action   = ["dynamodb:Query", "dynamodb:UpdateItem"], # UpdateItem: repair stamps data versions
+        Resource = aws_dynamodb_table.partition_stats.arn
+      },
+      {
+        Effect   = "Allow",
+        Action   = ["dynamodb:GetItem", "dynamodb:UpdateItem"],
+        Resource = aws_dynamodb_table.query_budget.arn
+      },
       {
         Effect = "Allow",
         Action = [
@@ -265,16 +317,31 @@ resource "aws_lambda_function" "s3_log_query" {
   runtime          = "python3.11"
   filename         = data.archive_file.s3_log_query.output_path
   source_code_hash = data.archive_file.s3_log_query.output_base64sha256
-  timeout          = 60 # Athena queries can take a few seconds
-  memory_size      = 128
+  layers           = [aws_lambda_layer_version.shared.arn]
+  timeout          = 60  # Athena queries can take a few seconds
+  memory_size      = 512 # CPU for the in-process engine scales with memory
 
   environment {
     variables = {
-      ATHENA_DATABASE  = aws_glue_catalog_database.suricata.name
-      ATHENA_TABLE     = aws_glue_catalog_table.suricata_events.name
-      ATHENA_WORKGROUP = aws_athena_workgroup.suricata.name
-      S3_BUCKET        = aws_s3_bucket.suricata_logs.bucket
-      RESULTS_BUCKET   = aws_s3_bucket.athena_results.bucket
+      ATHENA_DATABASE           = aws_glue_catalog_database.suricata.name
+      ATHENA_TABLE              = aws_glue_catalog_table.suricata_events.name
+      ATHENA_WORKGROUP          = aws_athena_workgroup.suricata.name
+      S3_BUCKET                 = aws_s3_bucket.suricata_logs.bucket
+      RESULTS_BUCKET            = aws_s3_bucket.athena_results.bucket
+      PARTITION_STATS_TABLE     = aws_dynamodb_table.partition_stats.name
+      CACHE_TTL_SECONDS         = "60"           # result cache lifetime for the still-open hour
+      CACHE_CLOSED_TTL_SECONDS  = "3600"         # closed hours with no data version to key on
+      INLINE_WAIT_SECONDS       = "20"           # GET /logs blocks this long before returning an execution id
+      RANGE_SPLIT_DAYS          = "3"            # longer from/to ranges run as concurrent per-day queries
+      LOCAL_ENGINE_MAX_BYTES    = "8388608"      # searches over less data than this skip Athena; "0" disables
+      LOCAL_ENGINE_MAX_OBJECTS  = "256"
+      QUERY_BUDGET_TABLE        = aws_dynamodb_table.query_budget.name
+      SCAN_BUDGET_REQUEST_BYTES = "10737418240"  # 10 GB: larger searches are narrowed to their newest hours
+      SCAN_BUDGET_DAILY_BYTES   = "107374182400" # 100 GB of Athena scans per UTC day
+      PROFILE_OUTPUT            = var.lambda_profile_output
+      PROFILE_SAMPLE_RATE       = var.lambda_profile_sample_rate
+      PROFILE_HEADER_SECRET     = var.lambda_profile_header_secret
+      METRICS_NAMESPACE         = "${var.project_name}/Api"
     }
   }
 
@@ -289,6 +356,30 @@ resource "aws_cloudwatch_log_group" "s3_log_query" {
   retention_in_days = 7
 }
 
+# ----------------------------------------------------------
+#            Daily partition backfill
+# ----------------------------------------------------------
+# Ingest registers partitions as it writes; this catches anything it
+# missed (e.g. Glue throttling) without touching the /logs request path.
+resource "aws_cloudwatch_event_rule" "partition_repair" {
+  name                = "${var.project_name}-eventbridge-partition-repair-${var.environment}"
+  schedule_expression = "rate(1 day)"
+}
+
+resource "aws_cloudwatch_event_target" "partition_repair" {
+  rule  = aws_cloudwatch_event_rule.partition_repair.name
+  arn   = aws_lambda_function.s3_log_query.arn
+  input = jsonencode({ action = "repair_partitions" })
+}
+
+resource "aws_lambda_permission" "partition_repair" {
+  statement_id  = "AllowEventBridgePartitionRepair"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.s3_log_query.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.partition_repair.arn
+}
+
 # ----------------------------------------------------------
 #            API Gateway Route - /logs
 # ----------------------------------------------------------
@@ -306,6 +397,25 @@ resource "aws_apigatewayv2_route" "s3_logs" {
   target    = "integrations/${aws_apigatewayv2_integration.s3_log_query.id}"
 }
 
+# Asynchronous search: submit, then poll by execution id
+resource "aws_apigatewayv2_route" "s3_logs_query_submit" {
+  api_id    = aws_apigatewayv2_api.suricata.id
+  route_key = "POST /logs/query"
+  target    = "integrations/${aws_apigatewayv2_integration.s3_log_query.id}"
+}
+
+resource "aws_apigatewayv2_route" "s3_logs_query_status" {
+  api_id    = aws_apigatewayv2_api.suricata.id
+  route_key = "GET /logs/query/{id}"
+  target    = "integrations/${aws_apigatewayv2_integration.s3_log_query.id}"
+}
+
+resource "aws_apigatewayv2_route" "s3_logs_query_export" {
+  api_id    = aws_apigatewayv2_api.suricata.id
+  route_key = "GET /logs/query/{id}/export"
+  target    = "integrations/${aws_apigatewayv2_integration.s3_log_query.id}"
+}
+
 resource "aws_lambda_permission" "apigw_log_query_invoke" {
   statement_id  = "AllowAPIGatewayInvokeLogQuery"
   action        = "lambda:InvokeFunction"
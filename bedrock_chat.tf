@@ -3,12 +3,39 @@
 #                     Bedrock Chat Configuration
 # ===========================================================
 # Description: AWS Bedrock-powered chat assistant for
-#             security analysis and threat intelligence
+#             security analysis and threat intelligence.
+#             Answers are streamed token by token over the
+#             realtime WebSocket API ("chat" route), and
+#             cached per question while the day's data is unchanged
 # 
 # Naming Convention: phantomwall-{resource}-{environment}
-# Last Updated: 2026-02-08
+# Last Updated: 2026-10-18
 # ===========================================================
 
+# Shared tier of the chat response cache; the in-container tier is always on.
+# Idle on-demand tables cost nothing, so it exists even when sharing is off.
+resource "aws_dynamodb_table" "chat_cache" {
+  name         = "${var.project_name}-dynamodb-chat-cache-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "cache_key"
+
+  attribute {
+    name = "cache_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
+  tags = {
+    Project = var.project_name
+    Env     = var.environment
+    Service = "chat-cache"
+  }
+}
+
 resource "aws_iam_role" "lambda_chat" {
   name = "${var.project_name}-lambda-chat-role-${var.environment}"
 
@@ -39,6 +66,11 @@ resource "aws_iam_role_policy" "lambda_chat" {
         ],
         Resource = aws_dynamodb_table.suricata_events.arn
       },
+      {
+        Effect   = "Allow",
+        Action   = "dynamodb:Query",
+        Resource = aws_dynamodb_table.partition_stats.arn
+      },
       {
         Effect = "Allow",
         Action = [
@@ -49,9 +81,25 @@ resource "aws_iam_role_policy" "lambda_chat" {
         Resource = "*"
       },
       {
-        Effect   = "Allow",
-        Action   = "bedrock:InvokeModel",
+        Effect = "Allow",
+        Action = [
+          "bedrock:InvokeModel",
+          "bedrock:InvokeModelWithResponseStream"
+        ],
         Resource = "*"
+      },
+      {
+        Effect   = "Allow",
+        Action   = "execute-api:ManageConnections",
+        Resource = "${aws_apigatewayv2_api.realtime.execution_arn}/*"
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem"
+        ],
+        Resource = aws_dynamodb_table.chat_cache.arn
       }
     ]
   })
@@ -70,14 +118,23 @@ resource "aws_lambda_function" "suricata_chat" {
   runtime          = "python3.11"
   filename         = data.archive_file.chat_lambda.output_path
   source_code_hash = data.archive_file.chat_lambda.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
   timeout          = 30
   memory_size      = 512
 
   environment {
     variables = {
-      TABLE_NAME       = aws_dynamodb_table.suricata_events.name
-      BEDROCK_MODEL_ID = var.bedrock_model_id
-      MAX_ITEMS        = var.chat_max_items
+      TABLE_NAME             = aws_dynamodb_table.suricata_events.name
+      BEDROCK_MODEL_ID       = var.bedrock_model_id
+      MAX_ITEMS              = var.chat_max_items
+      DIGEST_TOKEN_BUDGET    = var.chat_digest_token_budget
+      PARTITION_STATS_TABLE  = aws_dynamodb_table.partition_stats.name
+      CHAT_CACHE_TABLE       = var.chat_shared_cache ? aws_dynamodb_table.chat_cache.name : ""
+      CHAT_CACHE_TTL_SECONDS = var.chat_cache_ttl_seconds
+      WEBSOCKET_ENDPOINT     = "https://${aws_apigatewayv2_api.realtime.id}.execute-api.${var.aws_region}.amazonaws.com/${aws_apigatewayv2_stage.realtime.name}"
+      PROFILE_OUTPUT         = var.lambda_profile_output
+      PROFILE_SAMPLE_RATE    = var.lambda_profile_sample_rate
+      PROFILE_HEADER_SECRET  = var.lambda_profile_header_secret
     }
   }
 
@@ -91,3 +148,29 @@ resource "aws_cloudwatch_log_group" "suricata_chat" {
   name              = "/aws/lambda/${aws_lambda_function.suricata_chat.function_name}"
   retention_in_days = 7 # Reduced from 14 days for cost optimization
 }
+
+# ----------------------------------------------------------
+#            Streaming over the realtime WebSocket API
+# ----------------------------------------------------------
+# {"action": "chat", "prompt": "..."} is routed here; the answer comes back
+# as chat.telemetry / chat.delta / chat.done frames on the same connection
+resource "aws_apigatewayv2_integration" "chat_stream" {
+  api_id             = aws_apigatewayv2_api.realtime.id
+  integration_type   = "AWS_PROXY"
+  integration_uri    = aws_lambda_function.suricata_chat.invoke_arn
+  integration_method = "POST"
+}
+
+resource "aws_apigatewayv2_route" "realtime_chat" {
+  api_id    = aws_apigatewayv2_api.realtime.id
+  route_key = "chat"
+  target    = "integrations/${aws_apigatewayv2_integration.chat_stream.id}"
+}
+
+resource "aws_lambda_permission" "apigw_realtime_chat_invoke" {
+  statement_id  = "AllowAPIGatewayInvokeRealtimeChat"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.suricata_chat.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_apigatewayv2_api.realtime.execution_arn}/*/*"
+}
@@ -1,6 +1,9 @@
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect, useMemo, useRef } from 'react';
+import { useAlertStream } from './services/alertStream';
+import { createEventsPoller, mergeNewest } from './services/eventsPoll';
 
 const API_URL = import.meta.env.VITE_SURICATA_API_URL;
+const MAX_ROWS = 50;
 
 const AlertsLedger = () => {
   const [alerts, setAlerts] = useState([]);
@@ -21,11 +24,25 @@ const AlertsLedger = () => {
   const [responseTarget, setResponseTarget] = useState(null);
   const [responseStatus, setResponseStatus] = useState(null);
 
+  // New alerts arrive over the realtime socket; poll only while it is down
+  const live = useAlertStream({
+    onAlerts: (items) => {
+      const pushed = items.map(transformAlert).reverse();
+      setAlerts(prev => mergeNewest(pushed, prev, MAX_ROWS));
+      setLastUpdated(new Date());
+    },
+  });
+
+  const poller = useRef(null);
+  if (poller.current === null) poller.current = createEventsPoller({ limit: MAX_ROWS });
+
   useEffect(() => {
+    // One fetch on every (re)connect covers alerts missed while offline
     fetchAlerts();
+    if (live) return undefined;
     const interval = setInterval(fetchAlerts, 30000);
     return () => clearInterval(interval);
-  }, []);
+  }, [live]);
 
   const fetchAlerts = async () => {
     setIsRefreshing(true);
@@ -37,27 +54,12 @@ const AlertsLedger = () => {
     }
 
     try {
-      const response = await fetch(`${API_URL}/events?limit=50`);
-      if (!response.ok) throw new Error(`HTTP ${response.status}`);
-      const data = await response.json();
-
-      const transformedAlerts = (data.items || []).map((item, idx) => ({
-        id: item.alert_id || idx,
-        type: item.signature || item.category || 'Unknown Threat',
-        source: item.src_ip || 'Unknown',
-        country: item.country_name || (item.src_ip?.startsWith('10.') || item.src_ip?.startsWith('172.') || item.src_ip?.startsWith('192.168.') ? 'Private Network' : 'Unknown'),
-        flag: item.flag || '',
-        category: item.category || 'unknown',
-        action: item.action || item.alert_action || 'alerted',
-        severity: mapSeverity(item.severity),
-        time: formatTimestamp(item.timestamp),
-        raw_timestamp: item.timestamp,
-        dest_ip: item.dest_ip || 'Unknown',
-        dest_port: item.dest_port || '',
-        proto: item.proto || 'N/A',
-      }));
-
-      setAlerts(transformedAlerts);
+      // Only events newer than the newest row are fetched; 304 means none
+      const result = await poller.current.poll();
+      if (result) {
+        const transformedAlerts = result.items.map(transformAlert);
+        setAlerts(prev => (result.replace ? transformedAlerts : mergeNewest(transformedAlerts, prev, MAX_ROWS)));
+      }
       setError(null);
       setLastUpdated(new Date());
     } catch (err) {
@@ -69,6 +71,22 @@ const AlertsLedger = () => {
     }
   };
 
+  const transformAlert = (item, idx) => ({
+    id: item.event_id || item.alert_id || idx,
+    type: item.signature || item.category || 'Unknown Threat',
+    source: item.src_ip || 'Unknown',
+    country: item.country_name || (item.src_ip?.startsWith('10.') || item.src_ip?.startsWith('172.') || item.src_ip?.startsWith('192.168.') ? 'Private Network' : 'Unknown'),
+    flag: item.flag || '',
+    category: item.category || 'unknown',
+    action: item.action || item.alert_action || 'alerted',
+    severity: mapSeverity(item.severity),
+    time: formatTimestamp(item.timestamp),
+    raw_timestamp: item.timestamp,
+    dest_ip: item.dest_ip || 'Unknown',
+    dest_port: item.dest_port || '',
+    proto: item.proto || 'N/A',
+  });
+
   const mapSeverity = (sev) => {
     if (!sev) return 'low';
     const level = parseInt(sev, 10);
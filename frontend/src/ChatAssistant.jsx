@@ -1,6 +1,35 @@
 import React, { useEffect, useRef, useState } from "react"
 
 const API_URL = import.meta.env.VITE_SURICATA_API_URL
+// Realtime WebSocket API; when set, answers stream in token by token
+const WS_URL = import.meta.env.VITE_ALERTS_WS_URL
+
+// Sends {"action": "chat"} over the realtime API and feeds chat.delta frames to onText.
+function streamChat(prompt, onText) {
+  return new Promise((resolve, reject) => {
+    const requestId = `chat-${Date.now()}`
+    const ws = new WebSocket(WS_URL)
+    let answer = ""
+
+    ws.onopen = () => ws.send(JSON.stringify({ action: "chat", prompt, request_id: requestId }))
+    ws.onerror = () => reject(new Error("Chat stream connection failed"))
+    ws.onmessage = message => {
+      const frame = JSON.parse(message.data)
+      if (frame.request_id !== requestId) return
+      if (frame.type === "chat.delta") {
+        answer += frame.text
+        onText(answer)
+      } else if (frame.type === "chat.done") {
+        ws.close()
+        resolve(answer)
+      } else if (frame.type === "chat.error") {
+        ws.close()
+        reject(new Error(frame.error))
+      }
+    }
+    ws.onclose = () => resolve(answer)
+  })
+}
 
 export default function ChatAssistant() {
   const [isOpen, setIsOpen] = useState(false)
@@ -39,6 +68,16 @@ export default function ChatAssistant() {
     setIsSending(true)
 
     try {
+      if (WS_URL) {
+        const assistantId = `assistant-${Date.now()}`
+        setMessages(prev => [...prev, { id: assistantId, role: "assistant", content: "" }])
+        const update = content =>
+          setMessages(prev => prev.map(m => (m.id === assistantId ? { ...m, content } : m)))
+        const answer = await streamChat(prompt, update)
+        update(answer || "I couldn't find any relevant events.")
+        return
+      }
+
       if (!API_URL) {
         throw new Error("VITE_SURICATA_API_URL is not configured")
       }
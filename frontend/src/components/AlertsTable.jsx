@@ -1,7 +1,27 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './AlertsTable.css';
+import { useAlertStream } from '../services/alertStream';
+import { createEventsPoller, mergeNewest } from '../services/eventsPoll';
 
 const API_URL = import.meta.env.VITE_SURICATA_API_URL;
+const MAX_ROWS = 500;
+const IPV4_PATTERN = /^\d{1,3}(\.\d{1,3}){3}$/;
+
+// Map API fields to AlertsTable expected shape
+const toAlertRow = (item) => ({
+  id: item.event_id || item.flow_id?.toString() || Math.random().toString(),
+  timestamp: item.event_time || item.suricata?.timestamp || '',
+  severity: item.severity || item.suricata?.alert?.severity || 3,
+  sourceIP: item.src_ip || item.suricata?.src_ip || '',
+  destIP: item.dest_ip || item.suricata?.dest_ip || '',
+  signature: item.signature || item.suricata?.alert?.signature || 'Unknown',
+  category: item.category || item.suricata?.alert?.category || 'unknown',
+  action: item.suricata?.alert?.action || 'alerted',
+  flow_id: item.flow_id || 0,
+  proto: item.proto || item.suricata?.proto || '',
+  src_port: item.src_port || item.suricata?.src_port || 0,
+  dest_port: item.dest_port || item.suricata?.dest_port || 0,
+});
 
 const AlertsTable = () => {
   const [alerts, setAlerts] = useState([]);
@@ -14,11 +34,32 @@ const AlertsTable = () => {
     alertType: 'all'
   });
 
+  // New alerts are pushed over the realtime socket; the server-side filter is
+  // a superset (severity <= N, exact IP) and filterAlerts narrows it
+  const live = useAlertStream({
+    severity: filters.severity === 'all' ? null : parseInt(filters.severity),
+    srcIp: IPV4_PATTERN.test(filters.sourceIP) ? filters.sourceIP : '',
+    onAlerts: (items) => {
+      const pushed = filterAlerts(items.map(toAlertRow));
+      if (pushed.length === 0) return;
+      setAlerts(prev => mergeNewest(pushed.reverse(), prev, MAX_ROWS));
+    },
+  });
+
+  // Slim projection: the table only renders top-level alert attributes
+  const poller = useRef(null);
+  if (poller.current === null) poller.current = createEventsPoller({ fields: 'slim' });
+
+  // Rows on screen were narrowed by the old filters: reload them in full
+  useEffect(() => poller.current.reset(), [filters]);
+
   useEffect(() => {
+    // One fetch on every (re)connect covers alerts missed while offline
     fetchAlerts();
-    const interval = setInterval(fetchAlerts, 30000); // Refresh every 30 seconds
+    if (live) return undefined;
+    const interval = setInterval(fetchAlerts, 30000); // Poll only while the socket is down
     return () => clearInterval(interval);
-  }, [filters]);
+  }, [filters, live]);
 
   const fetchAlerts = async () => {
     try {
@@ -28,38 +69,12 @@ const AlertsTable = () => {
         return;
       }
 
-      const response = await fetch(`${API_URL}/events`);
-      const data = await response.json();
-
-      // Flatten the API response — items may be nested under date groups
-      let allItems = [];
-      if (data.items) {
-        allItems = data.items;
-      } else if (Array.isArray(data)) {
-        allItems = data;
-      } else if (data.event_date) {
-        // Single date group response
-        allItems = data.items || [];
+      // Only events newer than the newest row are fetched; 304 means none
+      const result = await poller.current.poll();
+      if (result) {
+        const mapped = filterAlerts(result.items.map(toAlertRow));
+        setAlerts(prev => (result.replace ? mapped : filterAlerts(mergeNewest(mapped, prev, MAX_ROWS))));
       }
-
-      // Map API fields to AlertsTable expected shape
-      const mapped = allItems.map(item => ({
-        id: item.event_id || item.flow_id?.toString() || Math.random().toString(),
-        timestamp: item.event_time || item.suricata?.timestamp || '',
-        severity: item.severity || item.suricata?.alert?.severity || 3,
-        sourceIP: item.src_ip || item.suricata?.src_ip || '',
-        destIP: item.dest_ip || item.suricata?.dest_ip || '',
-        signature: item.signature || item.suricata?.alert?.signature || 'Unknown',
-        category: item.category || item.suricata?.alert?.category || 'unknown',
-        action: item.suricata?.alert?.action || 'alerted',
-        flow_id: item.flow_id || 0,
-        proto: item.proto || item.suricata?.proto || '',
-        src_port: item.src_port || item.suricata?.src_port || 0,
-        dest_port: item.dest_port || item.suricata?.dest_port || 0,
-      }));
-
-      const filteredData = filterAlerts(mapped);
-      setAlerts(filteredData);
       setError(null);
     } catch (err) {
       setError('Failed to fetch alerts: ' + err.message);
@@ -152,6 +167,7 @@ const AlertsTable = () => {
         <h3>🚨 Security Alerts</h3>
         <div className="alerts-meta">
           <span className="alert-count">{alerts.length} alerts</span>
+          {live && <span className="refreshing">Live</span>}
           {loading && <span className="refreshing">Refreshing...</span>}
         </div>
       </div>
@@ -0,0 +1,106 @@
+// ==========================================
+// 🚨 PhantomWall Dashboard - Realtime Alert Push
+// ==========================================
+// Client for the realtime WebSocket API (lambda/alert_stream). New alerts
+// are pushed as {"type": "alerts", "items": [...]} so views only poll
+// /events while the socket is down.
+// ==========================================
+
+import { useEffect, useRef, useState } from 'react'
+
+const WS_URL = import.meta.env.VITE_ALERTS_WS_URL
+const RETRY_INITIAL_MS = 1000
+const RETRY_MAX_MS = 30000
+
+function subscribeMessage({ severity, srcIp }) {
+  const message = { action: 'subscribe' }
+  if (severity != null) message.severity = severity
+  if (srcIp) message.src_ip = srcIp
+  return JSON.stringify(message)
+}
+
+/**
+ * Open the alert stream and keep it open, reconnecting with backoff.
+ * filters: { severity, srcIp } — severity N pushes alerts with severity <= N.
+ * Returns { subscribe(filters), close() }.
+ */
+export function connectAlertStream(filters, { onAlerts, onStatus }) {
+  let current = filters
+  let socket = null
+  let retryMs = RETRY_INITIAL_MS
+  let retryTimer = null
+  let closed = false
+
+  const open = () => {
+    socket = new WebSocket(WS_URL)
+    socket.onopen = () => {
+      retryMs = RETRY_INITIAL_MS
+      socket.send(subscribeMessage(current))
+      onStatus(true)
+    }
+    socket.onmessage = event => {
+      let frame
+      try {
+        frame = JSON.parse(event.data)
+      } catch {
+        return
+      }
+      if (frame.type === 'alerts' && Array.isArray(frame.items)) {
+        onAlerts(frame.items)
+      }
+    }
+    socket.onerror = () => socket.close()
+    socket.onclose = () => {
+      if (closed) return
+      onStatus(false)
+      retryTimer = setTimeout(open, retryMs)
+      retryMs = Math.min(retryMs * 2, RETRY_MAX_MS)
+    }
+  }
+
+  open()
+
+  return {
+    subscribe(filters) {
+      current = filters
+      if (socket && socket.readyState === WebSocket.OPEN) {
+        socket.send(subscribeMessage(current))
+      }
+    },
+    close() {
+      closed = true
+      clearTimeout(retryTimer)
+      if (socket) socket.close()
+    },
+  }
+}
+
+/**
+ * React hook around connectAlertStream. Returns true while the socket is
+ * open; callers poll /events whenever it is false (or no WS URL is set).
+ */
+export function useAlertStream({ severity = null, srcIp = '', onAlerts }) {
+  const [live, setLive] = useState(false)
+  const onAlertsRef = useRef(onAlerts)
+  const streamRef = useRef(null)
+  onAlertsRef.current = onAlerts
+
+  useEffect(() => {
+    if (!WS_URL) return undefined
+    const stream = connectAlertStream(
+      { severity, srcIp },
+      { onAlerts: items => onAlertsRef.current(items), onStatus: setLive }
+    )
+    streamRef.current = stream
+    return () => {
+      streamRef.current = null
+      stream.close()
+    }
+  }, [])
+
+  useEffect(() => {
+    if (streamRef.current) streamRef.current.subscribe({ severity, srcIp })
+  }, [severity, srcIp])
+
+  return live
+}
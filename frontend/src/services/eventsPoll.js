@@ -0,0 +1,74 @@
+// ==========================================
+// 🚨 PhantomWall Dashboard - Incremental /events Polling
+// ==========================================
+// Polls GET /events without re-downloading the whole page each time. After
+// the first load a poll only asks for events newer than the newest one held
+// (`since`) and revalidates with If-None-Match, so an idle poll is a 304.
+// ==========================================
+
+const API_URL = import.meta.env.VITE_SURICATA_API_URL
+
+// event_id is `%Y%m%dT%H%M%S.%f_<suffix>` in UTC (see suricata_ingest)
+const EVENT_ID_PATTERN = /^(\d{4})(\d{2})(\d{2})T(\d{2})(\d{2})(\d{2})\.(\d{3})/
+
+/** Epoch milliseconds of an /events item, or null if it has no usable time. */
+export function eventTimeMs(item) {
+  const match = EVENT_ID_PATTERN.exec(item?.event_id || '')
+  if (match) {
+    const [, year, month, day, hour, minute, second, ms] = match.map(Number)
+    return Date.UTC(year, month - 1, day, hour, minute, second, ms)
+  }
+  const parsed = Date.parse(item?.event_time || item?.timestamp || '')
+  return Number.isNaN(parsed) ? null : parsed
+}
+
+/**
+ * Merge newly fetched rows in front of the ones already shown: newer rows
+ * win on id, order is newest first and the result is capped at maxRows.
+ */
+export function mergeNewest(fresh, current, maxRows) {
+  const ids = new Set(fresh.map(row => row.id))
+  return [...fresh, ...current.filter(row => !ids.has(row.id))].slice(0, maxRows)
+}
+
+/**
+ * Poller for GET /events with fixed query params, e.g. { fields: 'slim' }.
+ * poll() resolves to null when nothing changed (304), otherwise to
+ * { items, replace }. replace is true for a full page (first load, after
+ * reset(), or when more events arrived than one page holds) and false when
+ * items are only the new events to merge with mergeNewest.
+ */
+export function createEventsPoller(params = {}) {
+  let etag = null
+  let newestMs = null
+
+  const reset = () => {
+    etag = null
+    newestMs = null
+  }
+
+  const poll = async () => {
+    const query = new URLSearchParams(params)
+    const incremental = newestMs != null
+    // since is exclusive; step back 1 ms so events sharing the newest one's
+    // millisecond are not skipped (mergeNewest drops the repeat)
+    if (incremental) query.set('since', String(newestMs - 1))
+    const headers = etag ? { 'If-None-Match': etag } : {}
+
+    const response = await fetch(`${API_URL}/events?${query}`, { headers })
+    if (response.status === 304) return null
+    if (!response.ok) throw new Error(`HTTP ${response.status}`)
+    const data = await response.json()
+    const items = data.items || []
+
+    etag = response.headers.get('ETag')
+    for (const item of items) {
+      const ms = eventTimeMs(item)
+      if (ms != null && (newestMs == null || ms > newestMs)) newestMs = ms
+    }
+    // A full page of new events may have left a gap behind it: show it as is
+    return { items, replace: !incremental || Boolean(data.next_cursor) }
+  }
+
+  return { poll, reset }
+}
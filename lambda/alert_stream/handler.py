@@ -0,0 +1,187 @@
+"""
+================================================================================
+PhantomWall Realtime Alert Push Lambda
+================================================================================
+Purpose: Pushes new alerts to open dashboards over an API Gateway WebSocket
+         instead of having AlertsLedger / AlertsTable poll /events
+         (client: frontend/src/services/alertStream.js).
+
+Triggers:
+  - DynamoDB Stream on the events table (INSERT records only)
+  - WebSocket routes on the realtime API:
+      $connect     store the connection and its filters
+      $disconnect  forget the connection
+      $default     {"action": "subscribe", "severity": 2, "src_ip": "..."}
+                   replaces the connection's filters
+
+Connection filters (query string on connect, or a subscribe message):
+  - severity (optional)  Only alerts with severity <= N (Suricata: 1 = highest)
+  - src_ip   (optional)  Only alerts from this source IP
+
+Each stream batch is fanned out as one message per matching connection:
+  {"type": "alerts", "items": [...]}
+================================================================================
+"""
+
+import json
+import os
+import time
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+from phantomwall import aws, profiling
+from phantomwall.responses import encode_json
+
+CONNECTIONS_TABLE_NAME = os.environ["CONNECTIONS_TABLE_NAME"]
+WEBSOCKET_ENDPOINT = os.environ.get("WEBSOCKET_ENDPOINT", "")
+
+# API Gateway closes WebSocket connections after 2 hours; expire rows to match
+CONNECTION_TTL_SECONDS = 2 * 60 * 60
+
+_connections_table = aws.table(CONNECTIONS_TABLE_NAME)
+# Only stream batches post to connections; $connect/$disconnect never do
+_management = aws.client("apigatewaymanagementapi", endpoint_url=WEBSOCKET_ENDPOINT) if WEBSOCKET_ENDPOINT else None
+aws.prewarm(_connections_table)
+
+_deserializer = TypeDeserializer()
+
+
+def _ws_response(status_code, message=""):
+    return {"statusCode": status_code, "body": message}
+
+
+def _parse_filters(source):
+    """Normalise severity/src_ip filters from a query string or message."""
+    filters = {}
+    severity = source.get("severity")
+    if severity not in (None, ""):
+        try:
+            filters["severity"] = int(severity)
+        except (TypeError, ValueError):
+            raise ValueError("severity must be an integer") from None
+    src_ip = source.get("src_ip")
+    if src_ip:
+        filters["src_ip"] = str(src_ip).strip()
+    return filters
+
+
+def _save_connection(connection_id, filters):
+    item = {
+        "connection_id": connection_id,
+        "expires_at": int(time.time()) + CONNECTION_TTL_SECONDS,
+        **filters,
+    }
+    _connections_table.put_item(Item=item)
+
+
+def _handle_websocket(event):
+    request_context = event.get("requestContext") or {}
+    route_key = request_context.get("routeKey")
+    connection_id = request_context.get("connectionId")
+
+    if route_key == "$connect":
+        try:
+            filters = _parse_filters(event.get("queryStringParameters") or {})
+        except ValueError as e:
+            return _ws_response(400, str(e))
+        _save_connection(connection_id, filters)
+        return _ws_response(200)
+
+    if route_key == "$disconnect":
+        _connections_table.delete_item(Key={"connection_id": connection_id})
+        return _ws_response(200)
+
+    # $default: subscription updates
+    try:
+        message = json.loads(event.get("body") or "{}")
+        if message.get("action") != "subscribe":
+            return _ws_response(400, "Unsupported action")
+        filters = _parse_filters(message)
+    except (ValueError, AttributeError) as e:
+        return _ws_response(400, str(e))
+    _save_connection(connection_id, filters)
+    return _ws_response(200)
+
+
+def _alerts_from_stream(records):
+    """Decode INSERT images into the slim shape the dashboard renders."""
+    alerts = []
+    for record in records:
+        if record.get("eventName") != "INSERT":
+            continue
+        image = (record.get("dynamodb") or {}).get("NewImage")
+        if not image:
+            continue
+        item = {key: _deserializer.deserialize(value) for key, value in image.items()}
+        suricata = item.pop("suricata", None) or {}
+        action = (suricata.get("alert") or {}).get("action")
+        if action:
+            item["suricata"] = {"alert": {"action": action}}
+        alerts.append(item)
+    alerts.sort(key=lambda item: item.get("timestamp") or 0)
+    return alerts
+
+
+def _matches(connection, alert):
+    severity = connection.get("severity")
+    if severity is not None:
+        alert_severity = alert.get("severity")
+        if alert_severity is None or alert_severity > severity:
+            return False
+    src_ip = connection.get("src_ip")
+    if src_ip and alert.get("src_ip") != src_ip:
+        return False
+    return True
+
+
+def _iter_connections():
+    kwargs = {}
+    while True:
+        response = _connections_table.scan(**kwargs)
+        for item in response.get("Items", []):
+            yield item
+        last_evaluated = response.get("LastEvaluatedKey")
+        if not last_evaluated:
+            break
+        kwargs["ExclusiveStartKey"] = last_evaluated
+
+
+def _fan_out(alerts):
+    delivered = 0
+    stale = 0
+    if not alerts or _management is None:
+        return {"connections": 0, "delivered": 0, "stale": 0}
+
+    connections = 0
+    for connection in _iter_connections():
+        connections += 1
+        matching = [alert for alert in alerts if _matches(connection, alert)]
+        if not matching:
+            continue
+        payload = encode_json({"type": "alerts", "items": matching}).encode("utf-8")
+        try:
+            _management.post_to_connection(ConnectionId=connection["connection_id"], Data=payload)
+            delivered += 1
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "GoneException":
+                print(f"Push to {connection['connection_id']} failed: {e}")
+                continue
+            # Client went away without a clean $disconnect
+            _connections_table.delete_item(Key={"connection_id": connection["connection_id"]})
+            stale += 1
+
+    return {"connections": connections, "delivered": delivered, "stale": stale}
+
+
+@profiling.profiled
+def handler(event, context):
+    event = event or {}
+    aws.reset_counters()
+
+    if "Records" in event:
+        alerts = _alerts_from_stream(event["Records"])
+        result = _fan_out(alerts)
+        return {"statusCode": 200, "alerts": len(alerts), **result, "aws": aws.counters()}
+
+    return _handle_websocket(event)
@@ -1,99 +1,605 @@
+import base64
+import hashlib
 import json
 import os
 import time
-from decimal import Decimal
+from collections import Counter, OrderedDict
 
-import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from phantomwall import aws, partition_stats, profiling
+from phantomwall.responses import encode_json, json_response
 
 DDB_TABLE = os.environ["TABLE_NAME"]
 BEDROCK_MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0")
-MAX_ITEMS = int(os.environ.get("MAX_ITEMS", "25"))
+# Representative raw events included alongside the aggregates
+MAX_ITEMS = int(os.environ.get("MAX_ITEMS", "5"))
+# Rough prompt size the telemetry digest must fit in (~4 characters per token)
+DIGEST_TOKEN_BUDGET = int(os.environ.get("DIGEST_TOKEN_BUDGET", "1500"))
+# Stop reading after this many events so a flood day cannot time the Lambda out
+DIGEST_MAX_EVENTS = int(os.environ.get("DIGEST_MAX_EVENTS", "50000"))
+DIGEST_TOP_N = 10
+CHARS_PER_TOKEN = 4
+# Streaming: a delta frame is sent once this much text or time has built up
+STREAM_FLUSH_CHARS = int(os.environ.get("STREAM_FLUSH_CHARS", "24"))
+STREAM_FLUSH_SECONDS = 0.1
+WEBSOCKET_ENDPOINT = os.environ.get("WEBSOCKET_ENDPOINT", "")
+# Response cache: an answer is reused for the same normalized question and
+# window while the day's data version (newest ingest stamp) is unchanged
+CHAT_CACHE_TTL_SECONDS = int(os.environ.get("CHAT_CACHE_TTL_SECONDS", "900"))
+CHAT_CACHE_MEMORY_ENTRIES = int(os.environ.get("CHAT_CACHE_MEMORY_ENTRIES", "128"))
+CHAT_CACHE_MAX_BYTES = 64 * 1024  # bigger answers are not cached (DynamoDB items cap at 400 KB)
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(DDB_TABLE)
+# Only what the digest uses; the raw `suricata` map is never read
+DIGEST_ATTRIBUTES = (
+    "event_time", "timestamp", "event_type", "src_ip", "src_port", "dest_ip", "dest_port",
+    "proto", "severity", "signature", "signature_id", "category", "summary", "country_code",
+)
 
-bedrock = boto3.client("bedrock-runtime")
+table = aws.table(DDB_TABLE)
 
-def _decimal_to_native(value):
-    if isinstance(value, list):
-        return [_decimal_to_native(v) for v in value]
-    if isinstance(value, dict):
-        return {k: _decimal_to_native(v) for k, v in value.items()}
-    if isinstance(value, Decimal):
-        return float(value)
-    return value
+_partition_stats_table_name = os.environ.get("PARTITION_STATS_TABLE")
+_partition_stats_table = aws.table(_partition_stats_table_name) if _partition_stats_table_name else None
+# Optional shared tier so warm containers reuse each other's answers
+_chat_cache_table_name = os.environ.get("CHAT_CACHE_TABLE")
+_chat_cache_table = aws.table(_chat_cache_table_name) if _chat_cache_table_name else None
 
+bedrock = aws.client("bedrock-runtime")
+_management = aws.client("apigatewaymanagementapi", endpoint_url=WEBSOCKET_ENDPOINT) if WEBSOCKET_ENDPOINT else None
+# Every request reads DynamoDB; Bedrock is skipped on cache hits and the
+# management API is only used by the streaming route
+aws.prewarm(table)
 
-def _query_events(event_date: str):
-    # Most recent events first
-    response = table.query(
-        KeyConditionExpression=boto3.dynamodb.conditions.Key("event_date").eq(event_date),
-        ScanIndexForward=False,
-        Limit=MAX_ITEMS,
-    )
-    return [_decimal_to_native(item) for item in response.get("Items", [])]
+# Per-container response cache (survives warm invocations) and its counters
+_response_cache = OrderedDict()
+_cache_stats = {"lookups": 0, "hits": 0, "model_ms_saved": 0}
 
 
-def _build_prompt(user_prompt: str, events: list[dict]):
-    if not events:
-        return (
-            "You are a SOC assistant. No events matched the query. "
-            "Respond politely that no telemetry is available."
-        )
+def _request_window(payload):
+    """(from_hour, to_hour, token_budget) from the request; hours may be None."""
+    from_hour, to_hour = payload.get("from_hour"), payload.get("to_hour")
+    if payload.get("hour") is not None:
+        from_hour = to_hour = payload["hour"]
+    hours = []
+    for value in (from_hour, to_hour):
+        if value is None:
+            hours.append(None)
+            continue
+        try:
+            hour = int(value)
+        except (TypeError, ValueError):
+            raise ValueError("hour, from_hour and to_hour must be 0-23") from None
+        if not 0 <= hour <= 23:
+            raise ValueError("hour, from_hour and to_hour must be 0-23")
+        hours.append(hour)
+    try:
+        token_budget = int(payload.get("token_budget") or DIGEST_TOKEN_BUDGET)
+    except (TypeError, ValueError):
+        raise ValueError("token_budget must be an integer") from None
+    return hours[0], hours[1], max(100, token_budget)
+
+
+def _window_condition(event_date: str, from_hour=None, to_hour=None):
+    """Key condition for a day, or hours [from_hour, to_hour] of it.
+
+    event_id starts with the event time (YYYYMMDDTHHMMSS.ffffff_...), so an
+    hour window is a range on the sort key.
+    """
+    condition = Key("event_date").eq(event_date)
+    if from_hour is None and to_hour is None:
+        return condition
+    day = event_date.replace("-", "")
+    first = from_hour if from_hour is not None else 0
+    last = to_hour if to_hour is not None else 23
+    return condition & Key("event_id").between(f"{day}T{first:02d}", f"{day}T{last:02d}~")
+
+
+def _iter_events(event_date: str, from_hour=None, to_hour=None):
+    """Stream a day's (or window's) events, newest first, page by page."""
+    kwargs = {
+        "KeyConditionExpression": _window_condition(event_date, from_hour, to_hour),
+        "ScanIndexForward": False,
+        "ProjectionExpression": ", ".join(f"#a{i}" for i in range(len(DIGEST_ATTRIBUTES))),
+        "ExpressionAttributeNames": {f"#a{i}": name for i, name in enumerate(DIGEST_ATTRIBUTES)},
+    }
+    while True:
+        response = table.query(**kwargs)
+        yield from response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def _event_hour(evt):
+    event_time = evt.get("event_time")
+    if event_time:
+        return event_time[11:13]
+    return time.strftime("%H", time.gmtime(float(evt.get("timestamp", 0)) / 1000))
+
 
-    context_lines = []
+def _signature(evt):
+    signature = evt.get("signature")
+    if signature:
+        return signature
+    if evt.get("signature_id") is not None:
+        return f"sid:{int(evt['signature_id'])}"
+    return None
+
+
+def _build_digest(events):
+    """Fold an event stream into counters plus one sample per signature.
+
+    Samples keep the first (newest) event seen for each signature, or event
+    type when there is none.
+    """
+    digest = {
+        "events": 0,
+        "capped": False,
+        "event_types": Counter(),
+        "src_ips": Counter(),
+        "signatures": Counter(),
+        "dest_ports": Counter(),
+        "hours": Counter(),
+        "severities": Counter(),
+        "countries": {},
+        "samples": {},
+    }
     for evt in events:
-        summary = evt.get("summary", "suricata event")
-        event_time = evt.get("event_time") or time.strftime(
-            "%Y-%m-%dT%H:%M:%SZ", time.gmtime(evt.get("timestamp", 0) / 1000)
+        if digest["events"] >= DIGEST_MAX_EVENTS:
+            digest["capped"] = True
+            break
+        digest["events"] += 1
+        digest["event_types"][evt.get("event_type") or "unknown"] += 1
+        digest["hours"][_event_hour(evt)] += 1
+        src_ip = evt.get("src_ip")
+        if src_ip:
+            digest["src_ips"][src_ip] += 1
+            if evt.get("country_code"):
+                digest["countries"].setdefault(src_ip, evt["country_code"])
+        signature = _signature(evt)
+        if signature:
+            digest["signatures"][signature] += 1
+        if evt.get("dest_port") is not None:
+            digest["dest_ports"][int(evt["dest_port"])] += 1
+        if evt.get("severity") is not None:
+            digest["severities"][int(evt["severity"])] += 1
+        digest["samples"].setdefault(signature or evt.get("event_type"), evt)
+    return digest
+
+
+def _pick_samples(digest, count):
+    """Most severe first (Suricata severity 1 is highest), then most frequent signature."""
+    def _rank(item):
+        key, evt = item
+        severity = int(evt["severity"]) if evt.get("severity") is not None else 99
+        return severity, -digest["signatures"].get(key, 0)
+
+    return [evt for _, evt in sorted(digest["samples"].items(), key=_rank)[:count]]
+
+
+def _format_sample(evt):
+    event_time = evt.get("event_time") or time.strftime(
+        "%Y-%m-%dT%H:%M:%SZ", time.gmtime(float(evt.get("timestamp", 0)) / 1000)
+    )
+    return (
+        f"- time: {event_time}, type: {evt.get('event_type')}, src: {evt.get('src_ip')}:{evt.get('src_port')}, "
+        f"dest: {evt.get('dest_ip')}:{evt.get('dest_port')}, severity: {evt.get('severity')}, "
+        f"summary: {evt.get('summary', 'suricata event')}"
+    )
+
+
+def _render_digest(digest, top_n, sample_count):
+    def _top(counter, label=str):
+        return ", ".join(f"{label(key)} ({count})" for key, count in counter.most_common(top_n))
+
+    def _ip(ip):
+        country = digest["countries"].get(ip)
+        return f"{ip} [{country}]" if country else ip
+
+    lines = [
+        f"Events summarized: {digest['events']}" + (f" of more than {digest['events']} matched" if digest["capped"] else ""),
+        f"Event types: {_top(digest['event_types'])}",
+        f"Top attacker IPs: {_top(digest['src_ips'], _ip)}",
+        f"Top signatures: {_top(digest['signatures'])}",
+        f"Top destination ports: {_top(digest['dest_ports'])}",
+        f"Severity counts: {', '.join(f'{s}: {n}' for s, n in sorted(digest['severities'].items()))}",
+        f"Events per hour (UTC): {', '.join(f'{h}h: {n}' for h, n in sorted(digest['hours'].items()))}",
+    ]
+    samples = _pick_samples(digest, sample_count)
+    if samples:
+        lines.append("Representative events:")
+        lines.extend(_format_sample(evt) for evt in samples)
+    return "\n".join(lines), samples
+
+
+def _fit_digest(digest, token_budget):
+    """Render the digest, trimming top-N lists and samples until it fits the budget.
+
+    Returns (text, samples, estimated tokens, entries kept per top-N list).
+    """
+    top_n, sample_count = DIGEST_TOP_N, MAX_ITEMS
+    while True:
+        text, samples = _render_digest(digest, top_n, sample_count)
+        tokens = len(text) // CHARS_PER_TOKEN + 1
+        if tokens <= token_budget or (top_n <= 1 and sample_count == 0):
+            return text, samples, tokens, top_n
+        if sample_count > 0:
+            sample_count -= 1
+        else:
+            top_n = max(1, top_n // 2)
+
+
+def _coverage_note(digest, top_n):
+    """Tell the model how complete the digest is, so partial counts are not read as totals."""
+    summarized = digest["events"]
+    if not digest["capped"] and top_n >= DIGEST_TOP_N:
+        return " The telemetry below aggregates every event in the requested period; counts are exact."
+
+    note = " The telemetry below is partial."
+    if digest["capped"]:
+        note += (
+            f" More than {summarized} events matched, but only the newest {summarized} were summarized"
+            f" (the digest stops at {DIGEST_MAX_EVENTS}). Every count covers those {summarized} events only:"
+            " present counts as lower bounds (\"at least\"), never as totals for the period."
         )
-        context_lines.append(
-            f"- time: {event_time}, type: {evt.get('event_type')}, src: {evt.get('src_ip')}:{evt.get('src_port')}, "
-            f"dest: {evt.get('dest_ip')}:{evt.get('dest_port')}, severity: {evt.get('severity')}, summary: {summary}"
+    if top_n < DIGEST_TOP_N:
+        note += (
+            f" To fit the prompt, top lists were cut to {top_n} entries each; other IPs, signatures"
+            " and ports exist but are not listed."
         )
+    return note
 
-    context_block = "\n".join(context_lines)
+
+def _build_prompt(user_prompt: str, digest_text: str, digest, top_n=DIGEST_TOP_N):
+    if not digest["events"]:
+        return (
+            "You are a SOC assistant. No events matched the query. "
+            "Respond politely that no telemetry is available."
+        )
 
     return (
         "You are an expert security analyst. Summarise relevant honeypot activity for the user."
         " Focus on attacker IPs, ports, event types, and severity."
-        "\nTelemetry:\n"
-        f"{context_block}\n\n"
+        + _coverage_note(digest, top_n)
+        + "\nTelemetry:\n"
+        f"{digest_text}\n\n"
         f"User question: {user_prompt}\n"
         "If the question requests specific IPs or counts, reference the telemetry above."
     )
 
 
+def _bedrock_body(prompt: str):
+    return json.dumps(
+        {
+            "anthropic_version": "bedrock-2023-05-31",
+            "temperature": 0.2,
+            "top_p": 0.9,
+            "max_tokens": 600,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [{"type": "text", "text": prompt}],
+                }
+            ],
+        }
+    )
+
+
+def _parse_request(payload):
+    """Validated request fields; raises ValueError for a bad window."""
+    event_date = payload.get("event_date")
+    if not event_date:
+        event_date = time.strftime("%Y-%m-%d", time.gmtime())
+    from_hour, to_hour, token_budget = _request_window(payload)
+    return {
+        "user_prompt": payload.get("prompt") or "What happened recently?",
+        "event_date": event_date,
+        "from_hour": from_hour,
+        "to_hour": to_hour,
+        "token_budget": token_budget,
+        "no_cache": bool(payload.get("no_cache")),
+    }
+
+
+def _prepare(request):
+    """Digest the requested window and build the model prompt."""
+    digest = _build_digest(_iter_events(request["event_date"], request["from_hour"], request["to_hour"]))
+    digest_text, events, digest_tokens, top_n = _fit_digest(digest, request["token_budget"])
+    return {
+        "prompt": _build_prompt(request["user_prompt"], digest_text, digest, top_n),
+        "events": events,
+        "digest": {
+            "events_summarized": digest["events"],
+            "capped": digest["capped"],
+            "top_n": top_n,
+            "estimated_tokens": digest_tokens,
+            "token_budget": request["token_budget"],
+        },
+    }
+
+
+def _normalize_prompt(prompt: str):
+    """Case, whitespace and trailing punctuation do not change the question."""
+    return " ".join(prompt.lower().split()).rstrip("?!. ")
+
+
+def _data_version(event_date: str):
+    """Newest ingest stamp for the day, or None when it cannot be read."""
+    if _partition_stats_table is None:
+        return None
+    try:
+        return partition_stats.data_version(partition_stats.day_items(_partition_stats_table, event_date))
+    except ClientError as e:
+        print(f"Data version lookup warning: {e}")
+        return None
+
+
+def _cache_get(key):
+    """Look up a cached answer in memory, then the shared table. Returns (entry, tier)."""
+    now = time.time()
+    cached = _response_cache.get(key)
+    if cached:
+        if cached[0] > now:
+            _response_cache.move_to_end(key)
+            return cached[1], "memory"
+        del _response_cache[key]
+
+    if _chat_cache_table is None:
+        return None, None
+    try:
+        item = _chat_cache_table.get_item(Key={"cache_key": key}).get("Item")
+    except ClientError as e:
+        print(f"Chat cache read warning: {e}")
+        return None, None
+    # DynamoDB TTL deletes lazily; an expired item may still be returned
+    if not item or int(item.get("ttl", 0)) <= now:
+        return None, None
+    entry = json.loads(item["entry"])
+    _cache_put_memory(key, int(item["ttl"]), entry)
+    return entry, "dynamodb"
+
+
+def _cache_put_memory(key, expires_at, entry):
+    _response_cache[key] = (expires_at, entry)
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > CHAT_CACHE_MEMORY_ENTRIES:
+        _response_cache.popitem(last=False)
+
+
+def _cache_put(key, entry):
+    encoded = encode_json(entry)
+    if len(encoded) > CHAT_CACHE_MAX_BYTES:
+        return
+    expires_at = int(time.time()) + CHAT_CACHE_TTL_SECONDS
+    _cache_put_memory(key, expires_at, json.loads(encoded))
+    if _chat_cache_table is None:
+        return
+    try:
+        _chat_cache_table.put_item(Item={"cache_key": key, "entry": encoded, "ttl": expires_at})
+    except ClientError as e:
+        # The memory tier still holds it; a failed write only costs a model call
+        print(f"Chat cache write warning: {e}")
+
+
+def _cache_lookup(request):
+    """Resolve the request's cache key and any cached answer.
+
+    Returns {"key", "data_version", "entry", "tier"}; key is None when the
+    request bypasses the cache (no_cache, or no data version to key on).
+    """
+    lookup = {"key": None, "data_version": None, "entry": None, "tier": None}
+    if request["no_cache"]:
+        return lookup
+    version = _data_version(request["event_date"])
+    if version is None:
+        return lookup
+    parts = (
+        _normalize_prompt(request["user_prompt"]), request["event_date"], version,
+        request["from_hour"], request["to_hour"], request["token_budget"], BEDROCK_MODEL_ID,
+    )
+    lookup["key"] = hashlib.sha256("|".join(map(str, parts)).encode("utf-8")).hexdigest()
+    lookup["data_version"] = version
+    lookup["entry"], lookup["tier"] = _cache_get(lookup["key"])
+
+    _cache_stats["lookups"] += 1
+    if lookup["entry"]:
+        _cache_stats["hits"] += 1
+        _cache_stats["model_ms_saved"] += lookup["entry"]["model_ms"]
+    return lookup
+
+
+def _cache_block(lookup):
+    """The response's `cache` block; hit rate and savings are for this container."""
+    entry = lookup["entry"]
+    if lookup["key"] is None:
+        status = "bypass"
+    else:
+        status = "hit" if entry else "miss"
+    lookups = _cache_stats["lookups"]
+    return {
+        "status": status,
+        "tier": lookup["tier"],
+        "data_version": lookup["data_version"],
+        "model_ms_saved": entry["model_ms"] if entry else 0,
+        "hit_rate": round(_cache_stats["hits"] / lookups, 3) if lookups else 0.0,
+        "lookups": lookups,
+        "model_ms_saved_total": _cache_stats["model_ms_saved"],
+    }
+
+
+def _store_answer(lookup, prepared, answer, model_ms):
+    if lookup["key"] is None:
+        return
+    _cache_put(
+        lookup["key"],
+        {"answer": answer, "events": prepared["events"], "digest": prepared["digest"], "model_ms": model_ms},
+    )
+
+
+def _iter_deltas(stream):
+    """Text fragments from an invoke_model_with_response_stream body, in order.
+
+    Anthropic models emit content_block_delta chunks; older text models send
+    outputText / completion fields instead. Modelled stream errors are raised
+    by botocore while iterating.
+    """
+    for event in stream:
+        chunk = event.get("chunk")
+        if not chunk:
+            continue
+        data = json.loads(chunk["bytes"])
+        if data.get("type") == "content_block_delta":
+            text = data.get("delta", {}).get("text")
+        else:
+            text = data.get("outputText") or data.get("completion")
+        if text:
+            yield text
+
+
+def _post(connection_id, message):
+    """Send one frame to the WebSocket client; False once it has gone away."""
+    try:
+        _management.post_to_connection(ConnectionId=connection_id, Data=encode_json(message))
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "GoneException":
+            raise
+        return False
+
+
+def _handle_stream(event, connection_id):
+    """`chat` route on the realtime WebSocket API.
+
+    Frames, in order:
+      {"type": "chat.telemetry", "events": [...], "digest": {...}}
+      {"type": "chat.delta", "text": "..."}               (repeated)
+      {"type": "chat.done", "time_to_first_token_ms": N, "total_ms": N, "cache": {...}}
+    or {"type": "chat.error", "error": "..."} instead of the rest, including
+    when the digest read, Bedrock or the response stream fails part way.
+    Every frame echoes the client's request_id so answers can be matched up.
+    A cached answer arrives as a single delta.
+    """
+    started = time.time()
+    request_id = None
+
+    def _send(message):
+        return _post(connection_id, dict(message, request_id=request_id))
+
+    if _management is None:
+        print("WEBSOCKET_ENDPOINT is not configured; cannot stream chat")
+        return {"statusCode": 500, "body": "streaming not configured"}
+
+    try:
+        payload = json.loads(event.get("body") or "{}")
+        if not isinstance(payload, dict):
+            raise ValueError("Request body must be a JSON object")
+        request_id = payload.get("request_id")
+        request = _parse_request(payload)
+    except ValueError as e:
+        _send({"type": "chat.error", "error": str(e)})
+        return {"statusCode": 400, "body": str(e)}
+
+    try:
+        return _stream_answer(request, connection_id, started, _send)
+    except Exception as e:
+        # Whatever broke (digest read, Bedrock, the stream itself), the client
+        # still gets a terminal frame instead of waiting forever
+        print(f"Chat stream for {connection_id} failed: {e}")
+        try:
+            _send({"type": "chat.error", "error": "Failed to generate an answer"})
+        except ClientError as post_error:
+            print(f"Could not report chat failure to {connection_id}: {post_error}")
+        return {"statusCode": 500, "body": "chat failed"}
+
+
+def _stream_answer(request, connection_id, started, _send):
+    """Telemetry, deltas and chat.done for one parsed request (see _handle_stream)."""
+    lookup = _cache_lookup(request)
+    cached = lookup["entry"]
+    if cached:
+        _send({"type": "chat.telemetry", "events": cached["events"], "digest": cached["digest"]})
+        _send({"type": "chat.delta", "text": cached["answer"]})
+        total_ms = int((time.time() - started) * 1000)
+        _send({"type": "chat.done", "time_to_first_token_ms": total_ms, "total_ms": total_ms,
+               "cache": _cache_block(lookup), "aws": aws.counters()})
+        return {"statusCode": 200, "body": ""}
+
+    prepared = _prepare(request)
+    # Telemetry first: the dashboard can render the samples while the model thinks
+    if not _send({"type": "chat.telemetry", "events": prepared["events"], "digest": prepared["digest"]}):
+        return {"statusCode": 200, "body": ""}
+
+    model_started = time.time()
+    response = bedrock.invoke_model_with_response_stream(
+        modelId=BEDROCK_MODEL_ID,
+        body=_bedrock_body(prepared["prompt"]),
+        contentType="application/json",
+        accept="application/json",
+    )
+
+    # Coalesce fragments into fewer frames; the first one goes out immediately
+    first_token_ms = None
+    pending, flushed_at, answer = [], 0.0, []
+    for text in _iter_deltas(response["body"]):
+        if first_token_ms is None:
+            first_token_ms = int((time.time() - started) * 1000)
+        pending.append(text)
+        answer.append(text)
+        now = time.time()
+        if sum(len(part) for part in pending) < STREAM_FLUSH_CHARS and now - flushed_at < STREAM_FLUSH_SECONDS:
+            continue
+        if not _send({"type": "chat.delta", "text": "".join(pending)}):
+            print(f"Chat client {connection_id} disconnected mid-answer")
+            return {"statusCode": 200, "body": ""}
+        pending, flushed_at = [], now
+    if pending:
+        _send({"type": "chat.delta", "text": "".join(pending)})
+
+    total_ms = int((time.time() - started) * 1000)
+    _store_answer(lookup, prepared, "".join(answer).strip() or "No response generated.", int((time.time() - model_started) * 1000))
+    print(f"Streamed chat answer: first token {first_token_ms} ms, total {total_ms} ms")
+    _send({"type": "chat.done", "time_to_first_token_ms": first_token_ms, "total_ms": total_ms,
+           "cache": _cache_block(lookup), "aws": aws.counters()})
+    return {"statusCode": 200, "body": ""}
+
+
+@profiling.profiled
 def handler(event, context):
+    aws.reset_counters()
+    connection_id = event.get("requestContext", {}).get("connectionId")
+    if connection_id:
+        return _handle_stream(event, connection_id)
+    return aws.annotate(_handle_http(event))
+
+
+def _handle_http(event):
     body = event.get("body")
     if event.get("isBase64Encoded"):
         body = base64.b64decode(body).decode("utf-8")
     payload = json.loads(body or "{}")
 
-    user_prompt = payload.get("prompt") or "What happened recently?"
-    event_date = payload.get("event_date")
-    if not event_date:
-        event_date = time.strftime("%Y-%m-%d", time.gmtime())
+    try:
+        request = _parse_request(payload)
+    except ValueError as e:
+        return json_response(400, {"error": str(e)}, event)
 
-    events = _query_events(event_date)
-    prompt = _build_prompt(user_prompt, events)
+    lookup = _cache_lookup(request)
+    cached = lookup["entry"]
+    if cached:
+        response_body = {
+            "answer": cached["answer"],
+            "events": cached["events"],
+            "digest": cached["digest"],
+            "cache": _cache_block(lookup),
+        }
+        return json_response(200, response_body, event)
 
+    prepared = _prepare(request)
+    model_started = time.time()
     bedrock_response = bedrock.invoke_model(
         modelId=BEDROCK_MODEL_ID,
-        body=json.dumps(
-            {
-                "anthropic_version": "bedrock-2023-05-31",
-                "temperature": 0.2,
-                "top_p": 0.9,
-                "max_tokens": 600,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [{"type": "text", "text": prompt}],
-                    }
-                ],
-            }
-        ),
+        body=_bedrock_body(prepared["prompt"]),
         contentType="application/json",
         accept="application/json",
     )
@@ -107,16 +613,15 @@ def handler(event, context):
     elif "output_text" in result_body:
         text = result_body.get("output_text", "")
 
+    model_ms = int((time.time() - model_started) * 1000)
+    answer = text.strip() or "No response generated."
+    _store_answer(lookup, prepared, answer, model_ms)
+
     response_body = {
-        "answer": text.strip() or "No response generated.",
-        "events": events,
+        "answer": answer,
+        "events": prepared["events"],
+        "digest": prepared["digest"],
+        "cache": _cache_block(lookup),
     }
 
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-        },
-        "body": json.dumps(response_body),
-    }
+    return json_response(200, response_body, event)
@@ -0,0 +1,5 @@
+"""Helpers shared by the PhantomWall Lambda functions.
+
+Packaged as a Lambda layer (see lambda_layer.tf) so each function zip stays
+a single handler.py and imports these as `from phantomwall import ...`.
+"""
@@ -0,0 +1,279 @@
+"""
+Lazy, shared boto3 clients for the Lambda handlers.
+
+Building a client loads and parses its service model, which costs tens of
+milliseconds per service on a cold start. Handlers used to build every client
+at import, even when the route being served touched only one of them. Now
+they bind the same module-level names to lazy handles:
+
+    _s3 = aws.client("s3")
+    _table = aws.table(os.environ["TABLE_NAME"])
+    aws.prewarm(_table, _s3)
+
+A handle builds the real client on first attribute access and keeps it in a
+per-container registry, so warm invocations reuse it. Tests can still swap a
+handle for a mock by assigning to the module attribute.
+
+prewarm() builds, during init, the handles a function uses on every
+invocation. Init runs with Lambda's CPU boost, and with provisioned
+concurrency it runs before any request. Route-specific clients stay lazy.
+AWS_CLIENT_PREWARM overrides the default:
+    configured  (default) build the handles passed to prewarm()
+    none        build nothing until first use
+    all         build every declared handle (the old import-time behaviour)
+
+Every client and resource is built with client_config():
+  - max_pool_connections of at least the number of threads that share it
+    (`workers=`); botocore's default of 10 blocks wider fan-outs.
+  - TCP keep-alive, so pooled connections survive between warm invocations.
+  - Adaptive retries: standard retries plus client-side rate limiting once
+    the service starts throttling.
+  - Connect/read timeouts per service, overridable from the environment:
+        AWS_CONNECT_TIMEOUT / AWS_READ_TIMEOUT               all services
+        AWS_CONNECT_TIMEOUT_<SERVICE> / AWS_READ_TIMEOUT_<SERVICE>
+    where <SERVICE> is e.g. S3 or BEDROCK_RUNTIME.
+
+Calls, retries and throttled attempts are counted per invocation. Handlers
+call reset_counters() on entry and report counters() with their results
+(API responses carry them as X-Aws-Calls/-Retries/-Throttles headers).
+usage() adds the time spent in calls per service (summed across threads,
+so a parallel fan-out can exceed wall time) and the DynamoDB items read.
+"""
+
+import os
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+
+RETRY_MODE = os.environ.get("AWS_RETRY_MODE", "adaptive")
+MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", "4"))
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_CONNECT_TIMEOUT = 2
+DEFAULT_READ_TIMEOUT = 10
+# Services whose calls legitimately take longer (or should fail faster)
+READ_TIMEOUTS = {
+    "dynamodb": 5,
+    "apigatewaymanagementapi": 5,
+    "bedrock-runtime": 60,
+}
+THROTTLE_CODES = {
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottledException",
+    "TooManyRequestsException", "ProvisionedThroughputExceededException", "RequestLimitExceeded",
+    "SlowDown", "RequestThrottled", "LimitExceededException", "BandwidthLimitExceeded",
+}
+
+_registry = {}
+_declared = []
+_lock = threading.Lock()
+# ms spent building each client/resource, for the cold-start benchmark
+build_ms = {}
+_counters = {"calls": 0, "retries": 0, "throttles": 0}
+_service_ms = {}
+_items_read = {"dynamodb": 0}
+_counters_lock = threading.Lock()
+
+
+def _env_timeout(kind, service, default):
+    suffix = service.upper().replace("-", "_")
+    value = os.environ.get(f"AWS_{kind}_TIMEOUT_{suffix}") or os.environ.get(f"AWS_{kind}_TIMEOUT")
+    return float(value) if value else default
+
+
+def client_config(service, workers=None):
+    """The tuned botocore Config for `service` with `workers` sharing the client."""
+    return Config(
+        max_pool_connections=max(DEFAULT_POOL_CONNECTIONS, workers or 0),
+        tcp_keepalive=True,
+        retries={"mode": RETRY_MODE, "total_max_attempts": MAX_ATTEMPTS},
+        connect_timeout=_env_timeout("CONNECT", service, DEFAULT_CONNECT_TIMEOUT),
+        read_timeout=_env_timeout("READ", service, READ_TIMEOUTS.get(service, DEFAULT_READ_TIMEOUT)),
+    )
+
+
+def _count(**increments):
+    with _counters_lock:
+        for name, value in increments.items():
+            _counters[name] += value
+
+
+def _on_needs_retry(response=None, **kwargs):
+    # Emitted once per attempt; response is (http_response, parsed) or None
+    if response is None:
+        return None
+    http_response, parsed = response
+    code = (parsed or {}).get("Error", {}).get("Code")
+    if code in THROTTLE_CODES or getattr(http_response, "status_code", None) == 429:
+        _count(throttles=1)
+    return None
+
+
+def _dynamodb_items(parsed):
+    if "Count" in parsed:  # Query, Scan
+        return parsed["Count"]
+    if "Responses" in parsed:  # BatchGetItem
+        return sum(len(items) for items in parsed["Responses"].values())
+    return 1 if "Item" in parsed else 0
+
+
+def _record_time(event_name, context, parsed):
+    started = (context or {}).get("phantomwall_started")
+    if started is None:
+        return
+    service = event_name.split(".")[1]
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _counters_lock:
+        _service_ms[service] = _service_ms.get(service, 0) + elapsed_ms
+        if service == "dynamodb" and parsed:
+            _items_read["dynamodb"] += _dynamodb_items(parsed)
+
+
+def _on_before_call(context=None, **kwargs):
+    # `context` is the per-call dict botocore hands to before-call and after-call
+    if context is not None:
+        context["phantomwall_started"] = time.perf_counter()
+
+
+def _on_after_call(parsed=None, context=None, event_name="", **kwargs):
+    _count(calls=1, retries=(parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts", 0))
+    _record_time(event_name, context, parsed)
+
+
+def _on_after_call_error(exception=None, context=None, event_name="", **kwargs):
+    metadata = (getattr(exception, "response", None) or {}).get("ResponseMetadata", {})
+    _count(calls=1, retries=metadata.get("RetryAttempts", 0))
+    _record_time(event_name, context, None)
+
+
+def _instrument(events):
+    events.register("before-call", _on_before_call)
+    events.register("needs-retry", _on_needs_retry)
+    events.register("after-call", _on_after_call)
+    events.register("after-call-error", _on_after_call_error)
+
+
+def reset_counters():
+    """Start a fresh count for this invocation."""
+    with _counters_lock:
+        for name in _counters:
+            _counters[name] = 0
+        _service_ms.clear()
+        _items_read["dynamodb"] = 0
+
+
+def counters():
+    """{"calls", "retries", "throttles"} since the last reset_counters()."""
+    with _counters_lock:
+        return dict(_counters)
+
+
+def usage():
+    """{"service_ms": {service: ms}, "items_read": n} since the last reset_counters()."""
+    with _counters_lock:
+        return {
+            "service_ms": {service: round(ms, 2) for service, ms in _service_ms.items()},
+            "items_read": _items_read["dynamodb"],
+        }
+
+
+def annotate(response):
+    """Attach this invocation's counters to an API Gateway response as headers."""
+    stats = counters()
+    if stats["retries"] or stats["throttles"]:
+        print(f"AWS retries this invocation: {stats}")
+    if isinstance(response, dict) and "statusCode" in response:
+        headers = response.setdefault("headers", {})
+        headers["X-Aws-Calls"] = str(stats["calls"])
+        headers["X-Aws-Retries"] = str(stats["retries"])
+        headers["X-Aws-Throttles"] = str(stats["throttles"])
+    return response
+
+
+def _build(key, factory):
+    # Creating clients from the default session is not thread-safe, and the
+    # query fan-out may first touch a client from several workers at once
+    with _lock:
+        if key not in _registry:
+            started = time.perf_counter()
+            _registry[key] = factory()
+            build_ms[key] = round((time.perf_counter() - started) * 1000, 2)
+        return _registry[key]
+
+
+def _new_client(service, workers, kwargs):
+    built = boto3.client(service, config=client_config(service, workers), **kwargs)
+    _instrument(built.meta.events)
+    return built
+
+
+def _new_resource(service, workers, kwargs):
+    built = boto3.resource(service, config=client_config(service, workers), **kwargs)
+    _instrument(built.meta.client.meta.events)
+    return built
+
+
+def get_client(service, workers=None, **kwargs):
+    """The container's shared client for `service`, built on first call."""
+    key = ("client", service, workers, tuple(sorted(kwargs.items())))
+    found = _registry.get(key)
+    return found if found is not None else _build(key, lambda: _new_client(service, workers, kwargs))
+
+
+def get_resource(service, workers=None, **kwargs):
+    """The container's shared resource for `service`, built on first call."""
+    key = ("resource", service, workers, tuple(sorted(kwargs.items())))
+    found = _registry.get(key)
+    return found if found is not None else _build(key, lambda: _new_resource(service, workers, kwargs))
+
+
+class LazyHandle:
+    """Stands in for a client, resource or Table until it is first used."""
+
+    def __init__(self, label, factory):
+        self._label = label
+        self._factory = factory
+        self._target = None
+        _declared.append(self)
+
+    def resolve(self):
+        if self._target is None:
+            self._target = self._factory()
+        return self._target
+
+    @property
+    def built(self):
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __repr__(self):
+        state = "built" if self.built else "lazy"
+        return f"<LazyHandle {self._label} ({state})>"
+
+
+def client(service, workers=None, **kwargs):
+    """Lazy client; `workers` is how many threads may use it at once."""
+    return LazyHandle(service, lambda: get_client(service, workers, **kwargs))
+
+
+def resource(service, workers=None, **kwargs):
+    return LazyHandle(f"{service} resource", lambda: get_resource(service, workers, **kwargs))
+
+
+def table(name):
+    """Lazy DynamoDB Table; every table shares one dynamodb resource."""
+    return LazyHandle(f"dynamodb table {name}", lambda: get_resource("dynamodb").Table(name))
+
+
+def prewarm(*handles):
+    """Build `handles` now (None entries, i.e. unconfigured tables, are skipped)."""
+    mode = os.environ.get("AWS_CLIENT_PREWARM", "configured").lower()
+    if mode == "none":
+        return
+    if mode == "all":
+        handles = _declared
+    for handle in handles:
+        if isinstance(handle, LazyHandle):
+            handle.resolve()
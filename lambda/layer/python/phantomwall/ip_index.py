@@ -0,0 +1,87 @@
+"""
+Per-partition IP index sidecars for the S3 log lake.
+
+log_compactor writes one sidecar per compacted partition listing every
+src_ip and dest_ip it holds, so s3_log_query can leave out partitions that
+cannot contain a searched IP before handing the query to Athena:
+    s3://<logs bucket>/index/year=2026/month=01/day=29/hour=14/etype=alert/ips.idx
+
+Sidecars live outside the partition locations so Athena never reads them as
+data. Each is a gzip'd sorted list of 16-byte packed addresses (IPv4 mapped
+into IPv6), one list per field. Membership is exact: no false positives, and
+a partition with no sidecar is always scanned.
+"""
+
+import bisect
+import gzip
+import ipaddress
+import struct
+
+from phantomwall import partitions
+
+INDEX_PREFIX = "index/"
+INDEX_FILENAME = "ips.idx"
+FIELDS = ("src_ip", "dest_ip")
+
+_MAGIC = b"PWIX1"
+_ENTRY_BYTES = 16
+
+
+def index_key(values):
+    """S3 key of the sidecar for one partition."""
+    return f"{INDEX_PREFIX}{partitions.partition_prefix(values)}{INDEX_FILENAME}"
+
+
+def pack_ip(ip):
+    """16-byte sortable form of an address, or None if it does not parse."""
+    try:
+        addr = ipaddress.ip_address(str(ip).strip())
+    except ValueError:
+        return None
+    if addr.version == 4:
+        addr = ipaddress.IPv6Address(b"\x00" * 10 + b"\xff\xff" + addr.packed)
+    return addr.packed
+
+
+def new_collector():
+    """{field: set of packed addresses} accumulator."""
+    return {field: set() for field in FIELDS}
+
+
+def add_event(collector, event):
+    for field in FIELDS:
+        value = event.get(field)
+        if value:
+            packed = pack_ip(value)
+            if packed:
+                collector[field].add(packed)
+
+
+def encode(collector):
+    body = [_MAGIC]
+    for field in FIELDS:
+        entries = sorted(collector.get(field, ()))
+        body.append(struct.pack(">I", len(entries)))
+        body.extend(entries)
+    return gzip.compress(b"".join(body), 6)
+
+
+def decode(blob):
+    """Sidecar bytes → {field: sorted list of packed addresses}."""
+    raw = gzip.decompress(blob)
+    if not raw.startswith(_MAGIC):
+        raise ValueError("not an IP index sidecar")
+    offset = len(_MAGIC)
+    decoded = {}
+    for field in FIELDS:
+        (count,) = struct.unpack_from(">I", raw, offset)
+        offset += 4
+        decoded[field] = [raw[offset + i * _ENTRY_BYTES : offset + (i + 1) * _ENTRY_BYTES] for i in range(count)]
+        offset += count * _ENTRY_BYTES
+    return decoded
+
+
+def contains(decoded, field, packed):
+    entries = decoded.get(field, [])
+    i = bisect.bisect_left(entries, packed)
+    return i < len(entries) and entries[i] == packed
@@ -0,0 +1,130 @@
+"""
+In-process search over S3 log lake objects.
+
+For narrow searches (an hour, one IP) Athena's startup dominates latency, so
+s3_log_query can instead stream the few partition objects itself and filter
+them here. The engine only needs a way to open an object by key, so it runs
+the same against S3 bodies or local files:
+
+    items, stats = search(keys, open_object, filters, limit=100)
+
+Rows match what the Athena query returns: the same column names, values as
+strings (as in Athena's CSV output), NULLs left out, newest timestamp first.
+"""
+
+import gzip
+import heapq
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+# Output column → path in the eve.json event (mirrors the SELECT in _build_query)
+COLUMNS = {
+    "timestamp": ("timestamp",),
+    "event_type": ("event_type",),
+    "src_ip": ("src_ip",),
+    "src_port": ("src_port",),
+    "dest_ip": ("dest_ip",),
+    "dest_port": ("dest_port",),
+    "proto": ("proto",),
+    "flow_id": ("flow_id",),
+    "app_proto": ("app_proto",),
+    "sample_weight": ("sample_weight",),
+    "alert_signature": ("alert", "signature"),
+    "alert_severity": ("alert", "severity"),
+    "alert_category": ("alert", "category"),
+}
+
+
+def _lookup(event, path):
+    value = event
+    for part in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def matcher(filters):
+    """Predicate equivalent to _build_query's WHERE clause (minus partitions)."""
+    checks = []
+    for field in ("event_type", "src_ip", "dest_ip"):
+        if filters.get(field):
+            checks.append((field, filters[field]))
+    if filters.get("proto"):
+        checks.append(("proto", filters["proto"].upper()))
+    dest_port = int(filters["dest_port"]) if filters.get("dest_port") else None
+
+    def _matches(event):
+        for field, wanted in checks:
+            if event.get(field) != wanted:
+                return False
+        if dest_port is not None:
+            try:
+                return int(event.get("dest_port")) == dest_port
+            except (TypeError, ValueError):
+                return False
+        return True
+
+    return _matches
+
+
+def project(event):
+    row = {}
+    for column, path in COLUMNS.items():
+        value = _lookup(event, path)
+        if value is not None and value != "":
+            row[column] = str(value)
+    return row
+
+
+def iter_events(stream, key):
+    """Events from one object: NDJSON, gzip'd when the key ends in .gz."""
+    if key.endswith(".gz"):
+        stream = gzip.GzipFile(fileobj=stream)
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(event, dict):
+            yield event
+
+
+def _scan_object(key, open_object, matches, limit):
+    """Top `limit` matching rows of one object as (timestamp, row) pairs."""
+    top = []
+    scanned = 0
+    counter = itertools.count()
+    with open_object(key) as stream:
+        for event in iter_events(stream, key):
+            scanned += 1
+            if not matches(event):
+                continue
+            entry = (str(event.get("timestamp") or ""), next(counter), event)
+            if len(top) < limit:
+                heapq.heappush(top, entry)
+            elif entry[0] > top[0][0]:
+                heapq.heapreplace(top, entry)
+    return [(ts, project(event)) for ts, _, event in top], scanned
+
+
+def search(keys, open_object, filters, limit=100, workers=8):
+    """Scan `keys` and return (newest `limit` matching rows, stats).
+
+    `open_object(key)` must return a binary file-like context manager.
+    """
+    matches = matcher(filters)
+    candidates = []
+    rows_scanned = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for rows, scanned in pool.map(lambda key: _scan_object(key, open_object, matches, limit), keys):
+            candidates.extend(rows)
+            rows_scanned += scanned
+
+    newest = heapq.nlargest(limit, candidates, key=lambda pair: pair[0])
+    items = [row for _, row in newest]
+    return items, {"objects_read": len(keys), "rows_scanned": rows_scanned}
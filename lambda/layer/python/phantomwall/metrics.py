@@ -0,0 +1,169 @@
+"""
+Per-route request metrics for the analyst-facing APIs.
+
+suricata_api and s3_log_query wrap each request:
+
+    metrics.start("suricata_api", event)
+    return metrics.emit(aws.annotate(_route(event)))
+
+emit() prints one CloudWatch Embedded Metric Format (EMF) record. CloudWatch
+Logs turns it into metrics in METRICS_NAMESPACE, with no PutMetricData calls
+and no extra IAM. Each metric has two dimension sets, {Service, Route,
+Status} and {Service, Route}, so route p95s cover every status and can still
+be split by status.
+
+    LatencyMs                             start() to emit()
+    DynamoDBMs, AthenaMs, GlueMs, S3Ms    time inside AWS calls (aws.usage());
+                                          summed across fan-out threads
+    ItemsRead                             DynamoDB items plus the rows handlers
+                                          report with add_items()
+    ResponseBytes                         response body as sent
+    CacheHits, CacheMisses                from record_cache(); a 304 counts as
+                                          a hit on the client's copy
+    AwsCalls, AwsRetries                  from aws.counters()
+
+The route defaults to the API Gateway route key. Requests without one
+($default, unmatched paths) are all reported as UNMATCHED_ROUTE: every
+distinct dimension value is a separately billed metric, so raw paths never
+become a dimension. Handlers that serve several logical routes from one key
+(GET /logs?action=summary) call set_route(). The record also carries the
+request id, cache tier and any raw path as plain properties for Logs
+Insights.
+"""
+
+import json
+import os
+import threading
+import time
+
+from phantomwall import aws
+
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "phantomwall/Api")
+UNMATCHED_ROUTE = "other"
+DIMENSION_SETS = [["Service", "Route", "Status"], ["Service", "Route"]]
+SERVICE_METRICS = {
+    "dynamodb": "DynamoDBMs",
+    "athena": "AthenaMs",
+    "glue": "GlueMs",
+    "s3": "S3Ms",
+}
+_UNITS = {
+    "LatencyMs": "Milliseconds",
+    **{name: "Milliseconds" for name in SERVICE_METRICS.values()},
+    "ItemsRead": "Count",
+    "ResponseBytes": "Bytes",
+    "CacheHits": "Count",
+    "CacheMisses": "Count",
+    "AwsCalls": "Count",
+    "AwsRetries": "Count",
+}
+
+_lock = threading.Lock()
+_request = {}
+
+
+def _default_route(event):
+    event = event or {}
+    request_context = event.get("requestContext") or {}
+    route_key = request_context.get("routeKey")
+    if route_key and route_key != "$default":
+        return route_key
+    if route_key or event.get("rawPath"):
+        return UNMATCHED_ROUTE
+    return event.get("action") or "invoke"
+
+
+def start(service, event):
+    """Begin measuring one request of `service` (the Lambda, e.g. "s3_log_query")."""
+    with _lock:
+        _request.clear()
+        _request.update({
+            "service": service,
+            "route": _default_route(event),
+            "path": (event or {}).get("rawPath"),
+            "started": time.perf_counter(),
+            "items": 0,
+            "hits": 0,
+            "misses": 0,
+            "tiers": [],
+        })
+
+
+def set_route(route):
+    with _lock:
+        _request["route"] = route
+
+
+def add_items(count):
+    """Count rows read outside DynamoDB (Athena results, local engine scans)."""
+    with _lock:
+        _request["items"] = _request.get("items", 0) + count
+
+
+def record_cache(status, tier=None):
+    """Record one cache lookup: status "hit" or "miss", and the tier that answered."""
+    counter = "hits" if status == "hit" else "misses"
+    with _lock:
+        _request[counter] = _request.get(counter, 0) + 1
+        if tier:
+            _request.setdefault("tiers", []).append(tier)
+
+
+def _body_bytes(response):
+    body = response.get("body") or ""
+    if response.get("isBase64Encoded"):
+        return len(body) * 3 // 4 - body[-2:].count("=")
+    return len(body.encode("utf-8"))
+
+
+def record(response, request_id=None):
+    """The EMF record for the current request, answered with `response`."""
+    with _lock:
+        request = dict(_request)
+    status = response.get("statusCode", 200) if isinstance(response, dict) else 200
+    if status == 304 and not (request.get("hits") or request.get("misses")):
+        request["hits"], request["tiers"] = 1, ["etag"]
+    usage = aws.usage()
+    counts = aws.counters()
+
+    values = {
+        "LatencyMs": round((time.perf_counter() - request.get("started", time.perf_counter())) * 1000, 2),
+        **{name: usage["service_ms"].get(service, 0) for service, name in SERVICE_METRICS.items()},
+        "ItemsRead": usage["items_read"] + request.get("items", 0),
+        "ResponseBytes": _body_bytes(response) if isinstance(response, dict) else 0,
+        "CacheHits": request.get("hits", 0),
+        "CacheMisses": request.get("misses", 0),
+        "AwsCalls": counts["calls"],
+        "AwsRetries": counts["retries"],
+    }
+    entry = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE,
+                "Dimensions": DIMENSION_SETS,
+                "Metrics": [{"Name": name, "Unit": _UNITS[name]} for name in values],
+            }],
+        },
+        "Service": request.get("service", "unknown"),
+        "Route": request.get("route", "invoke"),
+        "Status": str(status),
+        **values,
+    }
+    if request.get("tiers"):
+        entry["CacheTier"] = ",".join(sorted(set(request["tiers"])))
+    if request.get("path"):
+        entry["Path"] = request["path"]
+    if request_id:
+        entry["RequestId"] = request_id
+    return entry
+
+
+def emit(response, request_id=None):
+    """Print this request's EMF record and hand `response` back unchanged."""
+    try:
+        print(json.dumps(record(response, request_id), separators=(",", ":")))
+    except Exception as e:
+        # Metrics must never fail the request they describe
+        print(f"Metrics emit error: {e}")
+    return response
@@ -0,0 +1,128 @@
+"""
+Per-hour statistics for the S3 log lake.
+
+suricata_ingest sees every event before it lands in S3, so it keeps running
+counters per hour partition in the partition stats table:
+
+    partition_date = "2026-01-29", hour = "14"
+    n_alert = 12, n_flow = 5310, n_dns = 804, ...
+
+s3_log_query answers the event-type summary from these items instead of a
+full-day Athena GROUP BY. Counters are only ever incremented (DynamoDB ADD),
+so concurrent ingest invocations never overwrite each other.
+
+The same items are the size manifest s3_log_query estimates Athena scans
+from, keyed by the partition's etype value:
+
+    b_alert = 48213, b_flow = 9120044, ...   raw bytes written (ingest, ADD)
+    z_alert = 6120, z_flow = 1033870, ...    gzip bytes after compaction
+                                             (log_compactor, SET)
+
+Each ingest batch also stamps the hours it touched with `ingested_at` (epoch
+seconds). The newest stamp of a day is that day's data version: when it is
+unchanged, nothing new has landed and derived answers (chat_assistant's
+response cache, s3_log_query's result cache) are still current. Partitions
+registered later by s3_log_query's repair pass stamp their hour too.
+"""
+
+COUNT_PREFIX = "n_"
+BYTES_PREFIX = "b_"
+COMPACTED_BYTES_PREFIX = "z_"
+INGESTED_AT = "ingested_at"
+UNKNOWN_EVENT_TYPE = "unknown"
+
+
+def hour_key(dt):
+    """Table key for the hour partition containing `dt`."""
+    return {"partition_date": dt.strftime("%Y-%m-%d"), "hour": f"{dt.hour:02d}"}
+
+
+def add_counts(table, key, counts, prefix=COUNT_PREFIX, ingested_at=None):
+    """Atomically add {name: n} to one hour's counters.
+
+    With `ingested_at`, the same update stamps the hour's data version.
+    """
+    if not counts:
+        return
+    names = {}
+    values = {}
+    clauses = []
+    for i, (name, count) in enumerate(sorted(counts.items())):
+        names[f"#c{i}"] = f"{prefix}{name}"
+        values[f":c{i}"] = count
+        clauses.append(f"#c{i} :c{i}")
+    expression = "ADD " + ", ".join(clauses)
+    if ingested_at is not None:
+        names["#ingested"] = INGESTED_AT
+        values[":ingested"] = ingested_at
+        expression += " SET #ingested = :ingested"
+    table.update_item(
+        Key=key,
+        UpdateExpression=expression,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
+
+
+def stamp_ingested(table, key, ingested_at):
+    """Advance one hour's data version without touching its counters."""
+    table.update_item(
+        Key=key,
+        UpdateExpression="SET #ingested = :ingested",
+        ExpressionAttributeNames={"#ingested": INGESTED_AT},
+        ExpressionAttributeValues={":ingested": ingested_at},
+    )
+
+
+def set_compacted_bytes(table, key, etype, size):
+    """Record a partition's size after compaction (replaces any earlier value)."""
+    table.update_item(
+        Key=key,
+        UpdateExpression="SET #z = :z",
+        ExpressionAttributeNames={"#z": f"{COMPACTED_BYTES_PREFIX}{etype}"},
+        ExpressionAttributeValues={":z": size},
+    )
+
+
+def partition_bytes(item, etype):
+    """Bytes an Athena scan of one partition reads, or None if unrecorded.
+
+    Compacted size wins; raw bytes only describe partitions not yet compacted.
+    """
+    for prefix in (COMPACTED_BYTES_PREFIX, BYTES_PREFIX):
+        value = (item or {}).get(f"{prefix}{etype}")
+        if value is not None:
+            return int(value)
+    return None
+
+
+def day_items(table, partition_date):
+    """All hour items recorded for one day."""
+    kwargs = {
+        "KeyConditionExpression": "partition_date = :d",
+        "ExpressionAttributeValues": {":d": partition_date},
+    }
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            return items
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def data_version(items):
+    """Newest `ingested_at` across hour items, or None if none is stamped."""
+    stamps = [int(item[INGESTED_AT]) for item in items if item.get(INGESTED_AT) is not None]
+    return max(stamps) if stamps else None
+
+
+def sum_counts(items, prefix=COUNT_PREFIX):
+    """Fold hour items into {name: total} for attributes with `prefix`."""
+    totals = {}
+    for item in items:
+        for attr, value in item.items():
+            if attr.startswith(prefix):
+                name = attr[len(prefix):]
+                totals[name] = totals.get(name, 0) + int(value)
+    return totals
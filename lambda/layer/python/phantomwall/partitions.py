@@ -0,0 +1,89 @@
+"""
+S3 log lake layout and Glue partition helpers.
+
+Raw Suricata events live under Hive-style hour partitions, split by event
+type so searches for one type only read that type's files:
+    s3://<logs bucket>/year=2026/month=01/day=29/hour=14/etype=alert/<uuid>.json
+
+The Glue key is `etype` rather than `event_type` because Hive does not allow
+a partition key to share its name with a data column. Objects written before
+the split sit directly under the hour prefix; they are registered with
+etype = 'all' and searches for any single type also read them.
+
+suricata_ingest registers each partition in Glue the first time it writes
+there, so the query path never has to discover partitions itself.
+
+Once an hour has closed, log_compactor rewrites each partition into a few
+gzip NDJSON files under a versioned prefix and points Glue there:
+    s3://<logs bucket>/compacted/year=2026/month=01/day=29/hour=14/etype=alert/v=<ts>/part-00000.json.gz
+"""
+
+import re
+
+PARTITION_KEYS = ("year", "month", "day", "hour", "etype")
+HOUR_KEYS = PARTITION_KEYS[:4]
+EVENT_TYPE_KEY = "etype"
+ALL_EVENT_TYPES = "all"  # legacy partitions holding every event type
+COMPACTED_PREFIX = "compacted/"
+
+_EVENT_TYPE_UNSAFE = re.compile(r"[^a-z0-9_]")
+
+
+def event_type_value(event_type):
+    """Partition value for an event type: lowercase, [a-z0-9_] only."""
+    value = _EVENT_TYPE_UNSAFE.sub("_", str(event_type or "").lower())[:64]
+    return value or "unknown"
+
+
+def hour_values(dt):
+    """Year/month/day/hour values for the hour containing `dt`."""
+    return [f"{dt.year}", f"{dt.month:02d}", f"{dt.day:02d}", f"{dt.hour:02d}"]
+
+
+def partition_values(dt, event_type=None):
+    """Glue partition values for `dt`'s hour and an event type.
+
+    Without an event type this is the legacy all-types partition.
+    """
+    etype = event_type_value(event_type) if event_type is not None else ALL_EVENT_TYPES
+    return hour_values(dt) + [etype]
+
+
+def partition_prefix(values):
+    """S3 key prefix (with trailing slash) for a list of partition values."""
+    parts = []
+    for key, value in zip(PARTITION_KEYS, values):
+        if key == EVENT_TYPE_KEY and value == ALL_EVENT_TYPES:
+            continue  # legacy objects sit directly under the hour
+        parts.append(f"{key}={value}/")
+    return "".join(parts)
+
+
+def hour_prefix(dt):
+    return partition_prefix(hour_values(dt))
+
+
+def compacted_prefix(values, version):
+    """S3 key prefix for one compacted version of a partition."""
+    return f"{COMPACTED_PREFIX}{partition_prefix(values)}v={version}/"
+
+
+def partition_input(values, storage_descriptor, location):
+    """PartitionInput for Glue, inheriting the table's storage descriptor."""
+    return {
+        "Values": list(values),
+        "StorageDescriptor": {**storage_descriptor, "Location": location},
+    }
+
+
+def create_partition(glue, database, table, values, storage_descriptor, location):
+    """Register one partition. Returns False if it already existed."""
+    try:
+        glue.create_partition(
+            DatabaseName=database,
+            TableName=table,
+            PartitionInput=partition_input(values, storage_descriptor, location),
+        )
+        return True
+    except glue.exceptions.AlreadyExistsException:
+        return False
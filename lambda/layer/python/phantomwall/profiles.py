@@ -0,0 +1,134 @@
+"""
+Per-attacker profile records.
+
+suricata_ingest folds every event from a public source IP into one profile
+per src_ip (first/last seen, counts, ports touched, top signatures, country)
+and suricata_api serves them from the attackers table.
+
+Ports are kept as a 65,536-bit bitmap (one bit per destination port),
+zlib-compressed for storage: a handful of ports costs a few dozen bytes and
+a full-range scanner tops out near 8 KB, so the item stays well under the
+DynamoDB item limit while the distinct-port count stays exact.
+"""
+
+import zlib
+
+PORT_BITMAP_BYTES = 65536 // 8
+TOP_SIGNATURES = 10
+PROFILE_SCOPE = "attacker"
+
+
+def _bitmap_int(blob):
+    """Decode a stored bitmap (bytes, DynamoDB Binary or None) into an int."""
+    if blob is None:
+        return 0
+    raw = getattr(blob, "value", blob)
+    if not raw:
+        return 0
+    return int.from_bytes(zlib.decompress(bytes(raw)), "big")
+
+
+def _bitmap_blob(bits):
+    return zlib.compress(bits.to_bytes(PORT_BITMAP_BYTES, "big"), 6)
+
+
+def ports_to_bits(ports):
+    bits = 0
+    for port in ports:
+        if port is not None and 0 <= port < 65536:
+            bits |= 1 << port
+    return bits
+
+
+def decode_ports(blob):
+    """Sorted list of ports recorded in a stored bitmap."""
+    bits = _bitmap_int(blob)
+    ports = []
+    while bits:
+        low = bits & -bits
+        ports.append(low.bit_length() - 1)
+        bits ^= low
+    return ports
+
+
+def new_delta():
+    """Accumulator for one IP within a single ingest invocation."""
+    return {
+        "first_seen": None,
+        "last_seen": None,
+        "event_count": 0,
+        "alert_count": 0,
+        "ports": set(),
+        "signatures": {},
+        "country_name": None,
+        "country_code": None,
+        "flag": None,
+    }
+
+
+def add_event(delta, normalized):
+    """Fold one normalized ingest event into a delta."""
+    ts = normalized.get("timestamp")
+    if ts is not None:
+        if delta["first_seen"] is None or ts < delta["first_seen"]:
+            delta["first_seen"] = ts
+        if delta["last_seen"] is None or ts > delta["last_seen"]:
+            delta["last_seen"] = ts
+    delta["event_count"] += 1
+
+    if normalized.get("dest_port") is not None:
+        delta["ports"].add(normalized["dest_port"])
+
+    signature = normalized.get("signature")
+    if normalized.get("event_type") == "alert" or signature:
+        delta["alert_count"] += 1
+    if signature:
+        delta["signatures"][signature] = delta["signatures"].get(signature, 0) + 1
+
+    if normalized.get("country_code"):
+        delta["country_name"] = normalized.get("country_name")
+        delta["country_code"] = normalized.get("country_code")
+        delta["flag"] = normalized.get("flag")
+
+
+def merge(src_ip, existing, delta):
+    """Return the new profile item for `src_ip` from the stored one and a delta.
+
+    Signature counts are summed and trimmed to the TOP_SIGNATURES heaviest,
+    so counts for long-tail signatures are approximate.
+    """
+    existing = existing or {}
+
+    first_seen = delta["first_seen"]
+    if existing.get("first_seen") is not None:
+        first_seen = min(int(existing["first_seen"]), first_seen) if first_seen is not None else int(existing["first_seen"])
+    last_seen = delta["last_seen"]
+    if existing.get("last_seen") is not None:
+        last_seen = max(int(existing["last_seen"]), last_seen) if last_seen is not None else int(existing["last_seen"])
+
+    bits = _bitmap_int(existing.get("ports_bitmap")) | ports_to_bits(delta["ports"])
+
+    signatures = {name: int(count) for name, count in (existing.get("top_signatures") or {}).items()}
+    for name, count in delta["signatures"].items():
+        signatures[name] = signatures.get(name, 0) + count
+    top = sorted(signatures.items(), key=lambda pair: (-pair[1], pair[0]))[:TOP_SIGNATURES]
+
+    item = {
+        "src_ip": src_ip,
+        "scope": PROFILE_SCOPE,
+        "first_seen": first_seen,
+        "last_seen": last_seen,
+        "event_count": int(existing.get("event_count", 0)) + delta["event_count"],
+        "alert_count": int(existing.get("alert_count", 0)) + delta["alert_count"],
+        "distinct_ports": bits.bit_count(),
+        "ports_bitmap": _bitmap_blob(bits),
+        "top_signatures": dict(top),
+        "version": int(existing.get("version", 0)) + 1,
+    }
+
+    for key in ("country_name", "country_code", "flag"):
+        value = delta[key] or existing.get(key)
+        if value:
+            item[key] = value
+
+    return item
@@ -0,0 +1,299 @@
+"""
+On-demand profiling of Lambda invocations.
+
+Every handler is wrapped with @profiled. Most invocations pass straight
+through; a sampled one runs under a profiler and writes a summary of where
+its time and memory went:
+
+    @profiling.profiled
+    def handler(event, context):
+        ...
+
+Profiling is off unless PROFILE_OUTPUT is set:
+    PROFILE_OUTPUT       "log"               one `PROFILE {json}` line in CloudWatch Logs
+                         s3://bucket/prefix  one JSON object per invocation (the role
+                                             needs s3:PutObject on the prefix)
+                         any other value     a local directory, e.g. /tmp/profiles
+    PROFILE_SAMPLE_RATE  fraction of invocations to profile (default 0)
+    PROFILE_MODE         cprofile (default)  exact call counts, invoking thread only
+                         sample              stack sampling every PROFILE_INTERVAL_MS,
+                                             all threads; lower overhead, and sees the
+                                             query fan-out workers
+    PROFILE_MEMORY       "true" (default) to also record peak memory and the largest
+                         live allocations with tracemalloc
+
+    PROFILE_HEADER_SECRET  shared secret for header-triggered profiles (default
+                           unset: the header is ignored)
+
+An API request whose `X-Profile` header equals PROFILE_HEADER_SECRET is
+profiled regardless of the sample rate, as long as PROFILE_OUTPUT is set.
+Anyone else sending the header gets an ordinary, unprofiled invocation, so
+callers cannot force the profiler's overhead onto the function.
+
+tools/profile_report.py aggregates collected summaries into a hot-function
+report.
+"""
+
+import cProfile
+import datetime
+import functools
+import hmac
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+from phantomwall import aws
+
+PROFILE_OUTPUT = os.environ.get("PROFILE_OUTPUT", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "cprofile").lower()
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MEMORY = os.environ.get("PROFILE_MEMORY", "true").lower() == "true"
+PROFILE_HEADER = "x-profile"
+PROFILE_HEADER_SECRET = os.environ.get("PROFILE_HEADER_SECRET", "")
+# Functions kept per summary: the top N by self time plus the top N by cumulative time
+TOP_FUNCTIONS = 40
+TOP_ALLOCATORS = 10
+# Frames in these files are a worker thread waiting for work, not doing any
+_IDLE_FILES = ("threading.py", "queue.py", "thread.py")
+
+_active = threading.Lock()
+
+
+def _short(filename):
+    # Last two path parts: handler.py files are told apart by their directory
+    return "/".join(filename.replace("\\", "/").split("/")[-2:])
+
+
+def _where(filename, lineno, name):
+    """Short, stable label for a function: file, line and name."""
+    if filename.startswith("<") or filename == "~":
+        return f"{filename}({name})"
+    return f"{_short(filename)}:{lineno}({name})"
+
+
+def _header_requested(event):
+    if not PROFILE_HEADER_SECRET or not isinstance(event, dict):
+        return False
+    headers = event.get("headers") or {}
+    for key, value in headers.items():
+        if key.lower() == PROFILE_HEADER:
+            return hmac.compare_digest(str(value).encode(), PROFILE_HEADER_SECRET.encode())
+    return False
+
+
+def _trigger(event):
+    """Why this invocation is profiled ("header" or "sampled"), or None."""
+    if not PROFILE_OUTPUT:
+        return None
+    if _header_requested(event):
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def _route(event):
+    if not isinstance(event, dict):
+        return None
+    request_context = event.get("requestContext") or {}
+    if request_context.get("routeKey"):
+        return request_context["routeKey"]
+    if event.get("rawPath"):
+        return event["rawPath"]
+    if "Records" in event:
+        return "records"
+    if "awslogs" in event:
+        return "awslogs"
+    return None
+
+
+class _CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        functions = []
+        for (filename, lineno, name), (_, calls, self_s, cum_s, _) in pstats.Stats(self.profile).stats.items():
+            functions.append({
+                "function": _where(filename, lineno, name),
+                "calls": calls,
+                "self_ms": round(self_s * 1000, 3),
+                "cum_ms": round(cum_s * 1000, 3),
+            })
+        return functions
+
+
+class _StackSampler:
+    """Samples every thread's stack from a background thread."""
+
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000
+        self.self_counts = {}
+        self.cum_counts = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._caller = threading.get_ident()
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                leaf_file = os.path.basename(frame.f_code.co_filename)
+                if thread_id != self._caller and leaf_file in _IDLE_FILES:
+                    continue
+                self._record(frame)
+
+    def _record(self, frame):
+        leaf = _where(frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)
+        self.self_counts[leaf] = self.self_counts.get(leaf, 0) + 1
+        seen = set()
+        while frame is not None:
+            label = _where(frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)
+            if label not in seen:
+                seen.add(label)
+                self.cum_counts[label] = self.cum_counts.get(label, 0) + 1
+            frame = frame.f_back
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        step_ms = self.interval * 1000
+        return [
+            {
+                "function": label,
+                "samples": count,
+                "self_ms": round(self.self_counts.get(label, 0) * step_ms, 3),
+                "cum_ms": round(count * step_ms, 3),
+            }
+            for label, count in self.cum_counts.items()
+        ]
+
+
+def _top(functions):
+    by_self = sorted(functions, key=lambda f: f["self_ms"], reverse=True)[:TOP_FUNCTIONS]
+    by_cum = sorted(functions, key=lambda f: f["cum_ms"], reverse=True)[:TOP_FUNCTIONS]
+    kept = {f["function"]: f for f in by_self + by_cum}
+    return sorted(kept.values(), key=lambda f: f["self_ms"], reverse=True)
+
+
+def _memory_summary(snapshot):
+    """Peak traced memory, and the lines holding the most memory still live at
+    the end of the invocation (module caches, pooled buffers: what a warm
+    container keeps)."""
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ])
+    top = []
+    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATORS]:
+        frame = stat.traceback[0]
+        top.append({
+            "where": f"{_short(frame.filename)}:{frame.lineno}",
+            "size_bytes": stat.size,
+            "count": stat.count,
+        })
+    return {"peak_bytes": peak, "top": top}
+
+
+def write_summary(summary, output=None):
+    """Send one invocation summary to PROFILE_OUTPUT (or `output`)."""
+    output = output or PROFILE_OUTPUT
+    if output == "log":
+        print("PROFILE " + json.dumps(summary, separators=(",", ":")))
+        return "log"
+
+    started = datetime.datetime.utcfromtimestamp(summary["started_at"])
+    name = f"{summary['function']}/{started:%Y-%m-%d}/{started:%H%M%S}-{summary['request_id']}.json"
+    body = json.dumps(summary, separators=(",", ":")).encode("utf-8")
+    if output.startswith("s3://"):
+        bucket, _, prefix = output[len("s3://"):].partition("/")
+        key = f"{prefix.rstrip('/')}/{name}" if prefix else name
+        aws.get_client("s3").put_object(Bucket=bucket, Key=key, Body=body, ContentType="application/json")
+        return f"s3://{bucket}/{key}"
+    path = os.path.join(output, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(body)
+    return path
+
+
+def _run_profiled(fn, event, context, trigger):
+    function = getattr(context, "function_name", None) or os.environ.get("AWS_LAMBDA_FUNCTION_NAME") or fn.__module__
+    request_id = getattr(context, "aws_request_id", None) or f"local-{int(time.time() * 1000)}"
+    mode = "sample" if PROFILE_MODE == "sample" else "cprofile"
+    profiler = _StackSampler(PROFILE_INTERVAL_MS) if mode == "sample" else _CProfiler()
+
+    tracing = PROFILE_MEMORY and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    started_at = time.time()
+    started = time.perf_counter()
+    status = None
+    profiler.start()
+    try:
+        result = fn(event, context)
+        status = result.get("statusCode") if isinstance(result, dict) else None
+        return result
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        functions = profiler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+        memory = None
+        if tracing:
+            memory = _memory_summary(tracemalloc.take_snapshot())
+            tracemalloc.stop()
+        summary = {
+            "function": function,
+            "request_id": request_id,
+            "route": _route(event),
+            "status": status,
+            "trigger": trigger,
+            "mode": mode,
+            "started_at": round(started_at, 3),
+            "duration_ms": round(duration_ms, 3),
+            "functions": _top(functions),
+            "memory": memory,
+        }
+        try:
+            location = write_summary(summary)
+            print(f"Profiled invocation ({trigger}, {duration_ms:.0f} ms) -> {location}")
+        except Exception as e:
+            print(f"Could not write profile: {e}")
+
+
+def profiled(fn):
+    """Wrap a Lambda handler so sampled invocations are profiled."""
+
+    @functools.wraps(fn)
+    def wrapper(event, context):
+        trigger = _trigger(event)
+        # Profilers don't nest; a re-entrant call (tests, local runners) just runs
+        if trigger is None or not _active.acquire(blocking=False):
+            return fn(event, context)
+        try:
+            return _run_profiled(fn, event, context, trigger)
+        finally:
+            _active.release()
+
+    return wrapper
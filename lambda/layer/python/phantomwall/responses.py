@@ -0,0 +1,147 @@
+"""
+API Gateway response encoding shared by the HTTP-facing Lambdas.
+
+DynamoDB hands back numbers as Decimal. Instead of rebuilding every item with
+a recursive converter before json.dumps, the encoder converts Decimals as it
+meets them (json's `default` hook), so the body is produced in one pass by
+the C encoder with no intermediate copies.
+
+Bodies above MIN_COMPRESS_BYTES are compressed when the client advertises
+gzip (or br, if the optional `brotli` package is bundled) in Accept-Encoding.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+from decimal import Decimal
+
+try:
+    import brotli
+except ImportError:  # not in the Lambda runtime unless bundled
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 5
+
+
+def json_default(value):
+    """`default` hook for json.dumps: Decimal → int/float, sets → lists."""
+    if isinstance(value, Decimal):
+        if value == value.to_integral_value():
+            return int(value)
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(body):
+    """Serialize `body` (which may contain Decimals) to a compact JSON string."""
+    return json.dumps(body, default=json_default, separators=(",", ":"))
+
+
+def request_header(event, name):
+    """Case-insensitive header lookup on an API Gateway event."""
+    headers = (event or {}).get("headers") or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _accepted_encoding(event):
+    """Pick br or gzip from Accept-Encoding, honouring q=0 exclusions."""
+    accept = request_header(event, "accept-encoding")
+    if not accept:
+        return None
+
+    weights = {}
+    for part in accept.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[token] = quality
+
+    def _allowed(token):
+        return weights.get(token, weights.get("*", 0.0)) > 0
+
+    if brotli is not None and _allowed("br"):
+        return "br"
+    if _allowed("gzip"):
+        return "gzip"
+    return None
+
+
+def _compress(payload, encoding):
+    if encoding == "br":
+        return brotli.compress(payload, quality=4)
+    return gzip.compress(payload, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def etag_for(payload):
+    """Strong ETag for an encoded body."""
+    return '"' + hashlib.md5(payload, usedforsecurity=False).hexdigest() + '"'
+
+
+def etag_matches(event, etag):
+    if_none_match = request_header(event, "if-none-match")
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def json_response(status_code, body, event=None, headers=None, etag=False):
+    """Build an API Gateway proxy response.
+
+    `event` is the incoming request; it drives content negotiation and, with
+    `etag=True`, conditional 304 responses via If-None-Match.
+    """
+    response_headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",
+    }
+    if headers:
+        response_headers.update(headers)
+
+    payload = encode_json(body).encode("utf-8") if body is not None else b""
+
+    if etag and status_code == 200:
+        tag = etag_for(payload)
+        response_headers["ETag"] = tag
+        response_headers.setdefault("Cache-Control", "no-cache")
+        if etag_matches(event, tag):
+            return {"statusCode": 304, "headers": response_headers, "body": ""}
+
+    if len(payload) >= MIN_COMPRESS_BYTES:
+        encoding = _accepted_encoding(event)
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+            response_headers["Vary"] = "Accept-Encoding"
+            return {
+                "statusCode": status_code,
+                "headers": response_headers,
+                "body": base64.b64encode(_compress(payload, encoding)).decode("ascii"),
+                "isBase64Encoded": True,
+            }
+
+    return {
+        "statusCode": status_code,
+        "headers": response_headers,
+        "body": payload.decode("utf-8"),
+    }
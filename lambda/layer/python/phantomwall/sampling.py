@@ -0,0 +1,130 @@
+"""
+Adaptive sampling of low-value event types for the S3 log lake.
+
+During a scan, flow/dns/stats events arrive in volumes that dominate
+suricata_ingest's S3 writes and latency, while alerts are what matter. A
+policy names what to do with each event type once it floods:
+
+    {"flow": {"mode": "sample"}, "dns": {"mode": "sample", "rate": 0.25},
+     "stats": {"mode": "aggregate"}}
+
+    keep       archive every event (also the default for unlisted types)
+    sample     archive a fraction: `rate`, or adaptively threshold / rate
+               seen, so a flooding type is held near the threshold; never
+               below MIN_SAMPLE_RATE
+    aggregate  archive one record per (type, src_ip, dest_ip, dest_port,
+               proto) per hour of each ingest batch instead of every
+               event; rollups are not merged across invocations, so an
+               hour ingested in N batches holds up to N records per key
+               (their weights still add up to the hour's count)
+
+A type floods when its rate in the batch (events / seconds spanned by their
+CloudWatch timestamps, at least one second) exceeds the threshold. Below it,
+everything is kept. ALWAYS_KEEP types and events carrying alert data are
+never sampled.
+
+Each archived record that stands for more than itself carries
+`sample_weight`: the number of events it represents. Sampling is systematic
+(every k-th event of a type in the batch), and the last kept event absorbs
+the remainder, so weights add up to the exact event count. Counts in the
+partition stats table, and SUM(COALESCE(sample_weight, 1)) in Athena, stay
+unbiased.
+"""
+
+import json
+
+ALWAYS_KEEP = frozenset({"alert", "anomaly", "drop"})
+MODES = ("keep", "sample", "aggregate")
+WEIGHT_FIELD = "sample_weight"
+AGGREGATE_FIELD = "aggregated"
+DEFAULT_POLICY = {
+    "flow": {"mode": "sample"},
+    "dns": {"mode": "sample"},
+    "stats": {"mode": "aggregate"},
+}
+MIN_SAMPLE_RATE = 0.01
+_AGGREGATE_KEY = ("event_type", "src_ip", "dest_ip", "dest_port", "proto")
+
+
+def parse_policy(text):
+    """Policy from INGEST_SAMPLING_POLICY (JSON); DEFAULT_POLICY when empty.
+
+    Entries for ALWAYS_KEEP types are dropped: those are never sampled.
+    """
+    if not text:
+        return dict(DEFAULT_POLICY)
+    parsed = json.loads(text)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Sampling policy must be a JSON object of event types: {text}")
+    policy = {}
+    for event_type, entry in parsed.items():
+        if isinstance(entry, str):
+            entry = {"mode": entry}
+        if not isinstance(entry, dict):
+            raise ValueError(f"Sampling policy for {event_type} must be a mode or an object: {entry!r}")
+        mode = entry.get("mode", "keep")
+        if mode not in MODES:
+            raise ValueError(f"Unknown sampling mode for {event_type}: {mode}")
+        rate = entry.get("rate")
+        if rate is not None and (isinstance(rate, bool) or not isinstance(rate, (int, float))):
+            raise ValueError(f"Sampling rate for {event_type} must be a number: {rate!r}")
+        if rate is not None and not 0 < float(rate) <= 1:
+            raise ValueError(f"Sampling rate for {event_type} must be in (0, 1]: {rate}")
+        if event_type not in ALWAYS_KEEP:
+            policy[event_type] = {"mode": mode, **({"rate": float(rate)} if rate is not None else {})}
+    return policy
+
+
+def batch_rates(type_timestamps):
+    """{event_type: events per second} from {event_type: [timestamp_ms, ...]}."""
+    all_ms = [ms for stamps in type_timestamps.values() for ms in stamps]
+    if not all_ms:
+        return {}
+    span_seconds = max((max(all_ms) - min(all_ms)) / 1000, 1.0)
+    return {event_type: len(stamps) / span_seconds for event_type, stamps in type_timestamps.items()}
+
+
+def plan(rates, policy, threshold, min_rate=MIN_SAMPLE_RATE):
+    """What to do with each event type in this batch.
+
+    Returns {event_type: {"mode", "rate_per_second", "keep_every"}}; keep_every
+    is only set for "sample".
+    """
+    decisions = {}
+    for event_type, rate in rates.items():
+        entry = policy.get(event_type)
+        decision = {"mode": "keep", "rate_per_second": round(rate, 1)}
+        if entry and entry["mode"] != "keep" and event_type not in ALWAYS_KEEP and rate > threshold:
+            decision["mode"] = entry["mode"]
+            if entry["mode"] == "sample":
+                fraction = entry.get("rate") or max(min_rate, threshold / rate)
+                decision["keep_every"] = max(1, round(1 / fraction))
+        decisions[event_type] = decision
+    return decisions
+
+
+def systematic_weight(index, total, keep_every):
+    """Weight of the `index`-th event (0-based) of `total` when keeping every
+    `keep_every`-th; 0 means drop it."""
+    if index % keep_every:
+        return 0
+    return min(keep_every, total - index)
+
+
+def aggregate_key(event):
+    return tuple(event.get(field) for field in _AGGREGATE_KEY)
+
+
+def add_to_aggregate(group, event, timestamp):
+    """Fold `event` into `group` (a dict; start with {}), the record archived for it."""
+    if not group:
+        group.update({field: event.get(field) for field in _AGGREGATE_KEY if event.get(field) is not None})
+        group["timestamp"] = timestamp
+        group[AGGREGATE_FIELD] = {"count": 0, "first_seen": timestamp, "last_seen": timestamp}
+        group[WEIGHT_FIELD] = 0
+    rollup = group[AGGREGATE_FIELD]
+    rollup["count"] += 1
+    rollup["first_seen"] = min(rollup["first_seen"], timestamp)
+    rollup["last_seen"] = max(rollup["last_seen"], timestamp)
+    group[WEIGHT_FIELD] += 1
+    return group
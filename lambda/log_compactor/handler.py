@@ -0,0 +1,340 @@
+"""
+================================================================================
+PhantomWall S3 Log Compactor Lambda
+================================================================================
+Purpose: Rewrites closed partitions of the S3 log lake into a few large
+         gzip NDJSON files. suricata_ingest writes one small object per event,
+         so an hour can hold thousands of objects; Athena spends most of a
+         historical query opening them and S3 bills every LIST/GET.
+
+Triggers:
+  - EventBridge, hourly:   {"action": "compact"}
+        compacts every partition in the last COMPACT_LOOKBACK_HOURS that
+        closed at least COMPACT_MIN_AGE_MINUTES ago and still has raw objects
+  - Backfill (manual):     {"action": "compact", "date": "2026-01-29"}
+                           {"action": "compact", "hours": ["2026-01-29T14"]}
+  - CLI:                   python handler.py --date 2026-01-29
+
+Per partition:
+  1. read every source object (raw per-event JSON under the hour prefix plus
+     the current compacted version, if any) as NDJSON lines
+  2. write them to compacted/<partition>/v=<ts>/part-NNNNN.json.gz
+  3. re-read the written files and check the row count matches the source
+  4. point the Glue partition at the new prefix (one UpdatePartition call,
+     so queries see either the old files or the new ones, never a mix)
+  5. delete exactly the source objects that were read
+
+Each compacted partition also gets an IP index sidecar (phantomwall.ip_index)
+that s3_log_query uses to skip partitions for src_ip/dest_ip searches.
+Partitions compacted before sidecars existed are indexed in place.
+
+With PARTITION_STATS_TABLE set, the compacted size is recorded in the size
+manifest (phantomwall.partition_stats) that s3_log_query estimates scans from.
+
+Events that land in the raw prefix after an hour is compacted are invisible
+to Athena until the next run merges them in.
+================================================================================
+"""
+
+import argparse
+import datetime
+import gzip
+import io
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from phantomwall import aws, ip_index, partition_stats, partitions, profiling
+
+S3_BUCKET = os.environ["S3_BUCKET"]
+DATABASE = os.environ["ATHENA_DATABASE"]
+TABLE = os.environ["ATHENA_TABLE"]
+
+# Size manifest shared with suricata_ingest, optional
+PARTITION_STATS_TABLE = os.environ.get("PARTITION_STATS_TABLE")
+_partition_stats_table = aws.table(PARTITION_STATS_TABLE) if PARTITION_STATS_TABLE else None
+
+COMPACT_LOOKBACK_HOURS = int(os.environ.get("COMPACT_LOOKBACK_HOURS", "24"))
+# Late CloudWatch deliveries still land in an hour shortly after it ends
+COMPACT_MIN_AGE_MINUTES = int(os.environ.get("COMPACT_MIN_AGE_MINUTES", "60"))
+# Roll to a new output file after this many uncompressed bytes
+TARGET_FILE_BYTES = int(os.environ.get("COMPACT_TARGET_FILE_BYTES", str(256 * 1024 * 1024)))
+READ_WORKERS = 16
+READ_WINDOW = 512  # source objects in flight at once
+DELETE_BATCH = 1000  # DeleteObjects limit
+
+# Every run lists Glue partitions and rewrites S3 objects; READ_WORKERS
+# threads share the S3 client
+_s3 = aws.client("s3", workers=READ_WORKERS)
+_glue = aws.client("glue")
+aws.prewarm(_s3, _glue)
+
+
+class CompactionError(Exception):
+    """Raised when the compacted output does not match its source."""
+
+
+def _split_location(location):
+    """s3://bucket/prefix/ → (bucket, prefix)."""
+    bucket, _, prefix = location[len("s3://"):].partition("/")
+    return bucket, prefix
+
+
+def _list_keys(prefix):
+    """Object keys directly under `prefix` (sub-prefixes are not descended)."""
+    keys = []
+    paginator = _s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix, Delimiter="/"):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def _read_lines(key):
+    """One source object as a list of NDJSON lines (bytes, no newline)."""
+    body = _s3.get_object(Bucket=S3_BUCKET, Key=key)["Body"].read()
+    if key.endswith(".gz"):
+        body = gzip.decompress(body)
+    return [line for line in body.splitlines() if line.strip()]
+
+
+def _collect_ips(collector, line):
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return
+    if isinstance(event, dict):
+        ip_index.add_event(collector, event)
+
+
+def _write_parts(prefix, sources, keys, collector):
+    """Stream source lines into gzip parts, appending each key written.
+
+    Returns (rows written, total gzip bytes written).
+    """
+    rows = 0
+    buffer = io.BytesIO()
+    writer = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=6)
+    written = 0
+    sizes = []
+
+    def _flush():
+        writer.close()
+        key = f"{prefix}part-{len(keys):05d}.json.gz"
+        body = buffer.getvalue()
+        _s3.put_object(
+            Bucket=S3_BUCKET,
+            Key=key,
+            Body=body,
+            ContentType="application/x-ndjson",
+            ContentEncoding="gzip",
+        )
+        keys.append(key)
+        sizes.append(len(body))
+
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        # Read ahead a bounded window so a busy hour is never held in memory whole
+        for start in range(0, len(sources), READ_WINDOW):
+            for lines in pool.map(_read_lines, sources[start : start + READ_WINDOW]):
+                for line in lines:
+                    _collect_ips(collector, line)
+                    writer.write(line + b"\n")
+                    written += len(line) + 1
+                    rows += 1
+                if written >= TARGET_FILE_BYTES:
+                    _flush()
+                    buffer = io.BytesIO()
+                    writer = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=6)
+                    written = 0
+
+    if written or not keys:
+        _flush()
+    return rows, sum(sizes)
+
+
+def _count_rows(keys):
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        return sum(len(lines) for lines in pool.map(_read_lines, keys))
+
+
+def _delete_keys(keys):
+    for i in range(0, len(keys), DELETE_BATCH):
+        _s3.delete_objects(
+            Bucket=S3_BUCKET,
+            Delete={"Objects": [{"Key": key} for key in keys[i : i + DELETE_BATCH]], "Quiet": True},
+        )
+
+
+def _put_index(values, collector):
+    _s3.put_object(Bucket=S3_BUCKET, Key=ip_index.index_key(values), Body=ip_index.encode(collector))
+
+
+def _has_index(values):
+    try:
+        _s3.head_object(Bucket=S3_BUCKET, Key=ip_index.index_key(values))
+        return True
+    except ClientError:
+        return False
+
+
+def _index_in_place(values, keys):
+    """Build the sidecar for an already-compacted partition."""
+    collector = ip_index.new_collector()
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        for lines in pool.map(_read_lines, keys):
+            for line in lines:
+                _collect_ips(collector, line)
+    _put_index(values, collector)
+
+
+def _record_compacted_bytes(values, size):
+    """Update the size manifest; never fails a compaction that already succeeded."""
+    if _partition_stats_table is None:
+        return
+    try:
+        key = {"partition_date": "-".join(values[:3]), "hour": values[3]}
+        partition_stats.set_compacted_bytes(_partition_stats_table, key, values[4], size)
+    except Exception as e:
+        print(f"Partition stats update error for {values}: {e}")
+
+
+def compact_partition(partition):
+    """Compact one Glue partition. Returns a stats dict, or None if nothing to do."""
+    values = partition["Values"]
+    raw_prefix = partitions.partition_prefix(values)
+    location = partition["StorageDescriptor"]["Location"]
+    _, current_prefix = _split_location(location)
+    if not current_prefix.endswith("/"):
+        current_prefix += "/"
+
+    raw_keys = _list_keys(raw_prefix)
+    previous_keys = _list_keys(current_prefix) if current_prefix != raw_prefix else []
+    if not raw_keys:
+        # Already compacted and no stragglers since; make sure it is indexed
+        if previous_keys and not _has_index(values):
+            _index_in_place(values, previous_keys)
+            print(f"Indexed {raw_prefix} in place ({len(previous_keys)} files)")
+        return None
+    sources = previous_keys + raw_keys
+
+    # Unique per run: the new prefix must never coincide with the one being replaced
+    version = f"{datetime.datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    new_prefix = partitions.compacted_prefix(values, version)
+    new_keys = []
+    collector = ip_index.new_collector()
+    try:
+        rows, compressed_bytes = _write_parts(new_prefix, sources, new_keys, collector)
+        verified = _count_rows(new_keys)
+        if verified != rows:
+            raise CompactionError(f"{raw_prefix}: read {rows} rows, compacted files hold {verified}")
+
+        # Written before the swap: it covers the new files, which are a
+        # superset of what the old location holds, so it is never too narrow
+        _put_index(values, collector)
+
+        _glue.update_partition(
+            DatabaseName=DATABASE,
+            TableName=TABLE,
+            PartitionValueList=values,
+            PartitionInput=partitions.partition_input(
+                values, partition["StorageDescriptor"], f"s3://{S3_BUCKET}/{new_prefix}"
+            ),
+        )
+    except Exception:
+        # Originals and the Glue location are untouched; drop the partial output
+        if new_keys:
+            _delete_keys(new_keys)
+        raise
+
+    _delete_keys(sources)
+    _record_compacted_bytes(values, compressed_bytes)
+    return {
+        "partition": raw_prefix,
+        "rows": rows,
+        "bytes": compressed_bytes,
+        "objects_before": len(sources),
+        "objects_after": len(new_keys),
+        "location": f"s3://{S3_BUCKET}/{new_prefix}",
+    }
+
+
+def _hour_expression(dt):
+    return " AND ".join(
+        f"{key} = '{value}'" for key, value in zip(partitions.HOUR_KEYS, partitions.hour_values(dt))
+    )
+
+
+def _partitions_for_hour(dt):
+    found = []
+    paginator = _glue.get_paginator("get_partitions")
+    for page in paginator.paginate(DatabaseName=DATABASE, TableName=TABLE, Expression=_hour_expression(dt)):
+        found.extend(page.get("Partitions", []))
+    return found
+
+
+def _closed_hours(now):
+    """Hours in the lookback window that closed at least COMPACT_MIN_AGE_MINUTES ago."""
+    newest = (now - datetime.timedelta(minutes=COMPACT_MIN_AGE_MINUTES)).replace(minute=0, second=0, microsecond=0)
+    newest -= datetime.timedelta(hours=1)
+    return [newest - datetime.timedelta(hours=i) for i in range(COMPACT_LOOKBACK_HOURS)]
+
+
+def _requested_hours(event, now):
+    if event.get("hours"):
+        return [datetime.datetime.strptime(h, "%Y-%m-%dT%H") for h in event["hours"]]
+    if event.get("date"):
+        day = datetime.datetime.strptime(event["date"], "%Y-%m-%d")
+        return [day + datetime.timedelta(hours=h) for h in range(24)]
+    return _closed_hours(now)
+
+
+@profiling.profiled
+def handler(event, context):
+    event = event or {}
+    aws.reset_counters()
+    now = datetime.datetime.utcnow()
+    try:
+        hours = _requested_hours(event, now)
+    except ValueError as e:
+        return {"statusCode": 400, "error": f"Invalid date or hour: {e}"}
+
+    # Never touch an hour that may still receive writes, even on backfill
+    cutoff = now - datetime.timedelta(minutes=COMPACT_MIN_AGE_MINUTES)
+    hours = [h for h in hours if h + datetime.timedelta(hours=1) <= cutoff]
+
+    started = time.monotonic()
+    compacted = []
+    failed = 0
+    for hour in hours:
+        for partition in _partitions_for_hour(hour):
+            try:
+                stats = compact_partition(partition)
+            except Exception as e:
+                failed += 1
+                print(f"Compaction failed for {partition['Values']}: {e}")
+                continue
+            if stats:
+                print(f"Compacted {stats['partition']}: {stats['objects_before']} objects → {stats['objects_after']} ({stats['rows']} rows)")
+                compacted.append(stats)
+
+    return {
+        "statusCode": 500 if failed else 200,
+        "hours_checked": len(hours),
+        "partitions_compacted": len(compacted),
+        "partitions_failed": failed,
+        "rows": sum(s["rows"] for s in compacted),
+        "objects_removed": sum(s["objects_before"] - s["objects_after"] for s in compacted),
+        "duration_ms": int((time.monotonic() - started) * 1000),
+        "aws": aws.counters(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact closed hour partitions of the S3 log lake")
+    parser.add_argument("--date", help="compact every hour of YYYY-MM-DD")
+    parser.add_argument("--hour", action="append", dest="hours", help="compact one hour, YYYY-MM-DDTHH (repeatable)")
+    args = parser.parse_args()
+    print(handler({"action": "compact", "date": args.date, "hours": args.hours}, None))
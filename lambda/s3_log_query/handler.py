@@ -5,32 +5,105 @@ PhantomWall S3 Log Query Lambda
 Purpose: Queries ALL Suricata logs stored in S3 via Athena.
          Separate from DynamoDB alerts - this is for full log exploration.
 
-API Endpoint: GET /logs
+API Endpoints:
+  GET  /logs             Search inline; waits up to INLINE_WAIT_SECONDS, then
+                         returns 202 with an execution id to poll
+  POST /logs/query       Start a search (JSON body, same fields as below) and
+                         return its execution id immediately
+  GET  /logs/query/{id}  Status of a search, or its results once finished
 
 Query Parameters:
-  - date       (required)  Date to query: YYYY-MM-DD
+  - date       (required)  Date to query: YYYY-MM-DD, unless from/to is given
+  - from / to  (optional)  Range instead of date: YYYY-MM-DD or YYYY-MM-DDTHH
+                           (max RANGE_MAX_DAYS). Ranges over RANGE_SPLIT_DAYS
+                           run as concurrent per-day queries, k-way merged by
+                           timestamp, stopping once `limit` is satisfied
   - event_type (optional)  Filter: alert, flow, dns, http, tls, etc.
   - src_ip     (optional)  Filter by source IP
   - dest_ip    (optional)  Filter by destination IP
   - proto      (optional)  Filter by protocol: TCP, UDP, ICMP
   - limit      (optional)  Max results (default: 100, max: 500)
+  - export     (optional)  POST /logs/query only: "true" drops the LIMIT so the
+                           whole day can be exported
+  - dry_run    (optional)  "true": return the plan (engine, SQL, scan estimate,
+                           budget verdict) without running anything
+  - over_budget (optional) narrow (default) | reject - what to do with a
+                           search estimated over a scan budget
+
+Results are streamed from the Athena CSV output object, never truncated.
+Finished searches page with ?offset=&page_size= on /logs/query/{id}, and
+GET /logs/query/{id}/export?format=csv|ndjson returns a presigned download.
+
+Partitions: year/month/day/hour/etype. suricata_ingest registers each
+            partition in Glue when it first writes there; event_type
+            searches prune on etype (plus legacy etype='all' hours).
+            A daily EventBridge invocation with {"action":
+            "repair_partitions"} backfills anything missed, so the request
+            path does no discovery work. The same repair migrates hours
+            registered before the etype key existed to etype='all'.
+
+IP index: src_ip/dest_ip searches read the per-partition IP sidecars
+          log_compactor writes (index/.../ips.idx) and restrict the query to
+          partitions that can hold the IP. Partitions without a sidecar are
+          always scanned. Counts are reported under `ip_index`.
+
+Local engine: when the partitions a search touches (after IP index pruning)
+              hold at most LOCAL_ENGINE_MAX_BYTES, the objects are streamed
+              and filtered in-process (phantomwall.local_engine) instead of
+              starting an Athena query. Such results carry "engine": "local"
+              and a `local` block (objects/bytes/rows read); everything else
+              reports "engine": "athena". Exports always use Athena.
+
+Scan budget: Athena scans are estimated before they start from the size
+             manifest suricata_ingest and log_compactor keep in
+             PARTITION_STATS_TABLE (phantomwall.partition_stats). Searches
+             over SCAN_BUDGET_REQUEST_BYTES, or over what is left of
+             SCAN_BUDGET_DAILY_BYTES today (QUERY_BUDGET_TABLE), are narrowed
+             to their newest hours that fit (reported under budget.narrowed)
+             or rejected with 400 / 429. Exports are never narrowed.
+
+Summary: action=summary is served from the per-hour event-type counters
+         suricata_ingest keeps in PARTITION_STATS_TABLE; only days with no
+         counters at all fall back to an Athena GROUP BY.
+
+Caching: results are cached by normalized SQL (container memory, then
+         RESULTS_BUCKET/cache/). Closed hours/days are keyed on their data
+         version (the newest ingest stamp in PARTITION_STATS_TABLE) and kept
+         for 7 days, so a late object or a newly registered partition makes
+         a fresh key. Without a version they live CACHE_CLOSED_TTL_SECONDS;
+         empty results and queries touching the current hour expire after
+         CACHE_TTL_SECONDS. Every Athena-served response carries a `cache` block.
+
+Metrics: every request prints one EMF record (phantomwall.metrics) with its
+         latency, time in Athena/Glue/S3/DynamoDB calls, rows read, response
+         bytes and cache hits/misses, by route ("GET /logs", "GET /logs
+         summary", ...) and status.
 
 Cost: Athena charges ~$5/TB scanned. Partition pruning keeps costs minimal.
 ================================================================================
 """
 
+import base64
+import codecs
+import csv
 import datetime
+import hashlib
+import heapq
+import io
+import itertools
 import json
 import os
 import re
 import time
+import urllib.parse
 import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
+from botocore.exceptions import ClientError
 
-_athena = boto3.client("athena")
-_glue = boto3.client("glue")
-_s3 = boto3.client("s3")
+from phantomwall import aws, ip_index, local_engine, metrics, partition_stats, partitions, profiling
+from phantomwall.responses import json_response
 
 DATABASE = os.environ["ATHENA_DATABASE"]
 TABLE = os.environ["ATHENA_TABLE"]
@@ -38,23 +111,134 @@ WORKGROUP = os.environ["ATHENA_WORKGROUP"]
 RESULTS_BUCKET = os.environ["RESULTS_BUCKET"]
 S3_BUCKET = os.environ.get("S3_BUCKET", "")
 
+# Per-hour event-type counters maintained by suricata_ingest, optional
+PARTITION_STATS_TABLE = os.environ.get("PARTITION_STATS_TABLE")
+_partition_stats_table = aws.table(PARTITION_STATS_TABLE) if PARTITION_STATS_TABLE else None
+
+# ── Query Result Cache ──
+# Keyed on the normalized SQL. Closed hours still change when objects land
+# late or a partition is registered after the fact, so their results are
+# also keyed on the data version and kept for CACHE_IMMUTABLE_TTL_SECONDS;
+# without a version they get the bounded CACHE_CLOSED_TTL_SECONDS. Anything
+# touching the current hour, and any empty result, lives CACHE_TTL_SECONDS.
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "60"))
+CACHE_CLOSED_TTL_SECONDS = int(os.environ.get("CACHE_CLOSED_TTL_SECONDS", "3600"))
+CACHE_IMMUTABLE_TTL_SECONDS = 7 * 24 * 3600  # results bucket expires objects after 7 days
+# Data versions read from the stats table are reused this long (one request)
+DATA_VERSION_MEMO_SECONDS = 5
+CACHE_MEMORY_ENTRIES = int(os.environ.get("CACHE_MEMORY_ENTRIES", "64"))
+CACHE_PREFIX = "cache/"
+# Events can land a little after their hour ends (CloudWatch subscription lag)
+PARTITION_CLOSE_GRACE = datetime.timedelta(minutes=15)
+
+_PARTITION_PREDICATE = re.compile(
+    r"year = '(\d{4})' AND month = '(\d{2})' AND day = '(\d{2})'(?: AND hour = '(\d{2})')?"
+)
+# day → (monotonic expiry, data version)
+_data_versions = {}
+
+# In-memory tier (per Lambda container): key -> (expires_at, result)
+_result_cache = OrderedDict()
+
+# ── Query Execution ──
+# Inline GET /logs waits at most this long, then hands back the execution id
+# so the client can keep polling /logs/query/{id}
+INLINE_WAIT_SECONDS = float(os.environ.get("INLINE_WAIT_SECONDS", "20"))
+POLL_INITIAL_SECONDS = 0.1
+POLL_MAX_SECONDS = 1.0
+POLL_BACKOFF = 1.5
+INVOCATION_MARGIN_SECONDS = 3
+# ── Range Searches ──
+# from/to ranges longer than RANGE_SPLIT_DAYS run as one Athena query per
+# day, at most RANGE_MAX_CONCURRENCY at a time, newest day first
+RANGE_MAX_DAYS = int(os.environ.get("RANGE_MAX_DAYS", "31"))
+RANGE_SPLIT_DAYS = int(os.environ.get("RANGE_SPLIT_DAYS", "3"))
+RANGE_MAX_CONCURRENCY = int(os.environ.get("RANGE_MAX_CONCURRENCY", "8"))
+
+# ── IP Index Sidecars ──
+IP_INDEX_WORKERS = 16
+# Sidecar answers, (key, field, packed ip) → bool, and partition lookups for
+# the current invocation. Re-compaction can add IPs to a sidecar and ingest
+# registers new partitions, so both are cleared per request.
+_ip_lookups = {}
+_partition_lookups = {}
+
+# ── Local Engine ──
+# Searches whose partitions hold at most LOCAL_ENGINE_MAX_BYTES in at most
+# LOCAL_ENGINE_MAX_OBJECTS objects are read and filtered in-process instead
+# of going to Athena. 0 sends everything to Athena.
+LOCAL_ENGINE_MAX_BYTES = int(os.environ.get("LOCAL_ENGINE_MAX_BYTES", str(8 * 1024 * 1024)))
+LOCAL_ENGINE_MAX_OBJECTS = int(os.environ.get("LOCAL_ENGINE_MAX_OBJECTS", "256"))
+LOCAL_ENGINE_WORKERS = 16
+
+# ── AWS Clients ──
+# Pools are sized to the widest fan-out sharing each client: per-day Glue
+# lookups run RANGE_MAX_CONCURRENCY at a time, sidecar and local-engine S3
+# reads IP_INDEX_WORKERS / LOCAL_ENGINE_WORKERS. Every search plans against
+# Glue; Athena is skipped by the local engine, cache hits and the
+# stats-backed summary, and S3 by most routes, so only Glue is pre-warmed.
+_athena = aws.client("athena", workers=RANGE_MAX_CONCURRENCY)
+_glue = aws.client("glue", workers=RANGE_MAX_CONCURRENCY)
+_s3 = aws.client("s3", workers=max(IP_INDEX_WORKERS, LOCAL_ENGINE_WORKERS))
+aws.prewarm(_glue)
+
+# ── Scan Estimates / Budgets ──
+# Athena scans are estimated before they run from the partition size
+# manifest (PARTITION_STATS_TABLE). A search estimated over
+# SCAN_BUDGET_REQUEST_BYTES, or over what is left of SCAN_BUDGET_DAILY_BYTES
+# today, is narrowed to its newest hours that fit or rejected. 0 disables a
+# budget; the daily one also needs QUERY_BUDGET_TABLE.
+SCAN_BUDGET_REQUEST_BYTES = int(os.environ.get("SCAN_BUDGET_REQUEST_BYTES", "0"))
+SCAN_BUDGET_DAILY_BYTES = int(os.environ.get("SCAN_BUDGET_DAILY_BYTES", "0"))
+QUERY_BUDGET_TABLE = os.environ.get("QUERY_BUDGET_TABLE")
+_query_budget_table = aws.table(QUERY_BUDGET_TABLE) if QUERY_BUDGET_TABLE else None
+QUERY_BUDGET_RETENTION_DAYS = 7
+ATHENA_PRICE_PER_TB = 5.0
+ATHENA_MIN_BILLED_BYTES = 10 * 1024 * 1024  # Athena bills at least 10 MB per query
+
+# ── Result Paging / Export ──
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+EXPORT_PREFIX = "exports/"
+EXPORT_PART_BYTES = 8 * 1024 * 1024  # S3 multipart minimum is 5 MB
+EXPORT_URL_TTL_SECONDS = 900
+_QUERY_ID_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
 # ── GeoIP Cache (in-memory, per Lambda container) ──
 _geo_cache = {}
 
 
-def _response(status_code, body):
-    return {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-        },
-        "body": json.dumps(body),
-    }
+def _response(status_code, body, event=None):
+    return json_response(status_code, body, event)
 
 
-def _build_query(params):
-    """Build an Athena SQL query with partition pruning and optional filters."""
+def _parse_range_bound(value, end):
+    """YYYY-MM-DD or YYYY-MM-DDTHH → the first (or, for `end`, last) hour it covers."""
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%dT%H")
+    except ValueError:
+        day = datetime.datetime.strptime(value, "%Y-%m-%d")
+        return day.replace(hour=23) if end else day
+
+
+def _resolve_range(params):
+    """Inclusive (first hour, last hour) a search covers, or an error string."""
+    if params.get("from") or params.get("to"):
+        try:
+            end = (
+                _parse_range_bound(params["to"], end=True)
+                if params.get("to")
+                else datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+            )
+            start = _parse_range_bound(params["from"], end=False) if params.get("from") else end.replace(hour=0)
+        except ValueError:
+            return None, None, "Invalid from/to. Use YYYY-MM-DD or YYYY-MM-DDTHH"
+        if start > end:
+            return None, None, "from must not be after to"
+        if (end.date() - start.date()).days + 1 > RANGE_MAX_DAYS:
+            return None, None, f"Range too long (max {RANGE_MAX_DAYS} days)"
+        return start, end, None
+
     date_str = params.get("date")
     if not date_str:
         date_str = datetime.datetime.utcnow().strftime("%Y-%m-%d")
@@ -63,25 +247,71 @@ def _build_query(params):
     try:
         dt = datetime.datetime.strptime(date_str, "%Y-%m-%d")
     except ValueError:
-        return None, "Invalid date format. Use YYYY-MM-DD"
+        return None, None, "Invalid date format. Use YYYY-MM-DD"
 
-    limit = min(int(params.get("limit", "100")), 500)
-
-    # Partition pruning - only scan the specific date partition
-    where_clauses = [
-        f"year = '{dt.year}'",
-        f"month = '{dt.month:02d}'",
-        f"day = '{dt.day:02d}'",
-    ]
-
-    # Optional hour filter
     hour = params.get("hour")
     if hour:
-        where_clauses.append(f"hour = '{int(hour):02d}'")
+        try:
+            dt = dt.replace(hour=int(hour))
+        except ValueError:
+            return None, None, "Invalid hour. Use 0-23"
+        return dt, dt, None
+    return dt, dt.replace(hour=23), None
+
+
+def _range_days(start, end):
+    """(first hour, last hour) for each day of the range, oldest first."""
+    days = []
+    day_start = start
+    while day_start <= end:
+        day_end = min(day_start.replace(hour=23), end)
+        days.append((day_start, day_end))
+        day_start = (day_start + datetime.timedelta(days=1)).replace(hour=0)
+    return days
+
+
+def _partition_predicate(start, end):
+    """Exact partition predicate for an inclusive hour range.
+
+    A single whole day or single hour keeps the historical
+    `year = .. AND month = .. AND day = ..[ AND hour = ..]` form.
+    """
+    terms = []
+    for day_start, day_end in _range_days(start, end):
+        term = f"year = '{day_start.year}' AND month = '{day_start.month:02d}' AND day = '{day_start.day:02d}'"
+        if day_start.hour == day_end.hour:
+            term += f" AND hour = '{day_start.hour:02d}'"
+        elif day_start.hour != 0 or day_end.hour != 23:
+            term += f" AND hour BETWEEN '{day_start.hour:02d}' AND '{day_end.hour:02d}'"
+        terms.append(term)
+    if len(terms) == 1:
+        return terms[0]
+    return "(" + " OR ".join(f"({term})" for term in terms) + ")"
+
+
+def _build_query(params, pruning=None):
+    """Build an Athena SQL query with partition pruning and optional filters.
+
+    Covers `date` (+ optional `hour`) or a `from`/`to` range. When `pruning`
+    is a dict, IP searches consult the IP index sidecars and the dict is
+    filled with partitions scanned/skipped/unindexed.
+    """
+    start, end, error = _resolve_range(params)
+    if error:
+        return None, error
+
+    export = str(params.get("export", "")).lower() == "true"
+    limit = min(int(params.get("limit", "100")), 500)
+
+    # Partition pruning - only scan the requested day/hour partitions
+    where_clauses = [_partition_predicate(start, end)]
 
     # Optional filters
     event_type = params.get("event_type")
     if event_type:
+        # Prune to that type's partitions plus legacy all-type hours
+        etype = partitions.event_type_value(event_type)
+        where_clauses.append(f"etype IN ('{etype}', '{partitions.ALL_EVENT_TYPES}')")
         where_clauses.append(f"event_type = '{_sanitize(event_type)}'")
 
     src_ip = params.get("src_ip")
@@ -100,23 +330,359 @@ def _build_query(params):
     if dest_port:
         where_clauses.append(f"dest_port = {int(dest_port)}")
 
+    ip_field, ip = ("src_ip", src_ip) if src_ip else ("dest_ip", dest_ip)
+    if pruning is not None and ip:
+        clause = _ip_partition_clause(start, end, event_type, ip_field, ip, pruning)
+        if clause:
+            where_clauses.append(clause)
+
     where_sql = " AND ".join(where_clauses)
 
     query = f"""
         SELECT timestamp, event_type, src_ip, src_port, dest_ip, dest_port,
-               proto, flow_id, app_proto,
+               proto, flow_id, app_proto, sample_weight,
                alert.signature as alert_signature,
                alert.severity as alert_severity,
                alert.category as alert_category
         FROM "{DATABASE}"."{TABLE}"
         WHERE {where_sql}
         ORDER BY timestamp DESC
-        LIMIT {limit}
+        {"" if export else f"LIMIT {limit}"}
     """
 
     return query, None
 
 
+def _day_partitions(day_start, day_end, event_type=None):
+    """(values, location) of the Glue partitions for one day's hours [day_start, day_end]."""
+    expression = (
+        f"year = '{day_start.year}' AND month = '{day_start.month:02d}' AND day = '{day_start.day:02d}'"
+        f" AND hour BETWEEN '{day_start.hour:02d}' AND '{day_end.hour:02d}'"
+    )
+    wanted = None
+    if event_type:
+        wanted = {partitions.event_type_value(event_type), partitions.ALL_EVENT_TYPES}
+
+    found = []
+    paginator = _glue.get_paginator("get_partitions")
+    for page in paginator.paginate(DatabaseName=DATABASE, TableName=TABLE, Expression=expression):
+        for p in page.get("Partitions", []):
+            values = p["Values"]
+            if wanted is None or values[-1] in wanted:
+                found.append((values, p["StorageDescriptor"]["Location"]))
+    return found
+
+
+def _sidecar_keys(dt):
+    """Keys of every IP index sidecar written for one day."""
+    prefix = f"{ip_index.INDEX_PREFIX}{partitions.partition_prefix(partitions.hour_values(dt)[:3])}"
+    keys = set()
+    paginator = _s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix):
+        keys.update(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def _partition_may_hold(key, field, packed):
+    memo_key = (key, field, packed)
+    if memo_key in _ip_lookups:
+        return _ip_lookups[memo_key]
+    try:
+        decoded = ip_index.decode(_s3.get_object(Bucket=S3_BUCKET, Key=key)["Body"].read())
+    except Exception as e:
+        print(f"IP index read error for {key}: {e}")
+        return True  # unreadable sidecar: scan rather than risk missing rows
+    _ip_lookups[memo_key] = ip_index.contains(decoded, field, packed)
+    return _ip_lookups[memo_key]
+
+
+def _search_partitions(start, end, event_type, field=None, ip=None, pruning=None):
+    """(values, location) of every partition a search has to read.
+
+    With an IP, partitions whose sidecar rules it out are left out and
+    `pruning` is filled with partitions scanned/skipped/unindexed.
+    Raises on Glue/S3 errors.
+    """
+    packed = ip_index.pack_ip(ip) if ip else None
+    memo_key = (start, end, event_type, field if packed else None, packed)
+    if memo_key not in _partition_lookups:
+        _partition_lookups[memo_key] = _lookup_partitions(start, end, event_type, field, packed)
+    candidates, stats = _partition_lookups[memo_key]
+    if pruning is not None:
+        pruning.update(stats)
+    return candidates
+
+
+def _lookup_partitions(start, end, event_type, field, packed):
+    days = _range_days(start, end)
+    with ThreadPoolExecutor(max_workers=RANGE_MAX_CONCURRENCY) as pool:
+        by_day = list(pool.map(lambda day: _day_partitions(day[0], day[1], event_type), days))
+    every = [entry for day in by_day for entry in day]
+    if packed is None:
+        return every, {}
+
+    sidecars = set()
+    for day_start, _ in days:
+        sidecars |= _sidecar_keys(day_start)
+    candidates = []
+    indexed = []
+    for entry in every:
+        key = ip_index.index_key(entry[0])
+        if key in sidecars:
+            indexed.append((entry, key))
+        else:
+            candidates.append(entry)
+    with ThreadPoolExecutor(max_workers=IP_INDEX_WORKERS) as pool:
+        hits = list(pool.map(lambda item: _partition_may_hold(item[1], field, packed), indexed))
+    candidates += [entry for (entry, _), hit in zip(indexed, hits) if hit]
+
+    return candidates, {
+        "partitions_scanned": len(candidates),
+        "partitions_skipped": len(every) - len(candidates),
+        "partitions_unindexed": len(every) - len(indexed),
+    }
+
+
+def _ip_partition_clause(start, end, event_type, field, ip, pruning):
+    """Partition predicate limited to partitions whose sidecar holds `ip`.
+
+    Returns None when nothing can be skipped, so the SQL (and its cache key)
+    stays the same as an unindexed search.
+    """
+    if ip_index.pack_ip(ip) is None or not S3_BUCKET:
+        return None
+    try:
+        candidates = _search_partitions(start, end, event_type, field, ip, pruning)
+    except Exception as e:
+        print(f"IP index lookup skipped: {e}")
+        return None
+
+    if not pruning.get("partitions_skipped"):
+        return None
+    if not candidates:
+        return "FALSE"
+    pairs = sorted(
+        "(" + " AND ".join(f"{key} = '{value}'" for key, value in zip(partitions.PARTITION_KEYS, values)) + ")"
+        for values, _ in candidates
+    )
+    return "(" + " OR ".join(pairs) + ")"
+
+
+def _list_partition_objects(location):
+    """(key, size) of the data objects directly under a partition location."""
+    bucket, _, prefix = location[len("s3://"):].partition("/")
+    if bucket != S3_BUCKET:
+        raise ValueError(f"partition outside the logs bucket: {location}")
+    if not prefix.endswith("/"):
+        prefix += "/"
+    paginator = _s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix, Delimiter="/"):
+        for obj in page.get("Contents", []):
+            yield obj["Key"], obj["Size"]
+
+
+def _plan_local_search(params, pruning):
+    """Objects to read for an in-process search, or None to use Athena.
+
+    Picks the local engine when the partitions a search touches (after IP
+    index pruning) hold at most LOCAL_ENGINE_MAX_BYTES in at most
+    LOCAL_ENGINE_MAX_OBJECTS objects. Listing stops as soon as either is
+    exceeded, so large searches pay for one LIST page at most per partition.
+    """
+    if LOCAL_ENGINE_MAX_BYTES <= 0 or not S3_BUCKET or str(params.get("export", "")).lower() == "true":
+        return None
+    start, end, error = _resolve_range(params)
+    if error:
+        return None
+
+    ip_field, ip = _ip_filter(params)
+    if not ip and len(_range_days(start, end)) > RANGE_SPLIT_DAYS:
+        return None  # only the IP index can make a long range small
+    try:
+        found = _search_partitions(start, end, params.get("event_type"), ip_field, ip, pruning)
+        if len(found) > LOCAL_ENGINE_MAX_OBJECTS:
+            return None
+        keys = []
+        total = 0
+        for _, location in found:
+            for key, size in _list_partition_objects(location):
+                keys.append(key)
+                total += size
+                if total > LOCAL_ENGINE_MAX_BYTES or len(keys) > LOCAL_ENGINE_MAX_OBJECTS:
+                    return None
+    except Exception as e:
+        print(f"Local engine planning skipped: {e}")
+        return None
+    return {"keys": keys, "bytes": total, "partitions": len(found)}
+
+
+def _open_log_object(key):
+    return _s3.get_object(Bucket=S3_BUCKET, Key=key)["Body"]
+
+
+def _local_search(params, plan):
+    """Run a planned search in-process; same result shape as an Athena search."""
+    filters = {
+        "event_type": _sanitize(params["event_type"]) if params.get("event_type") else None,
+        "src_ip": _sanitize(params["src_ip"]) if params.get("src_ip") else None,
+        "dest_ip": _sanitize(params["dest_ip"]) if params.get("dest_ip") else None,
+        "proto": _sanitize(params["proto"].upper()) if params.get("proto") else None,
+        "dest_port": params.get("dest_port"),
+    }
+    limit = min(int(params.get("limit", "100")), 500)
+    started = time.monotonic()
+    items, stats = local_engine.search(plan["keys"], _open_log_object, filters, limit, workers=LOCAL_ENGINE_WORKERS)
+    metrics.add_items(stats["rows_scanned"])
+    return {
+        "items": items,
+        "count": len(items),
+        "data_scanned_bytes": 0,
+        "data_scanned_mb": 0,
+        "engine": "local",
+        "local": {
+            "partitions": plan["partitions"],
+            "bytes_read": plan["bytes"],
+            **stats,
+            "duration_ms": int((time.monotonic() - started) * 1000),
+        },
+    }
+
+
+def _ip_filter(params):
+    """(field, ip) a search filters on, src_ip taking precedence."""
+    if params.get("src_ip"):
+        return "src_ip", params["src_ip"]
+    return "dest_ip", params.get("dest_ip")
+
+
+def _estimate_scan(found):
+    """Bytes Athena would scan reading `found` partitions, from the size manifest.
+
+    Partitions the manifest has no size for are counted at the mean size of
+    those it has. Returns None without a manifest or any measured partition.
+    """
+    if _partition_stats_table is None or not found:
+        return None
+    dates = sorted({"-".join(values[:3]) for values, _ in found})
+    with ThreadPoolExecutor(max_workers=RANGE_MAX_CONCURRENCY) as pool:
+        days = list(pool.map(lambda date: partition_stats.day_items(_partition_stats_table, date), dates))
+    items = {(item["partition_date"], item["hour"]): item for day in days for item in day}
+
+    sizes = []
+    for values, _ in found:
+        hour = datetime.datetime(int(values[0]), int(values[1]), int(values[2]), int(values[3]))
+        item = items.get(("-".join(values[:3]), values[3]))
+        sizes.append((hour, partition_stats.partition_bytes(item, values[4])))
+    measured = [size for _, size in sizes if size is not None]
+    if not measured:
+        return None
+    fill = sum(measured) / len(measured)
+
+    hours = {}
+    for hour, size in sizes:
+        hours[hour] = hours.get(hour, 0) + (fill if size is None else size)
+    return {
+        "bytes": int(sum(hours.values())),
+        "partitions": len(found),
+        "partitions_unmeasured": len(sizes) - len(measured),
+        "hours": hours,
+    }
+
+
+def _estimate_block(estimate):
+    if estimate is None:
+        return None
+    scanned = estimate["bytes"]
+    return {
+        "bytes": scanned,
+        "mb": round(scanned / (1024 * 1024), 2),
+        "cost_usd": round(max(scanned, ATHENA_MIN_BILLED_BYTES) / 1024 ** 4 * ATHENA_PRICE_PER_TB, 6),
+        "partitions": estimate["partitions"],
+        "partitions_unmeasured": estimate["partitions_unmeasured"],
+    }
+
+
+def _daily_scanned():
+    """Bytes Athena has scanned for this function so far today (UTC)."""
+    if _query_budget_table is None:
+        return 0
+    today = datetime.datetime.utcnow().strftime("%Y-%m-%d")
+    item = _query_budget_table.get_item(Key={"budget_date": today}).get("Item") or {}
+    return int(item.get("scanned_bytes", 0))
+
+
+def _charge_scan(scanned_bytes):
+    """Add bytes Athena actually scanned to today's total; never fails the request."""
+    if _query_budget_table is None or not scanned_bytes:
+        return
+    now = datetime.datetime.utcnow()
+    try:
+        _query_budget_table.update_item(
+            Key={"budget_date": now.strftime("%Y-%m-%d")},
+            UpdateExpression="ADD scanned_bytes :b SET #ttl = :ttl",
+            ExpressionAttributeNames={"#ttl": "ttl"},
+            ExpressionAttributeValues={
+                ":b": int(scanned_bytes),
+                ":ttl": int((now + datetime.timedelta(days=QUERY_BUDGET_RETENTION_DAYS)).timestamp()),
+            },
+        )
+    except Exception as e:
+        print(f"Scan budget update error: {e}")
+
+
+def _apply_scan_budget(params, pruning):
+    """Estimate a search's Athena scan and hold it to the scan budgets.
+
+    Returns (params, budget block, rejection). Over budget, searches are
+    narrowed to the newest hours that fit (`over_budget=narrow`, the default)
+    or refused (`over_budget=reject`, always the case for exports); the
+    rejection is a (status code, message) pair. Estimates are best effort:
+    if there is none, nothing is enforced.
+    """
+    start, end, error = _resolve_range(params)
+    if error:
+        return params, None, None
+    field, ip = _ip_filter(params)
+    try:
+        estimate = _estimate_scan(_search_partitions(start, end, params.get("event_type"), field, ip, pruning))
+        used = _daily_scanned() if SCAN_BUDGET_DAILY_BYTES else 0
+    except Exception as e:
+        print(f"Scan estimate skipped: {e}")
+        return params, None, None
+
+    budget = {"estimate": _estimate_block(estimate)}
+    limits = {}
+    if SCAN_BUDGET_REQUEST_BYTES:
+        budget["request_budget_bytes"] = SCAN_BUDGET_REQUEST_BYTES
+        limits["request"] = SCAN_BUDGET_REQUEST_BYTES
+    if SCAN_BUDGET_DAILY_BYTES and _query_budget_table is not None:
+        budget["daily_budget_bytes"] = SCAN_BUDGET_DAILY_BYTES
+        budget["daily_scanned_bytes"] = used
+        limits["daily"] = max(0, SCAN_BUDGET_DAILY_BYTES - used)
+    if estimate is None or not limits or estimate["bytes"] <= min(limits.values()):
+        return params, budget, None
+
+    allowed = min(limits.values())
+    export = str(params.get("export", "")).lower() == "true"
+    if params.get("over_budget", "narrow") == "narrow" and not export:
+        kept, total = None, 0
+        for hour in sorted(estimate["hours"], reverse=True):
+            if total + estimate["hours"][hour] > allowed:
+                break
+            kept, total = hour, total + estimate["hours"][hour]
+        if kept is not None:
+            narrowed = {key: value for key, value in params.items() if key not in ("date", "hour")}
+            narrowed["from"] = kept.strftime("%Y-%m-%dT%H")
+            narrowed["to"] = end.strftime("%Y-%m-%dT%H")
+            budget["narrowed"] = {"from": narrowed["from"], "to": narrowed["to"], "estimated_bytes": int(total)}
+            return narrowed, budget, None
+
+    mb = round(estimate["bytes"] / (1024 * 1024), 1)
+    if limits.get("daily") == allowed:
+        return params, budget, (429, f"Daily Athena scan budget exhausted: search needs ~{mb} MB, {round(allowed / (1024 * 1024), 1)} MB left today")
+    return params, budget, (400, f"Search would scan ~{mb} MB, over the {round(allowed / (1024 * 1024), 1)} MB per-request budget. Narrow the range or add filters")
+
+
 def _sanitize(value):
     """Basic SQL injection prevention for string values."""
     if not isinstance(value, str):
@@ -125,64 +691,518 @@ def _sanitize(value):
     return value.replace("'", "").replace('"', "").replace(";", "").replace("--", "").strip()
 
 
-def _run_athena_query(query):
-    """Execute Athena query and wait for results."""
-    response = _athena.start_query_execution(
-        QueryString=query,
-        WorkGroup=WORKGROUP,
+def _normalize_query(query):
+    return " ".join(query.split())
+
+
+def _cache_key(query):
+    normalized = _normalize_query(query)
+    version = _query_data_version(query)
+    if version is not None:
+        normalized += f" -- data_version={version}"
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _partitions_closed(query):
+    """True when every partition `query` reads has closed (past its grace)."""
+    matches = _PARTITION_PREDICATE.findall(query)
+    if not matches:
+        return False
+
+    latest_end = None
+    for year, month, day, hour in matches:
+        start = datetime.datetime(int(year), int(month), int(day), int(hour or 0))
+        end = start + (datetime.timedelta(hours=1) if hour else datetime.timedelta(days=1))
+        latest_end = end if latest_end is None else max(latest_end, end)
+    return latest_end + PARTITION_CLOSE_GRACE <= datetime.datetime.utcnow()
+
+
+def _day_data_version(date):
+    """Newest ingest stamp for one day, or None when unknown."""
+    now = time.monotonic()
+    memo = _data_versions.get(date)
+    if memo and memo[0] > now:
+        return memo[1]
+    try:
+        version = partition_stats.data_version(partition_stats.day_items(_partition_stats_table, date))
+    except Exception as e:
+        print(f"Data version lookup warning: {e}")
+        return None
+    _data_versions[date] = (now + DATA_VERSION_MEMO_SECONDS, version)
+    return version
+
+
+def _query_data_version(query):
+    """Data version of a query over closed partitions: the newest ingest stamp
+    across the days it reads. None if still open, or if any day is unstamped."""
+    if _partition_stats_table is None or not _partitions_closed(query):
+        return None
+    versions = []
+    for year, month, day, _ in _PARTITION_PREDICATE.findall(query):
+        version = _day_data_version(f"{year}-{month}-{day}")
+        if version is None:
+            return None
+        versions.append(version)
+    return max(versions)
+
+
+def _cache_ttl(query, result=None):
+    """Seconds a result may be served from cache, from its partition predicates.
+
+    An empty `result` is never kept long: its partitions may simply not be
+    registered or written yet.
+    """
+    if not _partitions_closed(query):
+        return CACHE_TTL_SECONDS
+    if result is not None and result.get("count") == 0:
+        return CACHE_TTL_SECONDS
+    if _query_data_version(query) is None:
+        return CACHE_CLOSED_TTL_SECONDS
+    return CACHE_IMMUTABLE_TTL_SECONDS
+
+
+def _reuse_minutes(query):
+    """How old an Athena result-reuse answer may be for `query`.
+
+    With a data version only results computed after the newest ingest are
+    reused (None when that was under a minute ago); otherwise the cache TTL.
+    """
+    version = _query_data_version(query)
+    if version is None:
+        return max(1, _cache_ttl(query) // 60)
+    return int(time.time() - version) // 60 or None
+
+
+def _cache_get(key):
+    """Look up a cached result in memory, then S3. Returns (result, tier)."""
+    now = time.time()
+    entry = _result_cache.get(key)
+    if entry:
+        if entry[0] > now:
+            _result_cache.move_to_end(key)
+            return entry[1], "memory"
+        del _result_cache[key]
+
+    try:
+        obj = _s3.get_object(Bucket=RESULTS_BUCKET, Key=f"{CACHE_PREFIX}{key}.json")
+        cached = json.loads(obj["Body"].read())
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404", "AccessDenied"):
+            print(f"Result cache read warning: {e}")
+        return None, None
+
+    if cached.get("expires_at", 0) <= now:
+        return None, None
+    _cache_put_memory(key, cached["expires_at"], cached["result"])
+    return cached["result"], "s3"
+
+
+def _cache_put_memory(key, expires_at, result):
+    _result_cache[key] = (expires_at, result)
+    _result_cache.move_to_end(key)
+    while len(_result_cache) > CACHE_MEMORY_ENTRIES:
+        _result_cache.popitem(last=False)
+
+
+def _cache_put(key, ttl, result):
+    expires_at = time.time() + ttl
+    _cache_put_memory(key, expires_at, result)
+    try:
+        _s3.put_object(
+            Bucket=RESULTS_BUCKET,
+            Key=f"{CACHE_PREFIX}{key}.json",
+            Body=json.dumps({"expires_at": expires_at, "result": result}),
+            ContentType="application/json",
+        )
+    except ClientError as e:
+        # The memory tier still holds it; a failed S3 write only costs a re-run
+        print(f"Result cache write warning: {e}")
+
+
+def _store_completed(query, result):
+    """Cache a finished result and attach the `cache` block for a miss."""
+    ttl = _cache_ttl(query, result)
+    reused = result.pop("reused_previous_result", False)
+    _charge_scan(0 if reused else result.get("data_scanned_bytes", 0))
+    _cache_put(_cache_key(query), ttl, result)
+    metrics.record_cache("hit" if reused else "miss", "athena_reuse" if reused else None)
+    return {
+        **result,
+        "cache": {
+            "status": "hit" if reused else "miss",
+            "tier": "athena_reuse" if reused else None,
+            "bytes_scanned_saved": 0,
+            "ttl_seconds": ttl,
+        },
+    }
+
+
+def _cache_hit(cached, tier):
+    metrics.record_cache("hit", tier)
+    return {
+        **cached,
+        "data_scanned_bytes": 0,
+        "data_scanned_mb": 0,
+        "cache": {
+            "status": "hit",
+            "tier": tier,
+            "bytes_scanned_saved": cached.get("data_scanned_bytes", 0),
+        },
+    }
+
+
+def _cached_athena_query(query, max_wait=None):
+    """Run `query` through the memory → S3 → Athena result-reuse tiers.
+
+    Adds a `cache` block to the result: status, tier, and the bytes Athena
+    did not have to scan because of it. A query still running after
+    `max_wait` comes back as a pending result (see `_execution_result`).
+    """
+    cached, tier = _cache_get(_cache_key(query))
+    if cached is not None:
+        return _cache_hit(cached, tier), None
+
+    result, error = _run_athena_query(
+        query,
+        reuse_minutes=_reuse_minutes(query),
+        max_wait=INLINE_WAIT_SECONDS if max_wait is None else max_wait,
     )
+    if error or result.get("pending"):
+        return result, error
+    return _store_completed(query, result), None
 
-    query_id = response["QueryExecutionId"]
 
-    # Poll for query completion (max 30 seconds)
-    for _ in range(30):
-        status = _athena.get_query_execution(QueryExecutionId=query_id)
-        state = status["QueryExecution"]["Status"]["State"]
+def _start_athena_query(query, reuse_minutes=None):
+    """Submit `query` and return its execution id without waiting.
 
-        if state == "SUCCEEDED":
-            break
-        elif state in ("FAILED", "CANCELLED"):
-            reason = status["QueryExecution"]["Status"].get("StateChangeReason", "Unknown error")
-            return None, f"Query {state}: {reason}"
+    With `reuse_minutes`, Athena may answer from a previous execution's
+    results (same query text) instead of scanning again.
+    """
+    start_kwargs = {
+        "QueryString": query,
+        "WorkGroup": WORKGROUP,
+    }
+    if reuse_minutes:
+        start_kwargs["ResultReuseConfiguration"] = {
+            "ResultReuseByAgeConfiguration": {
+                "Enabled": True,
+                "MaxAgeInMinutes": min(reuse_minutes, 10080),
+            }
+        }
+    response = _athena.start_query_execution(**start_kwargs)
+    return response["QueryExecutionId"]
 
-        time.sleep(1)
-    else:
-        # Timed out - cancel the query
-        _athena.stop_query_execution(QueryExecutionId=query_id)
-        return None, "Query timed out after 30 seconds"
 
-    # Get results
-    results = _athena.get_query_results(QueryExecutionId=query_id)
-    rows = results["ResultSet"]["Rows"]
+def _wait_for_query(query_id, max_wait):
+    """Poll with adaptive backoff (100 ms growing to 1 s) for up to `max_wait` s.
+
+    Returns the latest QueryExecution, finished or not.
+    """
+    deadline = time.monotonic() + max_wait
+    delay = POLL_INITIAL_SECONDS
+    while True:
+        execution = _athena.get_query_execution(QueryExecutionId=query_id)["QueryExecution"]
+        if execution["Status"]["State"] in ("SUCCEEDED", "FAILED", "CANCELLED"):
+            return execution
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return execution
+        time.sleep(min(delay, remaining))
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_SECONDS)
+
+
+def _execution_result(execution):
+    """Map a QueryExecution to (result, error).
+
+    Unfinished executions yield a pending result carrying the execution id,
+    which the caller hands back so the client can poll /logs/query/{id}.
+    """
+    state = execution["Status"]["State"]
+    if state == "SUCCEEDED":
+        return _fetch_results(execution), None
+    if state in ("FAILED", "CANCELLED"):
+        reason = execution["Status"].get("StateChangeReason", "Unknown error")
+        return None, f"Query {state}: {reason}"
+    return {
+        "pending": True,
+        "status": state,
+        "query_execution_id": execution["QueryExecutionId"],
+    }, None
+
+
+def _run_athena_query(query, reuse_minutes=None, max_wait=INLINE_WAIT_SECONDS):
+    """Execute Athena query and wait up to `max_wait` seconds for results."""
+    query_id = _start_athena_query(query, reuse_minutes)
+    return _execution_result(_wait_for_query(query_id, max_wait))
+
+
+def _output_location(execution):
+    """(bucket, key) of the CSV Athena wrote for an execution."""
+    location = execution["ResultConfiguration"]["OutputLocation"]
+    parsed = urllib.parse.urlparse(location)
+    return parsed.netloc, parsed.path.lstrip("/")
+
+
+def _iter_result_rows(execution):
+    """Stream rows of the Athena CSV output as dicts, one at a time.
+
+    Athena writes NULLs as empty fields; those are left out of the row dict,
+    as get_query_results-based parsing used to do.
+    """
+    bucket, key = _output_location(execution)
+    body = _s3.get_object(Bucket=bucket, Key=key)["Body"]
+    reader = csv.reader(codecs.getreader("utf-8")(body))
+    headers = next(reader, None)
+    if not headers:
+        return
+    for row in reader:
+        yield {name: value for name, value in zip(headers, row) if value != "" and name}
 
-    if len(rows) < 2:
-        return {"items": [], "count": 0, "data_scanned_bytes": 0, "data_scanned_mb": 0}, None
 
-    # First row is headers
-    headers = [col.get("VarCharValue", "") for col in rows[0]["Data"]]
+def _fetch_results(execution, offset=0, page_size=PAGE_SIZE):
+    """Read one page of a finished execution's rows from its CSV output."""
+    statistics = execution.get("Statistics", {})
+    reused = statistics.get("ResultReuseInformation", {}).get("ReusedPreviousResult", False)
 
-    # Convert remaining rows to dicts
     items = []
-    for row in rows[1:]:
-        item = {}
-        for i, col in enumerate(row["Data"]):
-            value = col.get("VarCharValue")
-            if value is not None and headers[i]:
-                item[headers[i]] = value
+    has_more = False
+    for index, item in enumerate(_iter_result_rows(execution)):
+        if index < offset:
+            continue
+        if len(items) == page_size:
+            has_more = True
+            break
         items.append(item)
 
+    metrics.add_items(len(items))
+
     # Get data scanned for cost tracking
-    data_scanned = status["QueryExecution"]["Statistics"].get("DataScannedInBytes", 0)
+    data_scanned = statistics.get("DataScannedInBytes", 0)
+
+    result = {
+        "query_execution_id": execution["QueryExecutionId"],
+        "items": items,
+        "count": len(items),
+        "data_scanned_bytes": data_scanned,
+        "data_scanned_mb": round(data_scanned / (1024 * 1024), 2),
+        "reused_previous_result": reused,
+    }
+    if has_more:
+        result["next_offset"] = offset + len(items)
+    return result
+
+
+def _export_ndjson(execution, key):
+    """Convert the CSV output to NDJSON in S3 without holding it in memory."""
+    buffer = io.BytesIO()
+    upload_id = None
+    parts = []
+
+    def _flush():
+        part = _s3.upload_part(
+            Bucket=RESULTS_BUCKET,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=len(parts) + 1,
+            Body=buffer.getvalue(),
+        )
+        parts.append({"ETag": part["ETag"], "PartNumber": len(parts) + 1})
+        buffer.seek(0)
+        buffer.truncate()
 
+    try:
+        for item in _iter_result_rows(execution):
+            buffer.write(json.dumps(item, separators=(",", ":")).encode("utf-8") + b"\n")
+            if buffer.tell() >= EXPORT_PART_BYTES:
+                if upload_id is None:
+                    upload_id = _s3.create_multipart_upload(
+                        Bucket=RESULTS_BUCKET, Key=key, ContentType="application/x-ndjson"
+                    )["UploadId"]
+                _flush()
+
+        if upload_id is None:
+            _s3.put_object(Bucket=RESULTS_BUCKET, Key=key, Body=buffer.getvalue(), ContentType="application/x-ndjson")
+            return
+        if buffer.tell():
+            _flush()
+        _s3.complete_multipart_upload(
+            Bucket=RESULTS_BUCKET, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except Exception:
+        if upload_id is not None:
+            _s3.abort_multipart_upload(Bucket=RESULTS_BUCKET, Key=key, UploadId=upload_id)
+        raise
+
+
+def _object_exists(bucket, key):
+    try:
+        _s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError:
+        return False
+
+
+def _split_range(params):
+    """Per-day params (newest day first) when a range should run split, else None."""
+    start, end, error = _resolve_range(params)
+    if error or str(params.get("export", "")).lower() == "true":
+        return None
+    days = _range_days(start, end)
+    if len(days) <= RANGE_SPLIT_DAYS:
+        return None
+    return [
+        {**params, "from": day_start.strftime("%Y-%m-%dT%H"), "to": day_end.strftime("%Y-%m-%dT%H")}
+        for day_start, day_end in reversed(days)
+    ]
+
+
+def _merge_newest(results, limit):
+    """k-way merge of per-day results (each sorted timestamp DESC), first `limit` rows."""
+    merged = heapq.merge(*(r["items"] for r in results), key=lambda item: item.get("timestamp", ""), reverse=True)
+    return list(itertools.islice(merged, limit))
+
+
+def _range_search(day_params, max_wait, pruning):
+    """Run one query per day concurrently and merge them newest-first.
+
+    Days are disjoint, so once the newest contiguous run of finished days
+    already holds `limit` rows no older day can change the answer: queries
+    still running for older days are stopped and the rest never start.
+    """
+    limit = min(int(day_params[0].get("limit", "100")), 500)
+    queries = []
+    for params in day_params:
+        day_pruning = {} if pruning is not None else None
+        query, error = _build_query(params, day_pruning)
+        if error:
+            return None, error
+        for key, value in (day_pruning or {}).items():
+            pruning[key] = pruning.get(key, 0) + value
+        # A day the IP index rules out needs no query at all
+        queries.append(None if day_pruning and day_pruning.get("partitions_scanned") == 0 else query)
+
+    results = {}
+    cache_hits = 0
+    for index, query in enumerate(queries):
+        if query is None:
+            results[index] = _empty_result()
+            continue
+        cached, tier = _cache_get(_cache_key(query))
+        if cached is not None:
+            results[index] = _cache_hit(cached, tier)
+            cache_hits += 1
+
+    def _enough():
+        rows = 0
+        for index in range(len(queries)):
+            if index not in results:
+                return False
+            rows += results[index]["count"]
+            if rows >= limit:
+                return True
+        return True
+
+    pending = [index for index in range(len(queries)) if index not in results]
+    running = {}
+    started = 0
+    deadline = time.monotonic() + max_wait
+    delay = POLL_INITIAL_SECONDS
+    while not _enough():
+        while pending and len(running) < RANGE_MAX_CONCURRENCY:
+            index = pending.pop(0)
+            running[_start_athena_query(queries[index], reuse_minutes=_reuse_minutes(queries[index]))] = index
+            started += 1
+
+        executions = _athena.batch_get_query_execution(QueryExecutionIds=list(running))["QueryExecutions"]
+        for execution in executions:
+            state = execution["Status"]["State"]
+            if state not in ("SUCCEEDED", "FAILED", "CANCELLED"):
+                continue
+            index = running.pop(execution["QueryExecutionId"])
+            result, error = _execution_result(execution)
+            if error:
+                _stop_queries(running)
+                return None, error
+            results[index] = _store_completed(queries[index], result)
+
+        if _enough():
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            # Unfinished days keep running; Athena result reuse picks them up on retry
+            return {
+                "pending": True,
+                "status": "RUNNING",
+                "days_total": len(queries),
+                "days_completed": len(results),
+            }, None
+        if running:
+            time.sleep(min(delay, remaining))
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_SECONDS)
+
+    cancelled = len(running)
+    _stop_queries(running)
+
+    used = []
+    for index in range(len(queries)):
+        if index not in results:
+            break
+        used.append(results[index])
+    items = _merge_newest(used, limit)
+    data_scanned = sum(r.get("data_scanned_bytes", 0) for r in results.values())
     return {
         "items": items,
         "count": len(items),
         "data_scanned_bytes": data_scanned,
         "data_scanned_mb": round(data_scanned / (1024 * 1024), 2),
+        "range": {
+            "days_total": len(queries),
+            "days_merged": len(used),
+            "days_from_cache": cache_hits,
+            "days_queried": started,
+            "days_stopped_early": cancelled,
+            "days_not_started": len(pending),
+        },
     }, None
 
 
-def _get_event_type_summary(params):
+def _stop_queries(running):
+    for query_id in list(running):
+        try:
+            _athena.stop_query_execution(QueryExecutionId=query_id)
+        except ClientError as e:
+            print(f"Stop query {query_id} failed: {e}")
+    running.clear()
+
+
+def _stats_summary(dt):
+    """Event-type summary from ingest counters, or None if the day has none."""
+    if _partition_stats_table is None:
+        return None
+    try:
+        hours = partition_stats.day_items(_partition_stats_table, dt.strftime("%Y-%m-%d"))
+    except Exception as e:
+        print(f"Partition stats read error: {e}")
+        return None
+    if not hours:
+        return None
+
+    totals = partition_stats.sum_counts(hours)
+    items = [
+        {"event_type": event_type, "event_count": count}
+        for event_type, count in sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))
+    ]
+    return {
+        "items": items,
+        "count": len(items),
+        "hours": len(hours),
+        "source": "partition_stats",
+        "data_scanned_bytes": 0,
+        "data_scanned_mb": 0,
+    }
+
+
+def _get_event_type_summary(params, max_wait=None):
     """Get a summary of event types for a given date (for the filter dropdown)."""
     date_str = params.get("date")
     if not date_str:
@@ -193,15 +1213,45 @@ def _get_event_type_summary(params):
     except ValueError:
         return None, "Invalid date format"
 
+    summary = _stats_summary(dt)
+    if summary is not None:
+        return summary, None
+
     query = f"""
-        SELECT event_type, COUNT(*) as event_count
+        SELECT event_type, SUM(COALESCE(sample_weight, 1)) as event_count
         FROM "{DATABASE}"."{TABLE}"
         WHERE year = '{dt.year}' AND month = '{dt.month:02d}' AND day = '{dt.day:02d}'
         GROUP BY event_type
         ORDER BY event_count DESC
     """
 
-    return _run_athena_query(query)
+    return _cached_athena_query(query, max_wait=max_wait)
+
+
+def _discover_partitions(prefix, values, found, compacted):
+    """Walk the key=value/ prefixes below `prefix`, recording partitions.
+
+    `found` maps partition values to their location; for compacted trees the
+    newest v=<ts>/ version wins.
+    """
+    depth = len(values)
+    paginator = _s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix, Delimiter="/"):
+        if page.get("Contents") and depth == len(partitions.HOUR_KEYS) and not compacted:
+            # Objects directly under the hour: pre-split, all event types
+            found[(*values, partitions.ALL_EVENT_TYPES)] = prefix
+        elif page.get("Contents") and depth == len(partitions.PARTITION_KEYS) and not compacted:
+            found[tuple(values)] = prefix
+
+        for child in (p["Prefix"] for p in page.get("CommonPrefixes", [])):
+            key, _, value = child[len(prefix):].rstrip("/").partition("=")
+            if compacted and key == "v" and depth >= len(partitions.HOUR_KEYS):
+                full = tuple(values) if depth == len(partitions.PARTITION_KEYS) else (*values, partitions.ALL_EVENT_TYPES)
+                current = found.get(full, "")
+                if not current.startswith(partitions.COMPACTED_PREFIX) or child > current:
+                    found[full] = child
+            elif depth < len(partitions.PARTITION_KEYS) and key == partitions.PARTITION_KEYS[depth]:
+                _discover_partitions(child, values + [value], found, compacted)
 
 
 def _repair_partitions():
@@ -209,62 +1259,62 @@ def _repair_partitions():
 
     Athena Engine v3 (Trino) does NOT support MSCK REPAIR TABLE.
     Instead, list S3 prefixes and call Glue batch_create_partition.
+
+    Raw prefixes and compacted versions are both discovered; a partition
+    with a compacted version is registered at its newest one. This walks
+    the whole bucket, so it only runs from the scheduled backfill; ingest
+    registers new partitions as it writes them.
+
+    Partitions registered before the etype key was added carry only the four
+    hour values and no longer match the table. They are dropped here, and
+    their hours are re-registered as etype='all' by the discovery pass, so
+    one run after upgrading migrates the catalog.
     """
     if not S3_BUCKET:
         print("Partition repair skipped: S3_BUCKET not set")
-        return
+        return 0
 
     try:
         # Get existing partitions from Glue
         existing = set()
+        legacy = []
         paginator = _glue.get_paginator("get_partitions")
         for page in paginator.paginate(DatabaseName=DATABASE, TableName=TABLE):
             for p in page.get("Partitions", []):
-                existing.add(tuple(p["Values"]))
+                if len(p["Values"]) == len(partitions.HOUR_KEYS):
+                    legacy.append(p["Values"])
+                else:
+                    existing.add(tuple(p["Values"]))
+
+        # Glue allows max 25 partitions per delete batch
+        for i in range(0, len(legacy), 25):
+            _glue.batch_delete_partition(
+                DatabaseName=DATABASE,
+                TableName=TABLE,
+                PartitionsToDelete=[{"Values": values} for values in legacy[i : i + 25]],
+            )
+        if legacy:
+            print(f"Partition repair: dropped {len(legacy)} pre-etype partitions")
 
         # Get table storage descriptor (needed for creating partitions)
         table_info = _glue.get_table(DatabaseName=DATABASE, Name=TABLE)
         sd = table_info["Table"]["StorageDescriptor"]
 
-        # Discover S3 partition prefixes: year=YYYY/month=MM/day=DD/hour=HH/
-        partition_pattern = re.compile(
-            r"year=(\d{4})/month=(\d{2})/day=(\d{2})/hour=(\d{2})/"
-        )
+        # Discover year=/month=/day=/hour=[/etype=] prefixes, then let
+        # compacted/ versions override the raw locations
+        found = {}
+        _discover_partitions("", [], found, compacted=False)
+        _discover_partitions(partitions.COMPACTED_PREFIX, [], found, compacted=True)
 
-        new_partitions = []
-        # List year prefixes
-        years_resp = _s3.list_objects_v2(
-            Bucket=S3_BUCKET, Prefix="year=", Delimiter="/"
-        )
-        for year_prefix in [p["Prefix"] for p in years_resp.get("CommonPrefixes", [])]:
-            months_resp = _s3.list_objects_v2(
-                Bucket=S3_BUCKET, Prefix=year_prefix, Delimiter="/"
-            )
-            for month_prefix in [p["Prefix"] for p in months_resp.get("CommonPrefixes", [])]:
-                days_resp = _s3.list_objects_v2(
-                    Bucket=S3_BUCKET, Prefix=month_prefix, Delimiter="/"
-                )
-                for day_prefix in [p["Prefix"] for p in days_resp.get("CommonPrefixes", [])]:
-                    hours_resp = _s3.list_objects_v2(
-                        Bucket=S3_BUCKET, Prefix=day_prefix, Delimiter="/"
-                    )
-                    for hour_prefix in [p["Prefix"] for p in hours_resp.get("CommonPrefixes", [])]:
-                        m = partition_pattern.match(hour_prefix)
-                        if not m:
-                            continue
-                        values = (m.group(1), m.group(2), m.group(3), m.group(4))
-                        if values not in existing:
-                            new_partitions.append({
-                                "Values": list(values),
-                                "StorageDescriptor": {
-                                    **sd,
-                                    "Location": f"s3://{S3_BUCKET}/{hour_prefix}",
-                                },
-                            })
+        new_partitions = [
+            partitions.partition_input(values, sd, f"s3://{S3_BUCKET}/{prefix}")
+            for values, prefix in sorted(found.items())
+            if values not in existing
+        ]
 
         if not new_partitions:
             print(f"Partition repair: 0 new (already {len(existing)} registered)")
-            return
+            return 0
 
         # Glue allows max 100 partitions per batch
         for i in range(0, len(new_partitions), 100):
@@ -278,10 +1328,24 @@ def _repair_partitions():
             if errors:
                 print(f"Partition batch errors: {errors}")
 
+        # Cached results for these hours predate the data now visible to Athena
+        if _partition_stats_table is not None:
+            stamped_at = int(time.time())
+            hours = sorted({tuple(p["Values"][: len(partitions.HOUR_KEYS)]) for p in new_partitions})
+            for year, month, day, hour in hours:
+                try:
+                    partition_stats.stamp_ingested(
+                        _partition_stats_table, {"partition_date": f"{year}-{month}-{day}", "hour": hour}, stamped_at
+                    )
+                except ClientError as e:
+                    print(f"Data version stamp warning for {year}-{month}-{day} {hour}: {e}")
+
         print(f"Partition repair: {len(new_partitions)} new partitions registered")
+        return len(new_partitions)
 
     except Exception as e:
         print(f"Partition repair warning: {e}")
+        return 0
 
 
 # ── GeoIP Enrichment ──
@@ -365,45 +1429,329 @@ def _enrich_results_with_geo(items):
     return items
 
 
+def _request_params(event):
+    """Query parameters from a POST JSON body, falling back to the query string."""
+    body = (event or {}).get("body")
+    if not body:
+        return (event or {}).get("queryStringParameters") or {}
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body).decode("utf-8")
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    return {key: str(value) for key, value in payload.items() if value is not None}
+
+
+def _inline_wait(context):
+    """How long GET /logs may block, leaving room to return before the Lambda timeout."""
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return INLINE_WAIT_SECONDS
+    remaining = context.get_remaining_time_in_millis() / 1000 - INVOCATION_MARGIN_SECONDS
+    return max(0, min(INLINE_WAIT_SECONDS, remaining))
+
+
+def _pending_response(result, event):
+    query_id = result["query_execution_id"]
+    return _response(202, {
+        "status": result["status"],
+        "query_execution_id": query_id,
+        "poll": f"/logs/query/{query_id}",
+    }, event)
+
+
+def _empty_result():
+    """Result for a search the IP index proved cannot match anything."""
+    return {"items": [], "count": 0, "data_scanned_bytes": 0, "data_scanned_mb": 0}
+
+
+def _log_search_body(params, result, pruning=None, budget=None):
+    body = {
+        "date": params.get("date", datetime.datetime.utcnow().strftime("%Y-%m-%d")),
+        **({"from": params.get("from"), "to": params.get("to")} if params.get("from") or params.get("to") else {}),
+        "filters": {
+            "event_type": params.get("event_type"),
+            "src_ip": params.get("src_ip"),
+            "dest_ip": params.get("dest_ip"),
+            "proto": params.get("proto"),
+        },
+        **result,
+    }
+    body.setdefault("engine", "athena")
+    if pruning:
+        body["ip_index"] = pruning
+    if budget:
+        body["budget"] = budget
+    return body
+
+
+def _handle_local_search(event, params, plan, pruning, status=False):
+    result = _local_search(params, plan)
+    if result["items"]:
+        result["items"] = _enrich_results_with_geo(result["items"])
+    body = _log_search_body(params, result, pruning)
+    return _response(200, {"status": "SUCCEEDED", **body} if status else body, event)
+
+
+def _handle_dry_run(event, params, plan, pruning, budget, rejection):
+    """?dry_run=true → how a search would run and what it would scan, without running it."""
+    body = {"dry_run": True, "engine": "local" if plan else "athena", "allowed": rejection is None}
+    if plan:
+        body["local"] = {"partitions": plan["partitions"], "objects": len(plan["keys"]), "bytes": plan["bytes"]}
+    else:
+        query, error = _build_query(params, pruning)
+        if error:
+            return _response(400, {"error": error}, event)
+        body["query"] = _normalize_query(query)
+        body["budget"] = budget
+        if rejection:
+            body["error"] = rejection[1]
+    if pruning:
+        body["ip_index"] = pruning
+    return _response(200, body, event)
+
+
+def _route_search(event, params, context, status=False):
+    """Shared front of GET /logs and POST /logs/query.
+
+    Answers here whatever needs no Athena execution id: local-engine searches,
+    dry runs, over-budget rejections and split ranges. Otherwise returns
+    (None, params, pruning, budget), with params possibly narrowed to fit the
+    scan budget.
+    """
+    pruning = {}
+    dry_run = str(params.get("dry_run", "")).lower() == "true"
+    plan = _plan_local_search(params, pruning)
+    if plan and not dry_run:
+        return _handle_local_search(event, params, plan, pruning, status), params, pruning, None
+
+    budget, rejection = None, None
+    if not plan:
+        params, budget, rejection = _apply_scan_budget(params, pruning)
+    if dry_run:
+        return _handle_dry_run(event, params, plan, pruning, budget, rejection), params, pruning, budget
+    if rejection:
+        return _response(rejection[0], {"error": rejection[1], "budget": budget}, event), params, pruning, budget
+
+    day_params = _split_range(params)
+    if day_params:
+        return _handle_range_search(event, params, day_params, context, budget), params, pruning, budget
+    return None, params, pruning, budget
+
+
+def _handle_range_search(event, params, day_params, context, budget=None):
+    """Long from/to ranges: per-day queries, merged. Answers inline or asks for a retry."""
+    pruning = {}
+    result, error = _range_search(day_params, _inline_wait(context), pruning)
+    if error:
+        return _response(500, {"error": error}, event)
+    if result.get("pending"):
+        # No single execution id to poll; finished days are reused on retry
+        return _response(202, {**result, "retry": True}, event)
+    if result["items"]:
+        result["items"] = _enrich_results_with_geo(result["items"])
+    return _response(200, {"status": "SUCCEEDED", **_log_search_body(params, result, pruning, budget)}, event)
+
+
+def _handle_submit_query(event, context=None):
+    """POST /logs/query → start the search and return its execution id.
+
+    Searches small enough for the local engine, ranges long enough to split
+    and dry runs have no execution id; they answer inline like GET /logs.
+    """
+    try:
+        params = _request_params(event)
+    except ValueError as e:
+        return _response(400, {"error": f"Invalid request body: {e}"}, event)
+
+    response, params, pruning, budget = _route_search(event, params, context, status=True)
+    if response:
+        return response
+
+    query, error = _build_query(params, pruning)
+    if error:
+        return _response(400, {"error": error}, event)
+    if pruning.get("partitions_scanned") == 0:
+        return _response(200, {"status": "SUCCEEDED", **_log_search_body(params, _empty_result(), pruning, budget)}, event)
+
+    cached, tier = _cache_get(_cache_key(query))
+    if cached is not None:
+        result = _cache_hit(cached, tier)
+        result["items"] = _enrich_results_with_geo(result["items"])
+        return _response(200, {"status": "SUCCEEDED", **_log_search_body(params, result, pruning, budget)}, event)
+
+    query_id = _start_athena_query(query, reuse_minutes=_reuse_minutes(query))
+    body = {
+        "status": "QUEUED",
+        "query_execution_id": query_id,
+        "poll": f"/logs/query/{query_id}",
+    }
+    if pruning:
+        body["ip_index"] = pruning
+    if budget:
+        body["budget"] = budget
+    return _response(202, body, event)
+
+
+def _handle_query_status(event, query_id):
+    """GET /logs/query/{id} → execution status, or the results once finished."""
+    if not query_id or not _QUERY_ID_PATTERN.match(query_id):
+        return _response(400, {"error": "Invalid query execution id"}, event)
+
+    try:
+        execution = _athena.get_query_execution(QueryExecutionId=query_id)["QueryExecution"]
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "InvalidRequestException":
+            return _response(404, {"error": "Unknown query execution id"}, event)
+        raise
+    if execution.get("WorkGroup") != WORKGROUP:
+        return _response(404, {"error": "Unknown query execution id"}, event)
+
+    params = (event or {}).get("queryStringParameters") or {}
+    try:
+        offset = max(0, int(params.get("offset", "0")))
+        page_size = max(1, min(int(params.get("page_size", PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        return _response(400, {"error": "offset and page_size must be integers"}, event)
+
+    query = execution.get("Query", "")
+    first_page = offset == 0 and page_size == PAGE_SIZE
+    cached, tier = _cache_get(_cache_key(query)) if first_page else (None, None)
+    if cached is not None:
+        result = _cache_hit(cached, tier)
+    elif not first_page and execution["Status"]["State"] == "SUCCEEDED":
+        # Later pages come straight from the CSV output; only page one is cached
+        result = _fetch_results(execution, offset, page_size)
+        result.pop("reused_previous_result", None)
+    else:
+        result, error = _execution_result(execution)
+        if error:
+            return _response(200, {"status": execution["Status"]["State"], "query_execution_id": query_id, "error": error}, event)
+        if result.get("pending"):
+            return _response(200, {"status": result["status"], "query_execution_id": query_id}, event)
+        result = _store_completed(query, result)
+
+    if any("src_ip" in item for item in result["items"]):
+        result["items"] = _enrich_results_with_geo(result["items"])
+    return _response(200, {"status": "SUCCEEDED", "query_execution_id": query_id, **result}, event)
+
+
+def _handle_export(event, query_id):
+    """GET /logs/query/{id}/export → presigned URL for the full result set."""
+    if not query_id or not _QUERY_ID_PATTERN.match(query_id):
+        return _response(400, {"error": "Invalid query execution id"}, event)
+
+    params = (event or {}).get("queryStringParameters") or {}
+    export_format = params.get("format", "ndjson").lower()
+    if export_format not in ("csv", "ndjson"):
+        return _response(400, {"error": "format must be csv or ndjson"}, event)
+
+    try:
+        execution = _athena.get_query_execution(QueryExecutionId=query_id)["QueryExecution"]
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "InvalidRequestException":
+            return _response(404, {"error": "Unknown query execution id"}, event)
+        raise
+    if execution.get("WorkGroup") != WORKGROUP:
+        return _response(404, {"error": "Unknown query execution id"}, event)
+
+    state = execution["Status"]["State"]
+    if state != "SUCCEEDED":
+        return _response(409, {"status": state, "error": "Query has not succeeded"}, event)
+
+    if export_format == "csv":
+        bucket, key = _output_location(execution)
+    else:
+        bucket, key = RESULTS_BUCKET, f"{EXPORT_PREFIX}{query_id}.ndjson"
+        if not _object_exists(bucket, key):
+            _export_ndjson(execution, key)
+
+    url = _s3.generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": bucket,
+            "Key": key,
+            "ResponseContentDisposition": f'attachment; filename="phantomwall-logs-{query_id}.{export_format}"',
+        },
+        ExpiresIn=EXPORT_URL_TTL_SECONDS,
+    )
+    return _response(200, {
+        "query_execution_id": query_id,
+        "format": export_format,
+        "url": url,
+        "expires_in": EXPORT_URL_TTL_SECONDS,
+    }, event)
+
+
+@profiling.profiled
 def handler(event, context):
+    aws.reset_counters()
+    metrics.start("s3_log_query", event)
+    return metrics.emit(aws.annotate(_route_request(event, context)), getattr(context, "aws_request_id", None))
+
+
+def _route_request(event, context):
     params = (event or {}).get("queryStringParameters") or {}
+    _ip_lookups.clear()
+    _partition_lookups.clear()
     raw_path = (event or {}).get("rawPath") or ""
+    request_context = (event or {}).get("requestContext") or {}
+    route_key = request_context.get("routeKey") or ""
+    method = (request_context.get("http") or {}).get("method", "GET")
+
+    # Scheduled backfill (EventBridge), never on the API request path
+    if (event or {}).get("action") == "repair_partitions":
+        return {"statusCode": 200, "partitions_created": _repair_partitions()}
 
     try:
-        # Always repair partitions so new data is discoverable
-        _repair_partitions()
+        # Route: POST /logs/query → asynchronous search, returns an execution id
+        if route_key == "POST /logs/query" or (method == "POST" and raw_path.endswith("/logs/query")):
+            return _handle_submit_query(event, context)
+
+        # Route: GET /logs/query/{id}/export → presigned CSV/NDJSON download
+        if route_key == "GET /logs/query/{id}/export" or raw_path.rstrip("/").endswith("/export"):
+            query_id = ((event or {}).get("pathParameters") or {}).get("id") or raw_path.rstrip("/").rsplit("/", 2)[-2]
+            return _handle_export(event, query_id)
+
+        # Route: GET /logs/query/{id} → status or results of an asynchronous search
+        if route_key == "GET /logs/query/{id}" or "/logs/query/" in raw_path:
+            query_id = ((event or {}).get("pathParameters") or {}).get("id") or raw_path.rstrip("/").rsplit("/", 1)[-1]
+            return _handle_query_status(event, query_id)
 
         # Route: GET /logs?action=summary → event type breakdown
         if params.get("action") == "summary":
-            result, error = _get_event_type_summary(params)
+            metrics.set_route(f"{route_key or 'GET /logs'} summary")
+            result, error = _get_event_type_summary(params, max_wait=_inline_wait(context))
             if error:
-                return _response(400, {"error": error})
-            return _response(200, result)
+                return _response(400, {"error": error}, event)
+            if result.get("pending"):
+                return _pending_response(result, event)
+            return _response(200, result, event)
+
+        # Small searches run in-process; ?dry_run=true only estimates; long
+        # from/to ranges run as per-day queries, merged
+        response, params, pruning, budget = _route_search(event, params, context)
+        if response:
+            return response
 
         # Route: GET /logs?date=2026-02-12 → query logs
-        query, error = _build_query(params)
+        query, error = _build_query(params, pruning)
         if error:
-            return _response(400, {"error": error})
+            return _response(400, {"error": error}, event)
+        if pruning.get("partitions_scanned") == 0:
+            return _response(200, _log_search_body(params, _empty_result(), pruning, budget), event)
 
-        result, error = _run_athena_query(query)
+        result, error = _cached_athena_query(query, max_wait=_inline_wait(context))
         if error:
-            return _response(500, {"error": error})
+            return _response(500, {"error": error}, event)
+        if result.get("pending"):
+            return _pending_response(result, event)
 
         # Enrich results with GeoIP country data
         if result and result.get("items"):
             result["items"] = _enrich_results_with_geo(result["items"])
 
-        return _response(200, {
-            "date": params.get("date", datetime.datetime.utcnow().strftime("%Y-%m-%d")),
-            "filters": {
-                "event_type": params.get("event_type"),
-                "src_ip": params.get("src_ip"),
-                "dest_ip": params.get("dest_ip"),
-                "proto": params.get("proto"),
-            },
-            **result,
-        })
+        return _response(200, _log_search_body(params, result, pruning, budget), event)
 
     except Exception as e:
         print(f"Error: {e}")
-        return _response(500, {"error": str(e)})
+        return _response(500, {"error": str(e)}, event)
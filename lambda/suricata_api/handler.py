@@ -1,35 +1,67 @@
+import base64
+import binascii
 import datetime
 import json
 import os
+import re
 from collections import Counter
 from decimal import Decimal
 
-import boto3
 from boto3.dynamodb.conditions import Attr, Key
 
-_dynamodb = boto3.resource("dynamodb")
-_table = _dynamodb.Table(os.environ["TABLE_NAME"])
-
-
-def _response(status_code, body):
-    return {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-        },
-        "body": json.dumps(body),
-    }
-
-
-def _decimal_to_native(value):
-    if isinstance(value, list):
-        return [_decimal_to_native(v) for v in value]
-    if isinstance(value, dict):
-        return {k: _decimal_to_native(v) for k, v in value.items()}
-    if isinstance(value, Decimal):
-        return float(value)
-    return value
+from phantomwall import aws, metrics, profiles, profiling
+from phantomwall.responses import json_default, json_response
+
+_table = aws.table(os.environ["TABLE_NAME"])
+aws.prewarm(_table)
+
+# GSI keyed on src_ip with timestamp as the sort key (see logging_lambda.tf)
+SRC_IP_INDEX_NAME = os.environ.get("SRC_IP_INDEX_NAME", "src_ip-timestamp-index")
+SRC_IP_DEFAULT_DAYS = 30
+
+# Per-attacker profiles maintained by suricata_ingest, optional
+ATTACKERS_TABLE_NAME = os.environ.get("ATTACKERS_TABLE_NAME")
+_attackers_table = aws.table(ATTACKERS_TABLE_NAME) if ATTACKERS_TABLE_NAME else None
+_ATTACKER_SORT_INDEXES = {
+    "last_seen": "scope-last_seen-index",
+    "first_seen": "scope-first_seen-index",
+    "event_count": "scope-event_count-index",
+}
+
+# Attributes returned by the event list for `fields=slim`. This is what the
+# alerts table view renders; the raw `suricata` map is only pulled for the one
+# nested attribute the table falls back to. Without `fields=` the full item is
+# returned, since the dashboard's raw-payload views render `suricata`.
+_SLIM_FIELDS = (
+    "event_date",
+    "event_id",
+    "event_time",
+    "timestamp",
+    "event_type",
+    "src_ip",
+    "src_port",
+    "dest_ip",
+    "dest_port",
+    "proto",
+    "flow_id",
+    "severity",
+    "category",
+    "signature",
+    "signature_id",
+    "summary",
+    "country_name",
+    "country_code",
+    "flag",
+    "suricata.alert.action",
+)
+# The src_ip index only projects top-level slim attributes (INCLUDE projection)
+_INDEX_FIELDS = tuple(field for field in _SLIM_FIELDS if "." not in field)
+_FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+_MAX_FIELDS = 40
+
+
+def _response(status_code, body, event=None, etag=False):
+    return json_response(status_code, body, event=event, etag=etag)
 
 
 def _safe_int(value):
@@ -148,44 +180,311 @@ def _calculate_metrics():
     }
 
 
+def _encode_cursor(last_evaluated_key):
+    """Turn a DynamoDB LastEvaluatedKey into an opaque, URL-safe token."""
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, default=json_default, separators=(",", ":"), sort_keys=True)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    """Reverse `_encode_cursor`. Returns None for anything malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, binascii.Error, UnicodeError):
+        return None
+    if not isinstance(key, dict) or not key:
+        return None
+    for name, value in key.items():
+        if isinstance(value, float):
+            key[name] = Decimal(str(value))
+        elif not isinstance(value, (str, int)):
+            return None
+    return key
+
+
+def _parse_fields(fields_param):
+    """Resolve `fields=` into attribute paths. None means the full item."""
+    if not fields_param or fields_param.strip().lower() == "all":
+        return None
+    if fields_param.strip().lower() == "slim":
+        return list(_SLIM_FIELDS)
+    fields = []
+    for field in fields_param.split(","):
+        field = field.strip()
+        if not field:
+            continue
+        if not _FIELD_PATTERN.match(field):
+            raise ValueError(f"Invalid field name: {field}")
+        if field not in fields:
+            fields.append(field)
+    if not fields or len(fields) > _MAX_FIELDS:
+        raise ValueError(f"fields must list between 1 and {_MAX_FIELDS} attributes")
+    return fields
+
+
+def _projection_kwargs(fields):
+    """Build ProjectionExpression kwargs, aliasing every path segment.
+
+    Aliasing sidesteps DynamoDB reserved words such as `timestamp`.
+    """
+    if fields is None:
+        return {}
+    names = {}
+    aliases = {}
+    paths = []
+    for field in fields:
+        segments = []
+        for segment in field.split("."):
+            if segment not in aliases:
+                aliases[segment] = f"#f{len(aliases)}"
+                names[aliases[segment]] = segment
+            segments.append(aliases[segment])
+        paths.append(".".join(segments))
+    return {
+        "ProjectionExpression": ", ".join(paths),
+        "ExpressionAttributeNames": names,
+    }
+
+
+def _since_event_id(since_ms):
+    """Lowest event_id strictly newer than `since_ms`.
+
+    Ingest builds event_id as `%Y%m%dT%H%M%S.%f_<suffix>` from the event
+    time, so the sort key itself orders by timestamp and `since` can be a key
+    condition instead of a filter that still pays for every read.
+    """
+    since_dt = datetime.datetime.utcfromtimestamp((since_ms + 1) / 1000)
+    return since_dt.strftime("%Y%m%dT%H%M%S.%f")
+
+
+def _parse_limit(params):
+    try:
+        return max(1, min(int(params.get("limit", "100")), 500))
+    except ValueError:
+        return 100
+
+
+def _parse_time_bound(value, end_of_day=False):
+    """Parse epoch ms, YYYY-MM-DD or an ISO-8601 timestamp into epoch ms."""
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        if len(value) == 10:
+            day = datetime.datetime.strptime(value, "%Y-%m-%d").date()
+            bound = datetime.time.max if end_of_day else datetime.time.min
+            dt = datetime.datetime.combine(day, bound, tzinfo=datetime.timezone.utc)
+        else:
+            dt = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        raise ValueError(f"Invalid time bound: {value}") from None
+    return int(dt.timestamp() * 1000)
+
+
+def _handle_list_events_by_ip(event, params):
+    """Time-ordered alerts for one source IP across days via the src_ip index."""
+    src_ip = params["src_ip"].strip()
+    limit = _parse_limit(params)
+
+    try:
+        fields = _parse_fields(params.get("fields"))
+        if fields is None or fields == list(_SLIM_FIELDS):
+            fields = list(_INDEX_FIELDS)
+        unavailable = [field for field in fields if field not in _INDEX_FIELDS]
+        if unavailable:
+            raise ValueError(f"Not available for src_ip queries: {', '.join(unavailable)}")
+
+        now_ms = int(datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+        if params.get("to"):
+            to_ms = _parse_time_bound(params["to"], end_of_day=True)
+        elif params.get("event_date"):
+            to_ms = _parse_time_bound(params["event_date"], end_of_day=True)
+        else:
+            to_ms = now_ms
+        if params.get("from"):
+            from_ms = _parse_time_bound(params["from"])
+        elif params.get("event_date"):
+            from_ms = _parse_time_bound(params["event_date"])
+        else:
+            from_ms = to_ms - SRC_IP_DEFAULT_DAYS * 86400000
+        if params.get("since"):
+            from_ms = max(from_ms, int(params["since"]) + 1)
+    except ValueError as exc:
+        return _response(400, {"error": str(exc)})
+
+    if from_ms > to_ms:
+        return _response(400, {"error": "from must not be after to"})
+
+    query_kwargs = {
+        "IndexName": SRC_IP_INDEX_NAME,
+        "KeyConditionExpression": Key("src_ip").eq(src_ip) & Key("timestamp").between(from_ms, to_ms),
+        "ScanIndexForward": False,
+        "Limit": limit,
+        **_projection_kwargs(fields),
+    }
+
+    cursor = params.get("cursor")
+    if cursor:
+        start_key = _decode_cursor(cursor)
+        if not start_key or start_key.get("src_ip") != src_ip:
+            return _response(400, {"error": "Invalid cursor"})
+        query_kwargs["ExclusiveStartKey"] = start_key
+
+    response = _table.query(**query_kwargs)
+    items = response.get("Items", [])
+
+    body = {
+        "src_ip": src_ip,
+        "from": from_ms,
+        "to": to_ms,
+        "count": len(items),
+        "items": items,
+        "next_cursor": _encode_cursor(response.get("LastEvaluatedKey")),
+    }
+
+    return _response(200, body, event, etag=True)
+
+
 def _handle_list_events(event):
     params = (event or {}).get("queryStringParameters") or {}
+    if params.get("src_ip"):
+        return _handle_list_events_by_ip(event, params)
+
     event_date = params.get("event_date")
-    limit_param = params.get("limit", "100")
-    try:
-        limit = max(1, min(int(limit_param), 500))
-    except ValueError:
-        limit = 100
+    limit = _parse_limit(params)
 
     if not event_date:
         event_date = datetime.datetime.utcnow().strftime("%Y-%m-%d")
 
+    try:
+        fields = _parse_fields(params.get("fields"))
+    except ValueError as exc:
+        return _response(400, {"error": str(exc)})
+
+    key_condition = Key("event_date").eq(event_date)
+    since = params.get("since")
+    if since:
+        try:
+            since_ms = int(since)
+        except ValueError:
+            return _response(400, {"error": "since must be an epoch timestamp in milliseconds"})
+        key_condition = key_condition & Key("event_id").gte(_since_event_id(since_ms))
+
     query_kwargs = {
-        "KeyConditionExpression": Key("event_date").eq(event_date),
+        "KeyConditionExpression": key_condition,
         "ScanIndexForward": False,
         "Limit": limit,
+        **_projection_kwargs(fields),
     }
 
+    cursor = params.get("cursor")
+    if cursor:
+        start_key = _decode_cursor(cursor)
+        if not start_key or start_key.get("event_date") != event_date:
+            return _response(400, {"error": "Invalid cursor"})
+        query_kwargs["ExclusiveStartKey"] = start_key
+
     response = _table.query(**query_kwargs)
-    items = [_decimal_to_native(item) for item in response.get("Items", [])]
+    items = response.get("Items", [])
 
     body = {
         "event_date": event_date,
         "count": len(items),
         "items": items,
+        "next_cursor": _encode_cursor(response.get("LastEvaluatedKey")),
+    }
+
+    return _response(200, body, event, etag=True)
+
+
+def _public_profile(item, include_ports=False):
+    profile = {k: v for k, v in item.items() if k not in ("ports_bitmap", "scope", "version")}
+    if include_ports:
+        profile["ports"] = profiles.decode_ports(item.get("ports_bitmap"))
+    return profile
+
+
+def _handle_list_attackers(event):
+    """Sorted pages of attacker profiles, or one profile with ?src_ip=."""
+    if _attackers_table is None:
+        return _response(404, {"error": "Attacker profiles are not enabled"})
+
+    params = (event or {}).get("queryStringParameters") or {}
+
+    src_ip = params.get("src_ip")
+    if src_ip:
+        item = _attackers_table.get_item(Key={"src_ip": src_ip.strip()}).get("Item")
+        if not item:
+            return _response(404, {"error": "No profile for this IP", "src_ip": src_ip.strip()})
+        return _response(200, _public_profile(item, include_ports=True), event, etag=True)
+
+    sort = params.get("sort", "last_seen")
+    if sort not in _ATTACKER_SORT_INDEXES:
+        return _response(400, {"error": f"sort must be one of: {', '.join(_ATTACKER_SORT_INDEXES)}"})
+    ascending = params.get("order", "desc").lower() == "asc"
+    limit = _parse_limit(params)
+
+    key_condition = Key("scope").eq(profiles.PROFILE_SCOPE)
+    since = params.get("since")
+    if since:
+        if sort == "event_count":
+            return _response(400, {"error": "since applies to last_seen and first_seen sorts"})
+        try:
+            key_condition = key_condition & Key(sort).gte(_parse_time_bound(since))
+        except ValueError as exc:
+            return _response(400, {"error": str(exc)})
+
+    query_kwargs = {
+        "IndexName": _ATTACKER_SORT_INDEXES[sort],
+        "KeyConditionExpression": key_condition,
+        "ScanIndexForward": ascending,
+        "Limit": limit,
+    }
+
+    cursor = params.get("cursor")
+    if cursor:
+        start_key = _decode_cursor(cursor)
+        if not start_key or start_key.get("scope") != profiles.PROFILE_SCOPE or sort not in start_key:
+            return _response(400, {"error": "Invalid cursor"})
+        query_kwargs["ExclusiveStartKey"] = start_key
+
+    response = _attackers_table.query(**query_kwargs)
+    items = [_public_profile(item) for item in response.get("Items", [])]
+
+    body = {
+        "sort": sort,
+        "order": "asc" if ascending else "desc",
+        "count": len(items),
+        "items": items,
+        "next_cursor": _encode_cursor(response.get("LastEvaluatedKey")),
     }
 
-    return _response(200, body)
+    return _response(200, body, event, etag=True)
 
 
+@profiling.profiled
 def handler(event, context):
+    aws.reset_counters()
+    metrics.start("suricata_api", event)
+    return metrics.emit(aws.annotate(_route(event)), getattr(context, "aws_request_id", None))
+
+
+def _route(event):
     request_context = (event or {}).get("requestContext") or {}
     route_key = request_context.get("routeKey") or ""
     raw_path = (event or {}).get("rawPath") or ""
 
     if route_key == "GET /metrics" or raw_path.endswith("/metrics"):
-        metrics = _calculate_metrics()
-        return _response(200, metrics)
+        summary = _calculate_metrics()
+        return _response(200, summary, event)
+
+    if route_key == "GET /attackers" or raw_path.endswith("/attackers"):
+        return _handle_list_attackers(event)
 
     return _handle_list_events(event)
 
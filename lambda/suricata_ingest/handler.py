@@ -3,19 +3,57 @@ import datetime
 import gzip
 import json
 import os
+import time
 import uuid
 from urllib import request, error
 from urllib.parse import quote
 
-import boto3
+from botocore.exceptions import ClientError
 
-_dynamodb = boto3.resource("dynamodb")
-_table = _dynamodb.Table(os.environ["TABLE_NAME"])
+from phantomwall import aws, partition_stats, partitions, profiles, profiling, sampling
+
+_dynamodb = aws.resource("dynamodb")
+_table = aws.table(os.environ["TABLE_NAME"])
+
+# Per-attacker profiles (one item per public src_ip), optional
+_attackers_table_name = os.environ.get("ATTACKERS_TABLE_NAME")
+_attackers_table = aws.table(_attackers_table_name) if _attackers_table_name else None
+_PROFILE_WRITE_ATTEMPTS = 3
 
 # S3 client for raw log storage
-_s3 = boto3.client("s3")
+_s3 = aws.client("s3")
 _s3_bucket = os.environ.get("S3_BUCKET_NAME")
 _s3_enabled = os.environ.get("ENABLE_S3_BACKUP", "false").lower() == "true"
+# Split each hour by event type (etype=<type>/) so Athena can prune on it
+_partition_by_event_type = os.environ.get("PARTITION_BY_EVENT_TYPE", "false").lower() == "true"
+
+# Glue catalog for the S3 archive; hour partitions are registered here on
+# first write so the /logs query path does no discovery work
+_glue = aws.client("glue")
+_glue_database = os.environ.get("ATHENA_DATABASE")
+_glue_table = os.environ.get("ATHENA_TABLE")
+_glue_storage_descriptor = None
+
+# Per-hour event-type counters backing the /logs summary, optional
+_partition_stats_table_name = os.environ.get("PARTITION_STATS_TABLE")
+_partition_stats_table = aws.table(_partition_stats_table_name) if _partition_stats_table_name else None
+
+# Adaptive sampling of flooding low-value event types in the S3 archive
+# (phantomwall.sampling); "{}" turns it off
+FLOOD_EVENTS_PER_SECOND = float(os.environ.get("INGEST_FLOOD_EVENTS_PER_SECOND", "200"))
+MIN_SAMPLE_RATE = float(os.environ.get("INGEST_MIN_SAMPLE_RATE", str(sampling.MIN_SAMPLE_RATE)))
+try:
+    _sampling_policy = sampling.parse_policy(os.environ.get("INGEST_SAMPLING_POLICY", ""))
+except ValueError as e:
+    print(f"Invalid INGEST_SAMPLING_POLICY, using the default: {e}")
+    _sampling_policy = sampling.parse_policy("")
+
+# Every batch writes events (and S3 when backups are on); Glue is only
+# touched for a new hour partition, so it stays lazy
+aws.prewarm(_table, _s3 if _s3_enabled else None)
+
+# Partitions known to exist in Glue (persists across invocations in same Lambda container)
+_known_partitions = set()
 
 # GeoIP cache (persists across invocations in same Lambda container)
 _geo_cache = {}
@@ -222,40 +260,198 @@ def _normalize_event(raw_event, fallback_ms):
     return normalized, event_dt.strftime("%Y-%m-%d"), event_ms
 
 
-def _write_to_s3(suricata_event, event_dt):
+def _archive_values(event_dt, event_type):
+    """Partition values an event is archived under."""
+    if _partition_by_event_type:
+        return partitions.partition_values(event_dt, event_type)
+    return partitions.partition_values(event_dt)
+
+
+def _write_to_s3(suricata_event, values):
     """
     Write raw Suricata event to S3 for long-term storage.
-    Partitioned by date for efficient Athena queries.
-    Path: s3://bucket/year=2026/month=01/day=29/hour=14/event_uuid.json
+    Partitioned by hour and event type for efficient Athena queries.
+    Path: s3://bucket/year=2026/month=01/day=29/hour=14/etype=alert/event_uuid.json
+
+    Returns the object size in bytes, 0 if nothing was written.
     """
     if not _s3_enabled or not _s3_bucket:
-        return False
+        return 0
     
     try:
-        # Partition by date/hour for efficient queries
-        s3_key = (
-            f"year={event_dt.year}/"
-            f"month={event_dt.month:02d}/"
-            f"day={event_dt.day:02d}/"
-            f"hour={event_dt.hour:02d}/"
-            f"{uuid.uuid4().hex}.json"
-        )
+        s3_key = f"{partitions.partition_prefix(values)}{uuid.uuid4().hex}.json"
+        body = json.dumps(suricata_event).encode("utf-8")
         
         _s3.put_object(
             Bucket=_s3_bucket,
             Key=s3_key,
-            Body=json.dumps(suricata_event),
+            Body=body,
             ContentType="application/json",
             StorageClass="STANDARD"  # Will transition to GLACIER_IR after 30 days
         )
-        return True
+        return len(body)
     except Exception as e:
         # Don't fail the whole Lambda if S3 write fails
         print(f"S3 write error: {e}")
+        return 0
+
+
+def _ensure_partition(values):
+    """Register an archive partition in Glue once per container."""
+    global _glue_storage_descriptor
+
+    if not _glue_database or not _glue_table:
+        return False
+    values = tuple(values)
+    if values in _known_partitions:
         return False
 
+    try:
+        if _glue_storage_descriptor is None:
+            table_info = _glue.get_table(DatabaseName=_glue_database, Name=_glue_table)
+            _glue_storage_descriptor = table_info["Table"]["StorageDescriptor"]
+        created = partitions.create_partition(
+            _glue,
+            _glue_database,
+            _glue_table,
+            values,
+            _glue_storage_descriptor,
+            f"s3://{_s3_bucket}/{partitions.partition_prefix(values)}",
+        )
+    except Exception as e:
+        # Retried on the next write to this hour; the scheduled repair is the backstop
+        print(f"Partition registration error for {values}: {e}")
+        return False
+
+    _known_partitions.add(values)
+    return created
+
+
+def _archive(record, values, event_dt, event_type, weight, hour_counts):
+    """Write one record to the S3 archive and count the `weight` events it
+    stands for. Returns (written, partition_created)."""
+    written = _write_to_s3(record, values)
+    if not written:
+        return False, False
+    created = _ensure_partition(values)
+    # Count only what reached S3 so the summary matches Athena
+    key = partition_stats.hour_key(event_dt)
+    counts = hour_counts.setdefault((key["partition_date"], key["hour"]), {})
+    count_attr = partition_stats.COUNT_PREFIX + (event_type or partition_stats.UNKNOWN_EVENT_TYPE)
+    counts[count_attr] = counts.get(count_attr, 0) + weight
+    # Size manifest for s3_log_query's scan estimates
+    bytes_attr = partition_stats.BYTES_PREFIX + values[-1]
+    counts[bytes_attr] = counts.get(bytes_attr, 0) + written
+    return True, created
+
+
+def _sampling_plan(parsed):
+    """Per-type sampling decisions for this batch, from the rate each type arrives at."""
+    type_timestamps = {}
+    for suricata_event, cw_timestamp_ms in parsed:
+        # Events carrying alert data are always kept, whatever their type
+        if suricata_event.get("alert") is None:
+            type_timestamps.setdefault(suricata_event.get("event_type", ""), []).append(cw_timestamp_ms)
+    rates = sampling.batch_rates(type_timestamps)
+    decisions = sampling.plan(rates, _sampling_policy, FLOOD_EVENTS_PER_SECOND, MIN_SAMPLE_RATE)
+    for event_type, decision in decisions.items():
+        decision["events"] = len(type_timestamps[event_type])
+        decision["archived"] = 0
+    return decisions
+
+
+def _get_profiles(src_ips):
+    """Batch-read existing attacker profiles, 100 keys per request."""
+    found = {}
+    src_ips = list(src_ips)
+    for i in range(0, len(src_ips), 100):
+        request_items = {
+            _attackers_table_name: {
+                "Keys": [{"src_ip": ip} for ip in src_ips[i : i + 100]],
+                "ConsistentRead": True,
+            }
+        }
+        while request_items:
+            response = _dynamodb.batch_get_item(RequestItems=request_items)
+            for item in response.get("Responses", {}).get(_attackers_table_name, []):
+                found[item["src_ip"]] = item
+            request_items = response.get("UnprocessedKeys") or None
+    return found
+
+
+def _put_profile(src_ip, existing, delta):
+    """Write one merged profile, retrying on a concurrent update."""
+    for _ in range(_PROFILE_WRITE_ATTEMPTS):
+        item = profiles.merge(src_ip, existing, delta)
+        if existing:
+            condition = {
+                "ConditionExpression": "version = :version",
+                "ExpressionAttributeValues": {":version": existing.get("version", 0)},
+            }
+        else:
+            condition = {"ConditionExpression": "attribute_not_exists(src_ip)"}
+        try:
+            _attackers_table.put_item(Item=item, **condition)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            existing = _attackers_table.get_item(Key={"src_ip": src_ip}, ConsistentRead=True).get("Item")
+    print(f"Attacker profile update for {src_ip} lost {_PROFILE_WRITE_ATTEMPTS} races, skipped")
+    return False
+
+
+def _update_attacker_profiles(deltas):
+    """Apply one read-merge-write per source IP for this invocation."""
+    if _attackers_table is None or not deltas:
+        return 0
+    try:
+        existing = _get_profiles(deltas.keys())
+        return sum(1 for ip, delta in deltas.items() if _put_profile(ip, existing.get(ip), delta))
+    except Exception as e:
+        # Profiles are derived data; never fail the ingest batch over them
+        print(f"Attacker profile update error: {e}")
+        return 0
+
+
+def _record_partition_stats(hour_counts, alert_hours=()):
+    """Add this invocation's per-hour counters (event-type counts, bytes per
+    partition) to the stats table.
 
+    Hours that got alerts in DynamoDB but nothing archived (S3 off or the
+    write failed) still have their data version stamped, so caches keyed on
+    it (chat_assistant's answers) see the new alerts.
+    """
+    if _partition_stats_table is None:
+        return 0
+    updated = 0
+    ingested_at = int(time.time())
+    for partition_date, hour in sorted(set(alert_hours) - set(hour_counts)):
+        try:
+            partition_stats.stamp_ingested(
+                _partition_stats_table, {"partition_date": partition_date, "hour": hour}, ingested_at
+            )
+        except Exception as e:
+            print(f"Data version stamp error for {partition_date} {hour}: {e}")
+    for (partition_date, hour), counts in hour_counts.items():
+        try:
+            partition_stats.add_counts(
+                _partition_stats_table,
+                {"partition_date": partition_date, "hour": hour},
+                counts,
+                prefix="",
+                ingested_at=ingested_at,
+            )
+            updated += 1
+        except Exception as e:
+            # Summary falls back to Athena for days without stats; never fail ingest
+            print(f"Partition stats update error for {partition_date} {hour}: {e}")
+    return updated
+
+
+@profiling.profiled
 def handler(event, context):
+    aws.reset_counters()
     log_events = _decode_logs(event)
     if not log_events:
         return {"statusCode": 200, "records": 0}
@@ -264,6 +460,10 @@ def handler(event, context):
     items = []
     s3_writes = 0
     s3_total = 0
+    profile_deltas = {}
+    partitions_created = 0
+    hour_counts = {}
+    alert_hours = set()
 
     # -------------------------------------------------------
     # Cost Optimization: Only alerts go to DynamoDB
@@ -282,28 +482,62 @@ def handler(event, context):
     # Event types we consider alerts (written to DynamoDB)
     ALERT_EVENT_TYPES = {"alert", "anomaly", "drop"}
 
+    parsed = []
     for log_event in log_events:
         raw_message = log_event.get("message", "")
-        cw_timestamp_ms = log_event.get("timestamp", now_ms)
-
         try:
             suricata_event = json.loads(raw_message)
         except json.JSONDecodeError:
             suricata_event = {"raw_message": raw_message}
+        parsed.append((suricata_event, log_event.get("timestamp", now_ms)))
+
+    # During a flood, low-value types are sampled or rolled up on the way to
+    # S3; DynamoDB, attacker profiles and alerts still see every event
+    decisions = _sampling_plan(parsed)
+    sampled_seen = {}
+    aggregates = {}
 
+    for suricata_event, cw_timestamp_ms in parsed:
         normalized, event_date, event_ms = _normalize_event(suricata_event, cw_timestamp_ms)
         event_time_for_id = datetime.datetime.utcfromtimestamp(event_ms / 1000)
         event_id = f"{event_time_for_id.strftime('%Y%m%dT%H%M%S.%f')}_{uuid.uuid4().hex[:8]}"
 
-        # Write ALL events to S3 (cheap long-term storage)
-        s3_total += 1
-        if _write_to_s3(suricata_event, event_time_for_id):
-            s3_writes += 1
+        # Fold into this invocation's per-attacker aggregate
+        src_ip = normalized.get("src_ip")
+        if src_ip and not _is_private_ip(src_ip):
+            if src_ip not in profile_deltas:
+                profile_deltas[src_ip] = profiles.new_delta()
+            profiles.add_event(profile_deltas[src_ip], normalized)
 
         # Only write ALERTS to DynamoDB (cost optimization)
         event_type = suricata_event.get("event_type", "")
+
         has_alert_data = suricata_event.get("alert") is not None
 
+        # Write ALL events to S3 (cheap long-term storage), sampled or
+        # rolled up per the plan while their type floods
+        s3_total += 1
+        archive_values = _archive_values(event_time_for_id, event_type)
+        decision = None if has_alert_data else decisions.get(event_type)
+        mode = decision["mode"] if decision else "keep"
+        if mode == "aggregate":
+            group_key = (tuple(archive_values), sampling.aggregate_key(suricata_event))
+            _, group = aggregates.setdefault(group_key, (event_time_for_id, {}))
+            sampling.add_to_aggregate(group, suricata_event, suricata_event.get("timestamp") or normalized["event_time"])
+        else:
+            record, weight = suricata_event, 1
+            if mode == "sample":
+                index = sampled_seen.get(event_type, 0)
+                sampled_seen[event_type] = index + 1
+                weight = sampling.systematic_weight(index, decision["events"], decision["keep_every"])
+                record = {**suricata_event, sampling.WEIGHT_FIELD: weight}
+            if weight:
+                written, created = _archive(record, archive_values, event_time_for_id, event_type, weight, hour_counts)
+                s3_writes += written
+                partitions_created += created
+                if decision and written:
+                    decision["archived"] += 1
+
         if event_type in ALERT_EVENT_TYPES or has_alert_data:
             item = {
                 "event_date": event_date,
@@ -317,6 +551,15 @@ def handler(event, context):
                     item[key] = value
 
             items.append(item)
+            key = partition_stats.hour_key(event_time_for_id)
+            alert_hours.add((key["partition_date"], key["hour"]))
+
+    for (archive_values, _), (event_dt, group) in aggregates.items():
+        event_type = group.get("event_type", "")
+        written, created = _archive(group, archive_values, event_dt, event_type, group[sampling.WEIGHT_FIELD], hour_counts)
+        s3_writes += written
+        partitions_created += created
+        decisions[event_type]["archived"] += written
 
     # Write alerts to DynamoDB
     if items:
@@ -324,11 +567,19 @@ def handler(event, context):
             for item in items:
                 batch.put_item(Item=item)
 
+    profiles_updated = _update_attacker_profiles(profile_deltas)
+    stats_updated = _record_partition_stats(hour_counts, alert_hours)
+
     return {
         "statusCode": 200, 
         "dynamodb_alerts": len(items),
+        "attacker_profiles": profiles_updated,
         "s3_total": s3_total,
         "s3_writes": s3_writes,
-        "s3_enabled": _s3_enabled
+        "partitions_created": partitions_created,
+        "partition_stats_updated": stats_updated,
+        "s3_enabled": _s3_enabled,
+        "sampling": {event_type: decision for event_type, decision in decisions.items() if decision["mode"] != "keep"},
+        "aws": aws.counters(),
     }
 
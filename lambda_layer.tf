@@ -0,0 +1,26 @@
+# ===========================================================
+#                     PhantomWall Cloud Threat
+#                     Shared Lambda Layer
+# ===========================================================
+# Description: Python helpers shared by every PhantomWall
+#             Lambda (response encoding, AWS plumbing).
+#             Source lives in lambda/layer/python so the
+#             runtime finds it on /opt/python.
+# 
+# Naming Convention: phantomwall-{resource}-{environment}
+# Last Updated: 2026-10-18
+# ===========================================================
+
+data "archive_file" "shared_layer" {
+  type        = "zip"
+  source_dir  = "${path.module}/lambda/layer"
+  output_path = "${path.module}/lambda/shared_layer.zip"
+  excludes    = ["python/phantomwall/__pycache__"]
+}
+
+resource "aws_lambda_layer_version" "shared" {
+  layer_name          = "${var.project_name}-lambda-layer-shared-${var.environment}"
+  filename            = data.archive_file.shared_layer.output_path
+  source_code_hash    = data.archive_file.shared_layer.output_base64sha256
+  compatible_runtimes = ["python3.11"]
+}
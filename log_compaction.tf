@@ -0,0 +1,137 @@
+# ===========================================================
+#                     PhantomWall Cloud Threat
+#                     S3 Log Lake Compaction
+# ===========================================================
+# Description: Hourly EventBridge -> Lambda job that rewrites
+#             closed hour partitions (one object per event)
+#             into a few gzip NDJSON files and repoints the
+#             Glue partition at them
+# 
+# Naming Convention: phantomwall-{resource}-{environment}
+# Last Updated: 2026-10-18
+# ===========================================================
+
+resource "aws_iam_role" "lambda_log_compactor" {
+  name = "${var.project_name}-lambda-log-compactor-role-${var.environment}"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect    = "Allow",
+        Principal = { Service = "lambda.amazonaws.com" },
+        Action    = "sts:AssumeRole"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "lambda_log_compactor" {
+  name = "${var.project_name}-lambda-log-compactor-policy-${var.environment}"
+  role = aws_iam_role.lambda_log_compactor.id
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect = "Allow",
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject",
+          "s3:ListBucket"
+        ],
+        Resource = [
+          aws_s3_bucket.suricata_logs.arn,
+          "${aws_s3_bucket.suricata_logs.arn}/*"
+        ]
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "glue:GetPartitions",
+          "glue:UpdatePartition"
+        ],
+        Resource = [
+          "arn:aws:glue:${var.aws_region}:*:catalog",
+          "arn:aws:glue:${var.aws_region}:*:database/${aws_glue_catalog_database.suricata.name}",
+          "arn:aws:glue:${var.aws_region}:*:table/${aws_glue_catalog_database.suricata.name}/*"
+        ]
+      },
+      {
+        Effect   = "Allow",
+        Action   = ["dynamodb:UpdateItem"], # compacted sizes for the scan estimator
+        Resource = aws_dynamodb_table.partition_stats.arn
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "logs:CreateLogGroup",
+          "logs:CreateLogStream",
+          "logs:PutLogEvents"
+        ],
+        Resource = "*"
+      }
+    ]
+  })
+}
+
+data "archive_file" "log_compactor" {
+  type        = "zip"
+  source_dir  = "${path.module}/lambda/log_compactor"
+  output_path = "${path.module}/lambda/log_compactor.zip"
+}
+
+resource "aws_lambda_function" "log_compactor" {
+  function_name    = "${var.project_name}-lambda-log-compactor-${var.environment}"
+  role             = aws_iam_role.lambda_log_compactor.arn
+  handler          = "handler.handler"
+  runtime          = "python3.11"
+  filename         = data.archive_file.log_compactor.output_path
+  source_code_hash = data.archive_file.log_compactor.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+  timeout          = 900 # a busy hour is thousands of small GETs
+  memory_size      = 1024
+
+  environment {
+    variables = {
+      S3_BUCKET               = aws_s3_bucket.suricata_logs.bucket
+      ATHENA_DATABASE         = aws_glue_catalog_database.suricata.name
+      ATHENA_TABLE            = aws_glue_catalog_table.suricata_events.name
+      PARTITION_STATS_TABLE   = aws_dynamodb_table.partition_stats.name
+      COMPACT_LOOKBACK_HOURS  = "24"
+      COMPACT_MIN_AGE_MINUTES = "60" # leave room for late CloudWatch deliveries
+      PROFILE_OUTPUT          = var.lambda_profile_output
+      PROFILE_SAMPLE_RATE     = var.lambda_profile_sample_rate
+    }
+  }
+
+  tags = {
+    Project = var.project_name
+    Env     = var.environment
+  }
+}
+
+resource "aws_cloudwatch_log_group" "log_compactor" {
+  name              = "/aws/lambda/${aws_lambda_function.log_compactor.function_name}"
+  retention_in_days = 7
+}
+
+resource "aws_cloudwatch_event_rule" "log_compaction" {
+  name                = "${var.project_name}-eventbridge-log-compaction-${var.environment}"
+  schedule_expression = "rate(1 hour)"
+}
+
+resource "aws_cloudwatch_event_target" "log_compaction" {
+  rule  = aws_cloudwatch_event_rule.log_compaction.name
+  arn   = aws_lambda_function.log_compactor.arn
+  input = jsonencode({ action = "compact" })
+}
+
+resource "aws_lambda_permission" "log_compaction" {
+  statement_id  = "AllowEventBridgeLogCompaction"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.log_compactor.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.log_compaction.arn
+}
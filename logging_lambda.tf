@@ -26,6 +26,10 @@ resource "aws_dynamodb_table" "suricata_events" {
   hash_key     = "event_date"
   range_key    = "event_id"
 
+  # New alerts feed the realtime push Lambda (realtime_push.tf)
+  stream_enabled   = true
+  stream_view_type = "NEW_IMAGE"
+
   attribute {
     name = "event_date"
     type = "S"
@@ -36,6 +40,31 @@ resource "aws_dynamodb_table" "suricata_events" {
     type = "S"
   }
 
+  attribute {
+    name = "src_ip"
+    type = "S"
+  }
+
+  attribute {
+    name = "timestamp"
+    type = "N"
+  }
+
+  # Attacker pivots: every alert for one source IP across days in a single
+  # Query instead of one per event_date partition. Projects only the slim
+  # attributes the alerts table renders to keep index storage small.
+  global_secondary_index {
+    name            = "src_ip-timestamp-index"
+    hash_key        = "src_ip"
+    range_key       = "timestamp"
+    projection_type = "INCLUDE"
+    non_key_attributes = [
+      "event_time", "event_type", "src_port", "dest_ip", "dest_port", "proto",
+      "flow_id", "severity", "category", "signature", "signature_id", "summary",
+      "country_name", "country_code", "flag",
+    ]
+  }
+
   tags = {
     Project = var.project_name
     Env     = var.environment
@@ -43,6 +72,99 @@ resource "aws_dynamodb_table" "suricata_events" {
   }
 }
 
+# One profile item per public source IP, maintained incrementally by
+# suricata_ingest (first/last seen, counts, ports bitmap, top signatures).
+# Every item carries scope = "attacker" so the GSIs below can serve the
+# whole population sorted by recency, novelty or volume.
+resource "aws_dynamodb_table" "attackers" {
+  name         = "${var.project_name}-dynamodb-attackers-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "src_ip"
+
+  attribute {
+    name = "src_ip"
+    type = "S"
+  }
+
+  attribute {
+    name = "scope"
+    type = "S"
+  }
+
+  attribute {
+    name = "last_seen"
+    type = "N"
+  }
+
+  attribute {
+    name = "first_seen"
+    type = "N"
+  }
+
+  attribute {
+    name = "event_count"
+    type = "N"
+  }
+
+  global_secondary_index {
+    name               = "scope-last_seen-index"
+    hash_key           = "scope"
+    range_key          = "last_seen"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["first_seen", "event_count", "alert_count", "distinct_ports", "top_signatures", "country_name", "country_code", "flag"]
+  }
+
+  global_secondary_index {
+    name               = "scope-first_seen-index"
+    hash_key           = "scope"
+    range_key          = "first_seen"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["last_seen", "event_count", "alert_count", "distinct_ports", "top_signatures", "country_name", "country_code", "flag"]
+  }
+
+  global_secondary_index {
+    name               = "scope-event_count-index"
+    hash_key           = "scope"
+    range_key          = "event_count"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["first_seen", "last_seen", "alert_count", "distinct_ports", "top_signatures", "country_name", "country_code", "flag"]
+  }
+
+  tags = {
+    Project = var.project_name
+    Env     = var.environment
+    Service = "attacker-profiles"
+  }
+}
+
+# Per-hour event-type counters for the S3 log lake, incremented by
+# suricata_ingest and read by s3_log_query for the /logs summary. The same
+# items carry per-partition byte sizes (raw from ingest, compacted from
+# log_compactor) that s3_log_query estimates Athena scans from, and the
+# ingested_at stamp chat_assistant keys its response cache on.
+resource "aws_dynamodb_table" "partition_stats" {
+  name         = "${var.project_name}-dynamodb-partition-stats-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "partition_date"
+  range_key    = "hour"
+
+  attribute {
+    name = "partition_date"
+    type = "S"
+  }
+
+  attribute {
+    name = "hour"
+    type = "S"
+  }
+
+  tags = {
+    Project = var.project_name
+    Env     = var.environment
+    Service = "partition-stats"
+  }
+}
+
 resource "aws_iam_role" "lambda_ingest" {
   name = "${var.project_name}-lambda-ingest-role-${var.environment}"
 
@@ -74,6 +196,20 @@ resource "aws_iam_role_policy" "lambda_ingest" {
         ],
         Resource = aws_dynamodb_table.suricata_events.arn
       },
+      {
+        Effect = "Allow",
+        Action = [
+          "dynamodb:BatchGetItem",
+          "dynamodb:GetItem",
+          "dynamodb:PutItem"
+        ],
+        Resource = aws_dynamodb_table.attackers.arn
+      },
+      {
+        Effect   = "Allow",
+        Action   = ["dynamodb:UpdateItem"],
+        Resource = aws_dynamodb_table.partition_stats.arn
+      },
       {
         Effect = "Allow",
         Action = [
@@ -82,6 +218,19 @@ resource "aws_iam_role_policy" "lambda_ingest" {
         ],
         Resource = "${aws_s3_bucket.suricata_logs.arn}/*"
       },
+      {
+        # Register new hour partitions as they are first written
+        Effect = "Allow",
+        Action = [
+          "glue:GetTable",
+          "glue:CreatePartition"
+        ],
+        Resource = [
+          "arn:aws:glue:${var.aws_region}:*:catalog",
+          "arn:aws:glue:${var.aws_region}:*:database/${aws_glue_catalog_database.suricata.name}",
+          "arn:aws:glue:${var.aws_region}:*:table/${aws_glue_catalog_database.suricata.name}/*"
+        ]
+      },
       {
         Effect = "Allow",
         Action = [
@@ -108,14 +257,24 @@ resource "aws_lambda_function" "suricata_ingest" {
   runtime          = "python3.11"
   filename         = data.archive_file.suricata_lambda.output_path
   source_code_hash = data.archive_file.suricata_lambda.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
   timeout          = 30
   memory_size      = 256 # Reduced from 512 MB - sufficient for JSON processing (~$1/month savings)
 
   environment {
     variables = {
-      TABLE_NAME       = aws_dynamodb_table.suricata_events.name
-      S3_BUCKET_NAME   = aws_s3_bucket.suricata_logs.id
-      ENABLE_S3_BACKUP = "true" # Feature flag to enable/disable S3 writes
+      TABLE_NAME                     = aws_dynamodb_table.suricata_events.name
+      ATTACKERS_TABLE_NAME           = aws_dynamodb_table.attackers.name
+      PARTITION_STATS_TABLE          = aws_dynamodb_table.partition_stats.name
+      S3_BUCKET_NAME                 = aws_s3_bucket.suricata_logs.id
+      ENABLE_S3_BACKUP               = "true" # Feature flag to enable/disable S3 writes
+      PARTITION_BY_EVENT_TYPE        = "true" # archive under hour=HH/etype=<type>/
+      ATHENA_DATABASE                = aws_glue_catalog_database.suricata.name
+      ATHENA_TABLE                   = aws_glue_catalog_table.suricata_events.name
+      INGEST_SAMPLING_POLICY         = jsonencode(var.ingest_sampling_policy)
+      INGEST_FLOOD_EVENTS_PER_SECOND = var.ingest_flood_events_per_second
+      PROFILE_OUTPUT                 = var.lambda_profile_output
+      PROFILE_SAMPLE_RATE            = var.lambda_profile_sample_rate
     }
   }
 
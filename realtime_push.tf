@@ -0,0 +1,199 @@
+# ===========================================================
+#                     PhantomWall Cloud Threat
+#                     Realtime Alert Push
+# ===========================================================
+# Description: DynamoDB Stream -> Lambda -> API Gateway
+#             WebSocket fan-out so dashboards receive new
+#             alerts as they land instead of polling /events
+# 
+# Naming Convention: phantomwall-{resource}-{environment}
+# Last Updated: 2026-10-18
+# ===========================================================
+
+# Open WebSocket connections and their per-connection filters
+resource "aws_dynamodb_table" "ws_connections" {
+  name         = "${var.project_name}-dynamodb-ws-connections-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "connection_id"
+
+  attribute {
+    name = "connection_id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Project = var.project_name
+    Env     = var.environment
+    Service = "realtime-push"
+  }
+}
+
+resource "aws_apigatewayv2_api" "realtime" {
+  name                       = "${var.project_name}-api-gateway-realtime-${var.environment}"
+  protocol_type              = "WEBSOCKET"
+  route_selection_expression = "$request.body.action"
+}
+
+resource "aws_apigatewayv2_stage" "realtime" {
+  api_id      = aws_apigatewayv2_api.realtime.id
+  name        = "prod"
+  auto_deploy = true
+}
+
+resource "aws_iam_role" "lambda_alert_stream" {
+  name = "${var.project_name}-lambda-alert-stream-role-${var.environment}"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect    = "Allow",
+        Principal = { Service = "lambda.amazonaws.com" },
+        Action    = "sts:AssumeRole"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "lambda_alert_stream" {
+  name = "${var.project_name}-lambda-alert-stream-policy-${var.environment}"
+  role = aws_iam_role.lambda_alert_stream.id
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect = "Allow",
+        Action = [
+          "dynamodb:DescribeStream",
+          "dynamodb:GetRecords",
+          "dynamodb:GetShardIterator",
+          "dynamodb:ListStreams"
+        ],
+        Resource = aws_dynamodb_table.suricata_events.stream_arn
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "dynamodb:PutItem",
+          "dynamodb:DeleteItem",
+          "dynamodb:Scan"
+        ],
+        Resource = aws_dynamodb_table.ws_connections.arn
+      },
+      {
+        Effect   = "Allow",
+        Action   = "execute-api:ManageConnections",
+        Resource = "${aws_apigatewayv2_api.realtime.execution_arn}/*"
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "logs:CreateLogGroup",
+          "logs:CreateLogStream",
+          "logs:PutLogEvents"
+        ],
+        Resource = "*"
+      }
+    ]
+  })
+}
+
+data "archive_file" "alert_stream" {
+  type        = "zip"
+  source_dir  = "${path.module}/lambda/alert_stream"
+  output_path = "${path.module}/lambda/alert_stream.zip"
+}
+
+resource "aws_lambda_function" "alert_stream" {
+  function_name    = "${var.project_name}-lambda-alert-stream-${var.environment}"
+  role             = aws_iam_role.lambda_alert_stream.arn
+  handler          = "handler.handler"
+  runtime          = "python3.11"
+  filename         = data.archive_file.alert_stream.output_path
+  source_code_hash = data.archive_file.alert_stream.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+  timeout          = 30
+  memory_size      = 128
+
+  environment {
+    variables = {
+      CONNECTIONS_TABLE_NAME = aws_dynamodb_table.ws_connections.name
+      WEBSOCKET_ENDPOINT     = "https://${aws_apigatewayv2_api.realtime.id}.execute-api.${var.aws_region}.amazonaws.com/${aws_apigatewayv2_stage.realtime.name}"
+      PROFILE_OUTPUT         = var.lambda_profile_output
+      PROFILE_SAMPLE_RATE    = var.lambda_profile_sample_rate
+    }
+  }
+
+  tags = {
+    Project = var.project_name
+    Env     = var.environment
+  }
+}
+
+resource "aws_cloudwatch_log_group" "alert_stream" {
+  name              = "/aws/lambda/${aws_lambda_function.alert_stream.function_name}"
+  retention_in_days = 7
+}
+
+# No batching window: alerts are pushed as soon as the stream delivers them
+resource "aws_lambda_event_source_mapping" "alert_stream" {
+  event_source_arn                   = aws_dynamodb_table.suricata_events.stream_arn
+  function_name                      = aws_lambda_function.alert_stream.arn
+  starting_position                  = "LATEST"
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 0
+  maximum_retry_attempts             = 2
+
+  filter_criteria {
+    filter {
+      pattern = jsonencode({ eventName = ["INSERT"] })
+    }
+  }
+}
+
+# ----------------------------------------------------------
+#            WebSocket routes
+# ----------------------------------------------------------
+resource "aws_apigatewayv2_integration" "alert_stream" {
+  api_id             = aws_apigatewayv2_api.realtime.id
+  integration_type   = "AWS_PROXY"
+  integration_uri    = aws_lambda_function.alert_stream.invoke_arn
+  integration_method = "POST"
+}
+
+resource "aws_apigatewayv2_route" "realtime_connect" {
+  api_id    = aws_apigatewayv2_api.realtime.id
+  route_key = "$connect"
+  target    = "integrations/${aws_apigatewayv2_integration.alert_stream.id}"
+}
+
+resource "aws_apigatewayv2_route" "realtime_disconnect" {
+  api_id    = aws_apigatewayv2_api.realtime.id
+  route_key = "$disconnect"
+  target    = "integrations/${aws_apigatewayv2_integration.alert_stream.id}"
+}
+
+resource "aws_apigatewayv2_route" "realtime_default" {
+  api_id    = aws_apigatewayv2_api.realtime.id
+  route_key = "$default"
+  target    = "integrations/${aws_apigatewayv2_integration.alert_stream.id}"
+}
+
+resource "aws_lambda_permission" "apigw_realtime_invoke" {
+  statement_id  = "AllowAPIGatewayInvokeRealtime"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.alert_stream.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_apigatewayv2_api.realtime.execution_arn}/*/*"
+}
+
+output "alerts_websocket_url" {
+  value       = aws_apigatewayv2_stage.realtime.invoke_url
+  description = "WebSocket endpoint for realtime alert push"
+}
@@ -65,6 +65,21 @@ resource "aws_s3_bucket_lifecycle_configuration" "suricata_logs" {
     }
   }
 
+  # Originals deleted by log_compactor stay recoverable for a week as
+  # noncurrent versions, then stop costing storage
+  rule {
+    id     = "expire-noncurrent-versions"
+    status = "Enabled"
+
+    filter {
+      prefix = ""
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 7
+    }
+  }
+
   # Delete incomplete multipart uploads after 7 days
   rule {
     id     = "cleanup-incomplete-uploads"
@@ -0,0 +1,128 @@
+"""
+Local test for the realtime alert push Lambda
+Replays an in-memory DynamoDB Stream batch against in-memory connections
+"""
+
+import importlib.util
+import json
+import os
+import sys
+
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+# Mock environment variables BEFORE importing handler
+os.environ['CONNECTIONS_TABLE_NAME'] = 'test-ws-connections'
+os.environ['WEBSOCKET_ENDPOINT'] = 'https://example.execute-api.us-east-1.amazonaws.com/prod'
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+def load_handler():
+    """Load lambda/alert_stream/handler.py without clashing with other handler modules"""
+    path = os.path.join(ROOT, 'lambda', 'alert_stream', 'handler.py')
+    spec = importlib.util.spec_from_file_location('alert_stream_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class MockConnectionsTable:
+    """In-memory stand-in for the WebSocket connections table"""
+    def __init__(self):
+        self.items = {}
+
+    def put_item(self, Item):
+        self.items[Item['connection_id']] = dict(Item)
+
+    def delete_item(self, Key):
+        self.items.pop(Key['connection_id'], None)
+
+    def scan(self, **kwargs):
+        return {'Items': list(self.items.values())}
+
+
+class MockManagementApi:
+    """In-memory stand-in for apigatewaymanagementapi"""
+    def __init__(self, gone=()):
+        self.sent = {}
+        self.gone = set(gone)
+
+    def post_to_connection(self, ConnectionId, Data):
+        if ConnectionId in self.gone:
+            raise ClientError({'Error': {'Code': 'GoneException', 'Message': 'gone'}}, 'PostToConnection')
+        self.sent.setdefault(ConnectionId, []).append(json.loads(Data))
+
+
+def stream_insert(item):
+    """Build a DynamoDB Stream INSERT record the way the events table emits it"""
+    serializer = TypeSerializer()
+    return {
+        'eventName': 'INSERT',
+        'eventSource': 'aws:dynamodb',
+        'dynamodb': {'NewImage': {k: serializer.serialize(v) for k, v in item.items()}},
+    }
+
+
+def ws_event(route_key, connection_id, query=None, body=None):
+    return {
+        'requestContext': {'routeKey': route_key, 'connectionId': connection_id},
+        'queryStringParameters': query,
+        'body': body,
+    }
+
+
+def test_alert_stream_push():
+    module = load_handler()
+    connections = MockConnectionsTable()
+    management = MockManagementApi(gone={'conn-gone'})
+    module._connections_table = connections
+    module._management = management
+
+    # Connect three clients with different filters, then one that vanished
+    assert module.handler(ws_event('$connect', 'conn-all'), None)['statusCode'] == 200
+    assert module.handler(ws_event('$connect', 'conn-high', {'severity': '1'}), None)['statusCode'] == 200
+    assert module.handler(ws_event('$connect', 'conn-ip'), None)['statusCode'] == 200
+    subscribe = json.dumps({'action': 'subscribe', 'src_ip': '203.0.113.50'})
+    assert module.handler(ws_event('$default', 'conn-ip', body=subscribe), None)['statusCode'] == 200
+    assert module.handler(ws_event('$connect', 'conn-gone'), None)['statusCode'] == 200
+    assert module.handler(ws_event('$connect', 'conn-bad', {'severity': 'high'}), None)['statusCode'] == 400
+
+    records = [
+        stream_insert({
+            'event_date': '2026-01-29', 'event_id': '20260129T143015.123456_aaaa0001',
+            'timestamp': 1769697015123, 'src_ip': '203.0.113.50', 'severity': 2,
+            'signature': 'ET SCAN Potential SSH Scan',
+            'suricata': {'alert': {'action': 'allowed', 'signature_id': 2001219}},
+        }),
+        stream_insert({
+            'event_date': '2026-01-29', 'event_id': '20260129T143016.000000_aaaa0002',
+            'timestamp': 1769697016000, 'src_ip': '198.51.100.7', 'severity': 1,
+            'signature': 'ET EXPLOIT Possible Log4j RCE',
+        }),
+        {'eventName': 'MODIFY', 'dynamodb': {}},
+    ]
+
+    result = module.handler({'Records': records}, None)
+    assert result['alerts'] == 2
+    assert result['delivered'] == 3
+    assert result['stale'] == 1
+
+    assert [a['src_ip'] for a in management.sent['conn-all'][0]['items']] == ['203.0.113.50', '198.51.100.7']
+    assert [a['src_ip'] for a in management.sent['conn-high'][0]['items']] == ['198.51.100.7']
+    assert [a['src_ip'] for a in management.sent['conn-ip'][0]['items']] == ['203.0.113.50']
+    # Raw suricata map is trimmed to what the table renders
+    assert management.sent['conn-ip'][0]['items'][0]['suricata'] == {'alert': {'action': 'allowed'}}
+    # Vanished clients are cleaned up
+    assert 'conn-gone' not in connections.items
+
+    assert module.handler(ws_event('$disconnect', 'conn-all'), None)['statusCode'] == 200
+    assert 'conn-all' not in connections.items
+
+
+if __name__ == "__main__":
+    test_alert_stream_push()
+    print("✅ Alert stream push test passed")
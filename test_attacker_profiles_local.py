@@ -0,0 +1,215 @@
+"""
+Local test for per-attacker profiles (phantomwall.profiles) maintained by suricata_ingest
+Merges batches into an in-memory attackers table, including a lost version race
+"""
+
+import base64
+import gzip
+import importlib.util
+import json
+import os
+import sys
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+# Mock environment variables BEFORE importing handler
+os.environ.setdefault('TABLE_NAME', 'test-suricata-events')
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+from phantomwall import profiles  # noqa: E402
+
+ATTACKERS_TABLE = 'test-attackers'
+T0 = 1769697000000  # 2026-01-29T14:30:00Z
+
+
+def load_handler():
+    """Load lambda/suricata_ingest/handler.py without clashing with other handler modules"""
+    path = os.path.join(ROOT, 'lambda', 'suricata_ingest', 'handler.py')
+    spec = importlib.util.spec_from_file_location('suricata_ingest_profiles_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _conflict():
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'conflict'}}, 'PutItem')
+
+
+class MockAttackersTable:
+    """In-memory stand-in for the attackers table (conditional puts on version)
+
+    `before_put` runs ahead of each put, standing in for a concurrent writer.
+    """
+    def __init__(self, items=None, before_put=None):
+        self.items = {item['src_ip']: dict(item) for item in (items or [])}
+        self.before_put = before_put
+        self.puts = 0
+
+    def put_item(self, Item, ConditionExpression, ExpressionAttributeValues=None):
+        self.puts += 1
+        if self.before_put:
+            self.before_put(self)
+        stored = self.items.get(Item['src_ip'])
+        if ConditionExpression == 'attribute_not_exists(src_ip)':
+            if stored is not None:
+                raise _conflict()
+        elif ConditionExpression == 'version = :version':
+            if stored is None or stored['version'] != ExpressionAttributeValues[':version']:
+                raise _conflict()
+        else:
+            raise AssertionError(f'Unexpected condition: {ConditionExpression}')
+        self.items[Item['src_ip']] = dict(Item)
+
+    def get_item(self, Key, ConsistentRead=False):
+        item = self.items.get(Key['src_ip'])
+        return {'Item': dict(item)} if item else {}
+
+
+class MockDynamoDB:
+    """In-memory stand-in for the DynamoDB resource (batch_get_item on the attackers table)"""
+    def __init__(self, table):
+        self.table = table
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems[ATTACKERS_TABLE]['Keys']
+        found = [dict(self.table.items[k['src_ip']]) for k in keys if k['src_ip'] in self.table.items]
+        return {'Responses': {ATTACKERS_TABLE: found}}
+
+
+class MockTable:
+    """In-memory stand-in for the events table (batch writer)"""
+    def __init__(self):
+        self.items = []
+
+    def batch_writer(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def put_item(self, Item):
+        self.items.append(Item)
+
+
+def setup(module, attackers):
+    module._table = MockTable()
+    module._attackers_table = attackers
+    module._attackers_table_name = ATTACKERS_TABLE
+    module._dynamodb = MockDynamoDB(attackers)
+    module._s3_enabled = False
+    module._partition_stats_table = None
+    module._enrich_geo = lambda ip: {'country_name': 'Testland', 'country_code': 'TL', 'flag': ''}
+
+
+def cloudwatch_event(events):
+    log_events = [{'id': str(i), 'timestamp': T0, 'message': json.dumps(e)} for i, e in enumerate(events)]
+    data = gzip.compress(json.dumps({'logEvents': log_events}).encode())
+    return {'awslogs': {'data': base64.b64encode(data).decode()}}
+
+
+def eve(src_ip, second, dest_port, signature=None):
+    event = {
+        'timestamp': f'2026-01-29T14:30:{second:02d}.000000+0000', 'event_type': 'alert' if signature else 'flow',
+        'src_ip': src_ip, 'src_port': 40000, 'dest_ip': '10.0.0.5', 'dest_port': dest_port, 'proto': 'TCP',
+    }
+    if signature:
+        event['alert'] = {'signature': signature, 'severity': 2}
+    return event
+
+
+def stored_profile(src_ip, first_second, last_second, ports, event_count, signatures, version):
+    delta = profiles.new_delta()
+    delta.update({'first_seen': T0 + first_second * 1000, 'last_seen': T0 + last_second * 1000,
+                  'event_count': event_count, 'ports': set(ports), 'signatures': dict(signatures)})
+    item = profiles.merge(src_ip, None, delta)
+    item['version'] = version
+    return item
+
+
+def test_merge_bitmap_seen_and_signature_cap():
+    existing = stored_profile('198.51.100.7', 10, 20, [22, 65535], 4, {'SIG A': 3}, version=4)
+    delta = profiles.new_delta()
+    for i in range(12):
+        profiles.add_event(delta, {'timestamp': T0 + (5 + i) * 1000, 'dest_port': 1000 + i, 'event_type': 'alert',
+                                   'signature': f'SIG {i:02d}' if i else 'SIG A'})
+    profiles.add_event(delta, {'timestamp': T0 + 30000, 'dest_port': 22, 'country_code': 'TL', 'country_name': 'Testland'})
+
+    item = profiles.merge('198.51.100.7', existing, delta)
+    assert item['first_seen'] == T0 + 5000 and item['last_seen'] == T0 + 30000
+    assert item['event_count'] == 4 + 13 and item['alert_count'] == 12
+    assert profiles.decode_ports(item['ports_bitmap']) == [22] + list(range(1000, 1012)) + [65535]
+    assert item['distinct_ports'] == 14 and item['version'] == 5
+
+    # Twelve distinct signatures, capped to the ten heaviest; SIG A carries its stored count
+    assert len(item['top_signatures']) == profiles.TOP_SIGNATURES
+    assert item['top_signatures']['SIG A'] == 4
+    assert list(item['top_signatures'])[0] == 'SIG A' and 'SIG 10' not in item['top_signatures']
+    assert item['country_code'] == 'TL'
+
+    # A delta without timestamps keeps the stored window
+    assert profiles.merge('198.51.100.7', existing, profiles.new_delta())['first_seen'] == T0 + 10000
+
+
+def test_ingest_retries_a_lost_version_race():
+    attackers = MockAttackersTable([stored_profile('198.51.100.7', 0, 10, [22], 5, {'SIG A': 5}, version=1)])
+
+    def concurrent_writer(table):
+        # Another container lands its batch for the same IP between our read and write
+        if table.puts == 1:
+            stored = table.items['198.51.100.7']
+            delta = profiles.new_delta()
+            profiles.add_event(delta, {'timestamp': T0 - 60000, 'dest_port': 3389, 'event_type': 'flow'})
+            table.items['198.51.100.7'] = profiles.merge('198.51.100.7', stored, delta)
+
+    attackers.before_put = concurrent_writer
+    module = load_handler()
+    setup(module, attackers)
+
+    batch = [
+        eve('198.51.100.7', 20, 80, 'SIG A'),
+        eve('198.51.100.7', 25, 443),
+        eve('198.51.100.7', 30, 22, 'SIG B'),
+        eve('203.0.113.9', 15, 8080),
+        eve('10.0.0.8', 15, 53),  # private: never profiled
+    ]
+    result = module.handler(cloudwatch_event(batch), None)
+    assert result['attacker_profiles'] == 2
+    assert set(attackers.items) == {'198.51.100.7', '203.0.113.9'}
+
+    merged = attackers.items['198.51.100.7']
+    assert merged['version'] == 3  # ours lands on top of the concurrent version 2
+    assert merged['event_count'] == 5 + 1 + 3
+    assert merged['first_seen'] == T0 - 60000 and merged['last_seen'] == T0 + 30000
+    assert profiles.decode_ports(merged['ports_bitmap']) == [22, 80, 443, 3389]
+    assert merged['top_signatures'] == {'SIG A': 6, 'SIG B': 1}
+    assert attackers.items['203.0.113.9']['version'] == 1
+
+
+def test_ingest_gives_up_after_repeated_races():
+    attackers = MockAttackersTable([stored_profile('198.51.100.7', 0, 10, [22], 5, {}, version=1)])
+
+    def always_ahead(table):
+        table.items['198.51.100.7'] = {**table.items['198.51.100.7'], 'version': table.items['198.51.100.7']['version'] + 1}
+
+    attackers.before_put = always_ahead
+    module = load_handler()
+    setup(module, attackers)
+
+    result = module.handler(cloudwatch_event([eve('198.51.100.7', 20, 80)]), None)
+    assert result['attacker_profiles'] == 0 and result['statusCode'] == 200
+    assert attackers.puts == module._PROFILE_WRITE_ATTEMPTS
+    assert attackers.items['198.51.100.7']['event_count'] == 5
+
+
+if __name__ == "__main__":
+    test_merge_bitmap_seen_and_signature_cap()
+    test_ingest_retries_a_lost_version_race()
+    test_ingest_gives_up_after_repeated_races()
+    print("✅ Attacker profile tests passed")
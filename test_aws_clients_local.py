@@ -0,0 +1,113 @@
+"""
+Local test for the shared AWS client layer (phantomwall.aws)
+Answers DynamoDB calls from a fake transport so real botocore retries run
+"""
+
+import json
+import os
+import sys
+
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+# Fake credentials go to the one client that needs them, never into the
+# environment or the default session, where later test modules would see them
+FAKE_CREDENTIALS = {'aws_access_key_id': 'testing', 'aws_secret_access_key': 'testing'}
+
+from phantomwall import aws  # noqa: E402
+
+
+class FakeRaw:
+    """Minimal urllib3 response body for AWSResponse"""
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, *args, **kwargs):
+        yield self.body
+
+
+class FakeTransport:
+    """Answers every request in turn from (status, body) pairs instead of sending it"""
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.sent = 0
+
+    def __call__(self, request, **kwargs):
+        status, body = self.replies[min(self.sent, len(self.replies) - 1)]
+        self.sent += 1
+        raw = json.dumps(body).encode()
+        return AWSResponse(request.url, status, {'Content-Type': 'application/x-amz-json-1.0'}, FakeRaw(raw))
+
+
+THROTTLED = (400, {'__type': 'com.amazonaws.dynamodb.v20120810#ThrottlingException', 'message': 'slow down'})
+OK = (200, {'TableNames': ['events']})
+
+
+def test_clients_are_lazy_and_shared():
+    handle = aws.client('dynamodb', region_name='eu-west-1')
+    assert not handle.built
+    built = handle.resolve()
+    assert handle.built and aws.client('dynamodb', region_name='eu-west-1').resolve() is built
+    assert aws.table('a').meta.client is not None  # tables share the dynamodb resource
+    assert aws.table('a').resolve().meta.client is aws.table('b').resolve().meta.client
+
+
+def test_client_config_from_env():
+    config = aws.client_config('s3', workers=32)
+    assert config.max_pool_connections == 32 and config.tcp_keepalive
+    assert config.retries['mode'] == 'adaptive'
+    assert aws.client_config('s3').max_pool_connections == aws.DEFAULT_POOL_CONNECTIONS
+    assert aws.client_config('bedrock-runtime').read_timeout == 60
+
+    os.environ['AWS_READ_TIMEOUT_BEDROCK_RUNTIME'] = '90'
+    os.environ['AWS_CONNECT_TIMEOUT'] = '1.5'
+    try:
+        config = aws.client_config('bedrock-runtime')
+        assert config.read_timeout == 90 and config.connect_timeout == 1.5
+    finally:
+        del os.environ['AWS_READ_TIMEOUT_BEDROCK_RUNTIME']
+        del os.environ['AWS_CONNECT_TIMEOUT']
+
+
+def test_retry_and_throttle_counters():
+    max_attempts = aws.MAX_ATTEMPTS
+    aws.MAX_ATTEMPTS = 3  # keeps retry backoff short
+    client = aws.get_client('dynamodb', workers=1, **FAKE_CREDENTIALS)
+    transport = FakeTransport(THROTTLED, OK)
+    client.meta.events.register_first('before-send.dynamodb.ListTables', transport)
+    try:
+        aws.reset_counters()
+        assert client.list_tables()['TableNames'] == ['events']
+        assert aws.counters() == {'calls': 1, 'retries': 1, 'throttles': 1}
+        assert transport.sent == 2
+
+        # A call that keeps being throttled fails once retries run out
+        transport.replies = [THROTTLED]
+        transport.sent = 0
+        aws.reset_counters()
+        try:
+            client.list_tables()
+            raise AssertionError('expected ThrottlingException')
+        except ClientError as e:
+            assert e.response['Error']['Code'] == 'ThrottlingException'
+        assert aws.counters() == {'calls': 1, 'retries': aws.MAX_ATTEMPTS - 1, 'throttles': aws.MAX_ATTEMPTS}
+
+        response = aws.annotate({'statusCode': 200, 'headers': {}, 'body': '{}'})
+        assert response['headers']['X-Aws-Throttles'] == str(aws.MAX_ATTEMPTS)
+    finally:
+        client.meta.events.unregister('before-send.dynamodb.ListTables', transport)
+        aws.MAX_ATTEMPTS = max_attempts
+        # Drop the short-retry client so nothing later picks it up from the registry
+        aws._registry.pop(('client', 'dynamodb', 1, tuple(sorted(FAKE_CREDENTIALS.items()))), None)
+
+
+if __name__ == "__main__":
+    test_clients_are_lazy_and_shared()
+    test_client_config_from_env()
+    test_retry_and_throttle_counters()
+    print("✅ Shared AWS client tests passed")
@@ -0,0 +1,383 @@
+"""
+Local test for the Bedrock chat assistant Lambda
+Builds the telemetry digest from an in-memory events table and a fake Bedrock,
+and streams answers from a fake Bedrock response stream over a fake WebSocket API
+"""
+
+import importlib.util
+import io
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import ConditionExpressionBuilder
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+# Mock environment variables BEFORE importing handler
+os.environ['TABLE_NAME'] = 'test-suricata-events'
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+def load_handler():
+    """Load lambda/chat_assistant/handler.py without clashing with other handler modules"""
+    path = os.path.join(ROOT, 'lambda', 'chat_assistant', 'handler.py')
+    spec = importlib.util.spec_from_file_location('chat_assistant_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class MockTable:
+    """In-memory stand-in for the events table, paging like DynamoDB"""
+    def __init__(self, items, page_size=100):
+        self.items = items
+        self.page_size = page_size
+        self.queries = []
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        start = kwargs.get('ExclusiveStartKey', {}).get('index', 0)
+        page = self.items[start:start + self.page_size]
+        response = {'Items': page}
+        if start + self.page_size < len(self.items):
+            response['LastEvaluatedKey'] = {'index': start + self.page_size}
+        return response
+
+
+class MockBedrock:
+    """Captures the prompt and answers with canned text"""
+    def __init__(self):
+        self.prompts = []
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.prompts.append(json.loads(body)['messages'][0]['content'][0]['text'])
+        return {'body': io.BytesIO(json.dumps({'content': [{'type': 'text', 'text': 'Mostly SSH scans.'}]}).encode())}
+
+
+class MockStreamingBedrock:
+    """Fake invoke_model_with_response_stream: yields canned chunks with a delay"""
+    def __init__(self, fragments, delay=0.0):
+        self.fragments = fragments
+        self.delay = delay
+        self.prompts = []
+
+    def _chunks(self):
+        yield {'chunk': {'bytes': json.dumps({'type': 'message_start', 'message': {}}).encode()}}
+        for text in self.fragments:
+            time.sleep(self.delay)
+            delta = {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': text}}
+            yield {'chunk': {'bytes': json.dumps(delta).encode()}}
+        yield {'chunk': {'bytes': json.dumps({'type': 'message_stop'}).encode()}}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        self.prompts.append(json.loads(body)['messages'][0]['content'][0]['text'])
+        return {'body': self._chunks()}
+
+
+class RaisingBedrock:
+    """Fake Bedrock that fails on invoke, or part way through the stream after `fragments`"""
+    def __init__(self, fragments=None):
+        self.fragments = fragments
+
+    def _chunks(self):
+        for text in self.fragments:
+            delta = {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': text}}
+            yield {'chunk': {'bytes': json.dumps(delta).encode()}}
+        raise ClientError({'Error': {'Code': 'ModelStreamErrorException', 'Message': 'stream broke'}}, 'InvokeModelWithResponseStream')
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        if self.fragments is None:
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'InvokeModelWithResponseStream')
+        return {'body': self._chunks()}
+
+
+class MockManagementApi:
+    """Records frames posted to WebSocket connections; optionally goes away after N"""
+    def __init__(self, gone_after=None):
+        self.frames = []
+        self.gone_after = gone_after
+
+    def post_to_connection(self, ConnectionId, Data):
+        if self.gone_after is not None and len(self.frames) >= self.gone_after:
+            raise ClientError({'Error': {'Code': 'GoneException'}}, 'PostToConnection')
+        self.frames.append((time.time(), json.loads(Data)))
+
+
+class MockStatsTable:
+    """In-memory stand-in for the partition stats table (one day of hour items)"""
+    def __init__(self):
+        self.items = []
+
+    def stamp(self, hour, ingested_at):
+        self.items.append({'partition_date': '2026-01-29', 'hour': hour, 'n_alert': Decimal(1),
+                           'ingested_at': Decimal(ingested_at)})
+
+    def query(self, **kwargs):
+        return {'Items': list(self.items)}
+
+
+class MockCacheTable:
+    """In-memory stand-in for the shared chat cache table"""
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key):
+        item = self.items.get(Key['cache_key'])
+        return {'Item': item} if item else {}
+
+    def put_item(self, Item):
+        self.items[Item['cache_key']] = Item
+
+
+def alert(i):
+    ssh = i % 10 != 0
+    return {
+        'event_time': f'2026-01-29T{10 + i % 3:02d}:{i % 60:02d}:00Z', 'timestamp': Decimal(1769680800000 + i),
+        'event_type': 'alert', 'src_ip': f'203.0.113.{i % 7}', 'src_port': Decimal(40000 + i),
+        'dest_ip': '10.0.0.5', 'dest_port': Decimal(22 if ssh else 445),
+        'severity': Decimal(2 if ssh else 1), 'country_code': 'NL',
+        'signature': 'ET SCAN Potential SSH Scan' if ssh else 'ET EXPLOIT SMB probe',
+        'summary': f'ALERT sample {i}',
+    }
+
+
+def chat(module, **payload):
+    response = module.handler({'body': json.dumps({'event_date': '2026-01-29', **payload})}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_digest_covers_every_event():
+    module = load_handler()
+    module.table = MockTable([alert(i) for i in range(1000)])
+    module.bedrock = MockBedrock()
+
+    status, body = chat(module, prompt='What happened?')
+    assert status == 200
+    assert body['answer'] == 'Mostly SSH scans.'
+    assert body['digest']['events_summarized'] == 1000
+    assert len(module.table.queries) == 10  # streamed page by page
+    assert 'suricata' not in module.table.queries[0]['ExpressionAttributeNames'].values()
+
+    prompt = module.bedrock.prompts[0]
+    assert 'Events summarized: 1000' in prompt
+    assert 'counts are exact' in prompt and 'partial' not in prompt
+    assert 'ET SCAN Potential SSH Scan (900)' in prompt
+    assert '22 (900)' in prompt and '445 (100)' in prompt
+    assert '203.0.113.0 [NL] (143)' in prompt
+    assert '10h: 334' in prompt
+    # One sample per signature, most severe first
+    assert [e['signature'] for e in body['events']] == ['ET EXPLOIT SMB probe', 'ET SCAN Potential SSH Scan']
+    assert body['digest']['estimated_tokens'] <= body['digest']['token_budget']
+
+
+def test_digest_fits_token_budget():
+    module = load_handler()
+    items = [dict(alert(i), signature=f'SIG {i % 40}', src_ip=f'198.51.100.{i % 50}') for i in range(500)]
+    module.table = MockTable(items)
+    module.bedrock = MockBedrock()
+
+    status, body = chat(module, token_budget=150)
+    assert status == 200
+    assert body['digest']['estimated_tokens'] <= 150
+    assert body['digest']['events_summarized'] == 500
+    assert len(module.bedrock.prompts[0]) < len(module._render_digest(module._build_digest(items), 10, 5)[0])
+    assert body['digest']['top_n'] == 10 and 'counts are exact' in module.bedrock.prompts[0]  # only samples dropped
+
+    # Trimmed lists are flagged to the model; the counts that remain still cover all 500
+    status, body = chat(module, token_budget=100)
+    prompt = module.bedrock.prompts[1]
+    assert body['digest']['top_n'] < 10
+    assert f"top lists were cut to {body['digest']['top_n']} entries" in prompt
+    assert 'counts are exact' not in prompt and 'lower bounds' not in prompt
+
+
+def test_capped_digest_is_not_presented_as_totals():
+    module = load_handler()
+    module.DIGEST_MAX_EVENTS = 300
+    module.table = MockTable([alert(i) for i in range(1000)])
+    module.bedrock = MockBedrock()
+
+    status, body = chat(module)
+    assert status == 200 and body['digest']['capped'] is True
+    assert body['digest']['events_summarized'] == 300
+    prompt = module.bedrock.prompts[0]
+    assert 'Events summarized: 300 of more than 300 matched' in prompt
+    assert 'More than 300 events matched, but only the newest 300 were summarized' in prompt
+    assert 'lower bounds' in prompt and 'counts are exact' not in prompt
+
+
+def test_window_and_validation():
+    module = load_handler()
+    condition = module._window_condition('2026-01-29', 9, 11)
+    expression = ConditionExpressionBuilder().build_expression(condition, is_key_condition=True)
+    assert sorted(expression.attribute_value_placeholders.values()) == ['2026-01-29', '20260129T09', '20260129T11~']
+
+    module.table = MockTable([])
+    module.bedrock = MockBedrock()
+    assert chat(module, from_hour=25)[0] == 400
+    status, body = chat(module, hour=3)
+    assert status == 200 and body['digest']['events_summarized'] == 0
+    assert 'No events matched' in module.bedrock.prompts[0]
+
+
+def stream(module, **payload):
+    message = {'action': 'chat', 'event_date': '2026-01-29', 'request_id': 'r1', **payload}
+    event = {'requestContext': {'connectionId': 'conn-1', 'routeKey': 'chat'}, 'body': json.dumps(message)}
+    return module.handler(event, None)
+
+
+def test_streaming_sends_telemetry_then_tokens():
+    module = load_handler()
+    module.table = MockTable([alert(i) for i in range(50)])
+    fragments = ['Mostly', ' SSH', ' scans', ' from', ' 203.0.113.0/24', ' against port 22.']
+    module.bedrock = MockStreamingBedrock(fragments, delay=0.05)
+    module._management = MockManagementApi()
+
+    started = time.time()
+    assert stream(module, prompt='What happened?')['statusCode'] == 200
+    finished = time.time()
+    frames = [frame for _, frame in module._management.frames]
+
+    assert frames[0]['type'] == 'chat.telemetry'
+    assert frames[0]['digest']['events_summarized'] == 50 and frames[0]['events']
+    assert frames[-1]['type'] == 'chat.done'
+    assert all(frame['request_id'] == 'r1' for frame in frames)
+    deltas = [frame['text'] for frame in frames if frame['type'] == 'chat.delta']
+    assert ''.join(deltas) == ''.join(fragments)
+    assert deltas[0] == 'Mostly'  # first token is not held back for coalescing
+    assert 'Events summarized: 50' in module.bedrock.prompts[0]
+
+    # The first token reaches the client well before the whole answer is done
+    first_delta_at = next(at for at, frame in module._management.frames if frame['type'] == 'chat.delta')
+    assert first_delta_at - started < (finished - started) / 2
+    assert frames[-1]['time_to_first_token_ms'] < frames[-1]['total_ms']
+
+
+def test_streaming_stops_when_client_leaves():
+    module = load_handler()
+    module.table = MockTable([alert(i) for i in range(5)])
+    module.bedrock = MockStreamingBedrock(['a' * 30] * 10)
+    module._management = MockManagementApi(gone_after=2)
+    assert stream(module)['statusCode'] == 200
+    assert [frame['type'] for _, frame in module._management.frames] == ['chat.telemetry', 'chat.delta']
+
+    module._management = MockManagementApi()
+    assert stream(module, hour=99)['statusCode'] == 400
+    assert module._management.frames[0][1]['type'] == 'chat.error'
+
+
+def test_streaming_always_ends_with_done_or_error():
+    module = load_handler()
+    module.table = MockTable([alert(i) for i in range(5)])
+
+    def frame_types():
+        return [frame['type'] for _, frame in module._management.frames]
+
+    # Bedrock refuses the call: telemetry went out, then an error closes the answer
+    module.bedrock = RaisingBedrock()
+    module._management = MockManagementApi()
+    assert stream(module)['statusCode'] == 500
+    assert frame_types() == ['chat.telemetry', 'chat.error']
+    assert module._management.frames[-1][1]['request_id'] == 'r1'
+
+    # The stream breaks after the first tokens
+    module.bedrock = RaisingBedrock(['a' * 30, 'b' * 30])
+    module._management = MockManagementApi()
+    assert stream(module)['statusCode'] == 500
+    assert frame_types()[0] == 'chat.telemetry' and 'chat.delta' in frame_types()
+    assert frame_types()[-1] == 'chat.error'
+
+    # The digest read fails before anything was sent
+    class BrokenTable:
+        def query(self, **kwargs):
+            raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'Query')
+
+    module.table = BrokenTable()
+    module._management = MockManagementApi()
+    assert stream(module)['statusCode'] == 500
+    assert frame_types() == ['chat.error']
+
+    # A body that is not JSON, or not an object
+    for body in ('{not json', '[1, 2]'):
+        module._management = MockManagementApi()
+        event = {'requestContext': {'connectionId': 'conn-1', 'routeKey': 'chat'}, 'body': body}
+        assert module.handler(event, None)['statusCode'] == 400
+        assert frame_types() == ['chat.error']
+
+
+def test_response_cache_tracks_data_version():
+    module = load_handler()
+    module.table = MockTable([alert(i) for i in range(20)])
+    module.bedrock = MockBedrock()
+    module._partition_stats_table = MockStatsTable()
+    module._partition_stats_table.stamp('10', 1769680000)
+    module._chat_cache_table = MockCacheTable()
+
+    status, first = chat(module, prompt='What happened recently?')
+    assert status == 200 and first['cache']['status'] == 'miss'
+    assert first['cache']['data_version'] == 1769680000
+
+    # Same question modulo case, spacing and punctuation: no DynamoDB digest, no model call
+    queries = len(module.table.queries)
+    status, second = chat(module, prompt='  what HAPPENED recently ')
+    assert second['cache']['status'] == 'hit' and second['cache']['tier'] == 'memory'
+    assert second['answer'] == first['answer'] and second['digest'] == first['digest']
+    assert len(module.bedrock.prompts) == 1 and len(module.table.queries) == queries
+    assert second['cache']['hit_rate'] == 0.5
+    assert second['cache']['model_ms_saved'] == second['cache']['model_ms_saved_total'] >= 0
+
+    # Another container only has the shared tier
+    module._response_cache.clear()
+    assert chat(module, prompt='What happened recently?')[1]['cache']['tier'] == 'dynamodb'
+
+    # A different window, or new data for the day, misses
+    assert chat(module, prompt='What happened recently?', hour=10)[1]['cache']['status'] == 'miss'
+    module._partition_stats_table.stamp('11', 1769683600)
+    status, fresh = chat(module, prompt='What happened recently?')
+    assert fresh['cache']['status'] == 'miss' and fresh['cache']['data_version'] == 1769683600
+    assert len(module.bedrock.prompts) == 3
+
+    assert chat(module, prompt='What happened recently?', no_cache=True)[1]['cache']['status'] == 'bypass'
+    assert len(module.bedrock.prompts) == 4
+
+
+def test_response_cache_bounds():
+    module = load_handler()
+    module.table = MockTable([alert(i) for i in range(3)])
+    module.bedrock = MockBedrock()
+    module._partition_stats_table = MockStatsTable()
+    module._partition_stats_table.stamp('10', 1769680000)
+    module.CHAT_CACHE_MEMORY_ENTRIES = 2
+
+    for prompt in ('one', 'two', 'three'):
+        chat(module, prompt=prompt)
+    assert len(module._response_cache) == 2
+    assert chat(module, prompt='one')[1]['cache']['status'] == 'miss'  # evicted, least recently used
+
+    key = next(reversed(module._response_cache))
+    expires_at, entry = module._response_cache[key]
+    module._response_cache[key] = (time.time() - 1, entry)
+    assert chat(module, prompt='one')[1]['cache']['status'] == 'miss'  # expired
+
+    # Without a data version there is nothing safe to key on
+    module._partition_stats_table = None
+    assert chat(module, prompt='one')[1]['cache']['status'] == 'bypass'
+
+
+if __name__ == "__main__":
+    test_digest_covers_every_event()
+    test_digest_fits_token_budget()
+    test_capped_digest_is_not_presented_as_totals()
+    test_window_and_validation()
+    test_streaming_sends_telemetry_then_tokens()
+    test_streaming_stops_when_client_leaves()
+    test_streaming_always_ends_with_done_or_error()
+    test_response_cache_tracks_data_version()
+    test_response_cache_bounds()
+    print("✅ Chat assistant digest, streaming and cache tests passed")
@@ -0,0 +1,184 @@
+"""
+Local test for ingest-time Glue partition registration in suricata_ingest
+Archives batches to an in-memory S3 and registers their partitions in a mock Glue
+"""
+
+import base64
+import gzip
+import importlib.util
+import json
+import os
+import sys
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+# Mock environment variables BEFORE importing handler
+os.environ.setdefault('TABLE_NAME', 'test-suricata-events')
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+def load_handler():
+    """Load lambda/suricata_ingest/handler.py without clashing with other handler modules"""
+    path = os.path.join(ROOT, 'lambda', 'suricata_ingest', 'handler.py')
+    spec = importlib.util.spec_from_file_location('suricata_ingest_partitions_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class AlreadyExistsException(Exception):
+    pass
+
+
+class MockGlue:
+    """In-memory stand-in for the Glue catalog (get_table, create_partition)
+
+    `fail_with` makes create_partition raise a ClientError with that code.
+    """
+    class exceptions:
+        AlreadyExistsException = AlreadyExistsException
+
+    def __init__(self, registered=(), fail_with=None):
+        self.partitions = {tuple(values): None for values in registered}
+        self.fail_with = fail_with
+        self.get_table_calls = 0
+        self.create_calls = []
+
+    def get_table(self, DatabaseName, Name):
+        self.get_table_calls += 1
+        return {'Table': {'StorageDescriptor': {'Columns': [], 'Location': 's3://test-logs/'}}}
+
+    def create_partition(self, DatabaseName, TableName, PartitionInput):
+        values = tuple(PartitionInput['Values'])
+        self.create_calls.append(values)
+        if self.fail_with:
+            raise ClientError({'Error': {'Code': self.fail_with, 'Message': 'no'}}, 'CreatePartition')
+        if values in self.partitions:
+            raise AlreadyExistsException(f'{values} exists')
+        self.partitions[values] = PartitionInput['StorageDescriptor']['Location']
+
+
+class MockS3:
+    """In-memory stand-in for the log archive bucket"""
+    def __init__(self):
+        self.keys = []
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.keys.append(Key)
+
+
+class MockTable:
+    """In-memory stand-in for the events table (batch writer)"""
+    def batch_writer(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def put_item(self, Item):
+        pass
+
+
+def setup(module, glue):
+    module._s3 = MockS3()
+    module._s3_enabled = True
+    module._s3_bucket = 'test-logs'
+    module._table = MockTable()
+    module._attackers_table = None
+    module._partition_stats_table = None
+    module._partition_by_event_type = True
+    module._enrich_geo = lambda ip: {'country_name': None, 'country_code': None, 'flag': ''}
+    module._glue = glue
+    module._glue_database = 'test_db'
+    module._glue_table = 'suricata_events'
+    module._glue_storage_descriptor = None
+    module._known_partitions.clear()
+
+
+def cloudwatch_event(events):
+    log_events = [{'id': str(i), 'timestamp': 1769697015000, 'message': json.dumps(e)} for i, e in enumerate(events)]
+    data = gzip.compress(json.dumps({'logEvents': log_events}).encode())
+    return {'awslogs': {'data': base64.b64encode(data).decode()}}
+
+
+def batch():
+    """Two hours, two event types each: four partitions"""
+    events = []
+    for hour in (13, 14):
+        for i, event_type in enumerate(('alert', 'dns', 'dns')):
+            event = {'timestamp': f'2026-01-29T{hour}:30:{i:02d}.000000+0000', 'event_type': event_type,
+                     'src_ip': '203.0.113.7', 'dest_ip': '10.0.0.5', 'dest_port': 53, 'proto': 'UDP'}
+            if event_type == 'alert':
+                event['alert'] = {'signature': 'ET SCAN', 'severity': 2}
+            events.append(event)
+    return events
+
+
+PARTITIONS = {
+    ('2026', '01', '29', '13', 'alert'), ('2026', '01', '29', '13', 'dns'),
+    ('2026', '01', '29', '14', 'alert'), ('2026', '01', '29', '14', 'dns'),
+}
+
+
+def test_new_partitions_are_registered_once_per_container():
+    module = load_handler()
+    glue = MockGlue()
+    setup(module, glue)
+
+    result = module.handler(cloudwatch_event(batch()), None)
+    assert result['partitions_created'] == 4 and result['s3_writes'] == 6
+    assert set(glue.partitions) == PARTITIONS and len(glue.create_calls) == 4
+    assert glue.partitions[('2026', '01', '29', '14', 'dns')] == 's3://test-logs/year=2026/month=01/day=29/hour=14/etype=dns/'
+    assert glue.get_table_calls == 1
+
+    # A warm container skips Glue for partitions it already registered
+    result = module.handler(cloudwatch_event(batch()), None)
+    assert result['partitions_created'] == 0 and len(glue.create_calls) == 4
+
+
+def test_existing_partitions_count_as_known():
+    module = load_handler()
+    glue = MockGlue(registered=[('2026', '01', '29', '13', 'alert'), ('2026', '01', '29', '13', 'dns')])
+    setup(module, glue)
+
+    result = module.handler(cloudwatch_event(batch()), None)
+    assert result['partitions_created'] == 2 and set(glue.partitions) == PARTITIONS
+    assert module._known_partitions == PARTITIONS
+
+    module.handler(cloudwatch_event(batch()), None)
+    assert len(glue.create_calls) == 4
+
+
+def test_registration_errors_retry_and_missing_config_skips():
+    module = load_handler()
+    glue = MockGlue(fail_with='AccessDeniedException')
+    setup(module, glue)
+
+    # Failures are not cached: every later write to the partition tries again
+    result = module.handler(cloudwatch_event(batch()), None)
+    assert result['partitions_created'] == 0 and result['s3_writes'] == 6
+    assert len(glue.create_calls) == 6 and not module._known_partitions
+    glue.fail_with = None
+    assert module.handler(cloudwatch_event(batch()), None)['partitions_created'] == 4
+
+    # Without ATHENA_DATABASE the archive is written but Glue is never called
+    glue = MockGlue()
+    setup(module, glue)
+    module._glue_database = None
+    result = module.handler(cloudwatch_event(batch()), None)
+    assert result['partitions_created'] == 0 and result['s3_writes'] == 6
+    assert glue.create_calls == [] and glue.get_table_calls == 0
+
+
+if __name__ == "__main__":
+    test_new_partitions_are_registered_once_per_container()
+    test_existing_partitions_count_as_known()
+    test_registration_errors_retry_and_missing_config_skips()
+    print("✅ Ingest partition registration tests passed")
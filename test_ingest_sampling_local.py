@@ -0,0 +1,198 @@
+"""
+Local test for adaptive sampling in suricata_ingest (phantomwall.sampling)
+A flood batch must keep every alert, and archived weights must add up to the true counts
+"""
+
+import base64
+import gzip
+import importlib.util
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+# Mock environment variables BEFORE importing handler
+os.environ.setdefault('TABLE_NAME', 'test-suricata-events')
+os.environ.setdefault('S3_BUCKET_NAME', 'test-suricata-logs')
+os.environ.setdefault('ENABLE_S3_BACKUP', 'true')
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+from phantomwall import sampling  # noqa: E402
+
+
+def load_handler():
+    """Load lambda/suricata_ingest/handler.py without clashing with other handler modules"""
+    path = os.path.join(ROOT, 'lambda', 'suricata_ingest', 'handler.py')
+    spec = importlib.util.spec_from_file_location('suricata_ingest_sampling_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class MockS3:
+    """In-memory stand-in for the log archive bucket"""
+    def __init__(self):
+        self.objects = []
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects.append((Key, json.loads(Body)))
+
+
+class MockTable:
+    """In-memory stand-in for the events table (batch writer)"""
+    def __init__(self):
+        self.items = []
+
+    def batch_writer(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def put_item(self, Item):
+        self.items.append(Item)
+
+
+class MockStatsTable:
+    """In-memory stand-in for the partition stats table (ADD counters, ingest stamps)"""
+    def __init__(self):
+        self.counts = {}
+        self.stamped = set()
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        for placeholder, name in ExpressionAttributeNames.items():
+            value = ExpressionAttributeValues[':' + placeholder[1:]]
+            if name.startswith('n_'):
+                self.counts[name] = self.counts.get(name, 0) + value
+            elif name == 'ingested_at':
+                self.stamped.add((Key['partition_date'], Key['hour']))
+
+
+def setup(module):
+    module._s3 = MockS3()
+    module._table = MockTable()
+    module._partition_stats_table = MockStatsTable()
+    module._attackers_table = None
+    module._glue_database = None  # never reach real Glue from ingest's partition registration
+    module._s3_enabled = True
+    module._s3_bucket = 'test-suricata-logs'
+    module._partition_by_event_type = True
+    module._enrich_geo = lambda ip: {'country_name': 'Test', 'country_code': None, 'flag': ''}
+    module.FLOOD_EVENTS_PER_SECOND = 200
+
+
+def cloudwatch_event(events, cw_ms=1769697015000):
+    log_events = [{'id': str(i), 'timestamp': cw_ms, 'message': json.dumps(e)} for i, e in enumerate(events)]
+    data = gzip.compress(json.dumps({'logEvents': log_events}).encode())
+    return {'awslogs': {'data': base64.b64encode(data).decode()}}
+
+
+def eve(event_type, i, **extra):
+    return {
+        'timestamp': f'2026-01-29T14:30:{i % 60:02d}.000000+0000', 'event_type': event_type, 'flow_id': i,
+        'src_ip': f'203.0.113.{i % 3}', 'src_port': 40000 + i, 'dest_ip': '10.0.0.5', 'dest_port': 22, 'proto': 'TCP',
+        **extra,
+    }
+
+
+def flood():
+    events = [eve('flow', i) for i in range(1001)]
+    events += [{'timestamp': '2026-01-29T14:30:00.000000+0000', 'event_type': 'stats', 'stats': {'uptime': i}} for i in range(600)]
+    events += [eve('alert', i, alert={'signature': 'ET SCAN', 'severity': 2}) for i in range(5)]
+    events += [eve('anomaly', i) for i in range(300)]
+    events += [eve('dns', i) for i in range(20)]
+    return events
+
+
+def test_systematic_weights_are_exact():
+    for total in (1, 4, 5, 999, 1001):
+        for keep_every in (1, 3, 5, 100):
+            weights = [sampling.systematic_weight(i, total, keep_every) for i in range(total)]
+            assert sum(weights) == total
+            assert sum(1 for w in weights if w) == -(-total // keep_every)
+
+    policy = sampling.parse_policy('{"alert": "sample", "flow": {"mode": "sample", "rate": 0.5}, "tls": "aggregate"}')
+    assert policy == {'flow': {'mode': 'sample', 'rate': 0.5}, 'tls': {'mode': 'aggregate'}}
+    for bad in ('{"flow": "drop"}', '{"flow": ["sample"]}', '{"flow": 0.5}', '{"flow": {"mode": "sample", "rate": "half"}}',
+                '["flow"]', '3', 'not json'):
+        try:
+            sampling.parse_policy(bad)
+            raise AssertionError(f'expected ValueError for {bad}')
+        except ValueError as e:
+            assert 'flow' in str(e) or not bad.startswith('{')
+
+
+def test_flood_is_sampled_with_unbiased_counts():
+    module = load_handler()
+    setup(module)
+
+    result = module.handler(cloudwatch_event(flood()), None)
+    archived = [record for _, record in module._s3.objects]
+
+    # Alerts and anomalies are kept one record per event, with no weight
+    for event_type, total in (('alert', 5), ('anomaly', 300)):
+        kept = [r for r in archived if r['event_type'] == event_type]
+        assert len(kept) == total and not any(sampling.WEIGHT_FIELD in r for r in kept)
+    assert len(module._table.items) == 305
+
+    # flow floods at 1001/s: kept near the 200/s threshold, weights sum to the true count
+    flows = [r for r in archived if r['event_type'] == 'flow']
+    assert len(flows) == 201 and sum(r[sampling.WEIGHT_FIELD] for r in flows) == 1001
+    assert result['sampling']['flow']['keep_every'] == 5 and result['sampling']['flow']['archived'] == 201
+
+    # stats roll up into one record per hour and key within the batch
+    stats = [r for r in archived if r['event_type'] == 'stats']
+    assert len(stats) == 1 and stats[0][sampling.WEIGHT_FIELD] == 600 and stats[0]['aggregated']['count'] == 600
+
+    # dns is below the threshold: untouched
+    assert len([r for r in archived if r['event_type'] == 'dns']) == 20 and 'dns' not in result['sampling']
+
+    assert module._partition_stats_table.counts == {
+        'n_flow': 1001, 'n_stats': 600, 'n_alert': 5, 'n_anomaly': 300, 'n_dns': 20,
+    }
+    assert result['s3_total'] == 1926 and result['s3_writes'] == len(archived) == 527
+
+
+def test_quiet_batch_keeps_everything():
+    module = load_handler()
+    setup(module)
+
+    events = [eve('flow', i) for i in range(50)] + [eve('dns', i) for i in range(10)]
+    result = module.handler(cloudwatch_event(events), None)
+    assert result['s3_writes'] == 60 and result['sampling'] == {}
+    assert not any(sampling.WEIGHT_FIELD in record for _, record in module._s3.objects)
+
+
+def test_alerts_advance_the_data_version_without_the_archive():
+    module = load_handler()
+    setup(module)
+
+    def failing_put(**kwargs):
+        raise RuntimeError('S3 unavailable')
+
+    module._s3.put_object = failing_put
+    events = [eve('alert', i, alert={'signature': 'ET SCAN', 'severity': 2}) for i in range(3)] + [eve('dns', 0)]
+    result = module.handler(cloudwatch_event(events), None)
+    assert result['s3_writes'] == 0 and result['dynamodb_alerts'] == 3
+    # Nothing was counted, but chat answers keyed on the data version must refresh
+    assert module._partition_stats_table.counts == {}
+    assert module._partition_stats_table.stamped == {('2026-01-29', '14')}
+
+    # Without alerts, a failed archive changes nothing
+    module._partition_stats_table = MockStatsTable()
+    module.handler(cloudwatch_event([eve('dns', i) for i in range(3)]), None)
+    assert module._partition_stats_table.stamped == set()
+
+
+if __name__ == "__main__":
+    test_systematic_weights_are_exact()
+    test_flood_is_sampled_with_unbiased_counts()
+    test_quiet_batch_keeps_everything()
+    test_alerts_advance_the_data_version_without_the_archive()
+    print("✅ Ingest sampling tests passed")
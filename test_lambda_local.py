@@ -13,6 +13,8 @@ from datetime import datetime
 # Add lambda directory to path
 lambda_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda', 'suricata_ingest')
 sys.path.insert(0, lambda_path)
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda', 'layer', 'python'))
 
 # Mock environment variables BEFORE importing handler
 os.environ['TABLE_NAME'] = 'test-suricata-events'
@@ -172,6 +174,7 @@ def test_lambda_handler():
     mock_table = MockDynamoDBTable()
     handler_module._s3 = mock_s3
     handler_module._table = mock_table
+    handler_module._glue_database = None  # no Glue partition registration
     
     # Create test event
     print("📦 Creating CloudWatch event with 3 Suricata logs...")
@@ -0,0 +1,238 @@
+"""
+Local test for the S3 log compactor Lambda
+Compacts an in-memory S3 log lake and Glue catalog
+"""
+
+import datetime
+import gzip
+import importlib.util
+import io
+import json
+import os
+import sys
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+# Mock environment variables BEFORE importing handler
+os.environ['S3_BUCKET'] = 'test-logs'
+os.environ['ATHENA_DATABASE'] = 'test_db'
+os.environ['ATHENA_TABLE'] = 'suricata_events'
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+HOUR_VALUES = ['2026', '01', '29', '14', 'alert']
+RAW_PREFIX = 'year=2026/month=01/day=29/hour=14/etype=alert/'
+
+
+def load_handler():
+    """Load lambda/log_compactor/handler.py without clashing with other handler modules"""
+    path = os.path.join(ROOT, 'lambda', 'log_compactor', 'handler.py')
+    spec = importlib.util.spec_from_file_location('log_compactor_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class MockPaginator:
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        yield self.method(**kwargs)
+
+
+class MockS3:
+    """In-memory stand-in for one S3 bucket"""
+    def __init__(self, fail_put_after=None):
+        self.objects = {}
+        self.fail_put_after = fail_put_after
+        self.puts = 0
+
+    def get_paginator(self, name):
+        assert name == 'list_objects_v2'
+        return MockPaginator(self.list_objects_v2)
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None):
+        contents = []
+        for key in sorted(self.objects):
+            rest = key[len(Prefix):] if key.startswith(Prefix) else None
+            if rest is None or (Delimiter and Delimiter in rest):
+                continue
+            contents.append({'Key': key, 'Size': len(self.objects[key])})
+        return {'Contents': contents}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ContentLength': len(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.puts += 1
+        if self.fail_put_after is not None and self.puts > self.fail_put_after:
+            raise RuntimeError('simulated S3 failure')
+        self.objects[Key] = Body if isinstance(Body, bytes) else Body.encode()
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete['Objects']:
+            self.objects.pop(obj['Key'], None)
+
+
+class MockGlue:
+    """In-memory stand-in for the Glue partitions of one table"""
+    def __init__(self):
+        self.partitions = {}
+
+    def add(self, values, location):
+        self.partitions[tuple(values)] = {
+            'Values': list(values),
+            'StorageDescriptor': {'Location': location, 'Columns': []},
+        }
+
+    def get_paginator(self, name):
+        assert name == 'get_partitions'
+        return MockPaginator(self.get_partitions)
+
+    def get_partitions(self, DatabaseName, TableName, Expression=None):
+        wanted = dict(part.split(' = ') for part in Expression.split(' AND '))
+        keys = ('year', 'month', 'day', 'hour', 'etype')
+        found = [
+            p for values, p in self.partitions.items()
+            if all(wanted.get(k, f"'{v}'") == f"'{v}'" for k, v in zip(keys, values))
+        ]
+        return {'Partitions': found}
+
+    def update_partition(self, DatabaseName, TableName, PartitionValueList, PartitionInput):
+        self.partitions[tuple(PartitionValueList)]['StorageDescriptor'] = PartitionInput['StorageDescriptor']
+
+
+def raw_event(i):
+    return json.dumps({
+        'timestamp': f'2026-01-29T14:{i % 60:02d}:00.000000+0000', 'event_type': 'alert', 'flow_id': i,
+        'src_ip': f'203.0.113.{i % 200}', 'dest_ip': '10.0.0.5',
+    }).encode()
+
+
+def setup(module, count, fail_put_after=None):
+    s3 = MockS3(fail_put_after)
+    glue = MockGlue()
+    for i in range(count):
+        s3.objects[f'{RAW_PREFIX}{i:032x}.json'] = raw_event(i)
+    glue.add(HOUR_VALUES, f's3://test-logs/{RAW_PREFIX}')
+    module._s3 = s3
+    module._glue = glue
+    return s3, glue
+
+
+def compacted_rows(s3, location):
+    prefix = location[len('s3://test-logs/'):]
+    rows = []
+    for key, body in s3.objects.items():
+        if key.startswith(prefix) and key.endswith('.json.gz'):
+            rows.extend(json.loads(line) for line in gzip.decompress(body).splitlines())
+    return rows
+
+
+def test_compacts_closed_hour():
+    module = load_handler()
+    module.TARGET_FILE_BYTES = 4096
+    s3, glue = setup(module, 300)
+
+    result = module.handler({'action': 'compact', 'hours': ['2026-01-29T14']}, None)
+    assert result['statusCode'] == 200
+    assert result['partitions_compacted'] == 1
+    assert result['rows'] == 300
+
+    location = glue.partitions[tuple(HOUR_VALUES)]['StorageDescriptor']['Location']
+    assert location.startswith('s3://test-logs/compacted/year=2026/month=01/day=29/hour=14/etype=alert/v=')
+    # Raw objects are gone, a handful of gzip parts remain
+    assert not [k for k in s3.objects if k.startswith(RAW_PREFIX)]
+    assert 1 < len(s3.objects) < 300
+    assert sorted(r['flow_id'] for r in compacted_rows(s3, location)) == list(range(300))
+
+    # IP index sidecar lists every address in the partition, exactly
+    from phantomwall import ip_index
+    sidecar = ip_index.decode(s3.objects['index/' + RAW_PREFIX + 'ips.idx'])
+    assert len(sidecar['src_ip']) == 200
+    assert ip_index.contains(sidecar, 'src_ip', ip_index.pack_ip('203.0.113.7'))
+    assert not ip_index.contains(sidecar, 'src_ip', ip_index.pack_ip('203.0.113.250'))
+    assert ip_index.contains(sidecar, 'dest_ip', ip_index.pack_ip('10.0.0.5'))
+
+    # Nothing new: a second run is a no-op
+    assert module.handler({'action': 'compact', 'hours': ['2026-01-29T14']}, None)['partitions_compacted'] == 0
+
+    # A straggler lands in the raw prefix: the next run merges it with the compacted files
+    s3.objects[f'{RAW_PREFIX}late.json'] = raw_event(999)
+    result = module.handler({'action': 'compact', 'hours': ['2026-01-29T14']}, None)
+    assert result['rows'] == 301
+    new_location = glue.partitions[tuple(HOUR_VALUES)]['StorageDescriptor']['Location']
+    assert new_location != location
+    assert len(compacted_rows(s3, new_location)) == 301
+    assert not compacted_rows(s3, location)
+
+
+def test_failed_write_keeps_originals():
+    module = load_handler()
+    module.TARGET_FILE_BYTES = 4096
+    s3, glue = setup(module, 300, fail_put_after=2)
+
+    result = module.handler({'action': 'compact', 'hours': ['2026-01-29T14']}, None)
+    assert result['statusCode'] == 500
+    assert result['partitions_failed'] == 1
+    assert glue.partitions[tuple(HOUR_VALUES)]['StorageDescriptor']['Location'] == f's3://test-logs/{RAW_PREFIX}'
+    # Every original is still there and the partial output was removed
+    assert sorted(s3.objects) == sorted(f'{RAW_PREFIX}{i:032x}.json' for i in range(300))
+
+
+def test_indexes_previously_compacted_partition():
+    module = load_handler()
+    s3, glue = setup(module, 0)
+    compacted = 'compacted/year=2026/month=01/day=29/hour=14/etype=alert/v=20260101T000000-aaaaaaaa/'
+    s3.objects[f'{compacted}part-00000.json.gz'] = gzip.compress(raw_event(1) + b'\n' + raw_event(2) + b'\n')
+    glue.add(HOUR_VALUES, f's3://test-logs/{compacted}')
+
+    result = module.handler({'action': 'compact', 'hours': ['2026-01-29T14']}, None)
+    assert result['partitions_compacted'] == 0
+    from phantomwall import ip_index
+    sidecar = ip_index.decode(s3.objects['index/' + RAW_PREFIX + 'ips.idx'])
+    assert sidecar['src_ip'] == sorted([ip_index.pack_ip('203.0.113.1'), ip_index.pack_ip('203.0.113.2')])
+
+
+def test_legacy_hour_leaves_event_type_partitions_alone():
+    module = load_handler()
+    s3, glue = setup(module, 20)
+    # Pre-split objects sit directly under the hour and are registered as etype='all'
+    legacy_prefix = 'year=2026/month=01/day=29/hour=14/'
+    for i in range(5):
+        s3.objects[f'{legacy_prefix}legacy{i}.json'] = raw_event(i)
+    glue.add(HOUR_VALUES[:4] + ['all'], f's3://test-logs/{legacy_prefix}')
+
+    result = module.handler({'action': 'compact', 'hours': ['2026-01-29T14']}, None)
+    assert result['partitions_compacted'] == 2
+    assert result['rows'] == 25
+    legacy_location = glue.partitions[('2026', '01', '29', '14', 'all')]['StorageDescriptor']['Location']
+    assert legacy_location.startswith('s3://test-logs/compacted/year=2026/month=01/day=29/hour=14/v=')
+    assert len(compacted_rows(s3, legacy_location)) == 5
+
+
+def test_open_hour_is_skipped():
+    module = load_handler()
+    s3, glue = setup(module, 10)
+    current_hour = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H')
+    result = module.handler({'action': 'compact', 'hours': [current_hour]}, None)
+    assert result['hours_checked'] == 0
+    assert len(s3.objects) == 10
+
+
+if __name__ == "__main__":
+    test_compacts_closed_hour()
+    test_failed_write_keeps_originals()
+    test_indexes_previously_compacted_partition()
+    test_legacy_hour_leaves_event_type_partitions_alone()
+    test_open_hour_is_skipped()
+    print("✅ Log compactor tests passed")
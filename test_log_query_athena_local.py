@@ -0,0 +1,680 @@
+"""
+Local test for the Athena paths of s3_log_query
+Runs the handler against an in-memory Athena that moves queries through their
+states and writes CSV output to an in-memory results bucket, under a fake clock
+"""
+
+import base64
+import csv
+import datetime
+import gzip
+import importlib.util
+import io
+import json
+import os
+import re
+import sys
+import time
+import types
+import uuid
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+# Mock environment variables BEFORE importing handler
+os.environ['ATHENA_DATABASE'] = 'test_db'
+os.environ['ATHENA_TABLE'] = 'suricata_events'
+os.environ['ATHENA_WORKGROUP'] = 'test-wg'
+os.environ['RESULTS_BUCKET'] = 'test-results'
+os.environ['S3_BUCKET'] = 'test-logs'
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+os.environ.setdefault('TABLE_NAME', 'test-suricata-events')
+
+COLUMNS = ['timestamp', 'event_type', 'src_ip', 'dest_port', 'alert_signature']
+
+
+def load_handler(name='s3_log_query'):
+    """Load lambda/<name>/handler.py without clashing with other handler modules"""
+    path = os.path.join(ROOT, 'lambda', name, 'handler.py')
+    spec = importlib.util.spec_from_file_location(f'{name}_athena_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeClock:
+    """Stands in for the handler's `time` module: sleeps advance a virtual clock"""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 4))
+        self.now += seconds
+
+    def time(self):
+        return time.time()
+
+
+def freeze_utcnow(module, now):
+    """Pin datetime.datetime.utcnow() inside the handler to `now`."""
+    class FrozenDatetime(datetime.datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+
+    frozen = types.ModuleType('datetime')
+    frozen.__dict__.update(datetime.__dict__)
+    frozen.datetime = FrozenDatetime
+    module.datetime = frozen
+
+
+class MockS3:
+    """In-memory stand-in for the results bucket (objects, multipart uploads, presigning)"""
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.completed = []
+        self.aborted = []
+        self.fail_on_part = None
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'Not Found'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body.encode() if isinstance(Body, str) else Body
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = f'upload-{len(self.uploads) + 1}'
+        self.uploads[upload_id] = {'key': (Bucket, Key), 'parts': {}}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if self.fail_on_part == PartNumber:
+            raise ClientError({'Error': {'Code': 'SlowDown', 'Message': 'Reduce your request rate'}}, 'UploadPart')
+        self.uploads[UploadId]['parts'][PartNumber] = Body
+        return {'ETag': f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        assert numbers == sorted(upload['parts']), 'every uploaded part must be listed, in order'
+        self.objects[(Bucket, Key)] = b''.join(upload['parts'][n] for n in numbers)
+        self.completed.append((Key, len(numbers)))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(UploadId)
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+def csv_body(rows):
+    columns = list(rows[0]) if rows else COLUMNS
+    out = io.StringIO()
+    writer = csv.writer(out, quoting=csv.QUOTE_ALL)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([row.get(column, '') for column in columns])
+    return out.getvalue().encode()
+
+
+class FakeAthena:
+    """In-memory Athena
+
+    Each execution steps through `states` (one step per status read) and, on
+    SUCCEEDED, its CSV output holds `rows_for(query)` in the results bucket.
+    """
+    def __init__(self, s3, rows_for=lambda query: [], states=('QUEUED', 'RUNNING', 'SUCCEEDED'), reason='boom'):
+        self.s3 = s3
+        self.rows_for = rows_for
+        self.states = states
+        self.reason = reason
+        self.executions = {}
+        self.started = []
+        self.stopped = []
+
+    def start_query_execution(self, QueryString, WorkGroup, ResultReuseConfiguration=None):
+        query_id = str(uuid.uuid4())
+        states = self.states(QueryString) if callable(self.states) else self.states
+        self.executions[query_id] = {'query': QueryString, 'states': list(states), 'step': 0, 'reuse': ResultReuseConfiguration}
+        self.started.append(QueryString)
+        self.s3.put_object(Bucket='test-results', Key=f'{query_id}.csv', Body=csv_body(self.rows_for(QueryString)))
+        return {'QueryExecutionId': query_id}
+
+    def _execution(self, query_id, advance=True):
+        entry = self.executions[query_id]
+        state = entry['states'][min(entry['step'], len(entry['states']) - 1)]
+        if advance and state not in ('SUCCEEDED', 'FAILED', 'CANCELLED'):
+            entry['step'] += 1
+        status = {'State': state}
+        if state in ('FAILED', 'CANCELLED'):
+            status['StateChangeReason'] = self.reason
+        return {
+            'QueryExecutionId': query_id,
+            'Query': entry['query'],
+            'WorkGroup': 'test-wg',
+            'Status': status,
+            'ResultConfiguration': {'OutputLocation': f's3://test-results/{query_id}.csv'},
+            'Statistics': {'DataScannedInBytes': 2048},
+        }
+
+    def get_query_execution(self, QueryExecutionId):
+        if QueryExecutionId not in self.executions:
+            raise ClientError({'Error': {'Code': 'InvalidRequestException', 'Message': 'not found'}}, 'GetQueryExecution')
+        return {'QueryExecution': self._execution(QueryExecutionId)}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        return {'QueryExecutions': [self._execution(query_id) for query_id in QueryExecutionIds]}
+
+    def stop_query_execution(self, QueryExecutionId):
+        self.stopped.append(self.executions[QueryExecutionId]['query'])
+        entry = self.executions[QueryExecutionId]
+        entry['states'], entry['step'] = ['CANCELLED'], 0
+
+
+class MockGlue:
+    """Glue with no registered partitions (the IP index and local engine stay out of the way)"""
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, **kwargs):
+        yield {'Partitions': []}
+
+
+def rows(day, count, hour=14):
+    return [
+        {'timestamp': f'{day}T{hour:02d}:{59 - i:02d}:00.000000+0000', 'event_type': 'alert',
+         'src_ip': '203.0.113.7', 'dest_port': '22', 'alert_signature': f'{day} #{i}'}
+        for i in range(count)
+    ]
+
+
+def setup(module, rows_for=lambda query: rows('2026-01-29', 3), **athena_kwargs):
+    module._s3 = MockS3()
+    module._glue = MockGlue()
+    module._athena = FakeAthena(module._s3, rows_for, **athena_kwargs)
+    module._partition_stats_table = None
+    module._query_budget_table = None
+    module._result_cache.clear()
+    module.time = FakeClock()
+    module.LOCAL_ENGINE_MAX_BYTES = 0
+    module._enrich_results_with_geo = lambda items: items
+
+
+def request(module, route_key, params=None, body=None, path_id=None):
+    event = {'requestContext': {'routeKey': route_key}, 'queryStringParameters': params}
+    if body is not None:
+        event['body'] = json.dumps(body)
+    if path_id:
+        event['pathParameters'] = {'id': path_id}
+    response = module.handler(event, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def stamp(module, *days, ingested_at=None):
+    """Give each day a data version in an in-memory stats table"""
+    if module._partition_stats_table is None:
+        module._partition_stats_table = MockStatsTable()
+    for day in days:
+        module.partition_stats.stamp_ingested(module._partition_stats_table, {'partition_date': day, 'hour': '23'},
+                                              ingested_at or int(time.time()) - 3 * 3600)
+    module._data_versions.clear()
+
+
+def test_cache_ttl_follows_partition_age():
+    module = load_handler()
+    setup(module)
+    stamp(module, '2026-01-26', '2026-01-27', '2026-01-28', '2026-01-29', '2026-01-30')
+    freeze_utcnow(module, datetime.datetime(2026, 1, 29, 14, 10))
+    short, immutable = module.CACHE_TTL_SECONDS, module.CACHE_IMMUTABLE_TTL_SECONDS
+
+    def ttl(**params):
+        query, error = module._build_query(params)
+        assert error is None
+        return module._cache_ttl(query)
+
+    assert ttl(date='2026-01-29') == short                   # today: partitions still open
+    assert ttl(date='2026-01-29', hour='13') == short         # closed 10 min ago, inside the grace window
+    assert ttl(date='2026-01-29', hour='12') == immutable     # closed 70 min ago
+    assert ttl(date='2026-01-28') == immutable
+    assert ttl(date='2026-01-30') == short
+    # Multi-day ranges are judged by their newest day; a partial day counts as the whole day
+    assert ttl(**{'from': '2026-01-26', 'to': '2026-01-28'}) == immutable
+    assert ttl(**{'from': '2026-01-27', 'to': '2026-01-29T10'}) == short
+    assert module._cache_ttl('SELECT 1') == short             # no partition predicate at all
+
+    # Closed but never stamped: no version to key on, so only a bounded TTL
+    assert ttl(date='2026-01-25') == module.CACHE_CLOSED_TTL_SECONDS
+    assert ttl(**{'from': '2026-01-25', 'to': '2026-01-27'}) == module.CACHE_CLOSED_TTL_SECONDS
+    # An empty result may just be a partition nobody registered yet
+    query, _ = module._build_query({'date': '2026-01-28'})
+    assert module._cache_ttl(query, {'items': [], 'count': 0}) == short
+    assert module._cache_ttl(query, {'items': [{}], 'count': 1}) == immutable
+
+    # Just after midnight, yesterday is still inside its grace window
+    freeze_utcnow(module, datetime.datetime(2026, 1, 29, 0, 10))
+    assert ttl(date='2026-01-28') == short
+    freeze_utcnow(module, datetime.datetime(2026, 1, 29, 0, 15))
+    assert ttl(date='2026-01-28') == immutable
+
+
+def test_cache_key_normalization_and_tiers():
+    module = load_handler()
+    setup(module, states=('SUCCEEDED',))
+    stamp(module, '2026-01-29')
+    freeze_utcnow(module, datetime.datetime(2026, 1, 30, 12, 0))
+
+    query, _ = module._build_query({'date': '2026-01-29', 'event_type': 'alert'})
+    reflowed = '\n'.join(f'   {line.strip()}  ' for line in query.strip().splitlines())
+    assert module._cache_key(query) == module._cache_key(reflowed)
+    other, _ = module._build_query({'date': '2026-01-29', 'event_type': 'dns'})
+    assert module._cache_key(query) != module._cache_key(other)
+
+    result, _ = module._cached_athena_query(query)
+    assert result['cache'] == {'status': 'miss', 'tier': None, 'bytes_scanned_saved': 0,
+                               'ttl_seconds': module.CACHE_IMMUTABLE_TTL_SECONDS}
+    # Athena may only reuse results computed after the day's newest ingest (3 hours ago)
+    reuse = module._athena.executions[next(iter(module._athena.executions))]['reuse']
+    assert reuse['ResultReuseByAgeConfiguration']['MaxAgeInMinutes'] == 180
+
+    # Same query, different whitespace: memory tier, then S3 once memory is gone
+    result, _ = module._cached_athena_query(reflowed)
+    assert result['cache']['tier'] == 'memory' and result['cache']['bytes_scanned_saved'] == 2048
+    assert result['data_scanned_bytes'] == 0 and result['count'] == 3
+    module._result_cache.clear()
+    result, _ = module._cached_athena_query(query)
+    assert result['cache']['tier'] == 's3'
+    assert len(module._athena.started) == 1
+
+    # Expired in both tiers: Athena runs again
+    key = module._cache_key(query)
+    module._result_cache.clear()
+    stored = json.loads(module._s3.objects[('test-results', f'cache/{key}.json')])
+    stored['expires_at'] = time.time() - 1
+    module._s3.put_object(Bucket='test-results', Key=f'cache/{key}.json', Body=json.dumps(stored))
+    result, _ = module._cached_athena_query(query)
+    assert result['cache']['status'] == 'miss' and len(module._athena.started) == 2
+
+    # Memory tier is an LRU bounded by CACHE_MEMORY_ENTRIES
+    module.CACHE_MEMORY_ENTRIES = 2
+    for name in ('a', 'b', 'c'):
+        module._cache_put(name, 60, {'items': []})
+    assert list(module._result_cache) == ['b', 'c']
+
+
+def test_late_data_gets_a_fresh_cache_key():
+    module = load_handler()
+    setup(module, states=('SUCCEEDED',))
+    stamp(module, '2026-01-28')
+    freeze_utcnow(module, datetime.datetime(2026, 1, 30, 12, 0))
+    query, _ = module._build_query({'date': '2026-01-28'})
+
+    result, _ = module._cached_athena_query(query)
+    assert result['cache']['ttl_seconds'] == module.CACHE_IMMUTABLE_TTL_SECONDS
+    result, _ = module._cached_athena_query(query)
+    assert result['cache']['tier'] == 'memory' and len(module._athena.started) == 1
+
+    # A late object lands in the closed day: the old entry no longer matches,
+    # and Athena must not hand back its pre-ingest result either
+    module.time.now += module.DATA_VERSION_MEMO_SECONDS
+    stamp(module, '2026-01-28', ingested_at=int(time.time()))
+    module._athena.rows_for = lambda query: rows('2026-01-28', 4)
+    result, _ = module._cached_athena_query(query)
+    assert result['cache']['status'] == 'miss' and result['count'] == 4
+    assert len(module._athena.started) == 2
+    assert module._athena.executions[list(module._athena.executions)[-1]]['reuse'] is None
+
+    # A day queried before anything was registered comes back empty: short-lived
+    empty, _ = module._build_query({'date': '2026-01-27'})
+    module._athena.rows_for = lambda query: []
+    result, _ = module._cached_athena_query(empty)
+    assert result['count'] == 0 and result['cache']['ttl_seconds'] == module.CACHE_TTL_SECONDS
+
+
+def test_submit_then_poll_until_succeeded():
+    module = load_handler()
+    setup(module)
+
+    status, body = request(module, 'POST /logs/query', body={'date': '2026-01-29', 'event_type': 'alert'})
+    assert status == 202 and body['status'] == 'QUEUED'
+    query_id = body['query_execution_id']
+    assert body['poll'] == f'/logs/query/{query_id}'
+    assert module._athena.executions[query_id]['step'] == 0  # submitted, never waited on
+
+    polls = [request(module, 'GET /logs/query/{id}', path_id=query_id) for _ in range(3)]
+    assert [(status, body['status']) for status, body in polls] == [(200, 'QUEUED'), (200, 'RUNNING'), (200, 'SUCCEEDED')]
+    assert polls[-1][1]['count'] == 3 and polls[-1][1]['cache']['status'] == 'miss'
+
+    # Finished results are cached for later polls
+    status, body = request(module, 'GET /logs/query/{id}', path_id=query_id)
+    assert body['status'] == 'SUCCEEDED' and body['cache']['tier'] == 'memory'
+
+    assert request(module, 'GET /logs/query/{id}', path_id='not-an-id')[0] == 400
+    assert request(module, 'GET /logs/query/{id}', path_id=str(uuid.uuid4()))[0] == 404
+
+
+def test_failed_and_cancelled_queries_report_their_reason():
+    for final in ('FAILED', 'CANCELLED'):
+        module = load_handler()
+        setup(module, states=('QUEUED', final), reason='SYNTAX_ERROR: line 1')
+
+        _, body = request(module, 'POST /logs/query', body={'date': '2026-01-29'})
+        query_id = body['query_execution_id']
+        assert request(module, 'GET /logs/query/{id}', path_id=query_id)[1]['status'] == 'QUEUED'
+        status, body = request(module, 'GET /logs/query/{id}', path_id=query_id)
+        assert status == 200 and body['status'] == final
+        assert body['error'] == f'Query {final}: SYNTAX_ERROR: line 1'
+        assert 'items' not in body
+
+        # Inline GET /logs surfaces the same failure as a 500
+        status, body = request(module, 'GET /logs', {'date': '2026-01-28'})
+        assert status == 500 and body['error'] == f'Query {final}: SYNTAX_ERROR: line 1'
+
+
+def test_inline_wait_backs_off_then_hands_back_an_execution_id():
+    module = load_handler()
+    setup(module, states=['QUEUED'] + ['RUNNING'] * 8 + ['SUCCEEDED'])
+
+    status, body = request(module, 'GET /logs', {'date': '2026-01-29'})
+    assert status == 200 and body['count'] == 3
+    # 100 ms growing by 1.5x, capped at 1 s
+    assert module.time.sleeps == [0.1, 0.15, 0.225, 0.3375, 0.5063, 0.7594, 1.0, 1.0, 1.0]
+
+    # Still running after INLINE_WAIT_SECONDS: 202 with the id to poll
+    setup(module, states=('RUNNING',))
+    status, body = request(module, 'GET /logs', {'date': '2026-01-29'})
+    assert status == 202 and body['status'] == 'RUNNING'
+    assert body['poll'] == f"/logs/query/{body['query_execution_id']}"
+    assert max(module.time.sleeps) == 1.0
+    assert abs((module.time.now - 1000.0) - module.INLINE_WAIT_SECONDS) < 1e-6
+
+
+def wide_rows(count):
+    """`count` rows; every 7th has a NULL src_ip and every 11th a signature that needs CSV quoting."""
+    return [
+        {'timestamp': f'2026-01-29T14:{i // 60 % 60:02d}:{i % 60:02d}.{i:06d}+0000', 'event_type': 'alert',
+         'src_ip': '' if i % 7 == 0 else '203.0.113.7', 'dest_port': str(i),
+         'alert_signature': f'ET SCAN "quoted", multi\nline #{i}' if i % 11 == 0 else f'SIG #{i}'}
+        for i in range(count)
+    ]
+
+
+def test_results_page_through_the_csv_output():
+    module = load_handler()
+    setup(module, rows_for=lambda query: wide_rows(1200), states=('SUCCEEDED',))
+    _, body = request(module, 'POST /logs/query', body={'date': '2026-01-29'})
+    query_id = body['query_execution_id']
+
+    pages, offset = [], None
+    while True:
+        params = {'offset': str(offset), 'page_size': '500'} if offset is not None else None
+        status, body = request(module, 'GET /logs/query/{id}', params, path_id=query_id)
+        assert status == 200 and body['status'] == 'SUCCEEDED'
+        pages.append(body)
+        offset = body.get('next_offset')
+        if offset is None:
+            break
+    assert [page['count'] for page in pages] == [500, 500, 200]
+    assert [page.get('next_offset') for page in pages] == [500, 1000, None]
+    items = [item for page in pages for item in page['items']]
+    assert [item['dest_port'] for item in items] == [str(i) for i in range(1200)]
+
+    # NULLs are left out of the row, quoted fields come back intact
+    assert 'src_ip' not in items[0] and items[1]['src_ip'] == '203.0.113.7'
+    assert items[11]['alert_signature'] == 'ET SCAN "quoted", multi\nline #11'
+
+    # Only page one is cached; oversized pages are clamped to MAX_PAGE_SIZE
+    assert 'cache' in pages[0] and 'cache' not in pages[1]
+    _, body = request(module, 'GET /logs/query/{id}', {'page_size': '100000'}, path_id=query_id)
+    assert body['count'] == 1200 and 'next_offset' not in body
+    assert request(module, 'GET /logs/query/{id}', {'offset': 'x'}, path_id=query_id)[0] == 400
+
+
+def test_ndjson_export_uses_multipart_and_aborts_on_failure():
+    module = load_handler()
+    setup(module, rows_for=lambda query: wide_rows(1200), states=('SUCCEEDED',))
+    module.EXPORT_PART_BYTES = 32 * 1024
+    _, body = request(module, 'POST /logs/query', body={'date': '2026-01-29', 'export': True})
+    query_id = body['query_execution_id']
+    request(module, 'GET /logs/query/{id}', path_id=query_id)
+
+    status, body = request(module, 'GET /logs/query/{id}/export', {'format': 'ndjson'}, path_id=query_id)
+    assert status == 200 and body['format'] == 'ndjson' and body['expires_in'] == module.EXPORT_URL_TTL_SECONDS
+    assert f'exports/{query_id}.ndjson' in body['url']
+    lines = module._s3.objects[('test-results', f'exports/{query_id}.ndjson')].decode().splitlines()
+    assert len(lines) == 1200
+    assert json.loads(lines[11])['alert_signature'] == 'ET SCAN "quoted", multi\nline #11'
+    assert 'src_ip' not in json.loads(lines[0])
+    assert module._s3.completed == [(f'exports/{query_id}.ndjson', 6)]  # ~190 KB in 32 KB parts
+    assert module._s3.uploads == {} and module._s3.aborted == []
+
+    # An existing export is reused; CSV exports hand out Athena's own output
+    module._s3.objects[('test-results', f'exports/{query_id}.ndjson')] = b'kept'
+    request(module, 'GET /logs/query/{id}/export', {'format': 'ndjson'}, path_id=query_id)
+    assert module._s3.objects[('test-results', f'exports/{query_id}.ndjson')] == b'kept'
+    _, body = request(module, 'GET /logs/query/{id}/export', {'format': 'csv'}, path_id=query_id)
+    assert f'/{query_id}.csv' in body['url']
+
+    # A part upload failing mid-export aborts the multipart upload
+    _, body = request(module, 'POST /logs/query', body={'date': '2026-01-28', 'export': True})
+    failing_id = body['query_execution_id']
+    module._s3.fail_on_part = 2
+    status, body = request(module, 'GET /logs/query/{id}/export', {'format': 'ndjson'}, path_id=failing_id)
+    assert status == 500 and 'SlowDown' in body['error']
+    assert module._s3.aborted == ['upload-1'] and module._s3.uploads == {}
+    assert ('test-results', f'exports/{failing_id}.ndjson') not in module._s3.objects
+
+    # Small results skip multipart entirely; unfinished queries cannot be exported
+    module._s3.fail_on_part = None
+    module.EXPORT_PART_BYTES = 8 * 1024 * 1024
+    module._athena.rows_for = lambda query: wide_rows(3)
+    _, body = request(module, 'POST /logs/query', body={'date': '2026-01-27', 'export': True})
+    request(module, 'GET /logs/query/{id}/export', {'format': 'ndjson'}, path_id=body['query_execution_id'])
+    assert len(module._s3.objects[('test-results', f"exports/{body['query_execution_id']}.ndjson")].splitlines()) == 3
+    module._athena.states = ('RUNNING',)
+    _, body = request(module, 'POST /logs/query', body={'date': '2026-01-26', 'export': True})
+    assert request(module, 'GET /logs/query/{id}/export', path_id=body['query_execution_id'])[0] == 409
+    assert request(module, 'GET /logs/query/{id}/export', {'format': 'xml'}, path_id=body['query_execution_id'])[0] == 400
+
+
+class MockStatsTable:
+    """In-memory stand-in for the partition stats table (ADD/SET updates, query by day)"""
+    def __init__(self):
+        self.items = {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        item = self.items.setdefault((Key['partition_date'], Key['hour']), dict(Key))
+        for verb, clauses in re.findall(r'(ADD|SET) ((?:(?!ADD |SET ).)+)', UpdateExpression):
+            for clause in clauses.split(','):
+                name, value = re.split(r'\s*=\s*|\s+', clause.strip(), maxsplit=1)
+                attr, amount = ExpressionAttributeNames[name], ExpressionAttributeValues[value]
+                item[attr] = item.get(attr, 0) + amount if verb == 'ADD' else amount
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        date = ExpressionAttributeValues[':d']
+        return {'Items': [dict(item) for (day, _), item in sorted(self.items.items()) if day == date]}
+
+
+class MockArchive:
+    """In-memory stand-in for the logs bucket suricata_ingest archives to"""
+    def __init__(self):
+        self.records = []
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.records.append(json.loads(Body))
+
+
+class MockEventsTable:
+    """In-memory stand-in for the events table (batch writer)"""
+    def batch_writer(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def put_item(self, Item):
+        pass
+
+
+def ingest_batch(ingest, events, cw_ms):
+    log_events = [{'id': str(i), 'timestamp': cw_ms, 'message': json.dumps(e)} for i, e in enumerate(events)]
+    data = gzip.compress(json.dumps({'logEvents': log_events}).encode())
+    return ingest.handler({'awslogs': {'data': base64.b64encode(data).decode()}}, None)
+
+
+def test_summary_matches_what_ingest_counted():
+    stats = MockStatsTable()
+    archive = MockArchive()
+    ingest = load_handler('suricata_ingest')
+    ingest._s3, ingest._s3_enabled, ingest._s3_bucket = archive, True, 'test-logs'
+    ingest._table, ingest._attackers_table, ingest._glue_database = MockEventsTable(), None, None
+    ingest._partition_stats_table = stats
+    ingest._partition_by_event_type = True
+    ingest._enrich_geo = lambda ip: {'country_name': None, 'country_code': None, 'flag': ''}
+
+    def eve(event_type, hour, i, **extra):
+        return {'timestamp': f'2026-01-29T{hour:02d}:00:{i % 60:02d}.000000+0000', 'event_type': event_type,
+                'src_ip': '203.0.113.7', 'dest_ip': '10.0.0.5', 'dest_port': 22, 'proto': 'TCP', **extra}
+
+    # A quiet hour, then a flood hour where flow is sampled and stats rolled up
+    ingest_batch(ingest, [eve('flow', 13, i) for i in range(30)] + [eve('dns', 13, i) for i in range(4)], 1769691600000)
+    flood = [eve('flow', 14, i) for i in range(901)] + [eve('stats', 14, i) for i in range(250)]
+    flood += [eve('alert', 14, i, alert={'signature': 'ET SCAN', 'severity': 2}) for i in range(7)]
+    result = ingest_batch(ingest, flood, 1769695200000)
+    assert set(result['sampling']) == {'flow', 'stats'}
+
+    module = load_handler()
+    setup(module)
+    module._partition_stats_table = stats
+    status, body = request(module, 'GET /logs', {'date': '2026-01-29', 'action': 'summary'})
+    assert status == 200 and body['source'] == 'partition_stats' and body['hours'] == 2
+    assert body['items'] == [
+        {'event_type': 'flow', 'event_count': 931},
+        {'event_type': 'stats', 'event_count': 250},
+        {'event_type': 'alert', 'event_count': 7},
+        {'event_type': 'dns', 'event_count': 4},
+    ]
+    assert module._athena.started == []
+
+    # A day without counters falls back to Athena, which sums sample weights
+    # over the archived records and lands on the same counts
+    def group_by(query):
+        assert 'SUM(COALESCE(sample_weight, 1)) as event_count' in query and 'GROUP BY event_type' in query
+        totals = {}
+        for record in archive.records:
+            totals[record['event_type']] = totals.get(record['event_type'], 0) + record.get('sample_weight', 1)
+        return [{'event_type': name, 'event_count': str(count)} for name, count in sorted(totals.items(), key=lambda kv: -kv[1])]
+
+    module._athena.rows_for, module._athena.states = group_by, ('SUCCEEDED',)
+    stats.items = {}
+    status, body = request(module, 'GET /logs', {'date': '2026-01-29', 'action': 'summary'})
+    assert status == 200 and len(module._athena.started) == 1
+    assert {item['event_type']: int(item['event_count']) for item in body['items']} == {'flow': 931, 'stats': 250, 'alert': 7, 'dns': 4}
+    assert len(archive.records) < 931 + 250 + 7 + 4
+
+
+def query_day(query):
+    return '2026-01-' + re.search(r"day = '(\d+)'", query).group(1)
+
+
+def range_request(module, limit):
+    return request(module, 'GET /logs', {'from': '2026-01-20', 'to': '2026-01-24', 'limit': str(limit)})
+
+
+def test_range_merges_newest_days_and_stops_older_queries():
+    day_rows = {'2026-01-24': rows('2026-01-24', 3, hour=1), '2026-01-23': rows('2026-01-23', 4, hour=22)}
+    day_states = {'2026-01-24': ('RUNNING', 'SUCCEEDED'), '2026-01-23': ('RUNNING', 'RUNNING', 'SUCCEEDED')}
+    module = load_handler()
+    setup(module, rows_for=lambda query: day_rows.get(query_day(query), rows(query_day(query), 5)),
+          states=lambda query: day_states.get(query_day(query), ('RUNNING',)))
+    module.RANGE_MAX_CONCURRENCY = 2
+
+    status, body = range_request(module, limit=5)
+    assert status == 200 and body['count'] == 5
+    # Newest day first, then the next day's newest rows, across the day boundary
+    assert [item['alert_signature'] for item in body['items']] == [
+        '2026-01-24 #0', '2026-01-24 #1', '2026-01-24 #2', '2026-01-23 #0', '2026-01-23 #1',
+    ]
+    timestamps = [item['timestamp'] for item in body['items']]
+    assert timestamps == sorted(timestamps, reverse=True)
+
+    # 24 + 23 already hold 5 rows: 22 is stopped mid-flight, 21 and 20 never start
+    assert [query_day(q) for q in module._athena.started] == ['2026-01-24', '2026-01-23', '2026-01-22']
+    assert [query_day(q) for q in module._athena.stopped] == ['2026-01-22']
+    assert body['range'] == {'days_total': 5, 'days_merged': 2, 'days_from_cache': 0, 'days_queried': 3,
+                             'days_stopped_early': 1, 'days_not_started': 2}
+
+    # The same merge with a limit smaller than the newest day alone
+    merged = module._merge_newest([{'items': rows('2026-01-24', 3)}, {'items': rows('2026-01-23', 3)}], 2)
+    assert [item['alert_signature'] for item in merged] == ['2026-01-24 #0', '2026-01-24 #1']
+
+
+def test_range_retry_reuses_finished_days():
+    attempts = {}
+
+    def states(query):
+        # 2026-01-23 outlives the first invocation's inline wait, then finishes
+        day = query_day(query)
+        attempts[day] = attempts.get(day, 0) + 1
+        if day == '2026-01-23' and attempts[day] == 1:
+            return ('RUNNING',) * 100 + ('SUCCEEDED',)
+        return ('RUNNING', 'SUCCEEDED')
+
+    module = load_handler()
+    setup(module, rows_for=lambda query: rows(query_day(query), 2), states=states)
+
+    status, body = range_request(module, limit=100)
+    assert status == 202 and body['retry'] is True
+    assert (body['status'], body['days_total'], body['days_completed']) == ('RUNNING', 5, 4)
+    assert len(module._athena.started) == 5 and module._athena.stopped == []
+
+    status, body = range_request(module, limit=100)
+    assert status == 200 and body['count'] == 10
+    assert body['range']['days_from_cache'] == 4 and body['range']['days_queried'] == 1
+    assert [query_day(q) for q in module._athena.started[5:]] == ['2026-01-23']
+    assert [item['timestamp'][:10] for item in body['items']] == [
+        day for day in ('2026-01-24', '2026-01-23', '2026-01-22', '2026-01-21', '2026-01-20') for _ in range(2)
+    ]
+
+
+def test_range_failure_stops_the_other_days():
+    module = load_handler()
+    setup(module, states=lambda query: ('FAILED',) if query_day(query) == '2026-01-22' else ('RUNNING',))
+
+    status, body = range_request(module, limit=10)
+    assert status == 500 and body['error']
+    assert sorted(query_day(q) for q in module._athena.stopped) == ['2026-01-20', '2026-01-21', '2026-01-23', '2026-01-24']
+
+
+if __name__ == "__main__":
+    test_cache_ttl_follows_partition_age()
+    test_cache_key_normalization_and_tiers()
+    test_late_data_gets_a_fresh_cache_key()
+    test_submit_then_poll_until_succeeded()
+    test_failed_and_cancelled_queries_report_their_reason()
+    test_inline_wait_backs_off_then_hands_back_an_execution_id()
+    test_results_page_through_the_csv_output()
+    test_ndjson_export_uses_multipart_and_aborts_on_failure()
+    test_summary_matches_what_ingest_counted()
+    test_range_merges_newest_days_and_stops_older_queries()
+    test_range_retry_reuses_finished_days()
+    test_range_failure_stops_the_other_days()
+    print("✅ Athena log query tests passed")
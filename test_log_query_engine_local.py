@@ -0,0 +1,414 @@
+"""
+Local test for the in-process log search engine and scan budgets
+Runs phantomwall.local_engine over files on disk, and the s3_log_query planner
+and scan budgets over an in-memory S3 log lake and size manifest
+"""
+
+import gzip
+import importlib.util
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+# Mock environment variables BEFORE importing handler
+os.environ['ATHENA_DATABASE'] = 'test_db'
+os.environ['ATHENA_TABLE'] = 'suricata_events'
+os.environ['ATHENA_WORKGROUP'] = 'test-wg'
+os.environ['RESULTS_BUCKET'] = 'test-results'
+os.environ['S3_BUCKET'] = 'test-logs'
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+from phantomwall import local_engine, metrics
+
+RAW_PREFIX = 'year=2026/month=01/day=29/hour=14/etype=alert/'
+COMPACTED_PREFIX = 'compacted/year=2026/month=01/day=29/hour=13/etype=alert/v=20260129T150000-aaaaaaaa/'
+
+
+def load_handler():
+    """Load lambda/s3_log_query/handler.py without clashing with other handler modules"""
+    path = os.path.join(ROOT, 'lambda', 's3_log_query', 'handler.py')
+    spec = importlib.util.spec_from_file_location('s3_log_query_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def event(i, hour=14, **extra):
+    return {
+        'timestamp': f'2026-01-29T{hour:02d}:{i % 60:02d}:00.000000+0000', 'event_type': 'alert', 'flow_id': i,
+        'src_ip': f'203.0.113.{i % 4}', 'dest_ip': '10.0.0.5', 'dest_port': 22 if i % 2 else 443, 'proto': 'TCP',
+        'alert': {'signature': f'SIG {i}', 'severity': 2}, **extra,
+    }
+
+
+def lake_objects():
+    """One raw object per event for hour 14, one gzip part for hour 13."""
+    objects = {f'{RAW_PREFIX}{i:032x}.json': json.dumps(event(i)).encode() for i in range(20)}
+    part = b''.join(json.dumps(event(i, hour=13)).encode() + b'\n' for i in range(40))
+    objects[f'{COMPACTED_PREFIX}part-00000.json.gz'] = gzip.compress(part)
+    return objects
+
+
+def test_search_local_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        for key, body in lake_objects().items():
+            path = os.path.join(tmp, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(body)
+        keys = sorted(lake_objects())
+
+        def open_file(key):
+            return open(os.path.join(tmp, key), 'rb')
+
+        items, stats = local_engine.search(keys, open_file, {'event_type': 'alert'}, limit=5)
+        assert stats == {'objects_read': 21, 'rows_scanned': 60}
+        # Newest first across raw and compacted objects
+        assert [item['timestamp'][11:19] for item in items] == ['14:19:00', '14:18:00', '14:17:00', '14:16:00', '14:15:00']
+        # Same columns and string values as the Athena CSV output
+        assert items[0] == {
+            'timestamp': '2026-01-29T14:19:00.000000+0000', 'event_type': 'alert', 'src_ip': '203.0.113.3',
+            'dest_ip': '10.0.0.5', 'dest_port': '22', 'proto': 'TCP', 'flow_id': '19',
+            'alert_signature': 'SIG 19', 'alert_severity': '2',
+        }
+
+        items, _ = local_engine.search(keys, open_file, {'src_ip': '203.0.113.1', 'dest_port': '22', 'proto': 'tcp'}, limit=100)
+        assert len(items) == 15  # i % 4 == 1 is always odd → port 22
+        assert all(item['src_ip'] == '203.0.113.1' for item in items)
+
+        items, _ = local_engine.search(keys, open_file, {'event_type': 'dns'}, limit=100)
+        assert items == []
+
+
+def test_search_skips_unparseable_lines():
+    body = io.BytesIO(b'{"event_type": "alert", "timestamp": "b"}\nnot json\n\n[1, 2]\n{"event_type": "alert", "timestamp": "a"}\n')
+    items, stats = local_engine.search(['x.json'], lambda key: body, {}, limit=10)
+    assert [item['timestamp'] for item in items] == ['b', 'a']
+    assert stats['rows_scanned'] == 2
+
+
+class MockPaginator:
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        yield self.method(**kwargs)
+
+
+class MockS3:
+    """In-memory stand-in for the logs bucket"""
+    def __init__(self, objects):
+        self.objects = objects
+        self.gets = []
+
+    def get_paginator(self, name):
+        return MockPaginator(self.list_objects_v2)
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None):
+        contents, common = [], set()
+        for key in sorted(self.objects):
+            rest = key[len(Prefix):] if key.startswith(Prefix) else None
+            if rest is None:
+                continue
+            if Delimiter and Delimiter in rest:
+                common.add(Prefix + rest.split(Delimiter)[0] + Delimiter)
+                continue
+            contents.append({'Key': key, 'Size': len(self.objects[key])})
+        return {'Contents': contents, 'CommonPrefixes': [{'Prefix': p} for p in sorted(common)]}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'Not Found'}}, 'GetObject')
+        self.gets.append(Key)
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body.encode() if isinstance(Body, str) else Body
+
+
+class MockGlue:
+    """In-memory stand-in for the Glue partitions of one table"""
+    def __init__(self, locations):
+        self.locations = locations
+
+    def get_paginator(self, name):
+        return MockPaginator(self.get_partitions)
+
+    def get_partitions(self, DatabaseName, TableName, Expression=None):
+        first, last = re.search(r"hour BETWEEN '(\d+)' AND '(\d+)'", Expression).groups()
+        return {'Partitions': [
+            {'Values': list(values), 'StorageDescriptor': {'Location': location}}
+            for values, location in self.locations.items()
+            if first <= values[3] <= last
+        ]}
+
+
+class MockAthena:
+    """Records submitted queries; never runs them"""
+    def __init__(self):
+        self.queries = []
+
+    def start_query_execution(self, QueryString, **kwargs):
+        self.queries.append(QueryString)
+        return {'QueryExecutionId': '00000000-0000-0000-0000-000000000001'}
+
+
+def setup(module):
+    module._s3 = MockS3(lake_objects())
+    module._glue = MockGlue({
+        ('2026', '01', '29', '13', 'alert'): f's3://test-logs/{COMPACTED_PREFIX}',
+        ('2026', '01', '29', '14', 'alert'): f's3://test-logs/{RAW_PREFIX}',
+    })
+    module._athena = MockAthena()
+    module._enrich_results_with_geo = lambda items: items
+
+
+def test_planner_picks_local_engine_for_small_searches():
+    module = load_handler()
+    setup(module)
+
+    response = module.handler({'queryStringParameters': {'date': '2026-01-29', 'event_type': 'alert', 'limit': '3'}}, None)
+    body = json.loads(response['body'])
+    assert response['statusCode'] == 200
+    assert body['engine'] == 'local'
+    assert body['local']['partitions'] == 2 and body['local']['objects_read'] == 21
+    assert [item['flow_id'] for item in body['items']] == ['19', '18', '17']
+    assert module._athena.queries == []
+
+    # POST /logs/query answers inline too
+    response = module.handler({
+        'requestContext': {'routeKey': 'POST /logs/query'},
+        'body': json.dumps({'date': '2026-01-29', 'hour': '13', 'src_ip': '203.0.113.2'}),
+    }, None)
+    body = json.loads(response['body'])
+    assert body['status'] == 'SUCCEEDED' and body['engine'] == 'local'
+    assert body['count'] == 10
+    assert module._athena.queries == []
+
+
+def test_planner_uses_athena_over_threshold():
+    module = load_handler()
+    setup(module)
+    module.LOCAL_ENGINE_MAX_BYTES = 1024
+
+    response = module.handler({
+        'requestContext': {'routeKey': 'POST /logs/query'},
+        'body': json.dumps({'date': '2026-01-29', 'event_type': 'alert'}),
+    }, None)
+    assert response['statusCode'] == 202
+    assert len(module._athena.queries) == 1
+    assert module._s3.gets == []  # listing only, no object was read
+
+    # Exports always go to Athena
+    module.LOCAL_ENGINE_MAX_BYTES = 64 * 1024 * 1024
+    response = module.handler({
+        'requestContext': {'routeKey': 'POST /logs/query'},
+        'body': json.dumps({'date': '2026-01-29', 'export': True}),
+    }, None)
+    assert response['statusCode'] == 202
+    assert len(module._athena.queries) == 2
+
+
+class MockStatsTable:
+    """In-memory stand-in for the partition stats table (size manifest, data version stamps)"""
+    def __init__(self, items):
+        self.items = items
+        self.stamped = []
+
+    def update_item(self, Key, **kwargs):
+        self.stamped.append(Key)
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        date = ExpressionAttributeValues[':d']
+        return {'Items': [item for item in self.items if item['partition_date'] == date]}
+
+
+class MockBudgetTable:
+    """In-memory stand-in for the daily scan budget table"""
+    def __init__(self, scanned=0):
+        self.scanned = scanned
+
+    def get_item(self, Key):
+        return {'Item': {'budget_date': Key['budget_date'], 'scanned_bytes': self.scanned}}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, **kwargs):
+        self.scanned += ExpressionAttributeValues[':b']
+
+
+def setup_budget(module, scanned_today=0):
+    """Five alert hours of 1 MB each, one compacted to 100 KB, Athena only."""
+    module.LOCAL_ENGINE_MAX_BYTES = 0
+    module._s3 = MockS3({})
+    module._glue = MockGlue({
+        ('2026', '01', '29', f'{h:02d}', 'alert'): f's3://test-logs/year=2026/month=01/day=29/hour={h:02d}/etype=alert/'
+        for h in range(10, 15)
+    })
+    module._athena = MockAthena()
+    items = [{'partition_date': '2026-01-29', 'hour': f'{h:02d}', 'n_alert': 10, 'b_alert': 1024 * 1024} for h in range(10, 15)]
+    items[0]['z_alert'] = 100 * 1024
+    module._partition_stats_table = MockStatsTable(items)
+    module._query_budget_table = MockBudgetTable(scanned_today)
+
+
+def submit(module, **params):
+    response = module.handler({'requestContext': {'routeKey': 'POST /logs/query'}, 'body': json.dumps(params)}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_dry_run_estimates_from_manifest():
+    module = load_handler()
+    setup_budget(module)
+
+    status, body = submit(module, date='2026-01-29', event_type='alert', dry_run=True)
+    assert status == 200
+    assert body['dry_run'] and body['allowed'] and body['engine'] == 'athena'
+    assert body['budget']['estimate']['bytes'] == 4 * 1024 * 1024 + 100 * 1024
+    assert body['budget']['estimate']['partitions'] == 5
+    assert "etype IN ('alert', 'all')" in body['query']
+    assert module._athena.queries == []
+
+
+def test_over_budget_search_is_narrowed_or_rejected():
+    module = load_handler()
+    setup_budget(module)
+    module.SCAN_BUDGET_REQUEST_BYTES = 2 * 1024 * 1024 + 1
+
+    # Narrowed to the newest hours that fit
+    status, body = submit(module, date='2026-01-29', event_type='alert')
+    assert status == 202
+    assert body['budget']['narrowed'] == {'from': '2026-01-29T13', 'to': '2026-01-29T23', 'estimated_bytes': 2 * 1024 * 1024}
+    assert "hour BETWEEN '13' AND '23'" in module._athena.queries[-1]
+
+    status, body = submit(module, date='2026-01-29', event_type='alert', over_budget='reject')
+    assert status == 400 and 'per-request budget' in body['error']
+    status, body = submit(module, date='2026-01-29', event_type='alert', export=True)
+    assert status == 400
+    assert len(module._athena.queries) == 1
+
+
+def test_daily_budget_counts_scanned_bytes():
+    module = load_handler()
+    setup_budget(module, scanned_today=10 * 1024 * 1024)
+    module.SCAN_BUDGET_DAILY_BYTES = 10 * 1024 * 1024
+
+    status, body = submit(module, date='2026-01-29', event_type='alert')
+    assert status == 429
+    assert body['budget']['daily_scanned_bytes'] == 10 * 1024 * 1024
+
+    # Finished queries are charged what Athena actually scanned
+    module._query_budget_table.scanned = 0
+    module._store_completed('SELECT 1', {'items': [], 'count': 0, 'data_scanned_bytes': 5000, 'reused_previous_result': False})
+    module._store_completed('SELECT 2', {'items': [], 'count': 0, 'data_scanned_bytes': 5000, 'reused_previous_result': True})
+    assert module._query_budget_table.scanned == 5000
+
+
+def emf_records(output):
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{"_aws"')]
+
+
+def test_route_metrics_emitted_as_emf():
+    module = load_handler()
+    setup(module)
+    module._partition_stats_table = MockStatsTable([{'partition_date': '2026-01-29', 'hour': '14', 'n_alert': 20}])
+
+    output = io.StringIO()
+    with redirect_stdout(output):
+        search = module.handler({'requestContext': {'routeKey': 'GET /logs'},
+                                 'queryStringParameters': {'date': '2026-01-29', 'event_type': 'alert', 'limit': '3'}}, None)
+        module.handler({'requestContext': {'routeKey': 'GET /logs'},
+                        'queryStringParameters': {'date': '2026-01-29', 'action': 'summary'}}, None)
+    first, summary = emf_records(output.getvalue())
+
+    assert first['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['Service', 'Route', 'Status'], ['Service', 'Route']]
+    assert (first['Service'], first['Route'], first['Status']) == ('s3_log_query', 'GET /logs', '200')
+    assert first['ItemsRead'] == 60  # every row of both hours was scanned by the local engine
+    assert first['ResponseBytes'] == len(search['body'].encode())
+    assert first['LatencyMs'] > 0 and first['AthenaMs'] == 0
+    assert (summary['Route'], summary['Status'], summary['CacheHits'], summary['CacheMisses']) == ('GET /logs summary', '200', 0, 0)
+
+    # Athena results report their cache outcome
+    metrics.start('s3_log_query', {'requestContext': {'routeKey': 'GET /logs'}})
+    module._store_completed('SELECT 1', {'items': [], 'count': 0, 'data_scanned_bytes': 0, 'reused_previous_result': False})
+    module._cache_hit({'items': [], 'count': 0, 'data_scanned_bytes': 10}, 'memory')
+    record = metrics.record({'statusCode': 200, 'body': ''})
+    assert (record['CacheHits'], record['CacheMisses'], record['CacheTier']) == (1, 1, 'memory')
+
+    # Paths without a route key share one bounded dimension value; the path is a plain property
+    for path in ('/logs/../etc', '/logs/query/abc/unknown', '/random-1234'):
+        metrics.start('s3_log_query', {'requestContext': {'routeKey': '$default'}, 'rawPath': path})
+        record = metrics.record({'statusCode': 404, 'body': ''})
+        assert record['Route'] == metrics.UNMATCHED_ROUTE and record['Path'] == path
+    metrics.start('s3_log_query', {'action': 'repair_partitions'})
+    assert metrics.record({'statusCode': 200})['Route'] == 'repair_partitions'
+
+
+class MockCatalog:
+    """In-memory stand-in for the Glue catalog that _repair_partitions rewrites"""
+    def __init__(self, values):
+        self.partitions = {tuple(v): 's3://test-logs/old/' for v in values}
+        self.deleted = []
+
+    def get_paginator(self, name):
+        return MockPaginator(lambda **kwargs: {'Partitions': [{'Values': list(v)} for v in self.partitions]})
+
+    def get_table(self, DatabaseName, Name):
+        return {'Table': {'StorageDescriptor': {'Columns': []}}}
+
+    def batch_delete_partition(self, DatabaseName, TableName, PartitionsToDelete):
+        for partition in PartitionsToDelete:
+            self.deleted.append(tuple(partition['Values']))
+            del self.partitions[tuple(partition['Values'])]
+        return {'Errors': []}
+
+    def batch_create_partition(self, DatabaseName, TableName, PartitionInputList):
+        for partition in PartitionInputList:
+            self.partitions[tuple(partition['Values'])] = partition['StorageDescriptor']['Location']
+        return {'Errors': []}
+
+
+def test_repair_migrates_partitions_registered_before_etype():
+    module = load_handler()
+    objects = lake_objects()
+    objects['year=2026/month=01/day=28/hour=09/0001.json'] = json.dumps(event(1, hour=9)).encode()
+    module._s3 = MockS3(objects)
+    # Hour 09 was registered with the old four keys; hour 14 is already current
+    module._glue = MockCatalog([('2026', '01', '28', '09'), ('2026', '01', '29', '14', 'alert')])
+
+    module._partition_stats_table = MockStatsTable([])
+
+    assert module._repair_partitions() == 2
+    assert module._glue.deleted == [('2026', '01', '28', '09')]
+    assert module._glue.partitions == {
+        ('2026', '01', '28', '09', 'all'): 's3://test-logs/year=2026/month=01/day=28/hour=09/',
+        ('2026', '01', '29', '13', 'alert'): f's3://test-logs/{COMPACTED_PREFIX}',
+        ('2026', '01', '29', '14', 'alert'): 's3://test-logs/old/',
+    }
+
+    # Newly registered hours get a new data version, invalidating cached results
+    assert sorted(key['hour'] for key in module._partition_stats_table.stamped) == ['09', '13']
+
+    # A second run has nothing left to migrate
+    assert module._repair_partitions() == 0 and len(module._glue.deleted) == 1
+
+
+if __name__ == "__main__":
+    test_search_local_files()
+    test_search_skips_unparseable_lines()
+    test_planner_picks_local_engine_for_small_searches()
+    test_planner_uses_athena_over_threshold()
+    test_dry_run_estimates_from_manifest()
+    test_over_budget_search_is_narrowed_or_rejected()
+    test_daily_budget_counts_scanned_bytes()
+    test_route_metrics_emitted_as_emf()
+    test_repair_migrates_partitions_registered_before_etype()
+    print("✅ Local log search engine and scan budget tests passed")
@@ -0,0 +1,136 @@
+"""
+Local test for on-demand invocation profiling (phantomwall.profiling)
+and the tools/profile_report.py aggregator
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+from phantomwall import profiling  # noqa: E402
+
+_spec = importlib.util.spec_from_file_location('profile_report', os.path.join(ROOT, 'tools', 'profile_report.py'))
+profile_report = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(profile_report)
+
+
+class MockContext:
+    """In-memory stand-in for the Lambda context object"""
+    function_name = 'phantomwall-lambda-suricata-api-test'
+
+    def __init__(self, request_id='req-1'):
+        self.aws_request_id = request_id
+
+
+def _busy(n):
+    return sum(i * i for i in range(n))
+
+
+def _allocate():
+    return [str(i) * 8 for i in range(20000)]
+
+
+@profiling.profiled
+def sample_handler(event, context):
+    blob = _allocate()
+    return {'statusCode': 200, 'body': str(_busy(200000) + len(blob))}
+
+
+@profiling.profiled
+def fan_out_handler(event, context):
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        return {'statusCode': 200, 'body': str(sum(pool.map(_busy, [300000, 300000])))}
+
+
+def _configure(output, rate=0.0, mode='cprofile'):
+    profiling.PROFILE_OUTPUT = output
+    profiling.PROFILE_SAMPLE_RATE = rate
+    profiling.PROFILE_MODE = mode
+
+
+def _written(directory):
+    return [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+
+
+def test_profiling_off_by_default_and_header_trigger():
+    with tempfile.TemporaryDirectory() as out:
+        _configure('', rate=1.0)
+        assert sample_handler({}, MockContext())['statusCode'] == 200
+        assert _written(out) == []
+
+        # Output configured but rate 0: only the header triggers a profile,
+        # and only when it carries the shared secret
+        _configure(out)
+        sample_handler({'headers': {'X-Profile': '1'}}, MockContext())
+        assert _written(out) == []
+        profiling.PROFILE_HEADER_SECRET = 'let-me-profile'
+        for value in ('1', 'true', 'let-me-profil', ''):
+            sample_handler({'headers': {'x-profile': value}}, MockContext())
+        assert _written(out) == []
+        event = {'headers': {'X-Profile': 'let-me-profile'}, 'requestContext': {'routeKey': 'GET /metrics'}}
+        assert sample_handler(event, MockContext())['statusCode'] == 200
+        profiling.PROFILE_HEADER_SECRET = ''
+
+        files = _written(out)
+        assert len(files) == 1 and MockContext.function_name in files[0]
+        with open(files[0]) as f:
+            summary = json.load(f)
+        _configure('')
+    assert summary['trigger'] == 'header' and summary['route'] == 'GET /metrics'
+    assert summary['status'] == 200 and summary['mode'] == 'cprofile'
+    busy = next(f for f in summary['functions'] if f['function'].endswith('(<genexpr>)'))
+    assert busy['calls'] > 100000
+    assert summary['memory']['peak_bytes'] > 0 and summary['memory']['top']
+
+
+def test_stack_sampler_sees_worker_threads():
+    with tempfile.TemporaryDirectory() as out:
+        _configure(out, rate=1.0, mode='sample')
+        fan_out_handler({}, MockContext())
+        with open(_written(out)[0]) as f:
+            summary = json.load(f)
+        _configure('')
+    assert summary['mode'] == 'sample'
+    busy = [f for f in summary['functions'] if f['function'].endswith('(_busy)')]
+    assert busy and busy[0]['samples'] > 0
+    assert not any(t.name == 'profile-sampler' for t in threading.enumerate())
+
+
+def test_report_aggregates_profiles_and_log_lines():
+    with tempfile.TemporaryDirectory() as out:
+        _configure(out, rate=1.0)
+        for i in range(3):
+            sample_handler({}, MockContext(f'req-{i}'))
+        _configure('')
+
+        log_path = os.path.join(out, 'profiles.log')
+        summary = json.loads(open(_written(out)[0]).read())
+        with open(log_path, 'w') as f:
+            f.write('2026-10-18T10:00:00 stream START\n')
+            f.write('2026-10-18T10:00:01 stream PROFILE ' + json.dumps(summary) + '\n')
+
+        summaries = profile_report.load([out])
+    assert len(summaries) == 4  # three JSON files plus one log line
+    report = profile_report.aggregate(summaries, sort='cum', top=10)
+    assert report['profiles'] == 4
+    handler_row = next(r for r in report['functions'] if r['function'].endswith('(sample_handler)'))
+    assert handler_row['profiles'] == 4 and handler_row['calls'] == 4
+    assert report['functions'][0]['cum_ms'] >= report['functions'][-1]['cum_ms']
+    assert report['memory']['peak_max_bytes'] > 0
+
+
+if __name__ == "__main__":
+    test_profiling_off_by_default_and_header_trigger()
+    test_stack_sampler_sees_worker_threads()
+    test_report_aggregates_profiles_and_log_lines()
+    print("✅ Profiling tests passed")
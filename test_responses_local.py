@@ -0,0 +1,131 @@
+"""
+Local test for the shared API response layer (phantomwall.responses)
+Checks content negotiation, compression, Decimal encoding and ETag revalidation
+"""
+
+import base64
+import gzip
+import json
+import os
+import sys
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+from phantomwall import responses  # noqa: E402
+
+
+class FakeBrotli:
+    """Stands in for the optional brotli package: tags its output instead of compressing"""
+    @staticmethod
+    def compress(payload, quality):
+        return b'br:' + payload
+
+
+def request(accept=None, if_none_match=None):
+    headers = {}
+    if accept is not None:
+        headers['Accept-Encoding'] = accept
+    if if_none_match is not None:
+        headers['If-None-Match'] = if_none_match
+    return {'headers': headers}
+
+
+def big_body():
+    return {'items': [{'signature': f'ET SCAN {i}', 'count': i} for i in range(100)]}
+
+
+def test_accept_encoding_negotiation():
+    original = responses.brotli
+    try:
+        responses.brotli = None
+        assert responses._accepted_encoding(request('gzip, deflate')) == 'gzip'
+        assert responses._accepted_encoding(request('br')) is None
+        assert responses._accepted_encoding(request('br, gzip')) == 'gzip'  # no brotli bundled
+        assert responses._accepted_encoding(request('gzip;q=0, br')) is None
+        assert responses._accepted_encoding(request('identity')) is None
+        assert responses._accepted_encoding(request('*')) == 'gzip'
+        assert responses._accepted_encoding(request('*, gzip;q=0')) is None
+        assert responses._accepted_encoding(request('gzip;q=bogus')) is None
+        assert responses._accepted_encoding(request()) is None
+        assert responses._accepted_encoding({'headers': {'accept-encoding': 'GZIP;q=0.5'}}) == 'gzip'
+
+        responses.brotli = FakeBrotli
+        assert responses._accepted_encoding(request('gzip, br')) == 'br'
+        assert responses._accepted_encoding(request('gzip, br;q=0')) == 'gzip'
+    finally:
+        responses.brotli = original
+
+
+def test_compression_threshold_and_headers():
+    original = responses.brotli
+    try:
+        responses.brotli = None
+        small = responses.json_response(200, {'ok': True}, request('gzip'))
+        assert small['body'] == '{"ok":true}' and 'isBase64Encoded' not in small
+        assert 'Content-Encoding' not in small['headers'] and 'Vary' not in small['headers']
+
+        plain = responses.json_response(200, big_body(), request('identity'))
+        assert len(plain['body']) >= responses.MIN_COMPRESS_BYTES and 'Content-Encoding' not in plain['headers']
+
+        compressed = responses.json_response(200, big_body(), request('gzip'))
+        assert compressed['isBase64Encoded'] is True
+        assert compressed['headers']['Content-Encoding'] == 'gzip'
+        assert compressed['headers']['Vary'] == 'Accept-Encoding'
+        assert compressed['headers']['Content-Type'] == 'application/json'
+        assert gzip.decompress(base64.b64decode(compressed['body'])).decode() == plain['body']
+        # mtime=0: the same body compresses to the same bytes every time
+        assert responses.json_response(200, big_body(), request('gzip'))['body'] == compressed['body']
+
+        responses.brotli = FakeBrotli
+        br = responses.json_response(200, big_body(), request('br, gzip'))
+        assert br['headers']['Content-Encoding'] == 'br'
+        assert base64.b64decode(br['body']) == b'br:' + plain['body'].encode()
+    finally:
+        responses.brotli = original
+
+
+def test_decimals_and_other_dynamodb_types():
+    body = {'count': Decimal('12'), 'ratio': Decimal('0.25'), 'ports': {443, 22}, 'raw': b'\x00\x01',
+            'nested': [{'severity': Decimal('2.0')}]}
+    decoded = json.loads(responses.encode_json(body))
+    assert decoded == {'count': 12, 'ratio': 0.25, 'ports': [22, 443], 'raw': 'AAE=', 'nested': [{'severity': 2}]}
+    assert isinstance(decoded['count'], int) and isinstance(decoded['nested'][0]['severity'], int)
+    assert isinstance(decoded['ratio'], float)
+    try:
+        responses.encode_json({'when': object()})
+        raise AssertionError('expected TypeError')
+    except TypeError:
+        pass
+
+
+def test_etag_revalidation():
+    first = responses.json_response(200, big_body(), request('gzip'), etag=True)
+    tag = first['headers']['ETag']
+    assert tag.startswith('"') and tag.endswith('"')
+    assert first['headers']['Cache-Control'] == 'no-cache'
+
+    # The tag covers the JSON body, not its compressed form
+    assert responses.json_response(200, big_body(), request(), etag=True)['headers']['ETag'] == tag
+
+    for if_none_match in (tag, f'W/{tag}', f'"other", {tag}', '*'):
+        not_modified = responses.json_response(200, big_body(), request('gzip', if_none_match), etag=True)
+        assert not_modified['statusCode'] == 304 and not_modified['body'] == ''
+        assert not_modified['headers']['ETag'] == tag and 'Content-Encoding' not in not_modified['headers']
+
+    changed = responses.json_response(200, {'items': []}, request(None, tag), etag=True)
+    assert changed['statusCode'] == 200 and changed['headers']['ETag'] != tag
+
+    # Only successful responses are tagged
+    error = responses.json_response(404, {'error': 'missing'}, request(None, '*'), etag=True)
+    assert error['statusCode'] == 404 and 'ETag' not in error['headers']
+
+
+if __name__ == "__main__":
+    test_accept_encoding_negotiation()
+    test_compression_threshold_and_headers()
+    test_decimals_and_other_dynamodb_types()
+    test_etag_revalidation()
+    print("✅ API response layer tests passed")
@@ -0,0 +1,187 @@
+"""
+Local test for the /events list in suricata_api
+Pages an in-memory events table with cursors, since= and If-None-Match
+"""
+
+import datetime
+import importlib.util
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Shared Lambda layer (deployed to /opt/python)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'layer', 'python'))
+
+# Mock environment variables BEFORE importing handler
+os.environ.setdefault('TABLE_NAME', 'test-suricata-events')
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+EVENT_DATE = '2026-01-29'
+BASE = datetime.datetime(2026, 1, 29, 14, 30, tzinfo=datetime.timezone.utc)
+
+
+def load_handler():
+    """Load lambda/suricata_api/handler.py without clashing with other handler modules"""
+    path = os.path.join(ROOT, 'lambda', 'suricata_api', 'handler.py')
+    spec = importlib.util.spec_from_file_location('suricata_api_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _matches(condition, item):
+    expression = condition.get_expression()
+    operator, values = expression['operator'], expression['values']
+    if operator == 'AND':
+        return all(_matches(value, item) for value in values)
+    actual = item.get(values[0].name)
+    if actual is None:
+        return False
+    if operator == '=':
+        return actual == values[1]
+    if operator == '>=':
+        return actual >= values[1]
+    if operator == 'BETWEEN':
+        return values[1] <= actual <= values[2]
+    raise AssertionError(f'Unsupported key condition: {operator}')
+
+
+def _key_names(condition):
+    expression = condition.get_expression()
+    if expression['operator'] == 'AND':
+        return set().union(*(_key_names(value) for value in expression['values']))
+    return {expression['values'][0].name}
+
+
+def _project(item, projection, names):
+    projected = {}
+    for path in projection.split(', '):
+        source, target = item, projected
+        segments = [names[alias] for alias in path.split('.')]
+        for segment in segments[:-1]:
+            source = (source or {}).get(segment)
+            target = target.setdefault(segment, {})
+        if isinstance(source, dict) and segments[-1] in source:
+            target[segments[-1]] = source[segments[-1]]
+    return projected
+
+
+class MockEventsTable:
+    """In-memory stand-in for the events table (query with key conditions, paging, projection)"""
+    def __init__(self, items):
+        self.items = list(items)
+        self.calls = []
+
+    def query(self, KeyConditionExpression, ScanIndexForward=True, Limit=None, ExclusiveStartKey=None,
+              IndexName=None, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self.calls.append({'KeyConditionExpression': KeyConditionExpression, 'IndexName': IndexName,
+                           'ProjectionExpression': ProjectionExpression})
+        sort_key = 'timestamp' if IndexName else 'event_id'
+        key_names = ('src_ip', 'timestamp', 'event_date', 'event_id') if IndexName else ('event_date', 'event_id')
+        matched = sorted((i for i in self.items if _matches(KeyConditionExpression, i)),
+                         key=lambda i: i[sort_key], reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            position = next(n for n, i in enumerate(matched) if i['event_id'] == ExclusiveStartKey['event_id'])
+            matched = matched[position + 1:]
+        page = matched[:Limit]
+        response = {'Items': [_project(i, ProjectionExpression, ExpressionAttributeNames) if ProjectionExpression else dict(i)
+                              for i in page]}
+        if Limit and len(matched) > Limit:
+            response['LastEvaluatedKey'] = {name: page[-1][name] for name in key_names}
+        return response
+
+
+def stored_event(i):
+    event_dt = BASE + datetime.timedelta(seconds=i)
+    return {
+        'event_date': EVENT_DATE,
+        'event_id': event_dt.strftime('%Y%m%dT%H%M%S.%f') + f'_{i:04x}',
+        'timestamp': int(event_dt.timestamp() * 1000),
+        'event_type': 'alert', 'src_ip': f'203.0.113.{i % 2}', 'dest_port': 22,
+        'severity': 2, 'signature': f'SIG {i}',
+        'suricata': {'alert': {'action': 'allowed', 'signature': f'SIG {i}'}, 'payload_printable': 'SSH-2.0'},
+    }
+
+
+def request(module, headers=None, **params):
+    event = {
+        'requestContext': {'routeKey': 'GET /events'},
+        'queryStringParameters': {'event_date': EVENT_DATE, **params},
+        'headers': headers or {},
+    }
+    response = module.handler(event, None)
+    body = json.loads(response['body']) if response['body'] else None
+    return response, body
+
+
+def test_projection_defaults_to_full_items():
+    module = load_handler()
+    module._table = MockEventsTable(stored_event(i) for i in range(3))
+
+    _, body = request(module)
+    assert body['items'][0]['suricata']['payload_printable'] == 'SSH-2.0'
+
+    _, body = request(module, fields='slim')
+    assert body['items'][0]['suricata'] == {'alert': {'action': 'allowed'}}
+    assert body['items'][0]['signature'] == 'SIG 2'
+
+    _, body = request(module, src_ip='203.0.113.0', fields='slim')
+    assert body['count'] == 2 and 'suricata' not in body['items'][0]
+
+    response, _ = request(module, fields='bad field')
+    assert response['statusCode'] == 400
+
+
+def test_cursor_round_trip_and_since():
+    module = load_handler()
+    module._table = MockEventsTable(stored_event(i) for i in range(7))
+
+    seen, cursor = [], None
+    for _ in range(5):
+        _, body = request(module, limit='3', **({'cursor': cursor} if cursor else {}))
+        seen.extend(item['signature'] for item in body['items'])
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert seen == [f'SIG {i}' for i in range(6, -1, -1)]
+
+    # A cursor is bound to its day; garbage is rejected rather than ignored
+    _, first = request(module, limit='3')
+    response, _ = request(module, limit='3', cursor=first['next_cursor'], event_date='2026-01-30')
+    assert response['statusCode'] == 400
+    response, _ = request(module, cursor='not-a-cursor')
+    assert response['statusCode'] == 400
+
+    # since is exclusive and becomes an event_id key condition, not a filter
+    since_ms = stored_event(4)['timestamp']
+    _, body = request(module, since=str(since_ms))
+    assert [item['signature'] for item in body['items']] == ['SIG 6', 'SIG 5']
+    assert _key_names(module._table.calls[-1]['KeyConditionExpression']) == {'event_date', 'event_id'}
+    response, _ = request(module, since='yesterday')
+    assert response['statusCode'] == 400
+
+
+def test_unchanged_page_returns_304():
+    module = load_handler()
+    module._table = MockEventsTable(stored_event(i) for i in range(3))
+
+    response, _ = request(module)
+    etag = response['headers']['ETag']
+    assert response['statusCode'] == 200 and etag.startswith('"')
+
+    response, body = request(module, headers={'If-None-Match': etag})
+    assert response['statusCode'] == 304 and body is None and response['headers']['ETag'] == etag
+
+    # A new event changes the page, so the stale tag gets a full 200
+    module._table.items.append(stored_event(3))
+    response, body = request(module, headers={'if-none-match': etag})
+    assert response['statusCode'] == 200 and body['count'] == 4
+    assert response['headers']['ETag'] != etag
+
+
+if __name__ == "__main__":
+    test_projection_defaults_to_full_items()
+    test_cursor_round_trip_and_since()
+    test_unchanged_page_returns_304()
+    print("✅ Event list API tests passed")
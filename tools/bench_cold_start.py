@@ -0,0 +1,102 @@
+"""
+Benchmark Lambda handler cold starts (module import + client construction).
+
+Each sample imports one handler in a fresh interpreter, as a new Lambda
+container would, with its deployed environment variables. It does this under
+each AWS_CLIENT_PREWARM mode:
+
+    all         every declared client built at import (the old behaviour)
+    configured  only the clients the handler pre-warms (the default)
+    none        nothing built until first use
+
+No AWS calls are made; building a client only loads its service model.
+
+Usage:
+    python tools/bench_cold_start.py [--rounds 5] [--handler s3_log_query]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+LAYER = os.path.join(ROOT, "lambda", "layer", "python")
+
+COMMON_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "bench",
+    "AWS_SECRET_ACCESS_KEY": "bench",
+}
+
+# Environment as deployed by Terraform (names only need to look plausible)
+HANDLER_ENV = {
+    "suricata_ingest": {
+        "TABLE_NAME": "events", "ATTACKERS_TABLE_NAME": "attackers", "PARTITION_STATS_TABLE": "stats",
+        "S3_BUCKET_NAME": "logs", "ENABLE_S3_BACKUP": "true", "ATHENA_DATABASE": "db", "ATHENA_TABLE": "tbl",
+    },
+    "suricata_api": {"TABLE_NAME": "events", "ATTACKERS_TABLE_NAME": "attackers"},
+    "s3_log_query": {
+        "ATHENA_DATABASE": "db", "ATHENA_TABLE": "tbl", "ATHENA_WORKGROUP": "wg", "RESULTS_BUCKET": "results",
+        "S3_BUCKET": "logs", "PARTITION_STATS_TABLE": "stats", "QUERY_BUDGET_TABLE": "budget",
+    },
+    "log_compactor": {
+        "S3_BUCKET": "logs", "ATHENA_DATABASE": "db", "ATHENA_TABLE": "tbl", "PARTITION_STATS_TABLE": "stats",
+    },
+    "alert_stream": {
+        "CONNECTIONS_TABLE_NAME": "connections",
+        "WEBSOCKET_ENDPOINT": "https://abc.execute-api.us-east-1.amazonaws.com/prod",
+    },
+    "chat_assistant": {
+        "TABLE_NAME": "events", "PARTITION_STATS_TABLE": "stats", "CHAT_CACHE_TABLE": "chat-cache",
+        "WEBSOCKET_ENDPOINT": "https://abc.execute-api.us-east-1.amazonaws.com/prod",
+    },
+}
+
+MODES = ("all", "configured", "none")
+
+# Runs inside the fresh interpreter: import the handler, report timings
+_PROBE = """
+import importlib.util, json, sys, time
+sys.path.insert(0, sys.argv[2])
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("handler", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+init_ms = (time.perf_counter() - started) * 1000
+from phantomwall import aws
+print(json.dumps({"init_ms": init_ms, "clients": len(aws.build_ms), "build_ms": sum(aws.build_ms.values())}))
+"""
+
+
+def _sample(handler, mode):
+    env = dict(os.environ, **COMMON_ENV, **HANDLER_ENV[handler], AWS_CLIENT_PREWARM=mode)
+    path = os.path.join(ROOT, "lambda", handler, "handler.py")
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE, path, LAYER], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--handler", choices=sorted(HANDLER_ENV), action="append")
+    args = parser.parse_args()
+
+    print(f"{'handler':<16} {'mode':<11} {'init ms':>9} {'clients':>8} {'client ms':>10}")
+    for handler in args.handler or sorted(HANDLER_ENV):
+        baseline = None
+        for mode in MODES:
+            samples = [_sample(handler, mode) for _ in range(args.rounds)]
+            init_ms = statistics.median(s["init_ms"] for s in samples)
+            build_ms = statistics.median(s["build_ms"] for s in samples)
+            baseline = baseline if baseline is not None else init_ms
+            delta = f"  ({init_ms - baseline:+.0f} ms)" if mode != "all" else ""
+            print(f"{handler:<16} {mode:<11} {init_ms:>9.1f} {samples[0]['clients']:>8} {build_ms:>10.1f}{delta}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark API response encoding.
+
+Compares the old per-handler path (recursive _decimal_to_native copy, then
+json.dumps) with phantomwall.responses.json_response on a synthetic page of
+DynamoDB alert items, including the raw `suricata` map.
+
+Usage:
+    python tools/bench_responses.py [--items 500] [--rounds 20]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda", "layer", "python"))
+
+from phantomwall.responses import json_response  # noqa: E402
+
+SIGNATURES = [
+    "ET SCAN Potential SSH Scan",
+    "ET SCAN NMAP -sS window 1024",
+    "ET POLICY Suspicious inbound to MSSQL port 1433",
+    "GPL ICMP_INFO PING *NIX",
+]
+
+
+def _legacy_decimal_to_native(value):
+    if isinstance(value, list):
+        return [_legacy_decimal_to_native(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _legacy_decimal_to_native(v) for k, v in value.items()}
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _make_item(i):
+    ts = 1769700000000 + i * 137
+    src_port = random.randint(1024, 65535)
+    dest_port = random.choice([22, 23, 80, 443, 1433, 3389, 8080])
+    signature = random.choice(SIGNATURES)
+    return {
+        "event_date": "2026-01-29",
+        "event_id": f"20260129T1430{i:06d}_{i:08x}",
+        "ingest_time": Decimal(ts + 500),
+        "timestamp": Decimal(ts),
+        "event_time": "2026-01-29T14:30:15.123456Z",
+        "event_type": "alert",
+        "src_ip": f"203.0.113.{i % 250}",
+        "src_port": Decimal(src_port),
+        "dest_ip": "10.0.0.50",
+        "dest_port": Decimal(dest_port),
+        "proto": "TCP",
+        "flow_id": Decimal(random.getrandbits(50)),
+        "severity": Decimal(2),
+        "category": "Attempted Information Leak",
+        "signature": signature,
+        "summary": f"ALERT | 203.0.113.{i % 250}:{src_port} ? 10.0.0.50:{dest_port} | TCP | {signature}",
+        "country_name": "United States",
+        "country_code": "US",
+        "flag": "\U0001F1FA\U0001F1F8",
+        "suricata": {
+            "timestamp": "2026-01-29T14:30:15.123456+0000",
+            "flow_id": Decimal(random.getrandbits(50)),
+            "in_iface": "ens5",
+            "event_type": "alert",
+            "src_ip": f"203.0.113.{i % 250}",
+            "src_port": Decimal(src_port),
+            "dest_ip": "10.0.0.50",
+            "dest_port": Decimal(dest_port),
+            "proto": "TCP",
+            "alert": {
+                "action": "allowed",
+                "gid": Decimal(1),
+                "signature_id": Decimal(2001219),
+                "rev": Decimal(20),
+                "signature": signature,
+                "category": "Attempted Information Leak",
+                "severity": Decimal(2),
+                "metadata": {"updated_at": ["2019_07_26"], "created_at": ["2010_07_30"]},
+            },
+            "flow": {
+                "pkts_toserver": Decimal(5),
+                "pkts_toclient": Decimal(3),
+                "bytes_toserver": Decimal(450),
+                "bytes_toclient": Decimal(200),
+                "start": "2026-01-29T14:30:14.998877+0000",
+            },
+        },
+    }
+
+
+def _legacy_response(body):
+    converted = {**body, "items": [_legacy_decimal_to_native(item) for item in body["items"]]}
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
+        "body": json.dumps(converted),
+    }
+
+
+def _time(fn, rounds):
+    samples = []
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(7)
+    body = {"event_date": "2026-01-29", "count": args.items, "items": [_make_item(i) for i in range(args.items)]}
+    gzip_request = {"headers": {"accept-encoding": "gzip, deflate, br"}}
+
+    cases = [
+        ("legacy _decimal_to_native + json.dumps", lambda: _legacy_response(body)),
+        ("json_response (identity)", lambda: json_response(200, body)),
+        ("json_response (Accept-Encoding: gzip/br)", lambda: json_response(200, body, gzip_request)),
+    ]
+
+    print(f"{args.items} items, median of {args.rounds} rounds")
+    print(f"{'path':<44} {'ms':>8} {'body bytes':>12} {'encoding':>9}")
+    for name, fn in cases:
+        median_ms, response = _time(fn, args.rounds)
+        encoding = response["headers"].get("Content-Encoding", "identity")
+        print(f"{name:<44} {median_ms:>8.2f} {len(response['body']):>12,} {encoding:>9}")
+
+
+if __name__ == "__main__":
+    main()
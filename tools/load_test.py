@@ -0,0 +1,429 @@
+"""
+End-to-end load test of the Lambda pipeline, run in-process.
+
+Replays eve.json through suricata_ingest as CloudWatch Logs subscription
+batches. The input is either a recorded NDJSON file or generated events.
+Between batches it issues the dashboard's reads:
+
+    suricata_api    GET /events, GET /metrics, GET /attackers
+    s3_log_query    GET /logs, GET /logs?action=summary
+    chat_assistant  POST /chat
+
+The AWS services are stand-ins. DynamoDB, S3 and Glue come from moto.
+Athena and Bedrock are canned clients with optional fixed latencies: moto's
+Athena writes no result CSV, so the stand-in writes one to the moto results
+bucket. Tables, indexes and environment variables mirror the Terraform.
+Absolute numbers include moto's in-process overhead, so compare runs on the
+same machine, not against production.
+
+Reports throughput and p50/p95/p99 latency per handler route. Exits 1 when
+a route misses its budget (--budgets, default tools/load_budgets.json);
+--record-budgets writes the current run, with headroom, as the new budget.
+
+Usage:
+    python tools/load_test.py [--eve eve.json | --events 5000] [--batch 100]
+                              [--rate 0] [--reads-every 5] [--bedrock-ms 0] [--athena-ms 0]
+                              [--budgets FILE] [--record-budgets FILE] [--json]
+
+Needs moto:  pip install "moto[dynamodb,s3,glue]"
+"""
+
+import argparse
+import base64
+import datetime
+import gzip
+import importlib.util
+import io
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "lambda", "layer", "python"))
+
+DEFAULT_BUDGETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_budgets.json")
+BUDGET_HEADROOM = 1.5
+# Recorded ceilings never go below this, so sub-millisecond routes don't flap
+BUDGET_FLOOR_MS = 50
+
+ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "load-test",
+    "AWS_SECRET_ACCESS_KEY": "load-test",
+    "TABLE_NAME": "events",
+    "ATTACKERS_TABLE_NAME": "attackers",
+    "PARTITION_STATS_TABLE": "partition-stats",
+    "QUERY_BUDGET_TABLE": "query-budget",
+    "CHAT_CACHE_TABLE": "chat-cache",
+    "S3_BUCKET_NAME": "phantomwall-logs",
+    "S3_BUCKET": "phantomwall-logs",
+    "ENABLE_S3_BACKUP": "true",
+    "PARTITION_BY_EVENT_TYPE": "true",
+    "ATHENA_DATABASE": "suricata",
+    "ATHENA_TABLE": "logs",
+    "ATHENA_WORKGROUP": "phantomwall",
+    "RESULTS_BUCKET": "phantomwall-athena-results",
+}
+
+EVENT_TYPES = (("flow", 60), ("dns", 20), ("http", 8), ("tls", 6), ("alert", 6))
+SIGNATURES = (
+    (2001219, "ET SCAN Potential SSH Scan", 2),
+    (2010935, "ET SCAN Suspicious inbound to MSSQL port 1433", 2),
+    (2024897, "ET EXPLOIT Possible SMB probe", 1),
+    (2100366, "GPL ICMP_INFO PING *NIX", 3),
+)
+
+
+def _load(name):
+    path = os.path.join(ROOT, "lambda", name, "handler.py")
+    spec = importlib.util.spec_from_file_location(f"load_test_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _offline_geo(ip):
+    """Deterministic stand-in for the ip-api.com lookup."""
+    code = ("NL", "US", "CN", "RU", "BR")[sum(map(int, ip.split("."))) % 5] if ip and ip.count(".") == 3 else None
+    return {"country_name": code or "Unknown", "country_code": code, "flag": ""}
+
+
+class CannedBedrock:
+    """Bedrock runtime stand-in: fixed answer after a fixed model latency."""
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000
+
+    def invoke_model(self, **kwargs):
+        time.sleep(self.latency)
+        answer = {"content": [{"type": "text", "text": "Mostly SSH and SMB scanning from a handful of IPs."}]}
+        return {"body": io.BytesIO(json.dumps(answer).encode())}
+
+
+class CannedAthena:
+    """Athena stand-in: queries succeed after a fixed latency with a canned CSV result."""
+
+    COLUMNS = ("timestamp", "event_type", "src_ip", "src_port", "dest_ip", "dest_port", "proto")
+
+    def __init__(self, latency_ms, rows=100):
+        import boto3
+
+        self.latency = latency_ms / 1000
+        self.rows = rows
+        self.started = {}
+        self.s3 = boto3.client("s3")
+
+    def start_query_execution(self, QueryString, **kwargs):
+        query_id = f"load-{len(self.started):06d}"
+        lines = [",".join(self.COLUMNS)]
+        for i in range(self.rows):
+            lines.append(f"2026-01-29T14:00:{i % 60:02d}.000000+0000,flow,203.0.113.{i % 250},{40000 + i},10.0.1.20,22,TCP")
+        self.s3.put_object(Bucket=ENV["RESULTS_BUCKET"], Key=f"{query_id}.csv", Body="\n".join(lines).encode())
+        self.started[query_id] = time.monotonic()
+        return {"QueryExecutionId": query_id}
+
+    def _execution(self, query_id):
+        done = time.monotonic() - self.started[query_id] >= self.latency
+        return {
+            "QueryExecutionId": query_id,
+            "Status": {"State": "SUCCEEDED" if done else "RUNNING"},
+            "ResultConfiguration": {"OutputLocation": f"s3://{ENV['RESULTS_BUCKET']}/{query_id}.csv"},
+            "Statistics": {"DataScannedInBytes": 10 * 1024 * 1024},
+        }
+
+    def get_query_execution(self, QueryExecutionId):
+        return {"QueryExecution": self._execution(QueryExecutionId)}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        return {"QueryExecutions": [self._execution(query_id) for query_id in QueryExecutionIds]}
+
+    def stop_query_execution(self, QueryExecutionId):
+        return {}
+
+
+# ── Stand-in AWS ──
+
+def _key_schema(hash_key, range_key=None):
+    schema = [{"AttributeName": hash_key, "KeyType": "HASH"}]
+    if range_key:
+        schema.append({"AttributeName": range_key, "KeyType": "RANGE"})
+    return schema
+
+
+def _create_table(ddb, name, hash_key, range_key=None, attributes=None, indexes=()):
+    attributes = dict(attributes or {}, **{hash_key: "S"}, **({range_key: "S"} if range_key else {}))
+    kwargs = {}
+    if indexes:
+        kwargs["GlobalSecondaryIndexes"] = [
+            {"IndexName": index, "KeySchema": _key_schema(h, r), "Projection": {"ProjectionType": "ALL"}}
+            for index, h, r in indexes
+        ]
+    ddb.create_table(
+        TableName=name,
+        KeySchema=_key_schema(hash_key, range_key),
+        AttributeDefinitions=[{"AttributeName": a, "AttributeType": t} for a, t in attributes.items()],
+        BillingMode="PAY_PER_REQUEST",
+        **kwargs,
+    )
+
+
+def _provision():
+    """Create the tables, buckets and catalog the Terraform would."""
+    import boto3
+
+    ddb = boto3.client("dynamodb")
+    _create_table(
+        ddb, ENV["TABLE_NAME"], "event_date", "event_id",
+        attributes={"src_ip": "S", "timestamp": "N"},
+        indexes=[("src_ip-timestamp-index", "src_ip", "timestamp")],
+    )
+    _create_table(
+        ddb, ENV["ATTACKERS_TABLE_NAME"], "src_ip",
+        attributes={"scope": "S", "last_seen": "N", "first_seen": "N", "event_count": "N"},
+        indexes=[(f"scope-{k}-index", "scope", k) for k in ("last_seen", "first_seen", "event_count")],
+    )
+    _create_table(ddb, ENV["PARTITION_STATS_TABLE"], "partition_date", "hour")
+    _create_table(ddb, ENV["QUERY_BUDGET_TABLE"], "budget_date")
+    _create_table(ddb, ENV["CHAT_CACHE_TABLE"], "cache_key")
+
+    s3 = boto3.client("s3")
+    s3.create_bucket(Bucket=ENV["S3_BUCKET"])
+    s3.create_bucket(Bucket=ENV["RESULTS_BUCKET"])
+
+    glue = boto3.client("glue")
+    glue.create_database(DatabaseInput={"Name": ENV["ATHENA_DATABASE"]})
+    glue.create_table(
+        DatabaseName=ENV["ATHENA_DATABASE"],
+        TableInput={
+            "Name": ENV["ATHENA_TABLE"],
+            "StorageDescriptor": {"Columns": [], "Location": f"s3://{ENV['S3_BUCKET']}/"},
+            "PartitionKeys": [{"Name": k, "Type": "string"} for k in ("year", "month", "day", "hour", "etype")],
+        },
+    )
+
+
+# ── Events ──
+
+def generate_events(count, seed=7):
+    """Synthetic eve.json records with a realistic event-type mix."""
+    rng = random.Random(seed)
+    types, weights = zip(*EVENT_TYPES)
+    for i in range(count):
+        event_type = rng.choices(types, weights)[0]
+        evt = {
+            "event_type": event_type,
+            "src_ip": f"{rng.choice((45, 89, 103, 185, 203))}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 40)}",
+            "src_port": rng.randint(1024, 65535),
+            "dest_ip": "10.0.1.20",
+            "dest_port": rng.choice((22, 23, 80, 443, 445, 1433, 3389)),
+            "proto": rng.choice(("TCP", "TCP", "TCP", "UDP")),
+            "flow_id": rng.getrandbits(50),
+        }
+        if event_type == "alert":
+            sid, signature, severity = rng.choice(SIGNATURES)
+            evt["alert"] = {"signature_id": sid, "signature": signature, "severity": severity, "category": "Attempted Recon"}
+        elif event_type == "dns":
+            evt["dns"] = {"type": "query", "rrname": f"host{i % 97}.example.com", "rrtype": "A"}
+        yield evt
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _retime(events, span_seconds):
+    """Spread events evenly over the last `span_seconds` so today's reads see them."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    events = list(events)
+    for i, evt in enumerate(events):
+        at = now - datetime.timedelta(seconds=span_seconds * (len(events) - i) / max(len(events), 1))
+        evt["timestamp"] = at.strftime("%Y-%m-%dT%H:%M:%S.%f+0000")
+    return events
+
+
+def subscription_event(batch):
+    """CloudWatch Logs subscription payload for a batch of eve records."""
+    now_ms = int(time.time() * 1000)
+    data = {"logEvents": [{"id": str(i), "timestamp": now_ms, "message": json.dumps(e)} for i, e in enumerate(batch)]}
+    return {"awslogs": {"data": base64.b64encode(gzip.compress(json.dumps(data).encode())).decode()}}
+
+
+def _http(route, params=None, body=None):
+    method, path = route.split(" ", 1)
+    event = {
+        "rawPath": path,
+        "requestContext": {"routeKey": route, "http": {"method": method}},
+        "queryStringParameters": params,
+        "headers": {},
+    }
+    if body is not None:
+        event["body"] = json.dumps(body)
+    return event
+
+
+# ── Measurement ──
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def call(self, name, fn, event):
+        started = time.perf_counter()
+        response = fn(event, None)
+        self.samples.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+        if (response or {}).get("statusCode", 200) >= 500:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+    def report(self, wall_seconds):
+        rows = {}
+        for name, samples in sorted(self.samples.items()):
+            rows[name] = {
+                "calls": len(samples),
+                "errors": self.errors.get(name, 0),
+                "per_second": round(len(samples) / wall_seconds, 2),
+                "p50_ms": round(percentile(samples, 50), 1),
+                "p95_ms": round(percentile(samples, 95), 1),
+                "p99_ms": round(percentile(samples, 99), 1),
+                "max_ms": round(max(samples), 1),
+            }
+        return rows
+
+
+def check_budgets(rows, budgets):
+    """Violations of {route: {"p50_ms"|"p95_ms"|"p99_ms": ceiling, "max_errors": n}}."""
+    failures = []
+    for name, budget in budgets.items():
+        row = rows.get(name)
+        if row is None:
+            failures.append(f"{name}: no samples")
+            continue
+        for metric, ceiling in budget.items():
+            if metric == "max_errors":
+                if row["errors"] > ceiling:
+                    failures.append(f"{name}: {row['errors']} errors > {ceiling}")
+            elif row[metric] > ceiling:
+                failures.append(f"{name}: {metric} {row[metric]} > {ceiling}")
+    return failures
+
+
+def run(events, batch_size, rate, reads_every, bedrock_ms, athena_ms):
+    from moto import mock_aws
+
+    os.environ.update(ENV)
+    with mock_aws():
+        _provision()
+        ingest = _load("suricata_ingest")
+        api = _load("suricata_api")
+        logs = _load("s3_log_query")
+        chat = _load("chat_assistant")
+        ingest._enrich_geo = _offline_geo
+        logs._enrich_geo = lambda ip: {}
+        logs._athena = CannedAthena(athena_ms)
+        chat.bedrock = CannedBedrock(bedrock_ms)
+
+        today = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
+        reads = [
+            ("suricata_api GET /events", api.handler, _http("GET /events", {"limit": "50"})),
+            ("suricata_api GET /metrics", api.handler, _http("GET /metrics")),
+            ("suricata_api GET /attackers", api.handler, _http("GET /attackers", {"limit": "25"})),
+            ("s3_log_query GET /logs", logs.handler, _http("GET /logs", {"date": today, "limit": "100"})),
+            ("s3_log_query GET /logs summary", logs.handler, _http("GET /logs", {"date": today, "action": "summary"})),
+            ("chat_assistant POST /chat", chat.handler, _http("POST /chat", body={"prompt": "What happened today?", "event_date": today, "no_cache": True})),
+        ]
+
+        recorder = Recorder()
+        started = time.perf_counter()
+        for n, offset in enumerate(range(0, len(events), batch_size)):
+            batch = events[offset:offset + batch_size]
+            if rate:
+                # Open-loop pacing: batch n is due at offset / rate seconds
+                delay = started + offset / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            recorder.call("suricata_ingest", ingest.handler, subscription_event(batch))
+            if reads_every and (n + 1) % reads_every == 0:
+                for name, fn, event in reads:
+                    recorder.call(name, fn, event)
+        wall = time.perf_counter() - started
+    return recorder.report(wall), wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eve", help="recorded eve.json (NDJSON); default: generated events")
+    parser.add_argument("--events", type=int, default=5000, help="generated events (ignored with --eve)")
+    parser.add_argument("--batch", type=int, default=100, help="eve records per subscription payload")
+    parser.add_argument("--rate", type=float, default=0, help="events/second to replay at; 0 = as fast as possible")
+    parser.add_argument("--reads-every", type=int, default=5, help="run the read routes after every N batches")
+    parser.add_argument("--bedrock-ms", type=float, default=0, help="simulated Bedrock latency")
+    parser.add_argument("--athena-ms", type=float, default=0, help="simulated Athena query latency")
+    parser.add_argument("--keep-timestamps", action="store_true", help="replay --eve with its original timestamps")
+    parser.add_argument("--budgets", default=DEFAULT_BUDGETS, help="budget file to enforce ('' to skip)")
+    parser.add_argument("--record-budgets", help=f"write this run x{BUDGET_HEADROOM} as a budget file")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    try:
+        import moto  # noqa: F401
+    except ImportError:
+        sys.exit('load_test needs moto: pip install "moto[dynamodb,s3,glue]"')
+
+    events = list(read_events(args.eve) if args.eve else generate_events(args.events))
+    if not (args.eve and args.keep_timestamps):
+        events = _retime(events, span_seconds=min(3000, len(events)))
+
+    rows, wall = run(events, args.batch, args.rate, args.reads_every, args.bedrock_ms, args.athena_ms)
+    ingest = rows.get("suricata_ingest", {})
+
+    if args.json:
+        print(json.dumps({"events": len(events), "wall_seconds": round(wall, 2), "routes": rows}, indent=2))
+    else:
+        print(f"{len(events)} events in {wall:.1f}s ({len(events) / wall:.0f} events/s, "
+              f"{ingest.get('calls', 0)} ingest batches of {args.batch})")
+        print(f"{'route':<32} {'calls':>6} {'err':>4} {'/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for name, row in rows.items():
+            print(f"{name:<32} {row['calls']:>6} {row['errors']:>4} {row['per_second']:>7} "
+                  f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} {row['max_ms']:>8}")
+
+    if args.record_budgets:
+        budgets = {
+            name: {
+                "p95_ms": round(max(row["p95_ms"] * BUDGET_HEADROOM, BUDGET_FLOOR_MS), 1),
+                "p99_ms": round(max(row["p99_ms"] * BUDGET_HEADROOM, BUDGET_FLOOR_MS), 1),
+                "max_errors": 0,
+            }
+            for name, row in rows.items()
+        }
+        with open(args.record_budgets, "w", encoding="utf-8") as f:
+            json.dump(budgets, f, indent=2)
+            f.write("\n")
+        print(f"Recorded budgets to {args.record_budgets}")
+        return
+
+    if args.budgets:
+        with open(args.budgets, encoding="utf-8") as f:
+            failures = check_budgets(rows, json.load(f))
+        if failures:
+            print("Budget regressions:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print("All routes within budget")
+
+
+if __name__ == "__main__":
+    main()
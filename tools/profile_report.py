@@ -0,0 +1,155 @@
+"""
+Aggregate Lambda invocation profiles into a hot-function report.
+
+Reads the summaries written by phantomwall.profiling (see PROFILE_OUTPUT):
+  - a directory of JSON summaries (searched recursively) or a single file
+  - an s3://bucket/prefix holding the same
+  - a saved log with `PROFILE {json}` lines, e.g.
+        aws logs tail /aws/lambda/<function> --since 1h --filter-pattern '"PROFILE "' > profiles.log
+
+Functions are ranked by total self time across all profiles. Share is that
+time as a fraction of all profiled wall time. cProfile and sampled
+summaries can be mixed; sampled ones have no call counts.
+
+Usage:
+    python tools/profile_report.py PATH [PATH ...] [--function NAME] [--route "GET /logs"]
+                                   [--sort self|cum] [--top 25] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+
+
+def _parse(text):
+    """Summaries in `text`: one JSON document, or PROFILE lines from a log."""
+    stripped = text.strip()
+    if stripped.startswith("{"):
+        try:
+            return [json.loads(stripped)]
+        except json.JSONDecodeError:
+            pass
+    summaries = []
+    for line in text.splitlines():
+        marker = line.find("PROFILE {")
+        if marker >= 0:
+            summaries.append(json.loads(line[marker + len("PROFILE "):]))
+    return summaries
+
+
+def _load_s3(uri):
+    import boto3
+
+    bucket, _, prefix = uri[len("s3://"):].partition("/")
+    s3 = boto3.client("s3")
+    summaries = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            body = s3.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read()
+            summaries.extend(_parse(body.decode("utf-8")))
+    return summaries
+
+
+def load(paths):
+    summaries = []
+    for path in paths:
+        if path.startswith("s3://"):
+            summaries.extend(_load_s3(path))
+            continue
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+            )
+        for file in files:
+            with open(file, encoding="utf-8") as f:
+                summaries.extend(_parse(f.read()))
+    return summaries
+
+
+def aggregate(summaries, sort="self", top=25):
+    """Totals per function and allocator across `summaries`."""
+    wall_ms = sum(s["duration_ms"] for s in summaries)
+    functions = {}
+    for summary in summaries:
+        for entry in summary.get("functions", []):
+            row = functions.setdefault(entry["function"], {
+                "function": entry["function"], "profiles": 0, "calls": 0, "self_ms": 0.0, "cum_ms": 0.0,
+            })
+            row["profiles"] += 1
+            row["calls"] += entry.get("calls", 0)
+            row["self_ms"] += entry["self_ms"]
+            row["cum_ms"] += entry["cum_ms"]
+    ranked = sorted(functions.values(), key=lambda r: r[f"{sort}_ms"], reverse=True)[:top]
+    for row in ranked:
+        row["self_ms"] = round(row["self_ms"], 1)
+        row["cum_ms"] = round(row["cum_ms"], 1)
+        row["share"] = round(row[f"{sort}_ms"] / wall_ms, 3) if wall_ms else 0
+
+    peaks = [s["memory"]["peak_bytes"] for s in summaries if s.get("memory")]
+    allocators = {}
+    for summary in summaries:
+        for entry in (summary.get("memory") or {}).get("top", []):
+            row = allocators.setdefault(entry["where"], {"where": entry["where"], "profiles": 0, "size_bytes": 0})
+            row["profiles"] += 1
+            row["size_bytes"] = max(row["size_bytes"], entry["size_bytes"])
+
+    durations = [s["duration_ms"] for s in summaries]
+    return {
+        "profiles": len(summaries),
+        "wall_ms": round(wall_ms, 1),
+        "p50_ms": round(statistics.median(durations), 1) if durations else 0,
+        "max_ms": round(max(durations), 1) if durations else 0,
+        "functions": ranked,
+        "memory": {
+            "peak_p50_bytes": int(statistics.median(peaks)) if peaks else 0,
+            "peak_max_bytes": max(peaks) if peaks else 0,
+            "top": sorted(allocators.values(), key=lambda r: r["size_bytes"], reverse=True)[:10],
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="directories, files or s3:// prefixes")
+    parser.add_argument("--function", help="only profiles of this Lambda function")
+    parser.add_argument("--route", help='only profiles of this route, e.g. "GET /logs"')
+    parser.add_argument("--sort", choices=("self", "cum"), default="self")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    summaries = [
+        s for s in load(args.paths)
+        if (not args.function or s.get("function") == args.function)
+        and (not args.route or s.get("route") == args.route)
+    ]
+    if not summaries:
+        sys.exit("No profiles found")
+    report = aggregate(summaries, args.sort, args.top)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['profiles']} profiles, {report['wall_ms']:.0f} ms profiled "
+          f"(p50 {report['p50_ms']:.0f} ms, max {report['max_ms']:.0f} ms)")
+    print(f"{'self ms':>10} {'cum ms':>10} {'share':>6} {'calls':>8} {'seen':>5}  function")
+    for row in report["functions"]:
+        calls = row["calls"] or "-"
+        print(f"{row['self_ms']:>10.1f} {row['cum_ms']:>10.1f} {row['share']:>6.1%} {calls:>8} {row['profiles']:>5}  "
+              f"{row['function']}")
+
+    memory = report["memory"]
+    if memory["peak_max_bytes"]:
+        print(f"\nPeak traced memory: p50 {memory['peak_p50_bytes'] / 1024:.0f} KiB, "
+              f"max {memory['peak_max_bytes'] / 1024:.0f} KiB")
+        print(f"{'max KiB':>10} {'seen':>5}  allocator")
+        for row in memory["top"]:
+            print(f"{row['size_bytes'] / 1024:>10.1f} {row['profiles']:>5}  {row['where']}")
+
+
+if __name__ == "__main__":
+    main()
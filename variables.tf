@@ -166,9 +166,81 @@ variable "bedrock_model_id" {
 }
 
 variable "chat_max_items" {
-  description = "Maximum number of Suricata events to include in a chat response"
+  description = "Representative Suricata events included with the chat telemetry digest"
   type        = number
-  default     = 25
+  default     = 5
+}
+
+variable "chat_digest_token_budget" {
+  description = "Approximate tokens the chat telemetry digest may use in the Bedrock prompt"
+  type        = number
+  default     = 1500
+}
+
+variable "chat_cache_ttl_seconds" {
+  description = "How long a cached chat answer may be reused while the day's data is unchanged"
+  type        = number
+  default     = 900
+}
+
+variable "chat_shared_cache" {
+  description = "If true, chat answers are also cached in DynamoDB and shared between Lambda containers"
+  type        = bool
+  default     = true
+}
+
+# ----------------------------------------------------------
+#            Ingest Sampling
+# ----------------------------------------------------------
+# Purpose: Bound ingest latency and S3 writes during floods
+# Usage: Per event type: "keep", "sample" (optional rate, else
+#        adaptive) or "aggregate". Applies only while a type
+#        arrives faster than the threshold; alert, anomaly and
+#        drop events are always kept.
+# ----------------------------------------------------------
+
+variable "ingest_sampling_policy" {
+  description = "S3 archive policy per Suricata event_type while it floods (see phantomwall/sampling.py)"
+  type        = map(object({ mode = string, rate = optional(number) }))
+  default = {
+    flow  = { mode = "sample" }
+    dns   = { mode = "sample" }
+    stats = { mode = "aggregate" }
+  }
+}
+
+variable "ingest_flood_events_per_second" {
+  description = "Per-type arrival rate in an ingest batch above which the sampling policy applies"
+  type        = number
+  default     = 200
+}
+
+# ----------------------------------------------------------
+#            Lambda Profiling
+# ----------------------------------------------------------
+# Purpose: Profile sampled invocations of the Python Lambdas
+# Usage: "log" writes summaries to CloudWatch Logs; aggregate them
+#        with tools/profile_report.py. An s3:// prefix also needs
+#        s3:PutObject on it in the function roles.
+# ----------------------------------------------------------
+
+variable "lambda_profile_output" {
+  description = "Where profiled invocations write summaries: \"\" (off), \"log\", or s3://bucket/prefix"
+  type        = string
+  default     = ""
+}
+
+variable "lambda_profile_sample_rate" {
+  description = "Fraction of invocations to profile; API requests whose X-Profile header carries lambda_profile_header_secret are always profiled"
+  type        = number
+  default     = 0
+}
+
+variable "lambda_profile_header_secret" {
+  description = "Shared secret an X-Profile request header must match to force a profile; \"\" ignores the header"
+  type        = string
+  default     = ""
+  sensitive   = true
 }
 
 # ----------------------------------------------------------